@@ -1,5 +1,6 @@
 CREATE EXTENSION IF NOT EXISTS pgcrypto;  -- 以便使用 gen_random_uuid()
 CREATE EXTENSION IF NOT EXISTS citext;    -- 不分大小寫的 email
+CREATE EXTENSION IF NOT EXISTS pg_trgm;   -- 食譜標題、食材名稱的 ILIKE '%詞%' 模糊查詢（中文需 UTF-8 且非 C 的 locale）
 
 -- ========== 1) users ==========
 -- 關係：users 1–1 profiles、users 1–多 family_members、users 1–多 ingredients、users 1–多 feedback
@@ -70,6 +71,61 @@ CREATE TABLE feedback (
 CREATE INDEX idx_feedback_user ON feedback(user_id);
 CREATE INDEX idx_feedback_tags_gin ON feedback USING GIN (tags);
 
+-- ========== 6) run_artifacts ==========
+-- LLM 服務每次流程的 selector / planner 輸出，以 run_id 查詢，依 created_at 淘汰
+CREATE TABLE run_artifacts (
+  run_id           TEXT NOT NULL,
+  kind             TEXT NOT NULL,                         -- selector / planner
+  payload          JSONB NOT NULL,
+  created_at       TIMESTAMPTZ NOT NULL DEFAULT now(),
+  PRIMARY KEY (run_id, kind)
+);
+CREATE INDEX idx_run_artifacts_created ON run_artifacts(created_at);
+
+-- ========== 7) recipes ==========
+-- 食譜語料（LLM 服務 RECIPE_BACKEND=postgres 時使用，以 python -m agents.planner.store 匯入爬蟲輸出）
+-- 關係：recipes 1–多 recipe_ingredients、recipes 1–多 recipe_tags
+CREATE TABLE recipes (
+  recipe_id        BIGSERIAL PRIMARY KEY,
+  url              TEXT NOT NULL UNIQUE,                  -- 來源網址；沒有網址者為 local:<雜湊>
+  title            TEXT NOT NULL,
+  steps            JSONB NOT NULL DEFAULT '[]'::jsonb,
+  cooking_time     INTEGER,                               -- 分鐘，可為 NULL（未標示）
+  servings         INTEGER,
+  step_count       INTEGER NOT NULL DEFAULT 0,
+  ingredient_count INTEGER NOT NULL DEFAULT 0,
+  ingredient_ids   TEXT[] NOT NULL DEFAULT '{}',          -- 標準食材 ID（不含常備調味料），覆蓋率排序用
+  search_text      TEXT NOT NULL DEFAULT '',              -- 標題、食材、標準 ID、標籤，以空白分隔
+  search_tsv       TSVECTOR GENERATED ALWAYS AS (to_tsvector('simple', search_text)) STORED,
+  created_at       TIMESTAMPTZ NOT NULL DEFAULT now(),
+  updated_at       TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+CREATE INDEX idx_recipes_ingredient_ids ON recipes USING GIN (ingredient_ids);
+CREATE INDEX idx_recipes_search_tsv ON recipes USING GIN (search_tsv);
+CREATE INDEX idx_recipes_title_trgm ON recipes USING GIN (title gin_trgm_ops);
+CREATE INDEX idx_recipes_cooking_time ON recipes(cooking_time);
+CREATE INDEX idx_recipes_step_count ON recipes(step_count);
+
+CREATE TABLE recipe_ingredients (
+  recipe_id        BIGINT NOT NULL REFERENCES recipes(recipe_id) ON DELETE CASCADE,
+  position         INTEGER NOT NULL,                      -- 食譜中的順序
+  name             TEXT NOT NULL,                         -- 原始名稱，如 龍膽石斑魚塊
+  amount           TEXT,                                  -- 原始份量字串，如 1包(300g)
+  canonical_ids    TEXT[] NOT NULL DEFAULT '{}',          -- 同義詞字典對應的標準食材 ID
+  PRIMARY KEY (recipe_id, position)
+);
+CREATE INDEX idx_recipe_ingredients_canonical ON recipe_ingredients USING GIN (canonical_ids);
+CREATE INDEX idx_recipe_ingredients_name_trgm ON recipe_ingredients USING GIN (name gin_trgm_ops);
+
+CREATE TABLE recipe_tags (
+  recipe_id        BIGINT NOT NULL REFERENCES recipes(recipe_id) ON DELETE CASCADE,
+  position         INTEGER NOT NULL,
+  label            TEXT NOT NULL,                         -- 原始標籤，如 #石斑料理
+  tag              TEXT NOT NULL,                         -- 去掉 # 並轉小寫，比對用
+  PRIMARY KEY (recipe_id, position)
+);
+CREATE INDEX idx_recipe_tags_tag_trgm ON recipe_tags USING GIN (tag gin_trgm_ops);
+
 -- ========== 通用更新時間 Trigger（可選，但很實用） ==========
 CREATE OR REPLACE FUNCTION set_updated_at()
 RETURNS TRIGGER AS $$
@@ -94,3 +150,7 @@ FOR EACH ROW EXECUTE FUNCTION set_updated_at();
 CREATE TRIGGER trg_ingredients_updated_at
 BEFORE UPDATE ON ingredients
 FOR EACH ROW EXECUTE FUNCTION set_updated_at();
+
+CREATE TRIGGER trg_recipes_updated_at
+BEFORE UPDATE ON recipes
+FOR EACH ROW EXECUTE FUNCTION set_updated_at();
@@ -0,0 +1,71 @@
+-- 既有資料庫的升級腳本：init.sql 只在資料目錄（dbdata volume）為空時執行，
+-- 之後 init.sql 新增的 LLM 服務資料表不會出現在既有的 volume 中，以本檔補上。
+-- 可重複執行；新建立的資料庫已由 init.sql 建好，執行本檔不會有任何變更。
+--   docker-compose exec -T db sh -c 'psql -U "$POSTGRES_USER" -d "$POSTGRES_DB"' < db/migrations/001_llm_service.sql
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- ========== run_artifacts ==========
+CREATE TABLE IF NOT EXISTS run_artifacts (
+  run_id           TEXT NOT NULL,
+  kind             TEXT NOT NULL,
+  payload          JSONB NOT NULL,
+  created_at       TIMESTAMPTZ NOT NULL DEFAULT now(),
+  PRIMARY KEY (run_id, kind)
+);
+CREATE INDEX IF NOT EXISTS idx_run_artifacts_created ON run_artifacts(created_at);
+
+-- ========== recipes ==========
+CREATE TABLE IF NOT EXISTS recipes (
+  recipe_id        BIGSERIAL PRIMARY KEY,
+  url              TEXT NOT NULL UNIQUE,
+  title            TEXT NOT NULL,
+  steps            JSONB NOT NULL DEFAULT '[]'::jsonb,
+  cooking_time     INTEGER,
+  servings         INTEGER,
+  step_count       INTEGER NOT NULL DEFAULT 0,
+  ingredient_count INTEGER NOT NULL DEFAULT 0,
+  ingredient_ids   TEXT[] NOT NULL DEFAULT '{}',
+  search_text      TEXT NOT NULL DEFAULT '',
+  search_tsv       TSVECTOR GENERATED ALWAYS AS (to_tsvector('simple', search_text)) STORED,
+  created_at       TIMESTAMPTZ NOT NULL DEFAULT now(),
+  updated_at       TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS idx_recipes_ingredient_ids ON recipes USING GIN (ingredient_ids);
+CREATE INDEX IF NOT EXISTS idx_recipes_search_tsv ON recipes USING GIN (search_tsv);
+CREATE INDEX IF NOT EXISTS idx_recipes_title_trgm ON recipes USING GIN (title gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_recipes_cooking_time ON recipes(cooking_time);
+CREATE INDEX IF NOT EXISTS idx_recipes_step_count ON recipes(step_count);
+
+CREATE TABLE IF NOT EXISTS recipe_ingredients (
+  recipe_id        BIGINT NOT NULL REFERENCES recipes(recipe_id) ON DELETE CASCADE,
+  position         INTEGER NOT NULL,
+  name             TEXT NOT NULL,
+  amount           TEXT,
+  canonical_ids    TEXT[] NOT NULL DEFAULT '{}',
+  PRIMARY KEY (recipe_id, position)
+);
+CREATE INDEX IF NOT EXISTS idx_recipe_ingredients_canonical ON recipe_ingredients USING GIN (canonical_ids);
+CREATE INDEX IF NOT EXISTS idx_recipe_ingredients_name_trgm ON recipe_ingredients USING GIN (name gin_trgm_ops);
+
+CREATE TABLE IF NOT EXISTS recipe_tags (
+  recipe_id        BIGINT NOT NULL REFERENCES recipes(recipe_id) ON DELETE CASCADE,
+  position         INTEGER NOT NULL,
+  label            TEXT NOT NULL,
+  tag              TEXT NOT NULL,
+  PRIMARY KEY (recipe_id, position)
+);
+CREATE INDEX IF NOT EXISTS idx_recipe_tags_tag_trgm ON recipe_tags USING GIN (tag gin_trgm_ops);
+
+CREATE OR REPLACE FUNCTION set_updated_at()
+RETURNS TRIGGER AS $$
+BEGIN
+  NEW.updated_at = now();
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_recipes_updated_at ON recipes;
+CREATE TRIGGER trg_recipes_updated_at
+BEFORE UPDATE ON recipes
+FOR EACH ROW EXECUTE FUNCTION set_updated_at();
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+批次規劃基準測試
+同一組家庭請求分別以「逐一呼叫 run_full_pipeline」與 batch.run_batch 執行（假模型 + 本地 SQLite 冰箱），
+比較每分鐘完成的家庭數，並列出批次內共用的食譜檢索次數
+
+用法: python bench/bench_batch.py [--households 24] [--concurrency 8] [--llm-latency-ms 300]
+                                  [--days 2] [--items 30]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import date
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.abspath(os.path.join(BENCH_DIR, "..", "src")))
+sys.path.insert(0, BENCH_DIR)
+
+from bench_pipeline import BENCH_USER_ID, prepare_sqlite, seed_fridge, setup_database  # noqa: E402
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="批次規劃基準測試")
+    parser.add_argument("--households", type=int, default=24)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0, help="每次假模型呼叫的延遲")
+    parser.add_argument("--days", type=int, default=2)
+    parser.add_argument("--items", type=int, default=30, help="每個家庭的冰箱食材筆數")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    workdir = tempfile.mkdtemp(prefix="menufest-bench-batch-")
+    setup_database("sqlite", workdir)
+    os.environ.setdefault("LOG_LEVEL", "ERROR")
+
+    from db import SessionLocal, engine
+    from artifacts import FileArtifactStore
+    from agents.main import MenufestOrchestrator
+    from agents.planner.agent import PlannerAgent
+    from agents.selector.agent_react import IngredientSelectorReactAgent, SelectorConstraints
+    from batch import run_batch
+    from fake_llm import ScriptedChatModel, planner_responder, selector_responder
+
+    prepare_sqlite(engine)
+    # 每個家庭一個使用者，冰箱內容相同、人數不同
+    users = [BENCH_USER_ID[:-4] + f"{i:04x}" for i in range(args.households)]
+    for user_id in users:
+        seed_fridge(SessionLocal, user_id, args.items)
+
+    latency = args.llm_latency_ms / 1000
+    orchestrator = MenufestOrchestrator(
+        store=FileArtifactStore(os.path.join(workdir, "artifacts")),
+        selector_agent=IngredientSelectorReactAgent(
+            mode="llm", llm=ScriptedChatModel(responder=selector_responder(), latency=latency)),
+        planner_agent=PlannerAgent(llm=ScriptedChatModel(responder=planner_responder(), latency=latency)),
+    )
+    requests = [{
+        "user_id": user_id,
+        "people": 1 + i % 4,
+        "days": args.days,
+        "meals": ["午餐", "晚餐"],
+        "constraints": {},
+        "planner_preferences": ["家常菜", "下飯菜"],
+        "max_cooking_time": 30,
+        "max_steps": 5,
+        "start_date": date.today().isoformat(),
+    } for i, user_id in enumerate(users)]
+
+    print(f"households={args.households} concurrency={args.concurrency} "
+          f"llm_latency={args.llm_latency_ms}ms days={args.days}")
+
+    start = time.perf_counter()
+    failed = 0
+    for request in requests:
+        result = orchestrator.run_full_pipeline(
+            **{k: v for k, v in request.items() if k != "constraints"},
+            constraints=SelectorConstraints(**request["constraints"]))
+        failed += not result["success"]
+    sequential = time.perf_counter() - start
+    print(f"逐一執行: {sequential:.2f}s, {len(requests) / sequential * 60:.1f} 家庭/分鐘, 失敗 {failed}")
+
+    summary = None
+    for line in run_batch(requests, args.concurrency, orchestrator):
+        if line["type"] == "summary":
+            summary = line
+    print(f"批次執行: {summary['elapsed_ms'] / 1000:.2f}s, {summary['households_per_minute']} 家庭/分鐘, "
+          f"失敗 {summary['failed']}, 檢索共用 {summary['retrieval']['hits']} / "
+          f"{summary['retrieval']['hits'] + summary['retrieval']['misses']}")
+    print(f"加速: {sequential / (summary['elapsed_ms'] / 1000):.1f}x")
+
+
+if __name__ == "__main__":
+    main()
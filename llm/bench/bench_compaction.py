@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+中間步驟精簡基準測試
+以假模型模擬長時間執行的 agent：Selector 逐頁讀冰箱、Planner 每一輪都再搜尋 / 過濾一次食譜，
+比較 SCRATCHPAD_COMPACT 開與關時每次 LLM 呼叫的輸入 token（由 PromptProfiler 統計），
+開啟時每輪大小應維持在上限附近，而不是隨輪數線性成長。沒有 tiktoken 編碼檔（離線）時 token 數為估算值
+
+用法: python bench/bench_compaction.py [--iterations 10] [--items 300] [--budget 4000]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+from datetime import date
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.abspath(os.path.join(BENCH_DIR, "..", "src")))
+sys.path.insert(0, BENCH_DIR)
+
+from bench_pipeline import BENCH_USER_ID, prepare_sqlite, seed_fridge, setup_database  # noqa: E402
+
+_QUERIES = ("雞蛋", "豆腐", "高麗菜", "雞腿", "豬肉", "洋蔥", "番茄", "鮭魚", "石斑", "青江菜", "馬鈴薯", "蔥")
+_TAGS = ("家常菜", "烤箱料理", "下飯菜", "湯品", "快速料理")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="中間步驟精簡基準測試")
+    parser.add_argument("--iterations", type=int, default=10,
+                        help="每個 agent 呼叫工具的輪數（Selector 受 recursion_limit 25 限制，最多 11）")
+    parser.add_argument("--items", type=int, default=300, help="冰箱食材筆數（Selector 每頁 25 筆）")
+    parser.add_argument("--budget", type=int, default=4000, help="SCRATCHPAD_TOKEN_BUDGET")
+    return parser.parse_args()
+
+
+def selector_pager(iterations: int, final):
+    """每輪讀下一頁冰箱，讀完 iterations 頁後交給一般的 Selector 腳本輸出分配"""
+    from langchain_core.messages import AIMessage, ToolMessage
+    from fake_llm import _tool_call
+
+    def respond(messages):
+        done = sum(isinstance(m, ToolMessage) for m in messages)
+        if done < iterations:
+            return AIMessage(content="", tool_calls=[_tool_call(
+                "search_fridge", {"user_id": BENCH_USER_ID, "limit": 25, "offset": 25 * done}, done)])
+        return final(messages)
+
+    return respond
+
+
+def planner_searcher(iterations: int, final):
+    """每輪輪流以食材、標籤搜尋，或把上一輪結果整包傳給 filter_recipes_by_constraints"""
+    from langchain_core.messages import AIMessage, ToolMessage
+    from fake_llm import _tool_call
+
+    def respond(messages):
+        tools = [m for m in messages if isinstance(m, ToolMessage)]
+        n = len(tools)
+        if n >= iterations:
+            return final(messages)
+        if n % 3 == 0:
+            call = ("search_recipe_by_ingredient", {"ingredients": _QUERIES[n % len(_QUERIES)], "max_results": 8})
+        elif n % 3 == 1:
+            call = ("search_recipes_by_tags", {"tags": _TAGS[n % len(_TAGS)], "max_results": 8})
+        else:
+            call = ("filter_recipes_by_constraints", {"recipes_json": tools[-1].content,
+                                                      "constraints": "max_time:40"})
+        return AIMessage(content="", tool_calls=[_tool_call(call[0], call[1], n)])
+
+    return respond
+
+
+def run(args, compact: bool):
+    os.environ["SCRATCHPAD_COMPACT"] = "1" if compact else "0"
+    from agents.planner.agent import PlannerAgent, PlannerRequest, IngredientGroup
+    from agents.selector.agent_react import IngredientSelectorReactAgent, SelectorConstraints
+    from fake_llm import ScriptedChatModel, planner_responder, selector_responder
+
+    selector = IngredientSelectorReactAgent(mode="llm", output_mode="prompt", validate=False, llm=ScriptedChatModel(
+        responder=selector_pager(args.iterations, selector_responder())))
+    planner = PlannerAgent(output_mode="prompt", llm=ScriptedChatModel(
+        responder=planner_searcher(args.iterations, planner_responder())))
+    for agent in (selector, planner):
+        if agent.compactor:
+            agent.compactor.budget = args.budget
+
+    output = selector.run(BENCH_USER_ID, 2, 1, ["早餐", "午餐", "晚餐"], SelectorConstraints(),
+                          start_date=date.today().isoformat())
+    result = planner.plan_menu_with_params(PlannerRequest(
+        ingredient_groups=[IngredientGroup(main_ingredient=q, supporting_ingredients=["蔥"], total_amount="200g")
+                           for q in _QUERIES[:4]],
+        people=2, days=1, meals=["早餐", "午餐", "晚餐"], start_date=date.today().isoformat()))
+    assert output.daily_meals and result.success, "流程失敗"
+    return ([c["total_tokens"] for c in selector.profiler.calls],
+            [c["total_tokens"] for c in planner.profiler.calls])
+
+
+def main() -> None:
+    args = parse_args()
+    workdir = tempfile.mkdtemp(prefix="menufest-bench-compaction-")
+    setup_database("sqlite", workdir)
+    os.environ.setdefault("LOG_LEVEL", "ERROR")
+    os.environ["PROMPT_PROFILE"] = "1"
+
+    from db import SessionLocal, engine
+
+    prepare_sqlite(engine)
+    seed_fridge(SessionLocal, BENCH_USER_ID, args.items)
+
+    print(f"iterations={args.iterations} items={args.items} budget={args.budget}")
+    off = run(args, compact=False)
+    on = run(args, compact=True)
+    for n, name in enumerate(("selector", "planner")):
+        print(f"\n== {name}: 每次 LLM 呼叫的輸入 token ==")
+        print(f"{'輪':>4} {'不精簡':>10} {'精簡':>10}")
+        for i, (a, b) in enumerate(zip(off[n], on[n]), 1):
+            print(f"{i:>4} {a:>10} {b:>10}")
+        print(f"合計 {sum(off[n]):>10} {sum(on[n]):>10}  ({1 - sum(on[n]) / sum(off[n]):.0%} 減少)")
+        print(f"單次最大 {max(off[n]):>10} {max(on[n]):>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Pipeline IR 微基準測試
+比較舊流程（多次 .dict()、手動重建巢狀 dict、dict → IngredientGroup(**)）與 PipelineIR 的序列化開銷。
+兩種流程交錯量測 --repeat 輪，各取最快的一輪，降低單次量測的雜訊。
+7 天 x 3 餐 x 3 菜時 IR 約省下 20–30%（每次約 130–200 µs），並非減半
+
+用法: python bench/bench_ir.py [--days 7] [--dishes 3] [--runs 2000] [--repeat 5]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+# 只量測轉換，不連線資料庫
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from agents.selector.agent_react import SelectorOutput
+from agents.planner.agent import IngredientGroup, PlannerRequest
+from agents.pipeline import PipelineIR, MEAL_FIELDS
+
+
+def make_selector_output(days: int, dishes: int) -> SelectorOutput:
+    daily = []
+    for d in range(days):
+        day = {"date": f"2025-11-{d + 1:02d}"}
+        for field_name, _ in MEAL_FIELDS:
+            day[field_name] = [
+                {
+                    "dish_name": f"菜色{d}-{field_name}-{i}",
+                    "ingredients": [
+                        {"name": name, "allocated_quantity": 100.0 + i}
+                        for name in ("雞腿", "洋蔥", "蒜頭", "高麗菜")
+                    ],
+                }
+                for i in range(dishes)
+            ]
+        daily.append(day)
+    return SelectorOutput(total_days=days, total_people=2, start_date="2025-11-01", daily_meals=daily)
+
+
+def legacy_run(output: SelectorOutput) -> None:
+    """舊版 orchestrator 每次 run 的轉換步驟"""
+    # save_selector_output 手動重建巢狀 dict
+    {
+        "daily_meals": [
+            {
+                "date": dm.date,
+                **{
+                    f: [
+                        {"dish_name": dish.dish_name,
+                         "ingredients": [{"name": i.name, "allocated_quantity": i.allocated_quantity}
+                                         for i in dish.ingredients]}
+                        for dish in getattr(dm, f)
+                    ]
+                    for f, _ in MEAL_FIELDS
+                },
+            }
+            for dm in output.daily_meals
+        ]
+    }
+    # convert_selector_to_planner_format 攤平成 dict，再 IngredientGroup(**group)
+    groups = []
+    for day_idx, dm in enumerate(output.daily_meals):
+        for f, meal in MEAL_FIELDS:
+            for dish in getattr(dm, f):
+                groups.append({
+                    "main_ingredient": dish.ingredients[0].name,
+                    "supporting_ingredients": [i.name for i in dish.ingredients[1:]],
+                    "total_amount": f"{output.total_people}人份",
+                    "day": day_idx + 1,
+                    "meal": meal,
+                    "dish_name": dish.dish_name,
+                })
+    objs = [IngredientGroup(**g) for g in groups]
+    PlannerRequest(ingredient_groups=objs, people=2, days=len(output.daily_meals), meals=["早餐"])
+    # 回應與錯誤路徑上的 .dict()
+    output.model_dump()
+    output.model_dump()
+
+
+def ir_run(output: SelectorOutput) -> None:
+    ir = PipelineIR.from_selector(output)
+    ir.selector_payload()
+    PlannerRequest(ingredient_groups=ir.ingredient_groups, people=2, days=len(output.daily_meals), meals=["早餐"])
+    ir.selector_payload()
+
+
+def bench(fn, output: SelectorOutput, runs: int) -> float:
+    start = time.perf_counter()
+    for _ in range(runs):
+        fn(output)
+    return (time.perf_counter() - start) / runs * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--dishes", type=int, default=3)
+    parser.add_argument("--runs", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5, help="交錯量測的輪數，取最快的一輪")
+    args = parser.parse_args()
+
+    output = make_selector_output(args.days, args.dishes)
+    legacy_run(output), ir_run(output)  # warm up
+    legacy_times, ir_times = [], []
+    for _ in range(max(args.repeat, 1)):
+        legacy_times.append(bench(legacy_run, output, args.runs))
+        ir_times.append(bench(ir_run, output, args.runs))
+    legacy_us, ir_us = min(legacy_times), min(ir_times)
+    slots = args.days * len(MEAL_FIELDS) * args.dishes
+    print(f"{args.days} 天 x {len(MEAL_FIELDS)} 餐 x {args.dishes} 菜 = {slots} 個菜色")
+    print(f"舊流程: {legacy_us:9.1f} µs/run")
+    print(f"IR    : {ir_us:9.1f} µs/run")
+    print(f"節省  : {legacy_us - ir_us:9.1f} µs/run ({(1 - ir_us / legacy_us) * 100:.1f}%)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+JSON 擷取基準測試
+在數 KB、含巢狀括號與字串內括號的 LLM 回應上，比較舊版 Selector / Planner 擷取邏輯與共用的 extract_json
+
+用法: python bench/bench_json_extract.py [--runs 50]
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from agents.json_utils import extract_json
+
+
+def _legacy_repairs(text: str) -> str:
+    s = text.strip()
+    s = re.sub(r"^```json\s*|^```\s*|```\s*$", "", s, flags=re.IGNORECASE | re.MULTILINE)
+    s = s.replace("﻿", "")
+    s = re.sub(r"[\x00-\x08\x0b\x0c\x0e-\x1f]", "", s)
+    s = re.sub(r",\s*([}\]])", r"\1", s)
+    s = re.sub(r"\bNaN\b|\bInfinity\b|-Infinity", "null", s)
+    return s
+
+
+def legacy_selector(response: str):
+    """舊版 selector：從每個 { 反向嘗試"""
+    try:
+        return json.loads(_legacy_repairs(response))
+    except Exception:
+        pass
+    m = re.search(r"```json\s*(\{[\s\S]*?\})\s*```", response, flags=re.IGNORECASE)
+    if m:
+        try:
+            return json.loads(_legacy_repairs(m.group(1)))
+        except Exception:
+            pass
+    for start in reversed([m.start() for m in re.finditer(r"\{", response)]):
+        count, end = 0, start
+        for i, ch in enumerate(response[start:], start):
+            if ch == "{":
+                count += 1
+            elif ch == "}":
+                count -= 1
+                if count == 0:
+                    end = i + 1
+                    break
+        if count == 0 and end > start:
+            try:
+                return json.loads(_legacy_repairs(response[start:end]))
+            except Exception:
+                continue
+    return None
+
+
+def legacy_planner(response: str):
+    """舊版 planner：多個回溯 regex 蒐集候選後由長到短嘗試"""
+    m = re.search(r"```json\s*(\{[\s\S]*?\})\s*```", response, flags=re.IGNORECASE)
+    if m:
+        try:
+            return json.loads(_legacy_repairs(m.group(1)))
+        except Exception:
+            pass
+    candidates = []
+    for p in (r"```\s*(\{[\s\S]*?\})\s*```",
+              r"(\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\})",
+              r"(\{[\s\S]*?\})"):
+        candidates.extend(re.findall(p, response, re.DOTALL))
+    for c in sorted(set(candidates), key=len, reverse=True):
+        try:
+            return json.loads(_legacy_repairs(c))
+        except Exception:
+            continue
+    return None
+
+
+def make_response(days: int, variant: str = "fenced") -> str:
+    """模擬 Planner 最終回應：前言含雜散括號、步驟字串內含括號、結尾附註
+
+    variant: fenced（```json 圍欄）、plain（無圍欄）、truncated（回應在結尾前被截斷）、
+             stray（前言有落單的引號與開括號，第一次掃描會把整份菜單當成字串吞掉）
+    """
+    recipe = {
+        "recipe_name": "蒜香雞腿飯",
+        "main_ingredient": "雞腿",
+        "ingredients": [{"name": f"食材{i}", "amount": "100g"} for i in range(6)],
+        "steps": ["醃料 {醬油, 米酒} 拌勻後靜置 10 分鐘", "以中火煎至金黃（約 5 分鐘）}", "加入 {蒜末} 拌炒"],
+    }
+    schedule = [
+        {"date": f"2025-11-{d + 1:02d}", "breakfast": [recipe], "lunch": [recipe, recipe], "dinner": [recipe, recipe]}
+        for d in range(days)
+    ]
+    plan = {"menu_plan": {"start_date": "2025-11-01", "days": days, "people": 2,
+                          "daytimes": ["早餐", "午餐", "晚餐"]},
+            "schedule": schedule}
+    body = json.dumps(plan, ensure_ascii=False, indent=2)
+    # 尾逗號讓直接解析失敗，迫使各實作進入擷取路徑
+    body = body.replace('"100g"\n', '"100g",\n', 1)
+    if variant == "truncated":
+        return "好的，以下是根據 {食材分組} 規劃的菜單：\n\n" + body[:-len(body) // 20]
+    if variant == "stray":
+        return '好的，使用者說 "冰箱裡有 { 雞腿" 之後的菜單：\n\n' + body
+    if variant == "plain":
+        return "好的，以下是根據 {食材分組} 規劃的菜單，格式為 {json}：\n\n" + body + "\n\n如需調整 {份量} 請告訴我。"
+    return ("好的，以下是根據 {食材分組} 規劃的菜單，格式為 {json}：\n\n```json\n"
+            + body + "\n```\n\n如需調整 {份量} 請告訴我。")
+
+
+def bench(fn, text: str, runs: int):
+    result = fn(text)
+    start = time.perf_counter()
+    for _ in range(runs):
+        fn(text)
+    return (time.perf_counter() - start) / runs * 1e3, result
+
+
+def check_cases():
+    """前言的落單引號與括號不能讓後面的物件擷取失敗"""
+    cases = {
+        'text "quote { not json" then {"ok": true}': {"ok": True},
+        "前言 {不是 JSON} 之後 {\"ok\": 1}": {"ok": 1},
+        '未閉合 { [ 之後 {"ok": [1, 2]}': {"ok": [1, 2]},
+    }
+    for text, expected in cases.items():
+        result = extract_json(text)
+        assert result == expected, f"{text!r}: {result!r}"
+    print(f"邊界案例 {len(cases)} 個 ✓")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=50)
+    args = parser.parse_args()
+
+    ok = lambda r: "✓" if isinstance(r, dict) and "schedule" in r else "✗"
+    print(f"{'情境':>10} {'大小':>8} {'selector(舊)':>14} {'planner(舊)':>14} {'extract_json':>14}")
+    for variant in ("fenced", "plain", "truncated", "stray"):
+        for days in (1, 3, 7, 14):
+            text = make_response(days, variant)
+            sel_ms, sel = bench(legacy_selector, text, args.runs)
+            pla_ms, pla = bench(legacy_planner, text, args.runs)
+            new_ms, new = bench(extract_json, text, args.runs)
+            print(f"{variant:>10} {len(text) / 1024:6.1f}KB {sel_ms:11.2f}ms {ok(sel)} "
+                  f"{pla_ms:11.2f}ms {ok(pla)} {new_ms:11.2f}ms {ok(new)}")
+    print("✓ = 取得完整菜單；✗ = 取得錯誤物件或失敗")
+    check_cases()
+
+if __name__ == "__main__":
+    main()
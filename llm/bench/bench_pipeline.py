@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+離線完整流程基準測試
+兩個 agent 的 ChatOpenAI 換成腳本化假模型（bench/fake_llm.py），對本地 SQLite 或 Postgres 冰箱
+執行 MenufestOrchestrator.run_full_pipeline，量測流程本身的開銷（prompt 組裝、工具、JSON 擷取、
+pydantic 驗證、artifact 寫入），不受 OpenAI 延遲影響
+
+用法: python bench/bench_pipeline.py [--db sqlite|<DATABASE_URL>] [--days 3] [--people 2]
+                                     [--items 40] [--runs 20] [--output-mode prompt]
+                                     [--llm-latency-ms 0] [--alloc]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(BENCH_DIR, "..", "src")
+sys.path.insert(0, os.path.abspath(SRC_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+BENCH_USER_ID = "00000000-0000-4000-8000-00000000be4c"
+
+# 冰箱樣本：名稱、單位、每件數量；到期日依序錯開
+FRIDGE_SAMPLE = [
+    ("雞蛋", "個", 10), ("雞腿", "個", 4), ("豬絞肉", "克", 500), ("高麗菜", "克", 800),
+    ("洋蔥", "個", 3), ("番茄", "個", 5), ("豆腐", "盒", 2), ("青江菜", "克", 300),
+    ("鮭魚", "克", 400), ("蒜頭", "克", 100), ("蔥", "克", 80), ("紅蘿蔔", "個", 3),
+    ("馬鈴薯", "個", 4), ("牛肉片", "克", 300), ("香菇", "克", 150), ("玉米", "個", 2),
+]
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="離線完整流程基準測試")
+    parser.add_argument("--db", default="sqlite", help="sqlite（暫存檔）或 Postgres 連線字串")
+    parser.add_argument("--days", type=int, default=3)
+    parser.add_argument("--people", type=int, default=2)
+    parser.add_argument("--items", type=int, default=40, help="冰箱食材筆數")
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--output-mode", choices=("prompt", "structured"), default="prompt")
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0, help="每次假模型呼叫的延遲")
+    parser.add_argument("--alloc", action="store_true", help="另跑一輪 tracemalloc 記錄各階段配置")
+    return parser.parse_args()
+
+
+# ==================== 冰箱資料 ====================
+
+def setup_database(db: str, workdir: str) -> str:
+    """設定 DATABASE_URL（須在匯入 src 模組前），回傳實際使用的連線字串"""
+    url = f"sqlite:///{os.path.join(workdir, 'fridge.db')}" if db == "sqlite" else db
+    os.environ["DATABASE_URL"] = url
+    os.environ.pop("LLM_DATABASE_URL", None)
+    return url
+
+
+def prepare_sqlite(engine) -> None:
+    """SQLite 沒有 to_date，註冊同名函式；資料表以 SQLite 可接受的 DDL 建立"""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "connect")
+    def _register(dbapi_conn, _record):
+        dbapi_conn.create_function("to_date", 2, lambda value, _fmt: value)
+
+    with engine.begin() as conn:
+        conn.exec_driver_sql(
+            "CREATE TABLE IF NOT EXISTS users (uid CHAR(32) PRIMARY KEY, username TEXT NOT NULL, "
+            "email TEXT NOT NULL, password_hash TEXT NOT NULL, birthday DATE)")
+        conn.exec_driver_sql(
+            "CREATE TABLE IF NOT EXISTS ingredients (ingredient_id CHAR(32) PRIMARY KEY, user_id CHAR(32), "
+            "ingredient_name TEXT NOT NULL, expiry_date DATE, quantity NUMERIC NOT NULL, "
+            "unit TEXT NOT NULL, created_at TIMESTAMP, updated_at TIMESTAMP)")
+
+
+def seed_fridge(session_factory, user_id: str, items: int) -> None:
+    """清空並重建基準使用者的冰箱"""
+    from sqlalchemy import text
+    from models import Ingredient
+
+    today = date.today()
+    now = datetime.now()
+    with session_factory() as s:
+        s.query(Ingredient).filter(Ingredient.user_id == user_id).delete()
+        # User.uid 為 as_uuid 型別，直接以 SQL 建立，SQLite 與 Postgres 通用
+        s.execute(text(
+            "INSERT INTO users (uid, username, email, password_hash) "
+            "VALUES (:uid, 'menufest-bench', 'bench@menufest.invalid', '-') ON CONFLICT DO NOTHING"
+        ), {"uid": user_id})
+        for i in range(items):
+            name, unit, qty = FRIDGE_SAMPLE[i % len(FRIDGE_SAMPLE)]
+            s.add(Ingredient(
+                ingredient_id=str(uuid.uuid4()),
+                user_id=user_id,
+                ingredient_name=name if i < len(FRIDGE_SAMPLE) else f"{name}{i // len(FRIDGE_SAMPLE)}",
+                expiry_date=today + timedelta(days=i % 14),
+                quantity=qty,
+                unit=unit,
+                created_at=now,
+                updated_at=now,
+            ))
+        s.commit()
+
+
+def cleanup_fridge(session_factory, user_id: str) -> None:
+    from sqlalchemy import text
+    from models import Ingredient
+
+    with session_factory() as s:
+        s.query(Ingredient).filter(Ingredient.user_id == user_id).delete()
+        s.execute(text("DELETE FROM users WHERE uid = :uid"), {"uid": user_id})
+        s.commit()
+
+
+# ==================== 量測 ====================
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(q * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def wrap_method(obj: Any, name: str, hook: Callable[[str, Callable], Any], label: str = None) -> None:
+    """以 hook(label, 原方法) 包裝實例方法"""
+    original = getattr(obj, name)
+    label = label or name
+
+    def wrapper(*args, **kwargs):
+        return hook(label, lambda: original(*args, **kwargs))
+
+    setattr(obj, name, wrapper)
+
+
+class StageTimer:
+    """收集 span 耗時（依 span 名稱與所屬階段）以及被包裝方法的耗時"""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        self._run: Dict[str, float] = defaultdict(float)
+
+    def on_span(self, s) -> None:
+        ms = s.duration_ms or 0.0
+        if s.name in ("selector", "planner"):
+            self._run[s.name] += ms
+        elif s.name in ("llm", "tool") or s.name.startswith("db."):
+            self._run[f"{s.stage}.{s.name}"] += ms
+
+    def timed(self, name: str, call: Callable) -> Any:
+        start = time.perf_counter()
+        try:
+            return call()
+        finally:
+            self._run[name] += (time.perf_counter() - start) * 1000
+
+    def end_run(self, total_ms: float) -> None:
+        run = self._run
+        # 階段自身開銷 = 階段耗時 − 模型呼叫 − 工具（工具內含 DB 查詢）
+        for stage in ("selector", "planner"):
+            run[f"{stage}.self"] = run[stage] - run[f"{stage}.llm"] - run[f"{stage}.tool"]
+        run["total"] = total_ms
+        for key, value in run.items():
+            self.samples[key].append(value)
+        self._run = defaultdict(float)
+
+    def report(self) -> None:
+        print(f"\n{'stage':<28}{'mean':>10}{'p50':>10}{'p95':>10}{'max':>10}  (ms)")
+        for key in sorted(self.samples, key=lambda k: (k != "total", k)):
+            values = self.samples[key]
+            print(f"{key:<28}{statistics.fmean(values):>10.2f}{percentile(values, 0.5):>10.2f}"
+                  f"{percentile(values, 0.95):>10.2f}{max(values):>10.2f}")
+
+
+class AllocationProfiler:
+    """tracemalloc：各階段的峰值與淨配置，以及整輪的主要配置位置"""
+
+    def __init__(self):
+        self.peak: Dict[str, List[int]] = defaultdict(list)
+        self.net: Dict[str, List[int]] = defaultdict(list)
+
+    def measured(self, name: str, call: Callable) -> Any:
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        try:
+            return call()
+        finally:
+            current, peak = tracemalloc.get_traced_memory()
+            self.peak[name].append(peak - before)
+            self.net[name].append(current - before)
+
+    def report(self, before: "tracemalloc.Snapshot", after: "tracemalloc.Snapshot", top: int = 12) -> None:
+        print(f"\n{'stage':<28}{'peak KiB':>12}{'net KiB':>12}")
+        for name in self.peak:
+            print(f"{name:<28}{statistics.fmean(self.peak[name]) / 1024:>12.1f}"
+                  f"{statistics.fmean(self.net[name]) / 1024:>12.1f}")
+        print(f"\n跑完後仍存活的配置，前 {top} 個位置:")
+        root = os.path.abspath(os.path.join(BENCH_DIR, ".."))
+        for stat in after.compare_to(before, "lineno")[:top]:
+            frame = stat.traceback[0]
+            path = os.path.relpath(frame.filename, root) if frame.filename.startswith(root) else frame.filename
+            print(f"  {stat.size_diff / 1024:>+9.1f} KiB {stat.count_diff:>+7}  {path}:{frame.lineno}")
+
+
+def main() -> None:
+    args = parse_args()
+    workdir = tempfile.mkdtemp(prefix="menufest-bench-")
+    url = setup_database(args.db, workdir)
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+    from db import SessionLocal, engine
+    from artifacts import FileArtifactStore
+    from telemetry import add_span_listener
+    from agents.main import MenufestOrchestrator
+    from agents.planner.agent import PlannerAgent
+    from agents.selector.agent_react import IngredientSelectorReactAgent, SelectorConstraints
+    from fake_llm import ScriptedChatModel, planner_responder, selector_responder
+
+    if url.startswith("sqlite"):
+        prepare_sqlite(engine)
+    seed_fridge(SessionLocal, BENCH_USER_ID, args.items)
+
+    latency = args.llm_latency_ms / 1000
+    orchestrator = MenufestOrchestrator(
+        store=FileArtifactStore(os.path.join(workdir, "artifacts")),
+        selector_agent=IngredientSelectorReactAgent(
+            output_mode=args.output_mode,
+            llm=ScriptedChatModel(responder=selector_responder(), latency=latency)),
+        planner_agent=PlannerAgent(
+            output_mode=args.output_mode,
+            llm=ScriptedChatModel(responder=planner_responder(), latency=latency)),
+    )
+
+    def run_once() -> Dict[str, Any]:
+        result = orchestrator.run_full_pipeline(
+            user_id=BENCH_USER_ID,
+            people=args.people,
+            days=args.days,
+            meals=["早餐", "午餐", "晚餐"],
+            constraints=SelectorConstraints(),
+            start_date=date.today().isoformat(),
+        )
+        if not result["success"]:
+            raise RuntimeError(f"流程失敗: {result.get('error')}")
+        return result
+
+    print(f"db={url.split('@')[-1]} days={args.days} people={args.people} items={args.items} "
+          f"runs={args.runs} mode={args.output_mode} llm_latency={args.llm_latency_ms}ms")
+    try:
+        result = run_once()  # 暖機：載入食譜、建立連線
+        schedule = result["planner_output"]["menu_plan"]["schedule"]
+        print(f"暖機完成：{sum(len(d[f]) for d in schedule for f in ('breakfast', 'lunch', 'dinner'))} 道菜，"
+              f"usage={result['usage']['total_tokens']} tokens")
+
+        timer = StageTimer()
+        add_span_listener(timer.on_span)
+        for name in ("save_selector_output", "save_planner_output"):
+            wrap_method(orchestrator, name, timer.timed)
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            run_once()
+            timer.end_run((time.perf_counter() - start) * 1000)
+        timer.report()
+
+        if args.alloc:
+            profiler = AllocationProfiler()
+            wrap_method(orchestrator.selector_agent, "run", profiler.measured, "selector")
+            wrap_method(orchestrator.planner_agent, "plan_menu_with_params", profiler.measured, "planner")
+            for name in ("save_selector_output", "save_planner_output"):
+                wrap_method(orchestrator, name, profiler.measured)
+            tracemalloc.start(1)
+            before = tracemalloc.take_snapshot()
+            for _ in range(max(1, args.runs // 4)):
+                run_once()
+            after = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            profiler.report(before, after)
+    finally:
+        if not url.startswith("sqlite"):
+            cleanup_fridge(SessionLocal, BENCH_USER_ID)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+提示詞大小分析
+以假模型跑一次完整流程（本地 SQLite 冰箱），列出 Selector 與 Planner 每次 LLM 呼叫各段落的輸入 token 數、
+固定前綴（工具定義 + system，可命中供應商 prompt 前綴快取）佔比，並檢查不同家庭的 system 前綴是否逐字相同。
+沒有 tiktoken 編碼檔（離線）時 token 數為估算值
+
+用法: python bench/bench_prompts.py [--days 2] [--people 2] [--items 40] [--output-mode prompt|structured]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+from datetime import date
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.abspath(os.path.join(BENCH_DIR, "..", "src")))
+sys.path.insert(0, BENCH_DIR)
+
+from bench_pipeline import BENCH_USER_ID, prepare_sqlite, seed_fridge, setup_database  # noqa: E402
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="提示詞大小分析")
+    parser.add_argument("--days", type=int, default=2)
+    parser.add_argument("--people", type=int, default=2)
+    parser.add_argument("--items", type=int, default=40, help="冰箱食材筆數")
+    parser.add_argument("--output-mode", choices=("prompt", "structured"), default="prompt")
+    return parser.parse_args()
+
+
+def print_calls(name: str, calls) -> None:
+    print(f"\n== {name}: {len(calls)} 次呼叫 ==")
+    for n, call in enumerate(calls, 1):
+        print(f"#{n} 共 {call['total_tokens']} token，固定前綴 {call['static_prefix_tokens']} "
+              f"({call['static_ratio']:.0%}){'，估算' if call['estimated'] else ''}")
+        for section, tokens in call["sections"].items():
+            print(f"    {section:<28} {tokens:>7}")
+
+
+def main() -> None:
+    args = parse_args()
+    workdir = tempfile.mkdtemp(prefix="menufest-bench-prompts-")
+    setup_database("sqlite", workdir)
+    os.environ.setdefault("LOG_LEVEL", "ERROR")
+    os.environ["PROMPT_PROFILE"] = "1"
+
+    from db import SessionLocal, engine
+    from artifacts import FileArtifactStore
+    from agents.main import MenufestOrchestrator
+    from agents.planner.agent import PlannerAgent
+    from agents.selector.agent_react import IngredientSelectorReactAgent, SelectorConstraints
+    from fake_llm import ScriptedChatModel, planner_responder, selector_responder
+
+    prepare_sqlite(engine)
+    users = [BENCH_USER_ID, BENCH_USER_ID[:-4] + "0001"]
+    for user_id in users:
+        seed_fridge(SessionLocal, user_id, args.items)
+
+    selector = IngredientSelectorReactAgent(
+        mode="llm", output_mode=args.output_mode, llm=ScriptedChatModel(responder=selector_responder()))
+    planner = PlannerAgent(output_mode=args.output_mode, llm=ScriptedChatModel(responder=planner_responder()))
+    orchestrator = MenufestOrchestrator(
+        store=FileArtifactStore(os.path.join(workdir, "artifacts")),
+        selector_agent=selector, planner_agent=planner)
+
+    # 兩個家庭（不同使用者、人數）各跑一次，system 前綴應逐字相同
+    for i, user_id in enumerate(users):
+        result = orchestrator.run_full_pipeline(
+            user_id=user_id, people=args.people + i, days=args.days, meals=["早餐", "午餐", "晚餐"],
+            constraints=SelectorConstraints(), planner_preferences=["家常菜"],
+            max_cooking_time=30, max_steps=5, start_date=date.today().isoformat())
+        if not result["success"]:
+            print(f"流程失敗: {result.get('error')}")
+            return
+
+    for name, agent in (("selector", selector), ("planner", planner)):
+        calls = agent.profiler.calls
+        half = len(calls) // len(users)
+        print_calls(f"{name}（第一個家庭）", calls[:half])
+        prefixes = {c["static_prefix_tokens"] for c in calls if any(k.startswith("static.") for k in c["sections"])}
+        print(f"不同家庭的固定前綴 token 數: {sorted(prefixes)}（只有一個值表示前綴不隨請求變動）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+局部重新規劃基準測試
+假 Planner 模型的最終菜單故意讓幾個槽位缺少或格式錯誤，比較：
+- 局部重新規劃：保留有效的天與餐，只以一次小型呼叫補上壞掉的槽位
+- 整份重跑：壞掉時重新執行一次完整的 Planner（工具迴圈 + 最終菜單）
+兩者的額外 token 與耗時（token 以假模型的字元數估算）
+
+用法: python bench/bench_repair.py [--days 5] [--broken 2] [--llm-latency-ms 300]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import date
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.abspath(os.path.join(BENCH_DIR, "..", "src")))
+sys.path.insert(0, BENCH_DIR)
+
+from bench_pipeline import setup_database  # noqa: E402
+
+_MAINS = ("雞腿", "豆腐", "鮭魚", "高麗菜", "豬肉", "雞蛋", "番茄", "洋蔥")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="局部重新規劃基準測試")
+    parser.add_argument("--days", type=int, default=5)
+    parser.add_argument("--broken", type=int, default=2, help="最終菜單中壞掉的槽位數")
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0, help="每次假模型呼叫的延遲")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    setup_database("sqlite", tempfile.mkdtemp(prefix="menufest-bench-repair-"))
+    os.environ.setdefault("LOG_LEVEL", "ERROR")
+
+    from agents.planner.agent import IngredientGroup, PlannerAgent, PlannerRequest
+    from fake_llm import ScriptedChatModel, planner_responder
+    from usage import usage_scope
+
+    meals = ["早餐", "午餐", "晚餐"]
+    request = PlannerRequest(
+        ingredient_groups=[
+            IngredientGroup(main_ingredient=_MAINS[(d * 3 + m) % len(_MAINS)], supporting_ingredients=["蔥", "蒜"],
+                            total_amount="300g", day=d + 1, meal=meal, dish_name="")
+            for d in range(args.days) for m, meal in enumerate(meals)],
+        people=2, days=args.days, meals=meals, start_date=date.today().isoformat())
+    latency = args.llm_latency_ms / 1000
+
+    def run(broken: int):
+        planner = PlannerAgent(output_mode="prompt", llm=ScriptedChatModel(
+            responder=planner_responder(broken_slots=broken), latency=latency))
+        start = time.perf_counter()
+        with usage_scope() as usage:
+            result = planner.plan_menu_with_params(request)
+        return result, usage.to_dict(), time.perf_counter() - start
+
+    print(f"days={args.days} broken={args.broken} llm_latency={args.llm_latency_ms}ms")
+    clean, clean_usage, clean_seconds = run(0)
+    repaired, repaired_usage, repaired_seconds = run(args.broken)
+    assert clean.success and repaired.success, "流程失敗"
+    filled = sum(bool(getattr(day, f)) for day in repaired.menu_plan.schedule for f in ("breakfast", "lunch", "dinner"))
+
+    extra_tokens = repaired_usage["total_tokens"] - clean_usage["total_tokens"]
+    extra_seconds = repaired_seconds - clean_seconds
+    print(f"重新規劃的槽位: {', '.join(repaired.regenerated_slots) or '（無）'}，"
+          f"有食譜的餐 {filled} / {args.days * len(meals)}")
+    print(f"{'':<10} {'額外 token':>10} {'額外耗時':>10} {'LLM 呼叫':>8}")
+    print(f"{'局部重新規劃':<10} {extra_tokens:>10} {extra_seconds:>9.2f}s "
+          f"{repaired_usage['llm_calls'] - clean_usage['llm_calls']:>8}")
+    print(f"{'整份重跑':<10} {clean_usage['total_tokens']:>10} {clean_seconds:>9.2f}s {clean_usage['llm_calls']:>8}")
+
+
+if __name__ == "__main__":
+    main()
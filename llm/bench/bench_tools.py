@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+工具規模化基準測試
+以合成資料（bench/synth_data.py）量測四個工具在不同資料量下的延遲，找出各自開始跟不上的規模：
+- search_fridge：每位使用者 10 ~ 100k 筆冰箱食材（SQLite 暫存檔或 Postgres）
+- search_recipe_by_ingredient / search_recipes_by_tags：10k ~ 1M 筆食譜語料
+- filter_recipes_by_constraints：輸入 10 ~ 10k 筆候選食譜
+
+每個情境取多次執行的中位數，並列出相對上一個規模的成長倍數（資料量 ×10 而耗時也 ×10 即為線性）
+
+用法: python bench/bench_tools.py [--fridge-sizes 10,1000,10000,100000]
+                                  [--recipe-sizes 10000,100000] [--filter-sizes 10,100,1000,10000]
+                                  [--db sqlite|<DATABASE_URL>] [--repeat 5]
+1M 筆食譜約需數 GB 記憶體，需要時再加到 --recipe-sizes
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+
+from bench_pipeline import BENCH_USER_ID, prepare_sqlite, setup_database
+from synth_data import SyntheticData, seed_synthetic_fridge
+
+
+def _sizes(text: str) -> List[int]:
+    return [int(x) for x in text.split(",") if x.strip()]
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="工具規模化基準測試")
+    parser.add_argument("--fridge-sizes", type=_sizes, default=[10, 1000, 10000, 100000])
+    parser.add_argument("--recipe-sizes", type=_sizes, default=[10000, 100000])
+    parser.add_argument("--filter-sizes", type=_sizes, default=[10, 100, 1000, 10000])
+    parser.add_argument("--db", default="sqlite", help="sqlite（暫存檔）或 Postgres 連線字串")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    return parser.parse_args()
+
+
+def measure(fn: Callable[[], Any], repeat: int) -> Tuple[float, Any]:
+    """回傳多次執行的中位數（毫秒）與最後一次的結果"""
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times), result
+
+
+class Table:
+    """依情境累積各規模的耗時，列出成長倍數"""
+
+    def __init__(self, title: str):
+        self.title = title
+        self.rows: Dict[str, List[Tuple[int, float, str]]] = {}
+
+    def add(self, case: str, size: int, ms: float, note: str = "") -> None:
+        self.rows.setdefault(case, []).append((size, ms, note))
+
+    def print(self) -> None:
+        print(f"\n== {self.title} ==")
+        print(f"{'case':<24}{'size':>10}{'median ms':>12}{'growth':>9}{'µs/row':>10}  note")
+        for case, rows in self.rows.items():
+            prev = None
+            for size, ms, note in rows:
+                growth = f"×{ms / prev:.1f}" if prev else ""
+                print(f"{case:<24}{size:>10}{ms:>12.2f}{growth:>9}{ms * 1000 / size:>10.3f}  {note}")
+                prev = ms if ms > 0 else None
+
+
+def bench_fridge(args: argparse.Namespace) -> None:
+    from db import SessionLocal
+    from agents.selector.tools import search_fridge
+
+    table = Table("search_fridge")
+    for size in args.fridge_sizes:
+        start = time.perf_counter()
+        seed_synthetic_fridge(SessionLocal, BENCH_USER_ID, size, args.seed)
+        print(f"fridge {size} 筆寫入 {time.perf_counter() - start:.1f}s")
+
+        ms, first = measure(lambda: search_fridge.func(user_id=BENCH_USER_ID), args.repeat)
+        table.add("first_page", size, ms, f"total={first['total']}")
+        ms, found = measure(lambda: search_fridge.func(user_id=BENCH_USER_ID, name_contains="雞"), args.repeat)
+        table.add("name_contains", size, ms, f"total={found['total']}")
+        last = max(0, first["total"] - 25)
+        ms, _ = measure(lambda: search_fridge.func(user_id=BENCH_USER_ID, offset=last), args.repeat)
+        table.add("last_page", size, ms, f"offset={last}")
+    table.print()
+
+
+def bench_recipes(args: argparse.Namespace) -> None:
+    from agents.planner import tools
+
+    # 命中多且早的查詢會提早結束；不存在的食材或標籤則必須掃完整份語料
+    ingredient_cases = {"ingredient_common": "雞蛋,洋蔥", "ingredient_rare": "芋頭", "ingredient_miss": "松露"}
+    tag_cases = {"tags_common": "家常菜", "tags_rare": "芋頭料理", "tags_miss": "米其林"}
+
+    search = Table("search_recipe_by_ingredient / search_recipes_by_tags")
+    corpus: List[Dict[str, Any]] = []
+    for size in args.recipe_sizes:
+        start = time.perf_counter()
+        corpus = list(SyntheticData(args.seed).recipes(size))
+        print(f"recipes {size} 筆產生 {time.perf_counter() - start:.1f}s")
+        tools._recipes_data = {"recipes": corpus, "pairings": []}
+
+        for case, query in ingredient_cases.items():
+            ms, out = measure(lambda: tools.search_recipe_by_ingredient.func(query, 10), args.repeat)
+            search.add(case, size, ms, f"found={json.loads(out)['total_found']}")
+        for case, query in tag_cases.items():
+            ms, out = measure(lambda: tools.search_recipes_by_tags.func(query, 10), args.repeat)
+            search.add(case, size, ms, f"found={json.loads(out)['total_found']}")
+    search.print()
+
+    constraint = Table("filter_recipes_by_constraints")
+    corpus = corpus or list(SyntheticData(args.seed).recipes(max(args.filter_sizes)))
+    for size in args.filter_sizes:
+        # 與 agent 相同：候選食譜以 JSON 字串傳入
+        recipes_json = json.dumps({"recipes": corpus[:size]}, ensure_ascii=False)
+        ms, out = measure(lambda: tools.filter_recipes_by_constraints.func(recipes_json, "max_time:30,max_steps:5"),
+                          args.repeat)
+        constraint.add("max_time+max_steps", min(size, len(corpus)), ms,
+                       f"input={len(recipes_json) // 1024}KiB kept={json.loads(out).get('total_found', '?')}")
+    constraint.print()
+
+
+def main() -> None:
+    args = parse_args()
+    url = setup_database(args.db, tempfile.mkdtemp(prefix="menufest-tools-"))
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    print(f"db={url.split('@')[-1]} repeat={args.repeat} seed={args.seed}")
+
+    from db import SessionLocal, engine
+    if url.startswith("sqlite"):
+        prepare_sqlite(engine)
+    try:
+        if args.fridge_sizes:
+            bench_fridge(args)
+        if args.recipe_sizes or args.filter_sizes:
+            bench_recipes(args)
+    finally:
+        if not url.startswith("sqlite"):
+            from bench_pipeline import cleanup_fridge
+            cleanup_fridge(SessionLocal, BENCH_USER_ID)
+
+
+if __name__ == "__main__":
+    main()
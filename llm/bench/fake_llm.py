@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+離線基準測試用的腳本化假聊天模型
+依對話內容決定回應：還沒有工具結果時發出工具呼叫，拿到工具結果後輸出最終 JSON，
+Selector 與 Planner 各一份腳本，可取代兩個 agent 的 ChatOpenAI
+"""
+
+import asyncio
+import json
+import math
+import random
+import re
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+Responder = Callable[[List[BaseMessage]], AIMessage]
+
+MEALS = (("breakfast", "早餐"), ("lunch", "午餐"), ("dinner", "晚餐"))
+
+
+class ScriptedChatModel(BaseChatModel):
+    """依 responder 產生回應的假模型
+
+    latency 為每次呼叫的延遲秒數，可傳入函式以模擬延遲分佈；token 用量以字元數估算
+    """
+
+    responder: Responder
+    latency: Union[float, Callable[[], float]] = 0.0
+    model_name: str = "scripted-fake"
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted-fake"
+
+    def bind_tools(self, tools, **kwargs):
+        # 工具呼叫由腳本決定，不需要綁定 schema
+        return self
+
+    def _delay(self) -> float:
+        return self.latency() if callable(self.latency) else self.latency
+
+    def _result(self, messages: List[BaseMessage]) -> ChatResult:
+        message = self.responder(messages)
+        prompt_chars = sum(len(m.content) if isinstance(m.content, str) else 0 for m in messages)
+        completion_chars = len(message.content) + len(json.dumps(message.tool_calls, ensure_ascii=False))
+        return ChatResult(
+            generations=[ChatGeneration(message=message)],
+            llm_output={
+                "token_usage": {"prompt_tokens": prompt_chars // 2, "completion_tokens": completion_chars // 2},
+                "model_name": self.model_name,
+            },
+        )
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        delay = self._delay()
+        if delay > 0:
+            time.sleep(delay)
+        return self._result(messages)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        delay = self._delay()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return self._result(messages)
+
+
+# ==================== 腳本 ====================
+
+def _human_text(messages: List[BaseMessage]) -> str:
+    return next((m.content for m in messages if isinstance(m, HumanMessage)), "")
+
+
+def _tool_results(messages: List[BaseMessage]) -> List[Any]:
+    results = []
+    for m in messages:
+        if isinstance(m, ToolMessage):
+            try:
+                results.append(json.loads(m.content))
+            except (TypeError, ValueError):
+                results.append(m.content)
+    return results
+
+
+def _field(pattern: str, text: str, default: str = "") -> str:
+    m = re.search(pattern, text)
+    return m.group(1).strip() if m else default
+
+
+def _tool_call(name: str, args: Dict[str, Any], index: int) -> Dict[str, Any]:
+    return {"name": name, "args": args, "id": f"call_{name}_{index}", "type": "tool_call"}
+
+
+def _fenced(data: Dict[str, Any]) -> str:
+    # 模仿模型常見輸出：前後有說明文字與 markdown 圍欄
+    return f"以下是規劃結果：\n```json\n{json.dumps(data, ensure_ascii=False, indent=2)}\n```"
+
+
+def selector_responder(dishes_per_meal: int = 2, ingredients_per_dish: int = 3) -> Responder:
+    """Selector 腳本：先 search_fridge，再依即期順序把冰箱食材分配到每一餐"""
+
+    def respond(messages: List[BaseMessage]) -> AIMessage:
+        text = _human_text(messages)
+        fridge = [r for r in _tool_results(messages) if isinstance(r, dict) and "items" in r]
+        if not fridge:
+            user_id = _field(r"user_id:\s*(\S+)", text)
+            return AIMessage(content="", tool_calls=[_tool_call("search_fridge", {"user_id": user_id, "limit": 100}, 0)])
+
+        days = int(_field(r"天數:\s*(\d+)", text, "1"))
+        people = int(_field(r"人數:\s*(\d+)", text, "1"))
+        start_date = _field(r"開始日期:\s*(\S+)", text, datetime.now().strftime("%Y-%m-%d"))
+        items = fridge[-1]["items"]
+        start = datetime.strptime(start_date, "%Y-%m-%d")
+
+        daily_meals = []
+        cursor = 0
+        for d in range(days):
+            day: Dict[str, Any] = {"date": (start + timedelta(days=d)).strftime("%Y-%m-%d")}
+            for field, label in MEALS:
+                dishes = []
+                for i in range(dishes_per_meal if items else 0):
+                    picked = [items[(cursor + k) % len(items)] for k in range(min(ingredients_per_dish, len(items)))]
+                    cursor += 1
+                    dishes.append({
+                        "dish_name": f"{picked[0]['name']}{label}{i + 1}",
+                        "ingredients": [
+                            {"name": it["name"],
+                             "allocated_quantity": round(min(it["quantity_available"], 100.0 * people), 1)}
+                            for it in picked
+                        ],
+                    })
+                day[field] = dishes
+            daily_meals.append(day)
+
+        return AIMessage(content=_fenced({
+            "total_days": days,
+            "total_people": people,
+            "start_date": start_date,
+            "daily_meals": daily_meals,
+        }))
+
+    return respond
+
+
+_GROUP_RE = re.compile(
+    r"^- (?:第(\d+)天 (\S+?)「([^」]*)」 )?主食材: (.+?) \((.*?)\), 配料: (.*)$", re.MULTILINE)
+
+
+_SLOT_RE = re.compile(r"^- 第(\d+)天 (\S+)$", re.MULTILINE)
+
+
+def _slot_response(text: str, steps: int) -> AIMessage:
+    """局部重新規劃：每個列出的槽位以其下方的食材分組（沒有時用雞蛋）排一道菜"""
+    slots = []
+    for match in _SLOT_RE.finditer(text):
+        block = text[match.end():].split("\n- 第", 1)[0]
+        groups = _GROUP_RE.findall("\n".join(line.strip() for line in block.splitlines()))
+        main, amount = (groups[0][3], groups[0][4]) if groups else ("雞蛋", "2顆")
+        slots.append({"day": int(match.group(1)), "meal": match.group(2), "recipes": [{
+            "recipe_name": f"{main}補菜",
+            "main_ingredient": main,
+            "ingredients": [{"name": main, "amount": amount}],
+            "steps": [f"步驟{i + 1}：處理{main}" for i in range(steps)],
+        }]})
+    return AIMessage(content=_fenced({"slots": slots}))
+
+
+def _break_schedule(schedule: List[Dict[str, Any]], count: int) -> None:
+    """模擬模型輸出錯誤：依序讓 count 個槽位缺少整餐或食譜缺少必要欄位"""
+    slots = [(day, field) for day in schedule for field, _ in MEALS if day.get(field)]
+    for n, (day, field) in enumerate(slots[:count]):
+        if n % 2 == 0:
+            del day[field]
+        else:
+            for recipe in day[field]:
+                recipe.pop("ingredients", None)
+
+
+def planner_responder(steps: int = 4, broken_slots: int = 0) -> Responder:
+    """Planner 腳本：先以主食材與偏好標籤搜尋食譜，再把每個食材分組排進對應的餐
+
+    broken_slots > 0 時最終菜單有幾個槽位故意缺少或格式錯誤，用來測試局部重新規劃
+    """
+
+    def respond(messages: List[BaseMessage]) -> AIMessage:
+        text = _human_text(messages)
+        if "需要重新規劃的槽位" in text:
+            return _slot_response(text, steps)
+        groups = _GROUP_RE.findall(text)
+        if not any(isinstance(m, ToolMessage) for m in messages):
+            mains = ",".join(sorted({g[3] for g in groups})[:5]) or "雞蛋"
+            tags = _field(r"偏好:\s*(.+)", text, "家常菜").replace(" ", "")
+            return AIMessage(content="", tool_calls=[
+                _tool_call("search_recipe_by_ingredient", {"ingredients": mains, "max_results": 5}, 0),
+                _tool_call("search_recipes_by_tags", {"tags": tags, "max_results": 5}, 1),
+            ])
+
+        days = int(_field(r"天數:\s*(\d+)", text, "1"))
+        people = int(_field(r"人數:\s*(\d+)", text, "1"))
+        meals = [m.strip() for m in _field(r"餐點類型:\s*(.+)", text, "早餐, 午餐, 晚餐").split(",")]
+        start_text = _field(r"開始日期:\s*(\S+)", text)
+        try:
+            start = datetime.strptime(start_text, "%Y-%m-%d")
+        except ValueError:
+            start = datetime.now()
+
+        schedule = [{"date": (start + timedelta(days=d)).strftime("%Y-%m-%d"), "breakfast": [], "lunch": [], "dinner": []}
+                    for d in range(max(days, 1))]
+        field_by_label = {label: field for field, label in MEALS}
+        for index, (day, meal, dish, main, amount, supporting) in enumerate(groups):
+            d = int(day) - 1 if day else index % len(schedule)
+            field = field_by_label.get(meal) or MEALS[index % 3][0]
+            if not 0 <= d < len(schedule):
+                continue
+            schedule[d][field].append({
+                "recipe_name": dish or f"{main}料理",
+                "main_ingredient": main,
+                "ingredients": [{"name": main, "amount": amount}]
+                               + [{"name": s.strip(), "amount": "適量"} for s in supporting.split(",") if s.strip()],
+                "steps": [f"步驟{i + 1}：處理{main}" for i in range(steps)],
+            })
+
+        _break_schedule(schedule, broken_slots)
+        return AIMessage(content=_fenced({
+            "menu_plan": {"start_date": schedule[0]["date"], "days": days, "people": people, "daytimes": meals},
+            "schedule": schedule,
+        }))
+
+    return respond
+
+
+
+# ==================== 延遲分佈 ====================
+
+def latency_from_spec(spec: str, seed: Optional[int] = None) -> Callable[[], float]:
+    """由字串建立延遲分佈（回傳秒），單位為毫秒：
+
+    const:800、uniform:300:1500、lognormal:800:0.5（中位數與 sigma）；純數字視為 const
+    """
+    rng = random.Random(seed)
+    kind, _, rest = spec.partition(":")
+    if not rest:
+        kind, rest = "const", kind
+    params = [float(x) for x in rest.split(":")]
+    if kind == "const":
+        value = params[0] / 1000
+        return lambda: value
+    if kind == "uniform":
+        low, high = params[0] / 1000, params[1] / 1000
+        return lambda: rng.uniform(low, high)
+    if kind == "lognormal":
+        mu, sigma = math.log(params[0] / 1000), (params[1] if len(params) > 1 else 0.5)
+        return lambda: rng.lognormvariate(mu, sigma)
+    raise ValueError(f"未知的延遲分佈: {spec}")
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+HTTP 負載測試
+以 httpx ASGITransport 直接驅動 FastAPI app（不經網路），agent 使用腳本化假模型並套用延遲分佈，
+以 repo 根目錄的範例請求檔為 payload，回報各端點的吞吐量、p50/p95/p99 延遲、錯誤率，
+以及同步端點所用 threadpool 的飽和程度
+
+兩種模式：
+- 固定併發（closed loop）：--concurrency N，N 個 worker 各自連續送出請求
+- 固定到達率（open loop）：--rate R，以 Poisson 到達每秒 R 個請求，不等待前一個完成
+
+用法: python bench/load_test.py [--endpoints full_pipeline,plan_menu,select_react]
+                                [--concurrency 8 | --rate 5] [--duration 30]
+                                [--latency lognormal:800:0.5] [--threads 40]
+                                [--json out.json] [--baseline old.json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+LLM_DIR = os.path.abspath(os.path.join(BENCH_DIR, ".."))
+REPO_DIR = os.path.abspath(os.path.join(LLM_DIR, ".."))
+sys.path.insert(0, LLM_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from bench_pipeline import BENCH_USER_ID, percentile, prepare_sqlite, seed_fridge, setup_database
+
+# 端點 → (路徑, 範例請求檔)
+ENDPOINTS: Dict[str, Tuple[str, str]] = {
+    "full_pipeline": ("/full_pipeline", "full_pipeline_request.json"),
+    "plan_menu": ("/plan_menu", "planner_agent_request.json"),
+    "select_react": ("/select_react", "select_agent_request.json"),
+}
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="FastAPI 服務負載測試（ASGI 直連 + 假模型）")
+    parser.add_argument("--db", default="sqlite", help="sqlite（暫存檔）或 Postgres 連線字串")
+    parser.add_argument("--endpoints", default="full_pipeline", help="逗號分隔，可重複以調整比例")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--concurrency", type=int, default=8, help="固定併發 worker 數")
+    mode.add_argument("--rate", type=float, help="固定到達率（每秒請求數）")
+    parser.add_argument("--duration", type=float, default=30.0, help="送出請求的秒數")
+    parser.add_argument("--latency", default="lognormal:800:0.5", help="假模型每次呼叫的延遲分佈（毫秒）")
+    parser.add_argument("--threads", type=int, default=None, help="threadpool 大小（預設沿用 anyio 的 40）")
+    parser.add_argument("--items", type=int, default=40, help="冰箱食材筆數")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", help="結果另存為 JSON")
+    parser.add_argument("--baseline", help="與先前的 JSON 結果比較")
+    return parser.parse_args()
+
+
+def load_payload(filename: str) -> Dict[str, Any]:
+    with open(os.path.join(REPO_DIR, filename), encoding="utf-8") as f:
+        body = json.load(f)
+    if "user_id" in body:
+        body["user_id"] = BENCH_USER_ID
+    return body
+
+
+def is_app_error(endpoint: str, data: Any) -> bool:
+    """端點以 200 回傳的失敗：status=error，或 Selector 回傳空菜單"""
+    if not isinstance(data, dict):
+        return True
+    if endpoint == "select_react":
+        return not data.get("daily_meals")
+    return data.get("status") != "success"
+
+
+class Recorder:
+    """逐筆記錄請求結果與 threadpool 取樣"""
+
+    def __init__(self):
+        self.latency: Dict[str, List[float]] = defaultdict(list)
+        self.http_errors: Dict[str, int] = defaultdict(int)
+        self.app_errors: Dict[str, int] = defaultdict(int)
+        self.exceptions: Dict[str, int] = defaultdict(int)
+        self.pool_busy: List[float] = []
+        self.pool_waiting: List[int] = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def record(self, endpoint: str, seconds: float, status: Optional[int], data: Any) -> None:
+        self.latency[endpoint].append(seconds * 1000)
+        if status is None:
+            self.exceptions[endpoint] += 1
+        elif status >= 400:
+            self.http_errors[endpoint] += 1
+        elif is_app_error(endpoint, data):
+            self.app_errors[endpoint] += 1
+
+    def summary(self, elapsed: float, pool_size: int) -> Dict[str, Any]:
+        endpoints = {}
+        for name, values in self.latency.items():
+            count = len(values)
+            failed = self.http_errors[name] + self.app_errors[name] + self.exceptions[name]
+            endpoints[name] = {
+                "count": count,
+                "throughput_rps": round(count / elapsed, 3),
+                "p50_ms": round(percentile(values, 0.50), 1),
+                "p95_ms": round(percentile(values, 0.95), 1),
+                "p99_ms": round(percentile(values, 0.99), 1),
+                "mean_ms": round(statistics.fmean(values), 1),
+                "error_rate": round(failed / count, 4) if count else 0.0,
+                "http_errors": self.http_errors[name],
+                "app_errors": self.app_errors[name],
+                "exceptions": self.exceptions[name],
+            }
+        busy = self.pool_busy or [0]
+        return {
+            "elapsed_s": round(elapsed, 2),
+            "endpoints": endpoints,
+            "threadpool": {
+                "size": pool_size,
+                "mean_busy": round(statistics.fmean(busy), 2),
+                "max_busy": max(busy),
+                "saturated_ratio": round(sum(b >= pool_size for b in busy) / len(busy), 4),
+                "max_waiting": max(self.pool_waiting or [0]),
+            },
+            "max_in_flight": self.max_in_flight,
+        }
+
+
+async def send(client, recorder: Recorder, endpoint: str, body: Dict[str, Any]) -> None:
+    path, _ = ENDPOINTS[endpoint]
+    recorder.in_flight += 1
+    recorder.max_in_flight = max(recorder.max_in_flight, recorder.in_flight)
+    start = time.perf_counter()
+    status, data = None, None
+    try:
+        response = await client.post(path, json=body)
+        status = response.status_code
+        try:
+            data = response.json()
+        except ValueError:
+            data = None
+    except Exception:
+        pass
+    finally:
+        recorder.in_flight -= 1
+        recorder.record(endpoint, time.perf_counter() - start, status, data)
+
+
+async def sample_pool(recorder: Recorder, stop: asyncio.Event, interval: float = 0.05) -> None:
+    """定期取樣 anyio 預設 threadpool（同步端點在此執行）的使用量與等待數"""
+    import anyio.to_thread
+
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    while not stop.is_set():
+        stats = limiter.statistics()
+        recorder.pool_busy.append(stats.borrowed_tokens)
+        recorder.pool_waiting.append(stats.tasks_waiting)
+        await asyncio.sleep(interval)
+
+
+async def run_load(app, args: argparse.Namespace) -> Dict[str, Any]:
+    import anyio.to_thread
+    import httpx
+
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    if args.threads:
+        limiter.total_tokens = args.threads
+    mix = [e.strip() for e in args.endpoints.split(",") if e.strip()]
+    payloads = {name: load_payload(ENDPOINTS[name][1]) for name in set(mix)}
+    rng = random.Random(args.seed)
+    recorder = Recorder()
+    stop = asyncio.Event()
+    # 請求逾時與後端呼叫 /full_pipeline 的 5 分鐘一致
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://menufest.bench", timeout=300) as client:
+        sampler = asyncio.create_task(sample_pool(recorder, stop))
+        start = time.perf_counter()
+        deadline = start + args.duration
+
+        if args.rate:
+            tasks = []
+            while time.perf_counter() < deadline:
+                endpoint = rng.choice(mix)
+                tasks.append(asyncio.create_task(send(client, recorder, endpoint, payloads[endpoint])))
+                await asyncio.sleep(rng.expovariate(args.rate))
+            await asyncio.gather(*tasks)
+        else:
+            async def worker() -> None:
+                while time.perf_counter() < deadline:
+                    endpoint = rng.choice(mix)
+                    await send(client, recorder, endpoint, payloads[endpoint])
+
+            await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await sampler
+    return recorder.summary(elapsed, limiter.total_tokens)
+
+
+def print_report(result: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None) -> None:
+    print(f"\n{'endpoint':<16}{'n':>6}{'rps':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'err%':>8}")
+    for name, r in result["endpoints"].items():
+        print(f"{name:<16}{r['count']:>6}{r['throughput_rps']:>8.2f}{r['p50_ms']:>9.0f}"
+              f"{r['p95_ms']:>9.0f}{r['p99_ms']:>9.0f}{r['error_rate'] * 100:>7.1f}%")
+        if r["http_errors"] or r["app_errors"] or r["exceptions"]:
+            print(f"{'':<16}http={r['http_errors']} app={r['app_errors']} exception={r['exceptions']}")
+        old = (baseline or {}).get("endpoints", {}).get(name)
+        if old:
+            def delta(key: str) -> str:
+                return f"{(r[key] - old[key]) / old[key] * 100:+.1f}%" if old[key] else "n/a"
+            print(f"{'':<16}vs baseline: rps {delta('throughput_rps')}, p95 {delta('p95_ms')}, "
+                  f"p99 {delta('p99_ms')}, err {r['error_rate'] - old['error_rate']:+.4f}")
+    pool = result["threadpool"]
+    print(f"\nthreadpool: size={pool['size']} mean_busy={pool['mean_busy']} max_busy={pool['max_busy']} "
+          f"saturated={pool['saturated_ratio'] * 100:.1f}% max_waiting={pool['max_waiting']} "
+          f"max_in_flight={result['max_in_flight']}")
+
+
+def main() -> None:
+    args = parse_args()
+    workdir = tempfile.mkdtemp(prefix="menufest-load-")
+    url = setup_database(args.db, workdir)
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ.setdefault("OPENAI_API_KEY", "offline")
+    os.environ["ARTIFACT_BACKEND"] = "file"
+    os.environ["ARTIFACT_DIR"] = os.path.join(workdir, "artifacts")
+
+    # 與 uvicorn src.server:app 相同的入口；server 會把 llm/src 設為匯入根目錄
+    from src import server
+    from db import SessionLocal, engine
+    from agents.registry import registry
+    from agents.selector.agent_react import IngredientSelectorReactAgent
+    from agents.planner.agent import PlannerAgent
+    from fake_llm import ScriptedChatModel, latency_from_spec, planner_responder, selector_responder
+
+    if url.startswith("sqlite"):
+        prepare_sqlite(engine)
+    seed_fridge(SessionLocal, BENCH_USER_ID, args.items)
+
+    # 以假模型取代 registry 的共用 agent；orchestrator 建立時會取用同一份
+    latency = latency_from_spec(args.latency, args.seed)
+    registry.override("selector", IngredientSelectorReactAgent(
+        llm=ScriptedChatModel(responder=selector_responder(), latency=latency)))
+    registry.override("planner", PlannerAgent(
+        llm=ScriptedChatModel(responder=planner_responder(), latency=latency)))
+
+    load = f"rate={args.rate}/s" if args.rate else f"concurrency={args.concurrency}"
+    print(f"endpoints={args.endpoints} {load} duration={args.duration}s latency={args.latency} "
+          f"threads={args.threads or 'default'}")
+    result = asyncio.run(run_load(server.app, args))
+    result["config"] = {k: v for k, v in vars(args).items() if k not in ("json", "baseline")}
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(result, baseline)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+合成資料產生器
+產生擬真的中文冰箱食材與食譜語料（食材熱門度呈 Zipf 分佈、標籤與 recipes.json 格式一致），
+供工具的規模化基準測試使用；同一個 seed 產生相同資料
+
+用法:
+  python bench/synth_data.py recipes --count 100000 --out /tmp/recipes.json
+  python bench/synth_data.py fridge --rows 10000 [--db sqlite|<DATABASE_URL>]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import uuid
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# (名稱, 常用單位, 分類)；順序即熱門度排名
+INGREDIENTS: List[Tuple[str, str, str]] = [
+    ("雞蛋", "個", "蛋豆"), ("洋蔥", "個", "蔬菜"), ("蒜頭", "瓣", "辛香"), ("蔥", "根", "辛香"),
+    ("高麗菜", "克", "蔬菜"), ("豬絞肉", "克", "肉類"), ("雞腿", "隻", "肉類"), ("番茄", "個", "蔬菜"),
+    ("豆腐", "盒", "蛋豆"), ("紅蘿蔔", "根", "蔬菜"), ("薑", "片", "辛香"), ("馬鈴薯", "個", "蔬菜"),
+    ("雞胸肉", "克", "肉類"), ("青江菜", "把", "蔬菜"), ("香菇", "朵", "菇類"), ("五花肉", "克", "肉類"),
+    ("牛肉片", "克", "肉類"), ("玉米", "根", "蔬菜"), ("白米", "杯", "主食"), ("鮭魚", "片", "海鮮"),
+    ("蝦仁", "克", "海鮮"), ("花椰菜", "朵", "蔬菜"), ("小黃瓜", "條", "蔬菜"), ("茄子", "條", "蔬菜"),
+    ("金針菇", "包", "菇類"), ("杏鮑菇", "根", "菇類"), ("青椒", "個", "蔬菜"), ("地瓜葉", "把", "蔬菜"),
+    ("空心菜", "把", "蔬菜"), ("白蘿蔔", "根", "蔬菜"), ("鴻喜菇", "包", "菇類"), ("豬里肌", "克", "肉類"),
+    ("蛤蜊", "克", "海鮮"), ("石斑魚", "克", "海鮮"), ("鯛魚片", "片", "海鮮"), ("透抽", "尾", "海鮮"),
+    ("板豆腐", "塊", "蛋豆"), ("雞翅", "隻", "肉類"), ("排骨", "克", "肉類"), ("牛腱", "克", "肉類"),
+    ("菠菜", "把", "蔬菜"), ("芹菜", "根", "蔬菜"), ("九層塔", "把", "辛香"), ("辣椒", "根", "辛香"),
+    ("南瓜", "克", "蔬菜"), ("山藥", "克", "蔬菜"), ("蓮藕", "節", "蔬菜"), ("豆芽菜", "克", "蔬菜"),
+    ("麵條", "把", "主食"), ("冬粉", "把", "主食"), ("年糕", "克", "主食"), ("吐司", "片", "主食"),
+    ("鮮奶", "毫升", "乳製品"), ("優格", "杯", "乳製品"), ("起司片", "片", "乳製品"), ("奶油", "克", "乳製品"),
+    ("木耳", "朵", "菇類"), ("秋葵", "根", "蔬菜"), ("蘆筍", "根", "蔬菜"), ("甜椒", "個", "蔬菜"),
+    ("四季豆", "克", "蔬菜"), ("毛豆", "克", "蛋豆"), ("皮蛋", "個", "蛋豆"), ("鹹蛋", "個", "蛋豆"),
+    ("干貝", "顆", "海鮮"), ("鯖魚", "片", "海鮮"), ("秋刀魚", "尾", "海鮮"), ("鴨肉", "克", "肉類"),
+    ("羊肉片", "克", "肉類"), ("培根", "片", "肉類"), ("火腿", "片", "肉類"), ("香腸", "條", "肉類"),
+    ("茼蒿", "把", "蔬菜"), ("韭菜", "把", "蔬菜"), ("大白菜", "顆", "蔬菜"), ("芋頭", "克", "蔬菜"),
+]
+
+SEASONINGS = ["醬油", "鹽", "糖", "米酒", "香油", "白胡椒粉", "蠔油", "烏醋", "味醂", "豆瓣醬", "味噌", "太白粉"]
+SEASONING_AMOUNTS = ["1大匙", "2大匙", "1/2大匙", "1小匙", "1/2小匙", "少許", "適量"]
+
+METHODS = ["炒", "燉", "蒸", "烤", "滷", "煎", "炸", "涼拌", "紅燒", "三杯", "糖醋", "醬爆", "清燉", "焗烤", "乾煎"]
+STYLES = ["家常", "台式", "日式", "韓式", "泰式", "港式", "川味", "客家"]
+TAGS = ["家常菜", "下飯菜", "快速料理", "便當菜", "烤箱料理", "電鍋料理", "氣炸鍋", "湯品", "素食",
+        "減脂", "兒童餐", "宴客菜", "早餐", "宵夜", "一鍋到底", "零失敗"]
+STEP_TEMPLATES = [
+    "{main}洗淨切塊，用{seasoning}醃漬10分鐘。",
+    "熱鍋下油，爆香{side}。",
+    "放入{main}拌炒至七分熟。",
+    "加入{seasoning}與少許水，蓋鍋燜煮{minutes}分鐘。",
+    "{side}切絲備用。",
+    "起鍋前淋上香油，撒上蔥花即可。",
+    "烤箱預熱{temp}度，烤{minutes}分鐘。",
+    "電鍋外鍋放1杯水，蒸至開關跳起。",
+]
+FRIDGE_VARIANTS = ["", "", "", "冷凍", "有機", "切片", "去骨", "小"]
+
+
+def _zipf_weights(n: int, s: float = 1.0) -> List[float]:
+    return [1 / (rank + 1) ** s for rank in range(n)]
+
+
+class SyntheticData:
+    """以固定 seed 產生冰箱與食譜資料"""
+
+    def __init__(self, seed: int = 42, vocab: Sequence[Tuple[str, str, str]] = INGREDIENTS):
+        self.rng = random.Random(seed)
+        self.vocab = list(vocab)
+        self._cum_weights = []
+        total = 0.0
+        for w in _zipf_weights(len(self.vocab)):
+            total += w
+            self._cum_weights.append(total)
+
+    def pick_ingredients(self, k: int) -> List[Tuple[str, str, str]]:
+        """依熱門度抽出 k 個不重複的食材"""
+        picked: Dict[str, Tuple[str, str, str]] = {}
+        while len(picked) < k:
+            item = self.rng.choices(self.vocab, cum_weights=self._cum_weights)[0]
+            picked.setdefault(item[0], item)
+        return list(picked.values())
+
+    def _amount(self, unit: str) -> str:
+        if unit in ("克", "毫升"):
+            return f"{self.rng.choice((50, 100, 150, 200, 300, 500))}{'g' if unit == '克' else 'ml'}"
+        return f"{self.rng.randint(1, 4)}{unit}"
+
+    def recipe(self, index: int) -> Dict[str, Any]:
+        rng = self.rng
+        items = self.pick_ingredients(rng.randint(2, 6))
+        main, side = items[0][0], items[1][0]
+        method = rng.choice(METHODS)
+        title = rng.choice((
+            f"{method}{main}",
+            f"{side}{method}{main}",
+            f"{rng.choice(STYLES)}{method}{main}",
+            f"{main}{side}{rng.choice(('湯', '燴飯', '炒麵', '蓋飯', '煲'))}",
+        ))
+        seasonings = rng.sample(SEASONINGS, rng.randint(1, 4))
+        ingredients = [{"name": name, "amount": self._amount(unit)} for name, unit, _ in items]
+        ingredients += [{"name": s, "amount": rng.choice(SEASONING_AMOUNTS)} for s in seasonings]
+        steps = [
+            rng.choice(STEP_TEMPLATES).format(
+                main=main, side=side, seasoning=seasonings[0],
+                minutes=rng.choice((5, 10, 15, 20, 30)), temp=rng.choice((180, 200, 220)))
+            for _ in range(rng.randint(2, 9))
+        ]
+        tags = {f"#{rng.choice(TAGS)}" for _ in range(rng.randint(1, 3))}
+        tags.add(f"#{main}" if rng.random() < 0.5 else f"#{main}料理")
+        if items[0][2] == "蔬菜" and rng.random() < 0.3:
+            tags.add("#素食")
+        recipe = {
+            "title": title,
+            "ingredients": ingredients,
+            "steps": steps,
+            # 約四分之一缺烹飪時間，與爬回來的 recipes.json 相近
+            "cooking_time": rng.choice((10, 15, 20, 25, 30, 40, 45, 60, 90)) if rng.random() > 0.25 else None,
+            "servings": rng.randint(1, 6),
+            "url": f"https://example.com/recipes/{index}",
+            "tags": sorted(tags),
+        }
+        return recipe
+
+    def recipes(self, count: int) -> Iterator[Dict[str, Any]]:
+        for i in range(count):
+            yield self.recipe(i)
+
+    def fridge_rows(self, user_id: str, rows: int, today: Optional[date] = None) -> Iterator[Dict[str, Any]]:
+        """冰箱食材列：約 10% 無到期日、約 15% 已過期、其餘在 30 天內到期"""
+        rng = self.rng
+        today = today or date.today()
+        now = datetime.now()
+        for i in range(rows):
+            name, unit, _ = self.pick_ingredients(1)[0]
+            variant = rng.choice(FRIDGE_VARIANTS)
+            roll = rng.random()
+            if roll < 0.10:
+                expiry = None
+            elif roll < 0.25:
+                expiry = today - timedelta(days=rng.randint(1, 30))
+            else:
+                expiry = today + timedelta(days=rng.randint(0, 30))
+            yield {
+                "ingredient_id": str(uuid.uuid4()),
+                "user_id": user_id,
+                "ingredient_name": f"{variant}{name}",
+                "expiry_date": expiry,
+                "quantity": rng.choice((1, 2, 3, 5, 10, 100, 200, 300, 500, 1000)) if rng.random() > 0.05 else 0,
+                "unit": unit,
+                "created_at": now - timedelta(minutes=i),
+                "updated_at": now - timedelta(minutes=i),
+            }
+
+
+def write_recipes_json(path: str, count: int, seed: int = 42) -> None:
+    """以 recipes.json 的格式寫出食譜語料（逐筆寫入，不在記憶體中組出整份 JSON 字串）"""
+    data = SyntheticData(seed)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('{"recipes": [\n')
+        for i, recipe in enumerate(data.recipes(count)):
+            if i:
+                f.write(",\n")
+            f.write(json.dumps(recipe, ensure_ascii=False))
+        f.write('\n], "pairings": []}\n')
+
+
+def seed_synthetic_fridge(session_factory, user_id: str, rows: int, seed: int = 42, batch: int = 5000) -> None:
+    """清空並以合成資料重建使用者冰箱（分批 bulk insert）"""
+    from sqlalchemy import insert, text
+    from models import Ingredient
+
+    data = SyntheticData(seed)
+    with session_factory() as s:
+        s.query(Ingredient).filter(Ingredient.user_id == user_id).delete()
+        s.execute(text(
+            "INSERT INTO users (uid, username, email, password_hash) "
+            "VALUES (:uid, :name, :email, '-') ON CONFLICT DO NOTHING"
+        ), {"uid": user_id, "name": f"synth-{user_id[:8]}", "email": f"{user_id[:8]}@menufest.invalid"})
+        chunk: List[Dict[str, Any]] = []
+        for row in data.fridge_rows(user_id, rows):
+            chunk.append(row)
+            if len(chunk) >= batch:
+                s.execute(insert(Ingredient), chunk)
+                chunk = []
+        if chunk:
+            s.execute(insert(Ingredient), chunk)
+        s.commit()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="合成冰箱與食譜資料")
+    sub = parser.add_subparsers(dest="kind", required=True)
+    rp = sub.add_parser("recipes", help="輸出 recipes.json 格式的食譜語料")
+    rp.add_argument("--count", type=int, default=10000)
+    rp.add_argument("--out", required=True)
+    rp.add_argument("--seed", type=int, default=42)
+    fp = sub.add_parser("fridge", help="寫入合成冰箱資料")
+    fp.add_argument("--rows", type=int, default=10000)
+    fp.add_argument("--user-id", default=None)
+    fp.add_argument("--db", default="sqlite", help="sqlite（暫存檔）或 Postgres 連線字串")
+    fp.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    if args.kind == "recipes":
+        write_recipes_json(args.out, args.count, args.seed)
+        print(f"已寫出 {args.count} 筆食譜到 {args.out}")
+        return
+
+    sys.path.insert(0, BENCH_DIR)
+    import tempfile
+    from bench_pipeline import BENCH_USER_ID, prepare_sqlite, setup_database
+
+    url = setup_database(args.db, tempfile.mkdtemp(prefix="menufest-synth-"))
+    from db import SessionLocal, engine
+    if url.startswith("sqlite"):
+        prepare_sqlite(engine)
+    user_id = args.user_id or BENCH_USER_ID
+    seed_synthetic_fridge(SessionLocal, user_id, args.rows, args.seed)
+    print(f"已寫入 {args.rows} 筆冰箱食材: user_id={user_id} db={url.split('@')[-1]}")
+
+
+if __name__ == "__main__":
+    main()
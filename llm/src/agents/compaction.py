@@ -0,0 +1,224 @@
+# llm/src/agents/compaction.py
+"""
+Agent 中間步驟精簡
+工具結果（食譜 JSON、分頁的冰箱清單）與模型傳給工具的長參數會留在 AgentExecutor 的 scratchpad /
+LangGraph 的訊息串中，之後每次 LLM 呼叫都重送一次。中間步驟超過 token 上限時，由舊到新精簡較早的回合：
+1) summary：食譜只留 url / recipe_id、名稱、時間、步驟數、食材名稱與排序欄位，冰箱食材去掉 ingredient_id
+2) elided：只留 url / recipe_id 與名稱（冰箱食材只留名稱）
+最近 SCRATCHPAD_KEEP_RECENT 個回合（一次模型回應與它的工具結果）維持原樣；原始狀態不會被修改，只影響送給模型的內容
+"""
+from __future__ import annotations
+
+import json
+import os
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from agents.prompts import compact_json, count_tokens
+from metrics import SCRATCHPAD_COMPACTIONS, SCRATCHPAD_TOKENS_SAVED
+from telemetry import get_logger
+
+logger = get_logger("compaction")
+
+DEFAULT_BUDGET = int(os.getenv("SCRATCHPAD_TOKEN_BUDGET", "4000"))
+DEFAULT_KEEP_RECENT = int(os.getenv("SCRATCHPAD_KEEP_RECENT", "1"))
+
+# 無法辨識結構的長文字只保留開頭
+_SUMMARY_CHARS = 400
+_ELIDED_CHARS = 80
+
+_SUMMARY_NOTE = "較早的工具結果已精簡（省略步驟內容與份量），需要完整內容請重新呼叫工具"
+_ELIDED_NOTE = "較早的工具結果已省略，只保留識別資訊，需要內容請重新呼叫工具"
+
+_RECIPE_KEYS = ("recipe_id", "url", "title", "cooking_time", "servings",
+                "score", "coverage", "missing_count", "missing_ingredients")
+_FRIDGE_KEYS = ("name", "quantity_available", "unit", "expiry_date")
+
+
+def compaction_enabled() -> bool:
+    """SCRATCHPAD_COMPACT（預設開啟）"""
+    return os.getenv("SCRATCHPAD_COMPACT", "1").lower() not in ("0", "false", "no")
+
+
+def _recipe_summary(recipe: Dict[str, Any]) -> Dict[str, Any]:
+    digest = {k: recipe[k] for k in _RECIPE_KEYS if recipe.get(k) not in (None, "", [])}
+    if isinstance(recipe.get("steps"), list):
+        digest["step_count"] = len(recipe["steps"])
+    names = [i.get("name") for i in recipe.get("ingredients") or [] if isinstance(i, dict) and i.get("name")]
+    if names:
+        digest["ingredients"] = names
+    return digest
+
+
+def _recipe_id(recipe: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: recipe[k] for k in ("recipe_id", "url", "title") if recipe.get(k) not in (None, "")}
+
+
+def _parse(text: str) -> Any:
+    stripped = text.lstrip()
+    if not stripped.startswith(("{", "[")):
+        return None
+    try:
+        return json.loads(text)
+    except ValueError:
+        return None
+
+
+def _rewrite(text: str, recipe: Callable[[Dict[str, Any]], Any], item: Callable[[Dict[str, Any]], Any],
+             note: str, chars: int) -> str:
+    data = _parse(text)
+    if isinstance(data, list) and data and all(isinstance(r, dict) for r in data):
+        data = {"recipes": data}
+    if isinstance(data, dict) and isinstance(data.get("recipes"), list):
+        rest = {k: v for k, v in data.items() if k not in ("recipes", "_compacted")}
+        return compact_json({"_compacted": note, **rest,
+                             "recipes": [recipe(r) for r in data["recipes"] if isinstance(r, dict)]})
+    if isinstance(data, dict) and isinstance(data.get("items"), list):
+        rest = {k: v for k, v in data.items() if k not in ("items", "_compacted")}
+        return compact_json({"_compacted": note, **rest,
+                             "items": [item(i) for i in data["items"] if isinstance(i, dict)]})
+    if len(text) <= chars:
+        return text
+    return f"{text[:chars]}…（{note}，共 {len(text)} 字）"
+
+
+@lru_cache(maxsize=1024)
+def summarize(text: str) -> str:
+    """第一級精簡：保留食譜識別與重點欄位、冰箱食材的名稱數量與到期日"""
+    return _rewrite(text, _recipe_summary, lambda i: {k: i[k] for k in _FRIDGE_KEYS if k in i},
+                    _SUMMARY_NOTE, _SUMMARY_CHARS)
+
+
+@lru_cache(maxsize=1024)
+def elide(text: str) -> str:
+    """第二級精簡：只保留食譜 url / recipe_id 與名稱、冰箱食材名稱"""
+    return _rewrite(text, _recipe_id, lambda i: i.get("name"), _ELIDED_NOTE, _ELIDED_CHARS)
+
+
+@lru_cache(maxsize=4096)
+def _tokens(text: str) -> int:
+    return count_tokens(text)[0]
+
+
+def _message_texts(message: Any) -> List[str]:
+    """AI 訊息取工具呼叫的字串參數，工具訊息取內容"""
+    if message.type != "ai":
+        return [_text(message.content)]
+    return [v for call in getattr(message, "tool_calls", None) or []
+            for v in (call.get("args") or {}).values() if isinstance(v, str)]
+
+
+def _rewrite_calls(message: Any, fn: Callable[[str], str]) -> Any:
+    calls = getattr(message, "tool_calls", None)
+    if not calls:
+        return message
+    new_calls = [{**call, "args": {k: fn(v) if isinstance(v, str) else v for k, v in (call.get("args") or {}).items()}}
+                 for call in calls]
+    if new_calls == calls:
+        return message
+    return message.model_copy(update={"tool_calls": new_calls})
+
+
+class ScratchpadCompactor:
+    """把中間步驟切成回合，超過 budget 時由舊到新精簡；最近 keep_recent 個回合不動"""
+
+    def __init__(self, agent: str, budget: Optional[int] = None, keep_recent: Optional[int] = None):
+        self.agent = agent
+        self.budget = DEFAULT_BUDGET if budget is None else budget
+        self.keep_recent = DEFAULT_KEEP_RECENT if keep_recent is None else keep_recent
+
+    def _levels(self, rounds: List[List[str]]) -> List[Optional[Callable[[str], str]]]:
+        """各回合的精簡方式（None 為原樣）：由舊到新先 summary，仍超過 budget 再 elided"""
+        sizes = [sum(_tokens(t) for t in texts) for texts in rounds]
+        levels: List[Optional[Callable[[str], str]]] = [None] * len(rounds)
+        before = total = sum(sizes)
+        old = max(len(rounds) - self.keep_recent, 0)
+        for fn in (summarize, elide):
+            for i in range(old):
+                if total <= self.budget:
+                    break
+                size = sum(_tokens(fn(t)) for t in rounds[i])
+                if size < sizes[i]:
+                    total -= sizes[i] - size
+                    sizes[i], levels[i] = size, fn
+        compacted = sum(1 for fn in levels if fn)
+        if compacted:
+            SCRATCHPAD_COMPACTIONS.labels(self.agent).inc(compacted)
+            SCRATCHPAD_TOKENS_SAVED.labels(self.agent).inc(before - total)
+            logger.debug("中間步驟精簡: agent=%s, 精簡 %d 個回合, %d → %d token",
+                         self.agent, compacted, before, total)
+        return levels
+
+    # ---------- LangGraph 訊息串 ----------
+
+    def messages(self, messages: Sequence[Any]) -> List[Any]:
+        """LangGraph state 的訊息串；第一則 AI 訊息之前的訊息（使用者需求）不動"""
+        rounds: List[List[int]] = []
+        for index, m in enumerate(messages):
+            if m.type == "ai":
+                rounds.append([index])
+            elif m.type == "tool" and rounds:
+                rounds[-1].append(index)
+
+        levels = self._levels([[t for i in r for t in _message_texts(messages[i])] for r in rounds])
+        out = list(messages)
+        for indexes, fn in zip(rounds, levels):
+            if fn is None:
+                continue
+            for i in indexes:
+                m = out[i]
+                if m.type == "ai":
+                    out[i] = _rewrite_calls(m, fn)
+                elif isinstance(m.content, str):
+                    out[i] = m.model_copy(update={"content": fn(m.content)})
+        return out
+
+    def state_modifier(self, system: str) -> Callable[[Dict[str, Any]], List[Any]]:
+        """create_react_agent 的 state_modifier：system 訊息 + 精簡後的訊息串"""
+        from langchain_core.messages import SystemMessage
+
+        system_message = SystemMessage(content=system)
+        return lambda state: [system_message, *self.messages(state["messages"])]
+
+    # ---------- AgentExecutor scratchpad ----------
+
+    def steps(self, steps: List[Tuple[Any, Any]]) -> List[Tuple[Any, Any]]:
+        """AgentExecutor 的 trim_intermediate_steps：同一則模型回應的工具呼叫屬於同一回合"""
+        rounds: List[List[int]] = []
+        last = None
+        for index, (action, _) in enumerate(steps):
+            log = getattr(action, "message_log", None)
+            key = id(log[0]) if log else None
+            if key is None or key != last:
+                rounds.append([])
+            rounds[-1].append(index)
+            last = key
+
+        levels = self._levels([
+            [t for m in getattr(steps[r[0]][0], "message_log", None) or [] for t in _message_texts(m)]
+            + [_text(steps[i][1]) for i in r]
+            for r in rounds])
+        if not any(levels):
+            return steps
+        out = list(steps)
+        for indexes, fn in zip(rounds, levels):
+            if fn is None:
+                continue
+            log = getattr(out[indexes[0]][0], "message_log", None)
+            # 同一回合的 action 共用同一份精簡後的 message_log，format_to_tool_messages 才會去重
+            new_log = [_rewrite_calls(m, fn) for m in log] if log else None
+            for i in indexes:
+                action, observation = out[i]
+                if new_log is not None:
+                    action = action.model_copy(update={"message_log": new_log})
+                out[i] = (action, fn(observation) if isinstance(observation, str) else observation)
+        return out
+
+
+def _text(content: Any) -> str:
+    return content if isinstance(content, str) else compact_json(content)
+
+
+def make_compactor(agent: str) -> Optional[ScratchpadCompactor]:
+    """SCRATCHPAD_COMPACT 開啟時建立 agent 共用的 ScratchpadCompactor，否則為 None"""
+    return ScratchpadCompactor(agent) if compaction_enabled() else None
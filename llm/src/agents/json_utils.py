@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+LLM 回應的 JSON 擷取與修復（Selector / Planner 共用）
+單次線性走訪、辨識字串與跳脫字元，可串流餵入
+"""
+
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from telemetry import get_logger
+from metrics import record_json_parse_failure
+
+logger = get_logger("json")
+
+# 物件外只需找開括號；物件內一次跳過一般字元與完整字串，停在括號或未閉合的引號；
+# 跨段的未閉合字串內只需停在引號與反斜線
+_OPEN_RE = re.compile(r'[{\[]')
+_SKIP_RE = re.compile(r'(?:[^{}\[\]"]+|"[^"\\]*(?:\\.[^"\\]*)*")*', re.DOTALL)
+_STRING_RE = re.compile(r'["\\]')
+_DANGLING_KEY_RE = re.compile(r'([{,])\s*"[^"\\]*(?:\\.[^"\\]*)*"\s*:?\s*$')
+_CLOSERS = {"{": "}", "[": "]"}
+# 擷取失敗時從下一個 { 重新掃描的次數上限，避免全是雜散括號的回應退化成平方時間
+_MAX_RESCANS = 32
+# 字串（群組 1）原樣保留；尾逗號只留下後面的括號（群組 2）；字串外的控制字元刪除
+_REPAIR_RE = re.compile(
+    r'("[^"\\]*(?:\\.[^"\\]*)*")|,(\s*[}\]])|[\x00-\x08\x0b\x0c\x0e-\x1f]',
+    re.DOTALL,
+)
+
+
+class JSONScanner:
+    """串流 JSON 掃描器
+
+    feed() 逐段餵入文字，掃描器記錄最外層（不被其他已閉合物件包含）的 {...} 區段，
+    以及目前仍未閉合的括號堆疊，供擷取與截斷修復使用。
+    """
+
+    def __init__(self):
+        self._chunks: List[str] = []
+        self._length = 0           # 已掃描的總長度（絕對位置基準）
+        self._stack: List[Tuple[str, int]] = []  # (開括號, 絕對位置)
+        self._in_string = False
+        self._escape = False
+        self.spans: List[Tuple[int, int]] = []   # 已閉合的最外層物件 [start, end)
+        self.mismatches = 0        # 括號不成對的次數
+
+    @property
+    def text(self) -> str:
+        if len(self._chunks) > 1:
+            self._chunks = ["".join(self._chunks)]
+        return self._chunks[0] if self._chunks else ""
+
+    @property
+    def depth(self) -> int:
+        return len(self._stack)
+
+    @property
+    def in_string(self) -> bool:
+        return self._in_string
+
+    def feed(self, chunk: str) -> "JSONScanner":
+        base, pos, end = self._length, 0, len(chunk)
+        stack = self._stack
+        while pos < end:
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                    pos += 1
+                    continue
+                m = _STRING_RE.search(chunk, pos)
+                if m is None:
+                    break
+                pos = m.end()
+                if m.group() == "\\":
+                    self._escape = True
+                else:
+                    self._in_string = False
+                continue
+
+            if stack:
+                pos = _SKIP_RE.match(chunk, pos).end()
+                if pos >= end:
+                    break
+            else:
+                # 括號外的引號屬於一般文字，不視為字串
+                m = _OPEN_RE.search(chunk, pos)
+                if m is None:
+                    break
+                pos = m.start()
+            ch = chunk[pos]
+            pos += 1
+            if ch == '"':
+                # 未閉合的引號：字串延續到下一段
+                self._in_string = True
+            elif ch in "{[":
+                stack.append((ch, base + pos - 1))
+            elif stack:
+                opener = "{" if ch == "}" else "["
+                if stack[-1][0] != opener:
+                    self.mismatches += 1
+                    # 往下找對應的開括號，找不到就忽略這個閉括號
+                    while stack and stack[-1][0] != opener:
+                        stack.pop()
+                    if not stack:
+                        continue
+                _, start = stack.pop()
+                if opener == "{":
+                    self._close_span(start, base + pos)
+        self._chunks.append(chunk)
+        self._length += end
+        return self
+
+    def _close_span(self, start: int, end: int) -> None:
+        # 被新區段包住的舊區段都在串列尾端，攤提後仍為線性
+        spans = self.spans
+        while spans and spans[-1][0] >= start:
+            spans.pop()
+        spans.append((start, end))
+
+    def candidates(self) -> List[str]:
+        """已閉合的最外層物件，由長到短"""
+        text = self.text
+        spans = sorted(self.spans, key=lambda s: s[1] - s[0], reverse=True)
+        return [text[s:e] for s, e in spans]
+
+    def truncated_start(self) -> Optional[int]:
+        """最外層未閉合物件的起點；沒有未閉合的物件時為 None"""
+        return next((i for ch, i in self._stack if ch == "{"), None)
+
+    def truncated_tail(self) -> Optional[str]:
+        """回應被截斷時，補上缺少的引號與閉括號後的最外層未閉合物件"""
+        outer = self.truncated_start()
+        if outer is None:
+            return None
+        tail = self.text[outer:]
+        if self._in_string:
+            tail += '"'
+        if self._stack[-1][0] == "{":
+            # 物件內最後一個 key 沒有值時整個丟掉
+            tail = _DANGLING_KEY_RE.sub(r"\1", tail)
+        tail = re.sub(r"[,:\s]+$", "", tail)
+        closers = "".join(_CLOSERS[ch] for ch, i in reversed(self._stack) if i >= outer)
+        return tail + closers
+
+
+def _strip_fence(text: str) -> str:
+    """去除整段外層的 markdown 圍欄"""
+    s = text.strip()
+    if s.startswith("```"):
+        s = s[3:]
+        if s[:4].lower() == "json":
+            s = s[4:]
+    if s.endswith("```"):
+        s = s[:-3]
+    return s.strip()
+
+
+def repair_json(text: str) -> str:
+    """修復常見 JSON 格式問題，不改動字串內容
+
+    去除 markdown 圍欄與 BOM、移除尾逗號與字串外的控制字元（NaN/Infinity 於解析時轉為 null）
+    """
+    s = _strip_fence(text.replace("\ufeff", ""))
+    return _REPAIR_RE.sub(r"\1\2", s)
+
+
+def _loads(text: str) -> Optional[Any]:
+    try:
+        # NaN / Infinity 一律視為 null
+        return json.loads(text, strict=False, parse_constant=lambda _: None)
+    except (ValueError, RecursionError):
+        # 巢狀過深（例如數千層括號）時 json 模組會遞迴到上限，視同無法解析
+        return None
+
+
+def _candidates(scanner: JSONScanner) -> List[Tuple[int, str, bool]]:
+    """(起點, 文字, 是否為截斷補齊) 的候選物件：最外層物件由長到短，截斷補齊的物件比它們長時放最前面"""
+    text = scanner.text
+    spans = sorted(scanner.spans, key=lambda s: s[1] - s[0], reverse=True)
+    found = [(s, text[s:e], False) for s, e in spans]
+    # 截斷補齊的物件包含其內所有已閉合的區段，比它們長時優先嘗試
+    tail = scanner.truncated_tail()
+    if tail and (not found or len(tail) > len(found[0][1])):
+        found.insert(0, (scanner.truncated_start(), tail, True))
+    return found
+
+
+def _parse_candidate(candidate: str, truncated: bool) -> Optional[Dict[str, Any]]:
+    result = _loads(candidate)
+    if result is None:
+        result = _loads(repair_json(candidate))
+    if not isinstance(result, dict):
+        return None
+    if truncated:
+        logger.warning("回應疑似被截斷，已補齊括號後解析")
+    return result
+
+
+def _misaligned(scanner: JSONScanner, before: int) -> Optional[int]:
+    """候選物件之前第一個含引號卻無法解析的最外層物件起點
+
+    這類區段多半起於前言裡落單的 { 與引號，之後的字串邊界全部錯位，後面「剛好解析得了」的物件不可信；
+    不含引號的區段（例如前言裡的 {食材分組}）不影響字串邊界，不必解析
+    """
+    text = scanner.text
+    for start, end in scanner.spans:
+        if start >= before:
+            break
+        if '"' in text[start:end] and _parse_candidate(text[start:end], False) is None:
+            return start
+    return None
+
+
+def extract_json(response: str) -> Optional[Dict[str, Any]]:
+    """從 LLM 回應中擷取 JSON 物件
+
+    依序嘗試：整段直接解析 → 最長的候選物件（原文、修復後）。最長的候選解析失敗、或它之前有錯位的區段時，
+    從失敗起點之後的下一個 { 重新掃描，最多 _MAX_RESCANS 次；仍失敗才退回第一次掃描的其餘候選。
+    一般情況只掃描一次
+    """
+    if not response:
+        return None
+
+    result = _loads(_strip_fence(response))
+    if isinstance(result, dict):
+        return result
+
+    offset, rest = 0, None
+    for _ in range(_MAX_RESCANS + 1):
+        scanner = JSONScanner().feed(response[offset:] if offset else response)
+        found = _candidates(scanner)
+        if not found:
+            break
+        start, candidate, truncated = found[0]
+        failed = _misaligned(scanner, start)
+        if failed is None:
+            result = _parse_candidate(candidate, truncated)
+            if result is not None:
+                return result
+            failed = start
+        if rest is None:
+            rest = found
+        offset = response.find("{", offset + failed + 1)
+        if offset < 0:
+            break
+    for _, candidate, truncated in rest or []:
+        result = _parse_candidate(candidate, truncated)
+        if result is not None:
+            return result
+
+    logger.warning("無法從回應中提取有效的 JSON (%d chars)", len(response))
+    record_json_parse_failure()
+    return None
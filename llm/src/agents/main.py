@@ -4,12 +4,10 @@ Menufest Agents 整合主程序
 負責調用 Selector Agent 和 Planner Agent，並處理數據流
 """
 
-import json
 import os
 import sys
 from datetime import datetime
 from typing import Dict, List, Any, Optional
-from pathlib import Path
 
 # 添加路徑以便導入模組
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -17,184 +15,97 @@ src_dir = os.path.dirname(current_dir)
 sys.path.insert(0, src_dir)
 
 from agents.selector.agent_react import IngredientSelectorReactAgent, SelectorConstraints, SelectorOutput
-from agents.planner.agent import PlannerAgent
+from agents.planner.agent import PlannerAgent, PlannerRequest, IngredientGroup
+from agents.pipeline import PipelineIR
+from agents.registry import get_planner, get_selector
+from agents.selector.tools import fridge_version
+from artifacts import ArtifactStore, get_artifact_store, new_run_id
+from telemetry import current_span, get_logger
+from coalesce import SingleFlight, request_key
+from metrics import PIPELINES_COALESCED, PIPELINES_IN_FLIGHT
+from usage import TokenBudgetExceeded, current_usage, usage_scope
+
+logger = get_logger("orchestrator")
+
+# 整個 process 共用：同一使用者、同一冰箱版本的相同請求同時只跑一條流程
+_pipeline_flights = SingleFlight()
+
+
+def _normalize_names(values: Optional[List[str]]) -> List[str]:
+    return sorted({v.strip() for v in values or [] if v and v.strip()})
+
+
+def _budget_exceeded() -> bool:
+    """目前 usage_scope 的 token 預算是否已用盡"""
+    usage = current_usage()
+    return bool(usage and usage.exceeded)
 
 
 class MenufestOrchestrator:
     """Menufest Agents 協調器"""
     
-    def __init__(self, data_dir: str = "data"):
-        self.data_dir = Path(data_dir)
-        self.data_dir.mkdir(exist_ok=True)
+    def __init__(self,
+                 store: Optional[ArtifactStore] = None,
+                 selector_agent: Optional[IngredientSelectorReactAgent] = None,
+                 planner_agent: Optional[PlannerAgent] = None):
+        # run artifact 依 run_id 保存，後端由 ARTIFACT_BACKEND 決定
+        self.store = store or get_artifact_store()
         
-        # 初始化 Agents
-        self.selector_agent = IngredientSelectorReactAgent()
-        self.planner_agent = PlannerAgent()
+        # 預設取 registry 的共用實例（與 server 端點同一份）；可注入，供基準測試替換模型
+        self.selector_agent = selector_agent or get_selector()
+        self.planner_agent = planner_agent or get_planner()
         
-        print("✅ Menufest Orchestrator 初始化完成")
+        logger.info("Menufest Orchestrator 初始化完成")
     
-    def save_selector_output(self, output: SelectorOutput, filename: str = None) -> str:
-        """保存 Selector Agent 輸出到本地 JSON"""
-        if filename is None:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"selector_output_{timestamp}.json"
-        
-        filepath = self.data_dir / filename
-        
-        # 轉換為字典格式 - 使用新的 schema
-        output_dict = {
-            "total_days": output.total_days,
-            "total_people": output.total_people,
-            "start_date": output.start_date,
-            "daily_meals": [
-                {
-                    "date": day_meal.date,
-                    "breakfast": [
-                        {
-                            "dish_name": dish.dish_name,
-                            "ingredients": [
-                                {
-                                    "name": ing.name,
-                                    "allocated_quantity": ing.allocated_quantity
-                                }
-                                for ing in dish.ingredients
-                            ]
-                        }
-                        for dish in day_meal.breakfast
-                    ],
-                    "lunch": [
-                        {
-                            "dish_name": dish.dish_name,
-                            "ingredients": [
-                                {
-                                    "name": ing.name,
-                                    "allocated_quantity": ing.allocated_quantity
-                                }
-                                for ing in dish.ingredients
-                            ]
-                        }
-                        for dish in day_meal.lunch
-                    ],
-                    "dinner": [
-                        {
-                            "dish_name": dish.dish_name,
-                            "ingredients": [
-                                {
-                                    "name": ing.name,
-                                    "allocated_quantity": ing.allocated_quantity
-                                }
-                                for ing in dish.ingredients
-                            ]
-                        }
-                        for dish in day_meal.dinner
-                    ]
-                }
-                for day_meal in output.daily_meals
-            ],
-            "generated_at": datetime.now().isoformat()
-        }
-        
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(output_dict, f, ensure_ascii=False, indent=2)
-        
-        print(f"📁 Selector 輸出已保存到: {filepath}")
-        return str(filepath)
+    def save_selector_output(self, ir: PipelineIR, run_id: str) -> str:
+        """保存 Selector Agent 輸出到 Artifact Store"""
+        payload = {**ir.selector_payload(), "generated_at": datetime.now().isoformat()}
+        self.store.put(run_id, "selector", payload)
+        logger.debug("Selector 輸出已保存: run_id=%s", run_id)
+        return run_id
     
-    def load_selector_output(self, filepath: str) -> Dict[str, Any]:
-        """從本地 JSON 讀取 Selector Agent 輸出"""
-        with open(filepath, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+    def load_selector_output(self, run_id: str) -> Dict[str, Any]:
+        """依 run_id 從 Artifact Store 讀取 Selector Agent 輸出"""
+        data = self.store.get(run_id, "selector")
+        if data is None:
+            raise KeyError(f"找不到 run_id={run_id} 的 Selector 輸出")
         
-        print(f"📖 已讀取 Selector 輸出: {filepath}")
+        logger.debug("已讀取 Selector 輸出: run_id=%s", run_id)
         return data
     
-    def convert_selector_to_planner_format(self, selector_output: SelectorOutput) -> List[Dict[str, Any]]:
-        """將 Selector 輸出轉換為 Planner 需要的格式"""
-        ingredient_groups = []
-        
-        # 按天數和餐點順序處理
-        for day_idx, day_meal in enumerate(selector_output.daily_meals):
-            print(f"📅 處理第 {day_idx + 1} 天 ({day_meal.date})")
-            
-            # 處理早餐
-            if day_meal.breakfast:
-                print(f"  🌅 早餐: {len(day_meal.breakfast)} 個菜色")
-                for dish_idx, dish in enumerate(day_meal.breakfast):
-                    if dish.ingredients:
-                        main_ingredient = dish.ingredients[0].name
-                        supporting_ingredients = [ing.name for ing in dish.ingredients[1:]]
-                        ingredient_groups.append({
-                            "main_ingredient": main_ingredient,
-                            "supporting_ingredients": supporting_ingredients,
-                            "total_amount": f"{selector_output.total_people}人份",
-                            "day": day_idx + 1,
-                            "meal": "早餐",
-                            "dish_name": dish.dish_name
-                        })
-                        print(f"    - {dish.dish_name}: {main_ingredient} + {supporting_ingredients}")
-            
-            # 處理午餐
-            if day_meal.lunch:
-                print(f"  🌞 午餐: {len(day_meal.lunch)} 個菜色")
-                for dish_idx, dish in enumerate(day_meal.lunch):
-                    if dish.ingredients:
-                        main_ingredient = dish.ingredients[0].name
-                        supporting_ingredients = [ing.name for ing in dish.ingredients[1:]]
-                        ingredient_groups.append({
-                            "main_ingredient": main_ingredient,
-                            "supporting_ingredients": supporting_ingredients,
-                            "total_amount": f"{selector_output.total_people}人份",
-                            "day": day_idx + 1,
-                            "meal": "午餐",
-                            "dish_name": dish.dish_name
-                        })
-                        print(f"    - {dish.dish_name}: {main_ingredient} + {supporting_ingredients}")
-            
-            # 處理晚餐
-            if day_meal.dinner:
-                print(f"  🌙 晚餐: {len(day_meal.dinner)} 個菜色")
-                for dish_idx, dish in enumerate(day_meal.dinner):
-                    if dish.ingredients:
-                        main_ingredient = dish.ingredients[0].name
-                        supporting_ingredients = [ing.name for ing in dish.ingredients[1:]]
-                        ingredient_groups.append({
-                            "main_ingredient": main_ingredient,
-                            "supporting_ingredients": supporting_ingredients,
-                            "total_amount": f"{selector_output.total_people}人份",
-                            "day": day_idx + 1,
-                            "meal": "晚餐",
-                            "dish_name": dish.dish_name
-                        })
-                        print(f"    - {dish.dish_name}: {main_ingredient} + {supporting_ingredients}")
-        
-        print(f"🔄 總共轉換了 {len(ingredient_groups)} 個食材分組")
-        return ingredient_groups
+    def convert_selector_to_planner_format(self, selector_output: SelectorOutput) -> List[IngredientGroup]:
+        """將 Selector 輸出轉換為 Planner 需要的食材分組（保留 day / meal / dish_name）"""
+        return PipelineIR.from_selector(selector_output).ingredient_groups
     
-    def save_planner_output(self, output: Dict[str, Any], filename: str = None) -> str:
-        """保存 Planner Agent 輸出到本地 JSON"""
-        if filename is None:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"planner_output_{timestamp}.json"
-        
-        filepath = self.data_dir / filename
-        
-        # 調試信息
-        print(f"🔍 save_planner_output 接收到的 output 類型: {type(output)}")
-        print(f"🔍 output 內容: {output}")
-        
-        # 創建可修改的副本並添加生成時間戳
-        try:
-            output_copy = dict(output) if output else {}
-            output_copy["generated_at"] = datetime.now().isoformat()
-        except Exception as e:
-            print(f"❌ 創建 output_copy 失敗: {e}")
-            output_copy = {"error": str(e), "generated_at": datetime.now().isoformat()}
-        
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(output_copy, f, ensure_ascii=False, indent=2)
-        
-        print(f"📁 Planner 輸出已保存到: {filepath}")
-        return str(filepath)
+    def save_planner_output(self, output: Dict[str, Any], run_id: str) -> str:
+        """保存 Planner Agent 輸出到 Artifact Store"""
+        payload = {**(output or {}), "generated_at": datetime.now().isoformat()}
+        self.store.put(run_id, "planner", payload)
+        logger.debug("Planner 輸出已保存: run_id=%s", run_id)
+        return run_id
+    
+    def _run_planner(self,
+                     ir: PipelineIR,
+                     people: int,
+                     days: int,
+                     meals: List[str],
+                     planner_preferences: List[str] = None,
+                     max_cooking_time: int = 30,
+                     max_steps: int = 5,
+                     start_date: str = None) -> Dict[str, Any]:
+        """以 IR 的食材分組調用 Planner Agent，回傳序列化後的結果"""
+        planner_request = PlannerRequest(
+            ingredient_groups=ir.ingredient_groups,
+            people=people,
+            days=days,
+            meals=meals,
+            max_cooking_time=max_cooking_time,
+            max_steps=max_steps,
+            preferences=planner_preferences or ["家常菜"],
+            start_date=start_date or datetime.now().strftime("%Y-%m-%d")
+        )
+        planner_output = self.planner_agent.plan_menu_with_params(planner_request)
+        return planner_output.model_dump()
     
     def run_full_pipeline(self, 
                          user_id: str,
@@ -205,14 +116,99 @@ class MenufestOrchestrator:
                          planner_preferences: List[str] = None,
                          max_cooking_time: int = 30,
                          max_steps: int = 5,
-                         start_date: str = None) -> Dict[str, Any]:
-        """運行完整的 Menufest 流程"""
-        
-        print("🚀 開始 Menufest 完整流程")
-        print(f"📋 參數: {people}人, {days}天, 餐點: {meals}")
+                         start_date: str = None,
+                         token_budget: Optional[int] = None,
+                         run_id: Optional[str] = None,
+                         selector_mode: Optional[str] = None) -> Dict[str, Any]:
+        """運行完整的 Menufest 流程
+
+        token_budget 為本次請求的 token 上限（未指定時用 TOKEN_BUDGET_PER_REQUEST），
+        另受使用者滾動額度限制；結果附上 usage 用量統計。
+        正規化後相同且冰箱版本相同的請求若已在執行（重複點擊、gateway 重試），直接等待並共用該次結果，
+        不另外呼叫 LLM 也不重複計入 token 額度；共用的結果帶 coalesced=True。
+        run_id 可由呼叫端指定（背景工作以 job_id 作為 run_id），未指定時自動產生；
+        selector_mode 為 llm / hybrid / solver（見 IngredientSelectorReactAgent），未指定時用 SELECTOR_MODE
+        """
+        def run() -> Dict[str, Any]:
+            return self._run_full_pipeline_tracked(
+                user_id, people, days, meals, constraints,
+                planner_preferences, max_cooking_time, max_steps, start_date, token_budget, run_id,
+                selector_mode
+            )
+
+        try:
+            key = request_key(
+                "full_pipeline", user_id, fridge_version(user_id), people, days,
+                _normalize_names(meals),
+                _normalize_names(constraints.allergies), _normalize_names(constraints.exclude_ingredients),
+                _normalize_names(planner_preferences), max_cooking_time, max_steps,
+                start_date or datetime.now().strftime("%Y-%m-%d"), token_budget,
+                selector_mode or self.selector_agent.mode
+            )
+        except Exception as e:
+            # 取不到冰箱版本時無法判斷是否相同，直接執行
+            logger.warning("無法計算請求合併 key，略過合併: %s", e)
+            return run()
+
+        result, coalesced = _pipeline_flights.do(key, run)
+        if coalesced:
+            PIPELINES_COALESCED.inc()
+            logger.info("併入執行中的相同流程: user_id=%s, run_id=%s", user_id, result.get("run_id"))
+            return {**result, "coalesced": True}
+        return result
+
+    def _run_full_pipeline_tracked(self,
+                                   user_id: str,
+                                   people: int,
+                                   days: int,
+                                   meals: List[str],
+                                   constraints: SelectorConstraints,
+                                   planner_preferences: List[str] = None,
+                                   max_cooking_time: int = 30,
+                                   max_steps: int = 5,
+                                   start_date: str = None,
+                                   token_budget: Optional[int] = None,
+                                   run_id: Optional[str] = None,
+                                   selector_mode: Optional[str] = None) -> Dict[str, Any]:
+        with PIPELINES_IN_FLIGHT.track_inprogress():
+            try:
+                with usage_scope(user_id, token_budget) as usage:
+                    result = self._run_full_pipeline(
+                        user_id, people, days, meals, constraints,
+                        planner_preferences, max_cooking_time, max_steps, start_date, run_id, selector_mode
+                    )
+            except TokenBudgetExceeded as e:
+                logger.warning("使用者 token 額度已用盡: user_id=%s, %s", user_id, e)
+                return {
+                    "success": False,
+                    "error": str(e),
+                    "run_id": None,
+                    "selector_output": None,
+                    "planner_output": None,
+                    "usage": None
+                }
+            result["usage"] = usage.to_dict()
+            return result
+    
+    def _run_full_pipeline(self,
+                           user_id: str,
+                           people: int,
+                           days: int,
+                           meals: List[str],
+                           constraints: SelectorConstraints,
+                           planner_preferences: List[str] = None,
+                           max_cooking_time: int = 30,
+                           max_steps: int = 5,
+                           start_date: str = None,
+                           run_id: Optional[str] = None,
+                           selector_mode: Optional[str] = None) -> Dict[str, Any]:
+        run_id = run_id or new_run_id()
+        logger.info("開始 Menufest 完整流程: run_id=%s, %d人, %d天, 餐點: %s", run_id, people, days, meals)
+        current = current_span()
+        if current is not None:
+            current.set(run_id=run_id)
         
         # Step 1: 調用 Selector Agent
-        print("\n=== Step 1: 食材選擇 ===")
         try:
             selector_output = self.selector_agent.run(
                 user_id=user_id,
@@ -220,148 +216,129 @@ class MenufestOrchestrator:
                 days=days,
                 meals=meals,
                 c=constraints,
-                start_date=start_date
+                start_date=start_date,
+                mode=selector_mode
             )
+            ir = PipelineIR.from_selector(selector_output)
             
             # 保存 Selector 輸出
-            selector_file = self.save_selector_output(selector_output)
+            self.save_selector_output(ir, run_id)
             
-            if not selector_output.daily_meals:
+            if ir.is_empty():
+                budget_exceeded = _budget_exceeded()
                 return {
                     "success": False,
-                    "error": "Selector Agent 無法找到足夠的食材",
-                    "selector_output": selector_output.dict(),
-                    "planner_output": None
+                    "error": "token 預算用盡，Selector Agent 未完成食材分配" if budget_exceeded
+                    else "Selector Agent 無法找到足夠的食材",
+                    "run_id": run_id,
+                    "selector_output": ir.selector_payload(),
+                    "planner_output": None,
+                    "budget_exceeded": budget_exceeded
                 }
             
         except Exception as e:
+            logger.exception("Selector Agent 執行失敗")
             return {
                 "success": False,
                 "error": f"Selector Agent 執行失敗: {str(e)}",
+                "run_id": run_id,
                 "selector_output": None,
                 "planner_output": None
             }
         
-        # Step 2: 轉換格式並調用 Planner Agent
-        print("\n=== Step 2: 菜單規劃 ===")
+        # Step 2: 以 IR 調用 Planner Agent
         try:
-            # 轉換 Selector 輸出為 Planner 格式
-            ingredient_groups = self.convert_selector_to_planner_format(selector_output)
-            
-            print(f"🔄 轉換後的食材分組: {len(ingredient_groups)} 組")
-            for i, group in enumerate(ingredient_groups):
-                print(f"  組 {i+1}: {group['main_ingredient']} + {group['supporting_ingredients']}")
-            
-            # 調用 Planner Agent - 使用新的 IO Schema
-            from agents.planner.agent import PlannerRequest, IngredientGroup
-            ingredient_group_objects = [IngredientGroup(**group) for group in ingredient_groups]
-            planner_request = PlannerRequest(
-                ingredient_groups=ingredient_group_objects,
+            logger.info("食材分組: %d 組", len(ir.ingredient_groups))
+            planner_data = self._run_planner(
+                ir,
                 people=people,
                 days=days,
                 meals=meals,
+                planner_preferences=planner_preferences,
                 max_cooking_time=max_cooking_time,
                 max_steps=max_steps,
-                preferences=planner_preferences or ["家常菜"],
-                start_date=start_date or datetime.now().strftime("%Y-%m-%d")
+                start_date=start_date
             )
-            planner_output = self.planner_agent.plan_menu_with_params(planner_request)
-            
-            # 調試信息
-            print(f"🔍 planner_output 類型: {type(planner_output)}")
-            print(f"🔍 planner_output 內容: {planner_output}")
-            
-            # 保存 Planner 輸出
-            if planner_output and hasattr(planner_output, 'model_dump'):
-                planner_data = planner_output.model_dump()
-                print(f"✅ 使用 model_dump() 轉換成功")
-            elif planner_output and hasattr(planner_output, 'dict'):
-                planner_data = planner_output.dict()
-                print(f"✅ 使用 dict() 轉換成功")
-            else:
-                planner_data = {}
-                print(f"❌ 無法轉換 planner_output，使用空字典")
-            
-            print(f"🔍 planner_data 類型: {type(planner_data)}")
-            planner_file = self.save_planner_output(planner_data)
+            self.save_planner_output(planner_data, run_id)
             
             return {
                 "success": True,
-                "selector_file": selector_file,
-                "planner_file": planner_file,
-                "selector_output": selector_output.dict(),
-                "planner_output": planner_data
+                "run_id": run_id,
+                "selector_output": ir.selector_payload(),
+                "planner_output": planner_data,
+                "budget_exceeded": _budget_exceeded()
             }
             
         except Exception as e:
+            logger.exception("Planner Agent 執行失敗")
             return {
                 "success": False,
                 "error": f"Planner Agent 執行失敗: {str(e)}",
-                "selector_output": selector_output.dict(),
+                "run_id": run_id,
+                "selector_output": ir.selector_payload(),
                 "planner_output": None
             }
     
-    def run_from_selector_file(self,
-                              selector_file: str,
+    def run_from_selector_run(self,
+                              run_id: str,
                               people: int,
                               days: int,
                               meals: List[str],
                               planner_preferences: List[str] = None,
                               max_cooking_time: int = 30,
                               max_steps: int = 5,
-                              start_date: str = None) -> Dict[str, Any]:
-        """從現有的 Selector 文件開始運行 Planner"""
-        
-        print(f"🔄 從 Selector 文件開始: {selector_file}")
+                              start_date: str = None,
+                              token_budget: Optional[int] = None) -> Dict[str, Any]:
+        """從既有 run 的 Selector 輸出開始運行 Planner，結果存回同一個 run_id"""
         
+        logger.info("從 Selector 輸出開始: run_id=%s", run_id)
+        with usage_scope(budget=token_budget) as usage:
+            result = self._run_from_selector_run(
+                run_id, people, days, meals,
+                planner_preferences, max_cooking_time, max_steps, start_date
+            )
+        result["usage"] = usage.to_dict()
+        return result
+
+    def _run_from_selector_run(self,
+                               run_id: str,
+                               people: int,
+                               days: int,
+                               meals: List[str],
+                               planner_preferences: List[str] = None,
+                               max_cooking_time: int = 30,
+                               max_steps: int = 5,
+                               start_date: str = None) -> Dict[str, Any]:
         try:
-            # 讀取 Selector 輸出
-            selector_data = self.load_selector_output(selector_file)
-            
-            # 轉換為 SelectorOutput 對象
-            from agents.selector.agent_react import SelectorOutput
-            selector_output = SelectorOutput(**selector_data)
+            # 讀取 Selector 輸出並建立 IR
+            selector_data = self.load_selector_output(run_id)
+            ir = PipelineIR.from_payload(selector_data)
             
-            # 轉換格式
-            ingredient_groups = self.convert_selector_to_planner_format(selector_output)
-            
-            # 調用 Planner Agent - 使用新的 IO Schema
-            from agents.planner.agent import PlannerRequest, IngredientGroup
-            ingredient_group_objects = [IngredientGroup(**group) for group in ingredient_groups]
-            planner_request = PlannerRequest(
-                ingredient_groups=ingredient_group_objects,
+            planner_data = self._run_planner(
+                ir,
                 people=people,
                 days=days,
                 meals=meals,
+                planner_preferences=planner_preferences,
                 max_cooking_time=max_cooking_time,
                 max_steps=max_steps,
-                preferences=planner_preferences or ["家常菜"],
-                start_date=start_date or datetime.now().strftime("%Y-%m-%d")
+                start_date=start_date
             )
-            planner_output = self.planner_agent.plan_menu_with_params(planner_request)
-            
-            # 保存 Planner 輸出
-            if planner_output and hasattr(planner_output, 'model_dump'):
-                planner_data = planner_output.model_dump()
-            elif planner_output and hasattr(planner_output, 'dict'):
-                planner_data = planner_output.dict()
-            else:
-                planner_data = {}
-            planner_file = self.save_planner_output(planner_data)
+            self.save_planner_output(planner_data, run_id)
             
             return {
                 "success": True,
-                "selector_file": selector_file,
-                "planner_file": planner_file,
+                "run_id": run_id,
                 "selector_data": selector_data,
                 "planner_output": planner_data
             }
             
         except Exception as e:
+            logger.exception("從 Selector 輸出運行失敗")
             return {
                 "success": False,
-                "error": f"從 Selector 文件運行失敗: {str(e)}",
-                "selector_file": selector_file,
+                "error": f"從 Selector 輸出運行失敗: {str(e)}",
+                "run_id": run_id,
                 "planner_output": None
             }
 
@@ -405,8 +382,7 @@ def main():
     print(f"\n🎯 執行結果:")
     if result["success"]:
         print("✅ 成功完成完整流程")
-        print(f"📁 Selector 文件: {result['selector_file']}")
-        print(f"📁 Planner 文件: {result['planner_file']}")
+        print(f"📁 run_id: {result['run_id']}")
         
         # 顯示菜單摘要
         if result["planner_output"] and result["planner_output"].get("success"):
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Pipeline IR - Selector / Orchestrator / Planner 之間共用的中介表示
+以 (day, meal) 槽位定址，Selector 輸出只轉換一次，序列化結果快取重用
+"""
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from agents.selector.agent_react import SelectorOutput
+from agents.planner.agent import IngredientGroup
+
+# DayMeal 欄位與餐點中文名稱的對應，順序即為輸出順序
+MEAL_FIELDS: Tuple[Tuple[str, str], ...] = (
+    ("breakfast", "早餐"),
+    ("lunch", "午餐"),
+    ("dinner", "晚餐"),
+)
+
+SlotKey = Tuple[int, str]  # (第幾天, 餐點中文名稱)
+
+
+@dataclass
+class PipelineIR:
+    """單次流程的中介表示"""
+    selector: SelectorOutput
+    slots: Dict[SlotKey, List[IngredientGroup]] = field(default_factory=dict)
+    _selector_payload: Optional[Dict[str, Any]] = field(default=None, repr=False)
+
+    @classmethod
+    def from_selector(cls, output: SelectorOutput) -> "PipelineIR":
+        """從 SelectorOutput 建立 IR，一次走訪建好所有槽位"""
+        total_amount = f"{output.total_people}人份"
+        slots: Dict[SlotKey, List[IngredientGroup]] = {}
+        for day_idx, day_meal in enumerate(output.daily_meals, start=1):
+            for field_name, meal_name in MEAL_FIELDS:
+                groups = []
+                for dish in getattr(day_meal, field_name):
+                    if not dish.ingredients:
+                        continue
+                    # 來源已通過 SelectorOutput 驗證，不需再驗證一次
+                    groups.append(IngredientGroup.model_construct(
+                        main_ingredient=dish.ingredients[0].name,
+                        supporting_ingredients=[ing.name for ing in dish.ingredients[1:]],
+                        total_amount=total_amount,
+                        day=day_idx,
+                        meal=meal_name,
+                        dish_name=dish.dish_name,
+                    ))
+                if groups:
+                    slots[(day_idx, meal_name)] = groups
+        return cls(selector=output, slots=slots)
+
+    @classmethod
+    def from_payload(cls, payload: Dict[str, Any]) -> "PipelineIR":
+        """從已保存的 Selector artifact 建立 IR"""
+        ir = cls.from_selector(SelectorOutput.model_validate(payload))
+        ir._selector_payload = payload
+        return ir
+
+    @property
+    def ingredient_groups(self) -> List[IngredientGroup]:
+        """依 (day, meal) 順序攤平的食材分組，直接作為 PlannerRequest 輸入"""
+        return [g for groups in self.slots.values() for g in groups]
+
+    def selector_payload(self) -> Dict[str, Any]:
+        """Selector 輸出的 dict 形式（只序列化一次）"""
+        if self._selector_payload is None:
+            self._selector_payload = self.selector.model_dump()
+        return self._selector_payload
+
+    def is_empty(self) -> bool:
+        return not self.selector.daily_meals
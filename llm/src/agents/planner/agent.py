@@ -14,24 +14,26 @@ from pydantic import BaseModel, Field
 # 添加路徑
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
 
-from langchain.agents import create_openai_tools_agent, AgentExecutor
-from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.messages import HumanMessage, AIMessage
+from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
 
 # 導入工具 - 動態導入避免相對導入問題
-try:
-    from .tools import (
-        search_recipe_by_ingredient,
-        filter_recipes_by_constraints,
-        search_recipes_by_tags
-    )
-except ImportError:
-    from agents.planner.tools import (
-        search_recipe_by_ingredient,
-        filter_recipes_by_constraints,
-        search_recipes_by_tags
-    )
+from agents.planner.tools import (
+    search_recipe_by_ingredient,
+    filter_recipes_by_constraints,
+    search_recipes_by_tags,
+    rank_recipes_by_fridge
+)
+from agents.compaction import make_compactor
+from agents.json_utils import extract_json
+from agents.prompts import PromptLayout, compact_json, make_profiler
+from agents.structured import default_output_mode, finalize_structured
+from agents.planner.repair import SLOT_PROMPT, check_slots, merge_slots, parse_slots, render_slot_prompt, slot_label
+from metrics import PLANNER_SLOT_REPAIRS
+from telemetry import TracingCallbackHandler, get_logger, payload, span
+from usage import TokenBudgetExceeded, UsageCallbackHandler
+
+logger = get_logger("planner")
 
 # ==================== IO Schema 定義 ====================
 
@@ -78,6 +80,18 @@ class IngredientGroup(BaseModel):
     main_ingredient: str = Field(..., description="主食材")
     supporting_ingredients: List[str] = Field(..., description="配料列表")
     total_amount: str = Field(..., description="總份量")
+    # 來自 Selector 的槽位資訊（第幾天、哪一餐、建議菜名），手動請求可省略
+    day: Optional[int] = Field(None, description="第幾天（從 1 開始）")
+    meal: Optional[str] = Field(None, description="餐點類型，如 早餐")
+    dish_name: Optional[str] = Field(None, description="Selector 建議的菜名")
+
+    def to_prompt_line(self) -> str:
+        """格式化為 User Prompt 中的一行"""
+        supporting = ', '.join(self.supporting_ingredients)
+        line = f"- 主食材: {self.main_ingredient} ({self.total_amount}), 配料: {supporting}"
+        if self.day is not None and self.meal:
+            line = f"- 第{self.day}天 {self.meal}「{self.dish_name or ''}」{line[1:]}"
+        return line
 
 class PlannerRequest(BaseModel):
     """菜單規劃請求"""
@@ -97,72 +111,93 @@ class PlannerResponse(BaseModel):
     message: Optional[str] = Field(None, description="訊息")
     error: Optional[str] = Field(None, description="錯誤訊息")
     raw_response: Optional[str] = Field(None, description="原始回應")
+    budget_exceeded: bool = Field(False, description="是否因 token 預算用盡而回傳簡易菜單")
+    regenerated_slots: List[str] = Field(default_factory=list, description="缺少或格式錯誤而重新規劃的餐，如 第2天 午餐")
+
+# 餐點中文名稱對應 DaySchedule 欄位
+MEAL_FIELD_BY_NAME = {"早餐": "breakfast", "午餐": "lunch", "晚餐": "dinner"}
+
+
+def fallback_menu_plan(request: PlannerRequest) -> MenuPlan:
+    """不呼叫模型，直接以食材分組組出簡易菜單（token 預算用盡時的盡力結果）
+
+    帶槽位資訊的分組放回原本的天與餐，其餘依序輪流填入各餐
+    """
+    try:
+        start = datetime.strptime(request.start_date, "%Y-%m-%d") if request.start_date else datetime.now()
+    except ValueError:
+        start = datetime.now()
+    days = max(request.days, 1)
+    schedule = [DaySchedule(date=(start + timedelta(days=i)).strftime("%Y-%m-%d")) for i in range(days)]
+    fields = [MEAL_FIELD_BY_NAME[m] for m in request.meals if m in MEAL_FIELD_BY_NAME] or ["breakfast", "lunch", "dinner"]
+
+    for index, group in enumerate(request.ingredient_groups):
+        if group.day is not None and group.meal in MEAL_FIELD_BY_NAME and 1 <= group.day <= days:
+            day, field = group.day - 1, MEAL_FIELD_BY_NAME[group.meal]
+        else:
+            day, field = divmod(index, len(fields))
+            day, field = day % days, fields[field]
+        getattr(schedule[day], field).append(RecipeItem(
+            recipe_name=group.dish_name or f"{group.main_ingredient}料理",
+            main_ingredient=group.main_ingredient,
+            ingredients=[IngredientItem(name=group.main_ingredient, amount=group.total_amount)]
+                        + [IngredientItem(name=name, amount="適量") for name in group.supporting_ingredients],
+        ))
+
+    return MenuPlan(
+        menu_plan=MenuPlanInfo(
+            start_date=schedule[0].date,
+            days=days,
+            people=request.people,
+            daytimes=request.meals,
+        ),
+        schedule=schedule,
+    )
 
-# System Prompt Template
-SYSTEM_ZH = """你是一個專業的菜單規劃助手。你的任務是根據使用者的食材和需求，生成完整的每日菜單。
+# ==================== Prompt ====================
+# system 只放固定內容（可命中供應商的 prompt 前綴快取），每次請求的資料都在最後的 user 訊息
+_EXAMPLE = {
+    "menu_plan": {"start_date": "2025-10-28", "days": 1, "people": 2, "daytimes": ["早餐", "午餐", "晚餐"]},
+    "schedule": [{
+        "date": "2025-10-28",
+        "breakfast": [{"recipe_name": "蔥花蛋餅", "main_ingredient": "蛋", "ingredients": [
+            {"name": "蛋", "amount": "2顆"}, {"name": "蔥花", "amount": "1小把"}]}],
+        "lunch": [{"recipe_name": "蒜香雞腿飯", "main_ingredient": "雞肉", "ingredients": [
+            {"name": "雞腿", "amount": "2隻"}, {"name": "蒜頭", "amount": "3瓣"}]}],
+        "dinner": [{"recipe_name": "豆腐鮮蔬湯", "main_ingredient": "豆腐", "ingredients": [
+            {"name": "嫩豆腐", "amount": "1盒"}, {"name": "青江菜", "amount": "1把"}]}],
+    }],
+}
+
+PROMPT = PromptLayout(
+    "planner",
+    static=[
+        ("role", """
+你是一個專業的菜單規劃助手。你的任務是根據使用者的食材和需求，生成完整的每日菜單。
 
 ## 可用工具:
 - search_recipe_by_ingredient(ingredients: str, max_results: int): 根據食材搜尋食譜
+- rank_recipes_by_fridge(ingredients: str, top_k: int, max_missing: int): 一次依所有食材排序食譜（覆蓋率高、用到快到期食材者優先），回傳缺少的食材
 - search_recipes_by_tags(tags: str, max_results: int): 根據標籤搜尋食譜，tags 格式如 "家常菜,烤箱料理,石斑料理"
 - filter_recipes_by_constraints(recipes_json: str, constraints: str = ""): 根據限制條件過濾食譜，constraints 格式如 "max_time:30,max_steps:5" (可選，max_steps 會自動從 steps 陣列計算)
 
 ## 工作流程:
 1) 拿到食材分組，每個分組包含主食材、配料、總份量
 2) 思考此食材分組，可以規劃什麼菜色
-3) 根據主食材(通常是第一個食材)搜尋食譜，作為參考
+3) 先用 rank_recipes_by_fridge 傳入所有分組的食材，一次取得最能用完現有食材的食譜；不足時再根據主食材(通常是第一個食材)搜尋食譜，作為參考
 4) 根據偏好標籤，使用 search_recipes_by_tags 搜尋相關食譜，作為參考
 5) 根據限制條件，思考可以搭配什麼食材，可用filter_recipes_by_constraints尋找食譜，作為參考
-6) 按照指定格式輸出最終菜單 
+6) 為基本資訊中的每一餐分配合適的食譜，按照指定格式輸出最終菜單
 7) 輸出json格式，請不要輸出url，steps 輸出請寫出食譜詳細步驟，約3-7步。
-
+"""),
+        ("output_format", f"""
 ## 輸出格式 (One-shot Example):
 
 ```json
-{{
-  "menu_plan": {{
-    "start_date": "2025-10-28",
-    "days": 1,
-    "people": 2,
-    "daytimes": ["早餐", "午餐", "晚餐"]
-  }},
-  "schedule": [
-    {{
-      "date": "2025-10-28",
-      "breakfast": [
-        {{
-          "recipe_name": "蔥花蛋餅",
-          "main_ingredient": "蛋",
-          "ingredients": [
-            {{"name": "蛋", "amount": "2顆"}},
-            {{"name": "蔥花", "amount": "1小把"}}
-          ]
-        }}
-      ],
-      "lunch": [
-        {{
-          "recipe_name": "蒜香雞腿飯",
-          "main_ingredient": "雞肉",
-          "ingredients": [
-            {{"name": "雞腿", "amount": "2隻"}},
-            {{"name": "蒜頭", "amount": "3瓣"}}
-          ]
-        }}
-      ],
-      "dinner": [
-        {{
-          "recipe_name": "豆腐鮮蔬湯",
-          "main_ingredient": "豆腐",
-          "ingredients": [
-            {{"name": "嫩豆腐", "amount": "1盒"}},
-            {{"name": "青江菜", "amount": "1把"}}
-          ]
-        }}
-      ]
-    }}
-  ]
-}}
+{compact_json(_EXAMPLE)}
 ```
-
+"""),
+        ("rules", """
 ## 強硬指令:
 1. 必須按照上述 JSON 格式輸出，不得有任何偏差
 2. 每個餐點必須包含至少一個食譜
@@ -171,51 +206,68 @@ SYSTEM_ZH = """你是一個專業的菜單規劃助手。你的任務是根據
 5. 使用工具搜尋食譜資料，為參考資料，不是最終食譜
 6. 最終輸出必須是有效的 JSON 格式，不得包含任何其他文字
 
-請嚴格遵循以上格式和指令。"""
-
-# User Prompt Template
-USER_ZH = """
-## 菜單規劃需求:
-
-### 食材分組:
-{ingredient_groups}
-
-### 基本資訊:
-- 人數: {people}人
-- 天數: {days}天
-- 餐點類型: {meals}
-- 開始日期: {start_date}
-
-### 限制條件:
-- 最大烹飪時間: {max_cooking_time}分鐘
-- 最大步驟數: {max_steps}步
-- 偏好: {preferences}
-
+請嚴格遵循以上格式和指令。
+"""),
+        # 原本在 user 訊息結尾的規劃步驟，不含請求資料，移到固定前綴
+        ("steps", """
 ### 請按照以下步驟進行規劃:
 
-1. **分析需求**: 確認要規劃的餐點類型為 {meals}
+1. **分析需求**: 確認要規劃的餐點類型（見使用者訊息的基本資訊）
 2. **搜尋食譜**: 根據食材分組搜尋適合的食譜
 3. **過濾優化**: 根據偏好和限制條件過濾食譜
 4. **菜單分配**: 為每餐分配合適的食譜
 5. **生成菜單**: 按照指定格式輸出最終菜單
 
-請開始執行菜單規劃流程。
-"""
+收到使用者訊息中的限制條件、基本資訊與食材分組後，請開始執行菜單規劃流程。
+"""),
+    ],
+    # 越常變動的段落越靠後：限制條件多為預設值，食材分組每個家庭都不同
+    dynamic=[
+        ("constraints", """
+### 限制條件:
+- 最大烹飪時間: {max_cooking_time}分鐘
+- 最大步驟數: {max_steps}步
+- 偏好: {preferences}
+"""),
+        ("basics", """
+### 基本資訊:
+- 餐點類型: {meals}
+- 人數: {people}人
+- 天數: {days}天
+- 開始日期: {start_date}
+"""),
+        ("ingredient_groups", """
+### 食材分組:
+{ingredient_groups}
+"""),
+    ],
+)
 
 class PlannerAgent:
     """Planner Agent - 主 Agent"""
     
-    def __init__(self):
-        self.llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.4)
+    def __init__(self, output_mode: Optional[str] = None, llm=None):
+        # langchain.agents 匯入成本高，延到建立 agent 時才載入（見 agents/registry.py）
+        from langchain.agents import create_openai_tools_agent, AgentExecutor
+
+        # llm 可注入（例如離線基準測試的假模型）
+        if llm is None:
+            # 未注入時取 registry 的共用 ChatOpenAI（共用 HTTP 連線池與 LLM 排程器）
+            from agents.registry import get_chat_model
+            llm = get_chat_model("gpt-4o-mini", 0.4)
+        self.llm = llm
+        # prompt: 只靠提示詞要求 JSON；structured: 最終輸出綁定 MenuPlan schema
+        self.output_mode = output_mode or default_output_mode()
         self.tools = [
             search_recipe_by_ingredient,
+            rank_recipes_by_fridge,
             filter_recipes_by_constraints,
             search_recipes_by_tags
         ]
         
         # 創建 System Prompt Template
         self.system_prompt = ChatPromptTemplate.from_messages([
-            ("system", SYSTEM_ZH),
+            ("system", PROMPT.system_template),
             ("human", "{input}"),
             ("placeholder", "{agent_scratchpad}")
         ])
@@ -227,25 +279,40 @@ class PlannerAgent:
             prompt=self.system_prompt
         )
         
+        # 中間步驟超過 SCRATCHPAD_TOKEN_BUDGET 時，較早的工具結果精簡後再送給模型
+        self.compactor = make_compactor("planner")
+
         # 創建 Agent Executor
         self.agent_executor = AgentExecutor(
             agent=self.agent,
             tools=self.tools,
-            verbose=True,
-            max_iterations=25
+            verbose=os.getenv("AGENT_VERBOSE", "").lower() in ("1", "true"),
+            max_iterations=25,
+            trim_intermediate_steps=self.compactor.steps if self.compactor else -1
         )
+        # 每次呼叫各提示詞段落的 token 數（PROMPT_PROFILE=0 時不建立）
+        self.profiler = make_profiler(PROMPT, self.tools)
+        self.slot_profiler = make_profiler(SLOT_PROMPT)
+
+    def _callbacks(self, usage_cb: UsageCallbackHandler, profiler=None) -> list:
+        callbacks = [TracingCallbackHandler("planner"), usage_cb]
+        profiler = profiler or self.profiler
+        if profiler:
+            callbacks.append(profiler)
+        return callbacks
     
     def plan_menu_with_params(self, request: PlannerRequest) -> PlannerResponse:
         """使用參數規劃菜單（用於 API 端點）"""
+        with span("planner", groups=len(request.ingredient_groups), days=request.days):
+            return self._plan_menu_with_params(request)
+
+    def _plan_menu_with_params(self, request: PlannerRequest) -> PlannerResponse:
         try:
             # 格式化食材分組
-            groups_text = []
-            for group in request.ingredient_groups:
-                supporting = ', '.join(group.supporting_ingredients)
-                groups_text.append(f"- 主食材: {group.main_ingredient} ({group.total_amount}), 配料: {supporting}")
+            groups_text = [group.to_prompt_line() for group in request.ingredient_groups]
             
-            # 使用 USER_ZH 模板構建 User Prompt
-            user_prompt = USER_ZH.format(
+            # 請求資料只出現在 User Prompt，system 前綴維持不變
+            user_prompt = PROMPT.render(
                 ingredient_groups='\n'.join(groups_text),
                 people=request.people,
                 days=request.days,
@@ -256,30 +323,38 @@ class PlannerAgent:
                 preferences=', '.join(request.preferences)
             )
             
+            # 同一個用量記錄涵蓋 agent 迴圈與 structured 最後一步
+            usage_cb = UsageCallbackHandler("planner")
+            
             # 調用原有的 plan_menu 方法
-            result = self.plan_menu(user_prompt)
+            result = self.plan_menu(user_prompt, usage_cb)
             
-            # 轉換為 PlannerResponse
-            if result["success"] and result.get("menu_plan"):
+            if self.output_mode == "structured" and result.get("raw_response") is not None:
+                # 草稿先在本地修復，不合格才以 MenuPlan schema 重新整理最後一步
+                draft = result["raw_response"]
                 try:
-                    # 調試信息
-                    print(f"🔍 嘗試解析 menu_plan: {type(result['menu_plan'])}")
-                    print(f"🔍 menu_plan 內容: {json.dumps(result['menu_plan'], indent=2, ensure_ascii=False)}")
-                    
-                    # 嘗試解析為 MenuPlan 對象
-                    menu_plan = MenuPlan(**result["menu_plan"])
-                    return PlannerResponse(
-                        success=True,
-                        menu_plan=menu_plan,
-                        message=result.get("message", "菜單規劃完成")
-                    )
-                except Exception as parse_error:
-                    print(f"❌ 菜單解析失敗: {str(parse_error)}")
-                    return PlannerResponse(
-                        success=False,
-                        error=f"菜單解析失敗: {str(parse_error)}",
-                        raw_response=result.get("raw_response")
+                    menu_plan = finalize_structured(
+                        self.llm, MenuPlan, draft,
+                        [HumanMessage(user_prompt), AIMessage(draft)],
+                        self._callbacks(usage_cb)
                     )
+                except TokenBudgetExceeded as e:
+                    logger.warning("Planner 最終整理中止: %s", e)
+                    return self._fallback_response(request)
+                if menu_plan:
+                    # schema 允許空的餐，缺少的餐仍需補上
+                    return self._complete_plan(request, menu_plan.model_dump(), draft, usage_cb)
+                return PlannerResponse(success=False, error="菜單解析失敗", raw_response=draft)
+            
+            if result.get("budget_exceeded"):
+                return self._fallback_response(request)
+            
+            # 轉換為 PlannerResponse
+            if result["success"] and isinstance(result.get("menu_plan"), dict):
+                # 調試信息
+                logger.debug("menu_plan 內容: %s", payload(result["menu_plan"]))
+                # 逐槽位檢查，只重新規劃壞掉的天與餐
+                return self._complete_plan(request, result["menu_plan"], result.get("raw_response"), usage_cb)
             else:
                 return PlannerResponse(
                     success=False,
@@ -293,23 +368,91 @@ class PlannerAgent:
                 error=str(e)
             )
 
-    def plan_menu(self, user_input: str) -> Dict[str, Any]:
+    def _complete_plan(self, request: PlannerRequest, plan: Dict[str, Any], raw_response: Optional[str],
+                       usage_cb: UsageCallbackHandler) -> PlannerResponse:
+        """逐槽位檢查模型輸出的菜單：有效的天與餐保留，缺少或格式錯誤的槽位才重新規劃後合併"""
+        fixed, broken, dropped = check_slots(request, plan, RecipeItem)
+        if not broken and not dropped:
+            try:
+                return PlannerResponse(success=True, menu_plan=MenuPlan(**plan), message="菜單規劃完成")
+            except Exception as parse_error:
+                # 槽位都有效但其餘欄位（如 menu_plan 資訊）不合格，改用補齊後的版本
+                logger.warning("菜單資訊解析失敗，改用逐槽位檢查後的菜單: %s", parse_error)
+        if not broken:
+            return PlannerResponse(success=True, menu_plan=MenuPlan(**fixed), message="菜單規劃完成")
+
+        labels = [slot_label(slot) for slot in broken]
+        logger.warning("菜單有 %d 個槽位缺少或格式錯誤（剔除 %d 個食譜），只重新規劃: %s",
+                       len(broken), dropped, ", ".join(labels))
+        with span("planner.repair", slots=len(broken), dropped=dropped) as s:
+            recipes = self._regenerate_slots(request, fixed, broken, usage_cb)
+            PLANNER_SLOT_REPAIRS.labels("regenerated").inc(len(recipes))
+            missing = [slot for slot in broken if slot not in recipes]
+            if missing:
+                # 重新規劃仍失敗的槽位以食材分組組出簡易食譜
+                fallback = fallback_menu_plan(request).model_dump()
+                for day, field in missing:
+                    items = fallback["schedule"][day][field] if day < len(fallback["schedule"]) else []
+                    if items:
+                        recipes[(day, field)] = items
+                        PLANNER_SLOT_REPAIRS.labels("fallback").inc()
+                    else:
+                        PLANNER_SLOT_REPAIRS.labels("unresolved").inc()
+            s.set(regenerated=len(recipes))
+        menu_plan = MenuPlan(**merge_slots(fixed, recipes))
+        return PlannerResponse(
+            success=True,
+            menu_plan=menu_plan,
+            message=f"菜單規劃完成（重新規劃 {', '.join(labels)}）",
+            raw_response=raw_response,
+            regenerated_slots=labels
+        )
+
+    def _regenerate_slots(self, request: PlannerRequest, plan: Dict[str, Any], broken: List[Any],
+                          usage_cb: UsageCallbackHandler) -> Dict[Any, List[Dict[str, Any]]]:
+        """一次模型呼叫只規劃壞掉的槽位（不經工具迴圈）；失敗時回傳空 dict"""
+        messages = [SystemMessage(SLOT_PROMPT.system), HumanMessage(render_slot_prompt(request, plan, broken))]
+        try:
+            callbacks = self._callbacks(usage_cb, self.slot_profiler)
+            content = self.llm.invoke(messages, config={"callbacks": callbacks}).content
+        except TokenBudgetExceeded as e:
+            logger.warning("Planner 局部重新規劃中止: %s", e)
+            return {}
+        except Exception as e:
+            logger.warning("Planner 局部重新規劃失敗: %s", e)
+            return {}
+        data = extract_json(content) if content else None
+        return parse_slots(data, broken, RecipeItem) if data else {}
+
+    def _fallback_response(self, request: PlannerRequest) -> PlannerResponse:
+        return PlannerResponse(
+            success=True,
+            menu_plan=fallback_menu_plan(request),
+            message="token 預算用盡，已依食材分組產生簡易菜單",
+            budget_exceeded=True
+        )
+
+    def plan_menu(self, user_input: str, usage_cb: Optional[UsageCallbackHandler] = None) -> Dict[str, Any]:
         """規劃菜單"""
         try:
             # 執行 Agent
-            result = self.agent_executor.invoke({"input": user_input})
+            result = self.agent_executor.invoke(
+                {"input": user_input},
+                config={"callbacks": self._callbacks(usage_cb or UsageCallbackHandler("planner"))}
+            )
             
             # 解析結果
             response = result.get("output", "")
             
             # 嘗試從回應中提取 JSON
-            menu_plan = self._extract_json_from_response(response)
+            menu_plan = extract_json(response)
             
             if menu_plan:
                 return {
                     "success": True,
                     "menu_plan": menu_plan,
-                    "message": "菜單規劃完成"
+                    "message": "菜單規劃完成",
+                    "raw_response": response
                 }
             else:
                 return {
@@ -318,85 +461,19 @@ class PlannerAgent:
                     "raw_response": response
                 }
                 
+        except TokenBudgetExceeded as e:
+            logger.warning("Planner 中止: %s", e)
+            return {
+                "success": False,
+                "budget_exceeded": True,
+                "error": str(e)
+            }
         except Exception as e:
             return {
                 "success": False,
                 "error": f"菜單規劃失敗: {str(e)}"
             }
     
-    def _extract_json_from_response(self, response: str) -> Optional[Dict[str, Any]]:
-        """從回應中提取 JSON，附帶常見錯誤修復"""
-        import re
-        
-        def attempt_repairs(text: str) -> str:
-            s = text.strip()
-            # 去除 markdown 圍欄
-            s = re.sub(r"^```json\s*|^```\s*|```\s*$", "", s, flags=re.IGNORECASE | re.MULTILINE)
-            # 移除 BOM 與不可見控制字元
-            s = s.replace("\ufeff", "")
-            s = re.sub(r"[\x00-\x08\x0b\x0c\x0e-\x1f]", "", s)
-            # 移除物件與陣列中的尾逗號
-            s = re.sub(r",\s*([}\]])", r"\1", s)
-            # 轉換 NaN/Infinity 為 null
-            s = re.sub(r"\bNaN\b|\bInfinity\b|-Infinity", "null", s)
-            return s
-        
-        # 打印原始回應以便調試
-        print(f"🔍 原始回應: {response[:500]}...")
-        
-        # 1) 代碼塊優先
-        m = re.search(r"```json\s*(\{[\s\S]*?\})\s*```", response, flags=re.IGNORECASE)
-        if m:
-            candidate = attempt_repairs(m.group(1))
-            try:
-                return json.loads(candidate)
-            except Exception as e:
-                print(f"❌ 代碼塊解析失敗: {e}")
-        
-        # 2) 搜集多種候選再由長到短嘗試
-        patterns = [
-            r"```\s*(\{[\s\S]*?\})\s*```",
-            r"(\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\})",
-            r"(\{[\s\S]*?\})",
-        ]
-        candidates: List[str] = []
-        for p in patterns:
-            candidates.extend(re.findall(p, response, re.DOTALL))
-        candidates = sorted(set(candidates), key=len, reverse=True)
-        for c in candidates:
-            try:
-                result = json.loads(attempt_repairs(c))
-                print("✅ 從候選解析成功")
-                return result
-            except Exception as e:
-                print(f"❌ 候選解析失敗: {e}")
-                continue
-        
-        # 3) 從最後一段完整大括號擷取
-        try:
-            start_idx = response.rfind('{')
-            if start_idx != -1:
-                brace_count = 0
-                end_idx = start_idx
-                for i, ch in enumerate(response[start_idx:], start_idx):
-                    if ch == '{':
-                        brace_count += 1
-                    elif ch == '}':
-                        brace_count -= 1
-                        if brace_count == 0:
-                            end_idx = i + 1
-                            break
-                if brace_count == 0 and end_idx > start_idx:
-                    json_str = attempt_repairs(response[start_idx:end_idx])
-                    result = json.loads(json_str)
-                    print("✅ 從最後括號段解析成功")
-                    return result
-        except Exception as e:
-            print(f"❌ 最後嘗試失敗: {e}")
-        
-        print("❌ 無法從回應中提取有效的 JSON")
-        return None
-    
     def format_menu_output(self, menu_plan: MenuPlan) -> str:
         """格式化菜單輸出"""
         if not menu_plan:
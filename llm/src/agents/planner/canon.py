@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+食材名稱正規化
+冰箱名稱（石斑魚、雞腿）與食譜食材名稱（龍膽石斑魚塊、去骨雞腿排、雞蛋 / 蛋）寫法不同：
+以同義詞字典編成 Aho-Corasick 自動機，一次線性掃描就把任意食材字串對應到標準食材 ID（標準名稱），
+多個寫法重疊時取最左、最長的詞（「橄欖油」不算「橄欖」、「皮蛋」不算「蛋」）
+"""
+
+import re
+import unicodedata
+from collections import deque
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+# 標準名稱 → 其他寫法（標準名稱本身也會加入）
+# 較長的複合詞（雞蛋豆腐、橄欖油、雞粉…）列為獨立項目，避免被短詞誤判
+SYNONYMS: Dict[str, List[str]] = {
+    # 海鮮
+    "石斑魚": ["石斑", "龍膽石斑", "龍膽"],
+    "鮭魚": ["三文魚", "鮭魚排", "鮭魚片"],
+    "鯛魚": ["鯛魚片", "台灣鯛"],
+    "蝦": ["蝦仁", "草蝦", "白蝦", "鮮蝦", "蝦子"],
+    "魷魚": ["發泡魷魚", "透抽", "小卷"],
+    "扇貝": ["干貝", "扇貝肉"],
+    "蛤蜊": ["蛤仔", "海瓜子"],
+    # 肉類
+    "雞腿": ["雞腿肉", "雞腿排", "去骨雞腿", "棒棒腿", "雞腿塊"],
+    "雞胸肉": ["雞胸", "雞柳", "雞里肌"],
+    "雞翅": ["雞翅膀", "二節翅", "三節翅"],
+    "豬絞肉": ["絞肉", "豬肉末", "肉末", "豬絞"],
+    "豬肉片": ["肉片", "梅花肉片", "豬梅花片", "火鍋肉片"],
+    "豬肉絲": ["肉絲"],
+    "五花肉": ["三層肉", "豬五花"],
+    "排骨": ["豬排骨", "小排", "豬小排", "子排"],
+    "豬大腸": ["大腸", "肥腸"],
+    "牛肉": ["牛肉片", "牛肉絲", "牛肋條", "牛腱", "牛小排", "骰子牛"],
+    "培根": ["bacon"],
+    # 蛋與豆製品
+    "雞蛋": ["蛋", "全蛋", "蛋液", "雞蛋液", "蛋黃", "蛋白", "土雞蛋"],
+    "皮蛋": [],
+    "鹹蛋": ["鹹蛋黃"],
+    "雞蛋豆腐": ["蛋豆腐"],
+    "豆腐": ["板豆腐", "嫩豆腐", "傳統豆腐", "家常豆腐", "盒裝豆腐"],
+    "豆干": ["豆乾", "豆皮"],
+    "豆漿": ["無糖豆漿"],
+    # 蔬菜
+    "洋蔥": ["洋蔥丁", "洋蔥絲", "洋蔥粒", "紫洋蔥"],
+    "番茄": ["蕃茄", "牛番茄", "牛蕃茄", "小番茄", "聖女番茄", "西紅柿"],
+    "番茄醬": ["蕃茄醬", "番茄糊", "蕃茄糊"],
+    "高麗菜": ["甘藍", "包心菜", "捲心菜", "洋白菜"],
+    "大白菜": ["白菜", "山東白菜", "娃娃菜"],
+    "小白菜": [],
+    "青江菜": ["湯匙菜"],
+    "茼蒿": ["山茼蒿", "茼蒿菜", "打某菜"],
+    "菠菜": ["菠薐菜"],
+    "空心菜": ["蕹菜"],
+    "地瓜葉": [],
+    "香菇": ["鮮香菇", "乾香菇", "冬菇", "花菇"],
+    "香菇粉": ["香菇風味"],
+    "菇類": ["鴻禧菇", "雪白菇", "金針菇", "杏鮑菇", "秀珍菇", "美白菇"],
+    "木耳": ["黑木耳", "白木耳"],
+    "紅蘿蔔": ["胡蘿蔔", "紅蘿蔔絲", "紅蘿蔔丁"],
+    "白蘿蔔": ["蘿蔔"],
+    "馬鈴薯": ["洋芋", "土豆"],
+    "地瓜": ["番薯", "甘藷"],
+    "玉米": ["玉米粒", "玉米筍"],
+    "小黃瓜": ["黃瓜", "胡瓜"],
+    "青椒": ["甜椒", "彩椒", "紅椒", "黃椒"],
+    "辣椒": ["紅辣椒", "朝天椒", "辣椒末"],
+    "筍": ["筍子", "竹筍", "綠竹筍", "麻竹筍"],
+    "泡菜": ["韓式泡菜", "台式泡菜"],
+    "酸菜": ["酸白菜"],
+    # 辛香料
+    "大蒜": ["蒜", "蒜頭", "蒜末", "蒜仁", "蒜粒", "蒜泥", "蒜片"],
+    "蒜苗": ["青蒜"],
+    "蔥": ["青蔥", "蔥花", "蔥段", "蔥末", "蔥白", "蔥綠"],
+    "油蔥酥": ["紅蔥酥", "紅蔥頭"],
+    "薑": ["生薑", "老薑", "嫩薑", "薑片", "薑絲", "薑末", "薑泥"],
+    "九層塔": ["羅勒", "打拋葉"],
+    "香菜": ["芫荽"],
+    "檸檬": ["檸檬汁", "檸檬皮", "黃檸檬", "綠檸檬"],
+    # 其他
+    "橄欖": ["黑橄欖", "綠橄欖"],
+    "橄欖油": ["初榨橄欖油"],
+    "優格": ["優酪乳", "希臘優格", "無糖優格"],
+    "味噌": ["白味噌", "赤味噌"],
+    "雞粉": ["鮮雞粉", "雞精粉"],
+    "起司": ["乳酪", "乳酪絲", "起司片", "起司絲", "芝士"],
+    "牛奶": ["鮮奶", "鮮乳", "牛乳"],
+    "奶油": ["無鹽奶油", "動物性奶油"],
+}
+
+_SPACES = re.compile(r"\s+")
+# 去掉括號註記，例如「洋蔥（中型）」「日式醬油(淡色醬油)」
+_PARENS = re.compile(r"[(（][^)）]*[)）]?")
+
+
+def normalize(name: str) -> str:
+    """全形轉半形、去括號註記與空白、轉小寫"""
+    text = unicodedata.normalize("NFKC", name or "")
+    text = _PARENS.sub("", text)
+    return _SPACES.sub("", text).lower()
+
+
+class AhoCorasick:
+    """多字串比對自動機：build 時編譯所有寫法，find() 一次掃描回傳最左最長、不重疊的命中"""
+
+    def __init__(self, patterns: Iterable[Tuple[str, str]]):
+        # 每個節點：子節點、失敗連結、在此結束的最長寫法 (長度, 值)、沿失敗鏈的輸出節點
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[Optional[Tuple[int, str]]] = [None]
+        self._link: List[int] = [0]
+        for pattern, value in patterns:
+            self._add(pattern, value)
+        self._build()
+
+    def _add(self, pattern: str, value: str) -> None:
+        node = 0
+        for ch in pattern:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(None)
+                self._link.append(0)
+            node = nxt
+        self._out[node] = (len(pattern), value)
+
+    def _build(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[child] = self._goto[f].get(ch, 0)
+                fail = self._fail[child]
+                self._link[child] = fail if self._out[fail] is not None else self._link[fail]
+                queue.append(child)
+
+    def find(self, text: str) -> List[Tuple[int, int, str]]:
+        """回傳 [(start, end, value)]，重疊時保留最左、最長者"""
+        hits: List[Tuple[int, int, str]] = []
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(ch, 0)
+            out = node if self._out[node] is not None else self._link[node]
+            while out:
+                length, value = self._out[out]
+                hits.append((i + 1 - length, i + 1, value))
+                out = self._link[out]
+        hits.sort(key=lambda h: (h[0], h[0] - h[1]))
+        chosen: List[Tuple[int, int, str]] = []
+        end = 0
+        for start, stop, value in hits:
+            if start >= end:
+                chosen.append((start, stop, value))
+                end = stop
+        return chosen
+
+
+def _build_automaton(synonyms: Dict[str, List[str]]) -> AhoCorasick:
+    patterns: Dict[str, str] = {}
+    for canonical, aliases in synonyms.items():
+        for alias in [canonical, *aliases]:
+            patterns.setdefault(normalize(alias), canonical)
+    return AhoCorasick(patterns.items())
+
+
+_automaton = _build_automaton(SYNONYMS)
+
+
+@lru_cache(maxsize=65536)
+def canonical_ids(name: str) -> FrozenSet[str]:
+    """字典命中的標準食材 ID；字典沒有收錄時為空集合"""
+    return frozenset(value for _, _, value in _automaton.find(normalize(name)))
+
+
+def ingredient_ids(name: str) -> FrozenSet[str]:
+    """標準食材 ID；字典沒有收錄時以正規化後的名稱本身作為 ID"""
+    ids = canonical_ids(name)
+    if ids:
+        return ids
+    text = normalize(name)
+    return frozenset([text]) if text else frozenset()
+
+
+def same_ingredient(query: str, name: str) -> bool:
+    """query（例如冰箱食材）與 name（例如食譜食材）是否指同一食材
+
+    兩者都被字典收錄時比對 ID；任一方未收錄時退回互相包含的字串比對
+    """
+    a, b = canonical_ids(query), canonical_ids(name)
+    if a and b:
+        return not a.isdisjoint(b)
+    q, n = normalize(query), normalize(name)
+    return bool(q and n) and (q in n or n in q)
@@ -15,6 +15,12 @@ from dataclasses import dataclass, field
 from pathlib import Path
 import re
 
+# 直接執行 python crawler.py 時也能匯入 agents 套件
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from agents.planner.canon import same_ingredient
+from agents.planner.store import ingest_recipes, recipe_backend
+
 @dataclass
 class Recipe:
     """食譜資料結構"""
@@ -417,14 +423,20 @@ def main():
     print(f"\n=== 爬取完成 ===")
     print(f"總共爬取 {len(all_recipes)} 個食譜")
     print(f"結果已保存到 {output_file}")
+
+    # Postgres 語料：同一批結果一併匯入（url 相同者覆寫）
+    if recipe_backend() == "postgres":
+        with open(output_file, 'r', encoding='utf-8') as f:
+            counts = ingest_recipes(json.load(f)["recipes"])
+        print(f"已匯入 {counts['recipes']} 個食譜到資料庫")
     
-    # 顯示食材覆蓋情況
+    # 顯示食材覆蓋情況（以同義詞字典比對，例如「石斑魚」涵蓋「龍膽石斑魚塊」）
     covered_ingredients = set()
     for recipe in all_recipes:
         for ingredient in recipe.ingredients:
             ingredient_name = ingredient["name"]
             for user_ingredient in user_ingredients:
-                if user_ingredient in ingredient_name or ingredient_name in user_ingredient:
+                if same_ingredient(user_ingredient, ingredient_name):
                     covered_ingredients.add(user_ingredient)
     
     print(f"\n=== 食材覆蓋情況 ===")
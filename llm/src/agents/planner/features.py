@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+食譜數值特徵欄與範圍索引
+語料載入時把每個食譜的烹飪時間、步驟數、份量、食材數預先算成 NumPy 欄位，並為每欄建立排序索引：
+範圍條件（max_time、max_steps、份量上下限…）以二分搜尋取出符合的區段，多個條件以布林遮罩交集，
+不必每次呼叫都逐一讀 dict、重算 len(steps)。
+缺少的數值（例如沒有 cooking_time）不符合任何針對該欄的條件
+"""
+
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# 限制條件名稱 → (特徵欄, 上限 / 下限)
+CONSTRAINTS: Dict[str, Tuple[str, str]] = {
+    "max_time": ("cooking_time", "max"),
+    "min_time": ("cooking_time", "min"),
+    "max_steps": ("steps", "max"),
+    "min_steps": ("steps", "min"),
+    "max_servings": ("servings", "max"),
+    "min_servings": ("servings", "min"),
+    "max_ingredients": ("ingredients", "max"),
+    "min_ingredients": ("ingredients", "min"),
+}
+
+
+def _number(value: Any) -> float:
+    """轉成數值；缺少或無法解析時為 NaN"""
+    if value is None or isinstance(value, bool):
+        return np.nan
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _length(value: Any) -> float:
+    return float(len(value)) if isinstance(value, (list, tuple)) else 0.0
+
+
+class RecipeFeatures:
+    """食譜特徵欄（float64，缺值為 NaN）與各欄的排序索引"""
+
+    def __init__(self, recipes: List[Dict[str, Any]]):
+        self.recipes = recipes
+        self.size = len(recipes)
+        self.columns: Dict[str, np.ndarray] = {
+            "cooking_time": np.array([_number(r.get("cooking_time")) for r in recipes], dtype=float),
+            "steps": np.array([_length(r.get("steps")) for r in recipes], dtype=float),
+            "servings": np.array([_number(r.get("servings")) for r in recipes], dtype=float),
+            "ingredients": np.array([_length(r.get("ingredients")) for r in recipes], dtype=float),
+        }
+        # 每欄：依數值排序的位置、排序後的數值、非缺值筆數（NaN 排在最後）
+        self._sorted: Dict[str, Tuple[np.ndarray, np.ndarray, int]] = {}
+        for name, column in self.columns.items():
+            order = np.argsort(column, kind="stable")
+            self._sorted[name] = (order, column[order], int(np.count_nonzero(~np.isnan(column))))
+        # url → 位置：工具收到的食譜 JSON 可對回語料，直接沿用預先算好的特徵
+        self.positions: Dict[str, int] = {}
+        for i, r in enumerate(recipes):
+            if r.get("url"):
+                self.positions.setdefault(r["url"], i)
+        self._masks: Dict[Tuple[Tuple[str, float], ...], np.ndarray] = {}
+
+    def range_mask(self, name: str, low: Optional[float] = None, high: Optional[float] = None) -> np.ndarray:
+        """low <= 欄位值 <= high 的布林遮罩；以排序索引二分搜尋，缺值一律不符合"""
+        order, values, valid = self._sorted[name]
+        lo = 0 if low is None else int(np.searchsorted(values[:valid], low, side="left"))
+        hi = valid if high is None else int(np.searchsorted(values[:valid], high, side="right"))
+        mask = np.zeros(self.size, dtype=bool)
+        mask[order[lo:hi]] = True
+        return mask
+
+    def mask(self, constraints: Dict[str, float]) -> np.ndarray:
+        """所有限制條件的交集；同一組條件的結果會快取"""
+        key = tuple(sorted((k, float(v)) for k, v in constraints.items() if k in CONSTRAINTS))
+        mask = self._masks.get(key)
+        if mask is None:
+            bounds: Dict[str, List[Optional[float]]] = {}
+            for k, value in key:
+                column, side = CONSTRAINTS[k]
+                low, high = bounds.setdefault(column, [None, None])
+                if side == "max":
+                    bounds[column][1] = value if high is None else min(high, value)
+                else:
+                    bounds[column][0] = value if low is None else max(low, value)
+            mask = np.ones(self.size, dtype=bool)
+            for column, (low, high) in bounds.items():
+                mask &= self.range_mask(column, low, high)
+            if len(self._masks) < 256:
+                self._masks[key] = mask
+        return mask
+
+    def lookup(self, recipes: Iterable[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """食譜在語料中的位置（依 url）；有任何一筆對不回語料時回傳 None"""
+        get = self.positions.get
+        positions = [get(r.get("url")) if isinstance(r, dict) else None for r in recipes]
+        if None in positions:
+            return None
+        return np.array(positions, dtype=np.int64)
+
+
+def get_features(data: Dict[str, Any]) -> RecipeFeatures:
+    """語料的特徵欄，與語料一起快取；語料被替換時重建"""
+    features = data.get("features")
+    if features is None or features.recipes is not data["recipes"] or features.size != len(data["recipes"]):
+        features = RecipeFeatures(data["recipes"])
+        data["features"] = features
+    return features
+
+
+def filter_recipes(recipes: List[Dict[str, Any]], constraints: Dict[str, float],
+                   corpus: Optional[RecipeFeatures] = None) -> List[Dict[str, Any]]:
+    """保留符合所有限制條件的食譜（維持原順序）
+
+    recipes 都能依 url 對回語料時直接用 corpus 預先算好的特徵，否則就地建立這批食譜的特徵
+    """
+    if not constraints or not recipes:
+        return list(recipes)
+    if corpus is not None and recipes is corpus.recipes:
+        keep = corpus.mask(constraints)
+    else:
+        positions = corpus.lookup(recipes) if corpus is not None else None
+        if positions is not None:
+            keep = corpus.mask(constraints)[positions]
+        else:
+            keep = RecipeFeatures(recipes).mask(constraints)
+    return [recipes[i] for i in np.flatnonzero(keep)]
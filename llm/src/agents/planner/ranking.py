@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+食譜覆蓋率排序
+語料載入時建立「食譜 × 標準食材」稀疏關聯矩陣（COO：每個非零元素一組 (食譜, 食材)），
+冰箱食材轉成依到期日加權的向量後，一次稀疏矩陣 × 向量（np.bincount）就得到所有食譜的：
+- 加權分數：冰箱有的食材權重總和，越快到期權重越高
+- 缺少食材數與覆蓋率：同一份矩陣乘上「有 / 沒有」向量
+鹽、糖、醬油等常備調味料不列入食材數
+"""
+
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from agents.planner.canon import ingredient_ids
+from agents.planner.features import get_features
+
+# 常備調味料：食譜有用到也不算缺少
+PANTRY = frozenset().union(*(ingredient_ids(n) for n in (
+    "鹽", "鹽巴", "味付鹽", "海鹽", "水", "冷開水", "熱水", "白開水", "過濾水", "清水",
+    "糖", "砂糖", "細砂糖", "二砂", "冰糖", "醬油", "醬油膏", "醬油露", "低鈉醬油", "米酒", "料理酒",
+    "油", "沙拉油", "食用油", "香油", "麻油", "香油麻油", "白胡椒粉", "黑胡椒粉", "胡椒粉", "胡椒", "白胡椒",
+    "黑胡椒", "粗粒黑胡椒", "醋", "白醋", "烏醋", "太白粉", "地瓜粉", "味精", "雞粉", "蠔油", "素蠔油",
+)))
+
+# 到期加權：今天到期 1 + URGENCY_WEIGHT，之後隨天數遞減，沒有到期日為 1
+URGENCY_WEIGHT = 2.0
+# 排序時分數取到小數第幾位：加權和的浮點誤差依加總順序而異，不捨入的話同分的食譜會被誤差排開
+SCORE_DIGITS = 9
+
+
+def expiry_weight(days_left: Optional[int]) -> float:
+    """越快到期權重越高"""
+    if days_left is None:
+        return 1.0
+    return 1.0 + URGENCY_WEIGHT / (1 + max(days_left, 0))
+
+
+class CoverageMatrix:
+    """食譜 × 標準食材的稀疏關聯矩陣（每個食譜同一食材只記一次，不含常備調味料）"""
+
+    def __init__(self, recipes: List[Dict[str, Any]]):
+        self.recipes = recipes
+        self.size = len(recipes)
+        self.columns: Dict[str, int] = {}
+        rows: List[int] = []
+        cols: List[int] = []
+        for r, recipe in enumerate(recipes):
+            ids = set()
+            for ing in recipe.get("ingredients", []):
+                ids |= ingredient_ids(ing.get("name", ""))
+            for cid in ids - PANTRY:
+                rows.append(r)
+                cols.append(self.columns.setdefault(cid, len(self.columns)))
+        self.names = list(self.columns)
+        self.rows = np.array(rows, dtype=np.int64)
+        self.cols = np.array(cols, dtype=np.int64)
+        # 每個食譜需要的食材數（列的非零元素個數）；rows 依食譜順序排列，indptr 為各列起點（CSR）
+        self.needed = np.bincount(self.rows, minlength=self.size)
+        self.indptr = np.concatenate([[0], np.cumsum(self.needed)])
+
+    def multiply(self, vectors: np.ndarray) -> np.ndarray:
+        """稀疏矩陣 × 向量：每個食譜把它用到的食材欄位值加總；傳入 (欄位數, k) 時一次乘 k 個向量"""
+        if vectors.ndim == 1:
+            return np.bincount(self.rows, weights=vectors[self.cols], minlength=self.size)
+        return np.stack([self.multiply(v) for v in vectors.T], axis=1)
+
+    def fridge_vector(self, fridge: Iterable[Tuple[str, Optional[int]]]) -> np.ndarray:
+        """(名稱, 剩餘天數) 轉成依到期加權的欄位向量；同一食材多筆取最高權重"""
+        weights = np.zeros(len(self.columns))
+        for name, days_left in fridge:
+            w = expiry_weight(days_left)
+            for cid in ingredient_ids(name):
+                col = self.columns.get(cid)
+                if col is not None:
+                    weights[col] = max(weights[col], w)
+        return weights
+
+    def rank(self, fridge: Iterable[Tuple[str, Optional[int]]], top_k: int = 10,
+             max_missing: Optional[int] = None, allowed: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
+        """回傳前 top_k 個食譜的 (位置, 分數, 覆蓋率, 缺少數, 符合與缺少的食材)
+
+        allowed: 可選的布林遮罩（例如限制條件的結果），只排序遮罩內的食譜
+
+        分數 = 加權命中 / 所需食材數；同分時缺少較少者優先，再依語料順序
+        """
+        if not self.size:
+            return []
+        weights = self.fridge_vector(fridge)
+        have = (weights > 0).astype(float)
+        hits, weighted = self.multiply(np.stack([have, weights], axis=1)).T
+        needed = np.maximum(self.needed, 1)
+        missing = self.needed - hits.astype(np.int64)
+        score = weighted / needed
+        candidates = np.flatnonzero(hits > 0 if allowed is None else (hits > 0) & allowed)
+        if max_missing is not None:
+            candidates = candidates[missing[candidates] <= max_missing]
+        order = np.lexsort((candidates, missing[candidates], -np.round(score[candidates], SCORE_DIGITS)))[:top_k]
+
+        results = []
+        for r in candidates[order]:
+            cols = self.cols[self.indptr[r]:self.indptr[r + 1]]
+            results.append({
+                "index": int(r),
+                "score": round(float(score[r]), 4),
+                "coverage": round(float(hits[r] / needed[r]), 4),
+                "missing_count": int(missing[r]),
+                "matched_ingredients": [self.names[c] for c in cols if have[c]],
+                "missing_ingredients": [self.names[c] for c in cols if not have[c]],
+            })
+        return results
+
+
+def get_matrix(data: Dict[str, Any]) -> CoverageMatrix:
+    """語料的關聯矩陣，與語料一起快取；語料被替換時重建"""
+    matrix = data.get("coverage_matrix")
+    if matrix is None or matrix.recipes is not data["recipes"] or matrix.size != len(data["recipes"]):
+        matrix = CoverageMatrix(data["recipes"])
+        data["coverage_matrix"] = matrix
+    return matrix
+
+
+def days_left(expiry_date: Optional[str], today: Optional[date] = None) -> Optional[int]:
+    """YYYY-MM-DD 到今天的剩餘天數；沒有或無法解析時為 None"""
+    if not expiry_date:
+        return None
+    try:
+        expiry = datetime.strptime(expiry_date[:10], "%Y-%m-%d").date()
+    except ValueError:
+        return None
+    return (expiry - (today or date.today())).days
+
+
+def rank_recipes(data: Dict[str, Any], fridge: Iterable[Tuple[str, Optional[int]]], top_k: int = 10,
+                 max_missing: Optional[int] = None,
+                 constraints: Optional[Dict[str, float]] = None) -> List[Dict[str, Any]]:
+    """依冰箱食材排序語料中的食譜，回傳附上排序欄位的食譜 dict；constraints 見 features.CONSTRAINTS"""
+    recipes = data["recipes"]
+    allowed = get_features(data).mask(constraints) if constraints else None
+    ranked = []
+    for hit in get_matrix(data).rank(fridge, top_k, max_missing, allowed):
+        recipe = recipes[hit.pop("index")]
+        ranked.append({**recipe, **hit})
+    return ranked
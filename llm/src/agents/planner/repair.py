@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Planner 菜單的槽位檢查與局部重新規劃
+模型輸出的菜單以「第幾天 × 哪一餐」為單位檢查：格式正確的天與餐全部保留，
+格式錯誤的食譜剔除，缺少或剔除後沒有食譜的槽位才以一次小型提示詞重新規劃，結果再合併回原菜單；
+重新規劃失敗的槽位改用食材分組組出的簡易食譜填補，不必整份重跑
+"""
+
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Tuple
+
+from pydantic import ValidationError
+
+from agents.prompts import PromptLayout, compact_json
+
+# 槽位：(第幾天，從 0 開始, DaySchedule 欄位)
+Slot = Tuple[int, str]
+
+MEAL_NAME_BY_FIELD = {"breakfast": "早餐", "lunch": "午餐", "dinner": "晚餐"}
+
+_EXAMPLE = {"slots": [{"day": 2, "meal": "午餐", "recipes": [{
+    "recipe_name": "蒜香雞腿飯", "main_ingredient": "雞肉",
+    "ingredients": [{"name": "雞腿", "amount": "2隻"}, {"name": "蒜頭", "amount": "3瓣"}],
+    "steps": ["雞腿以鹽、米酒醃10分鐘", "蒜頭切末", "雞腿煎至兩面金黃", "加入蒜末炒香後燜5分鐘"]}]}]}
+
+SLOT_PROMPT = PromptLayout(
+    "planner",
+    static=[("instructions", f"""
+你是菜單規劃助手。一份多天菜單中有部分餐點缺少或格式錯誤，只需要為列出的槽位重新規劃食譜，其他餐點已完成、不要輸出。
+
+## 規則:
+1. 每個槽位至少一個食譜，優先使用該槽位列出的食材分組，主食材放在 main_ingredient
+2. 食譜必須包含 recipe_name、main_ingredient、ingredients（name 與 amount）、steps（3-7步）
+3. 避免與已排入的菜色重複
+4. day 與 meal 照抄槽位列表
+5. 只輸出純 JSON，不要任何其他文字
+
+## 輸出格式:
+{compact_json(_EXAMPLE)}
+""")],
+    dynamic=[
+        ("basics", """
+### 基本資訊:
+- 人數: {people}人
+- 最大烹飪時間: {max_cooking_time}分鐘
+- 最大步驟數: {max_steps}步
+- 偏好: {preferences}
+"""),
+        ("planned", """
+### 已排入的菜色:
+{planned}
+"""),
+        ("slots", """
+### 需要重新規劃的槽位:
+{slots}
+"""),
+    ],
+)
+
+
+def slot_label(slot: Slot) -> str:
+    day, field = slot
+    return f"第{day + 1}天 {MEAL_NAME_BY_FIELD[field]}"
+
+
+def _start_date(request, plan: Dict[str, Any]) -> datetime:
+    """請求指定的開始日期，其次是模型輸出的開始日期，都沒有時為今天"""
+    info = plan.get("menu_plan") if isinstance(plan.get("menu_plan"), dict) else {}
+    for value in (request.start_date, info.get("start_date")):
+        try:
+            return datetime.strptime(str(value)[:10], "%Y-%m-%d")
+        except (TypeError, ValueError):
+            continue
+    return datetime.now()
+
+
+def check_slots(request, plan: Dict[str, Any], recipe_model) -> Tuple[Dict[str, Any], List[Slot], int]:
+    """逐槽位檢查模型輸出的菜單
+
+    回傳 (保留有效食譜、補齊日期與天數後的菜單 dict, 需要重新規劃的槽位, 剔除的食譜數)；
+    請求的每一天、每一餐都必須至少有一個通過 recipe_model 驗證的食譜
+    """
+    start = _start_date(request, plan)
+    days = max(request.days, 1)
+    dates = [(start + timedelta(days=i)).strftime("%Y-%m-%d") for i in range(days)]
+    fields = [f for f, name in MEAL_NAME_BY_FIELD.items() if name in request.meals] or list(MEAL_NAME_BY_FIELD)
+
+    raw_days = plan.get("schedule") if isinstance(plan.get("schedule"), list) else []
+    raw_days = [d if isinstance(d, dict) else {} for d in raw_days]
+    # 先依日期對回請求的每一天，日期缺少或不符的再依位置對應
+    by_date: Dict[str, Dict[str, Any]] = {}
+    for day in raw_days:
+        if day.get("date") in dates:
+            by_date.setdefault(day["date"], day)
+    used = {id(d) for d in by_date.values()}
+
+    schedule, broken, dropped = [], [], 0
+    for i, date in enumerate(dates):
+        day = by_date.get(date)
+        if day is None and i < len(raw_days) and id(raw_days[i]) not in used:
+            day = raw_days[i]
+        day = day or {}
+        fixed: Dict[str, Any] = {"date": date}
+        for field in MEAL_NAME_BY_FIELD:
+            items = day.get(field) if isinstance(day.get(field), list) else []
+            valid = []
+            for item in items:
+                try:
+                    valid.append(recipe_model.model_validate(item).model_dump())
+                except ValidationError:
+                    dropped += 1
+            fixed[field] = valid
+            if field in fields and not valid:
+                broken.append((i, field))
+        schedule.append(fixed)
+
+    fixed_plan = {
+        "menu_plan": {
+            "start_date": dates[0],
+            "days": days,
+            "people": request.people,
+            "daytimes": request.meals,
+        },
+        "schedule": schedule,
+    }
+    return fixed_plan, broken, dropped
+
+
+def _groups_for(request, slot: Slot) -> List[Any]:
+    """槽位對應的食材分組；分組沒有槽位資訊時全部列出，由模型挑選"""
+    day, field = slot
+    tagged = [g for g in request.ingredient_groups if g.day is not None and g.meal]
+    if not tagged:
+        return list(request.ingredient_groups)
+    return [g for g in tagged if g.day == day + 1 and g.meal == MEAL_NAME_BY_FIELD[field]]
+
+
+def render_slot_prompt(request, plan: Dict[str, Any], broken: List[Slot]) -> str:
+    """只含壞掉槽位與其食材分組的小型 user 提示詞"""
+    planned = sorted({r["recipe_name"] for day in plan["schedule"] for f in MEAL_NAME_BY_FIELD for r in day[f]})
+    lines = []
+    for slot in broken:
+        lines.append(f"- {slot_label(slot)}")
+        lines.extend(f"  {g.to_prompt_line()}" for g in _groups_for(request, slot))
+    return SLOT_PROMPT.render(
+        people=request.people,
+        max_cooking_time=request.max_cooking_time,
+        max_steps=request.max_steps,
+        preferences=", ".join(request.preferences),
+        planned=", ".join(planned) or "（無）",
+        slots="\n".join(lines),
+    )
+
+
+def parse_slots(data: Any, broken: List[Slot], recipe_model) -> Dict[Slot, List[Dict[str, Any]]]:
+    """模型回傳的 {"slots": [...]}，只接受列出的槽位與通過驗證的食譜"""
+    wanted = {(day + 1, MEAL_NAME_BY_FIELD[field]): (day, field) for day, field in broken}
+    entries = data.get("slots") if isinstance(data, dict) else data
+    result: Dict[Slot, List[Dict[str, Any]]] = {}
+    for entry in entries if isinstance(entries, list) else []:
+        if not isinstance(entry, dict):
+            continue
+        try:
+            key = (int(entry.get("day")), entry.get("meal"))
+        except (TypeError, ValueError):
+            continue
+        slot = wanted.get(key)
+        if slot is None:
+            continue
+        for item in entry.get("recipes") if isinstance(entry.get("recipes"), list) else []:
+            try:
+                result.setdefault(slot, []).append(recipe_model.model_validate(item).model_dump())
+            except ValidationError:
+                continue
+    return result
+
+
+def merge_slots(plan: Dict[str, Any], recipes: Dict[Slot, List[Dict[str, Any]]]) -> Dict[str, Any]:
+    """把重新規劃的食譜放回對應的天與餐"""
+    for (day, field), items in recipes.items():
+        plan["schedule"][day][field] = items
+    return plan
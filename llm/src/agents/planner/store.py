@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+"""
+Postgres 食譜語料
+RECIPE_BACKEND=postgres 時 planner 工具改查資料庫，而不是把 recipes.json 整份載入記憶體：
+- recipes / recipe_ingredients / recipe_tags 三張正規化的表（見 db/init.sql）
+- 食材名稱與標題以 pg_trgm 三元組索引支援 ILIKE '%詞%'，標準食材 ID（canon.py）存成 TEXT[] 以 GIN 索引查詢
+- search_tsv 為標題、食材、標準 ID 與標籤組成的全文檢索欄位（'simple' 設定，依空白切詞）
+- 覆蓋率排序（ranking.py 的加權分數）改在 SQL 以 unnest + GROUP BY 計算，只取回前 top_k 筆
+
+爬蟲輸出以 ingest_recipes() 或 python -m agents.planner.store <recipes.json> 匯入；同一 url 重複匯入時覆寫
+"""
+
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from agents.planner.canon import canonical_ids, ingredient_ids, normalize
+from agents.planner.features import CONSTRAINTS
+from agents.planner.ranking import PANTRY, SCORE_DIGITS, expiry_weight
+
+# features.py 的特徵欄 → recipes 表的數值欄位
+_COLUMNS = {
+    "cooking_time": "cooking_time",
+    "steps": "step_count",
+    "servings": "servings",
+    "ingredients": "ingredient_count",
+}
+
+# 每批匯入的食譜數
+INGEST_CHUNK = 500
+
+
+def recipe_backend() -> str:
+    """RECIPE_BACKEND: json（預設，讀 data/recipes.json）或 postgres"""
+    return os.getenv("RECIPE_BACKEND", "json").lower()
+
+
+def _recipe_models():
+    from models import Recipe, RecipeIngredient, RecipeTag
+    return Recipe, RecipeIngredient, RecipeTag
+
+
+def _like(term: str) -> str:
+    """ILIKE 的 %詞% 樣式（跳脫 % _ \\）"""
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def _clean_tag(label: str) -> str:
+    return label.replace("#", "").strip().lower()
+
+
+def _recipe_url(recipe: Dict[str, Any]) -> str:
+    """沒有 url 的食譜以標題與食材雜湊出穩定的鍵，重複匯入時仍會覆寫同一筆"""
+    url = (recipe.get("url") or "").strip()
+    if url:
+        return url
+    key = json.dumps([recipe.get("title"), recipe.get("ingredients")], ensure_ascii=False, sort_keys=True)
+    return "local:" + hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+def _int(value: Any) -> Optional[int]:
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def recipe_row(recipe: Dict[str, Any]) -> Tuple[Dict[str, Any], List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """爬蟲輸出的一個食譜 → (recipes 列, recipe_ingredients 列, recipe_tags 列)；子表的 recipe_id 匯入時補上"""
+    ingredients = [ing for ing in recipe.get("ingredients") or [] if isinstance(ing, dict) and ing.get("name")]
+    steps = [s for s in recipe.get("steps") or [] if isinstance(s, str)]
+    labels = [t for t in recipe.get("tags") or [] if isinstance(t, str) and _clean_tag(t)]
+
+    ids: set = set()
+    ingredient_rows = []
+    for pos, ing in enumerate(ingredients):
+        ids |= ingredient_ids(ing["name"])
+        ingredient_rows.append({
+            "position": pos,
+            "name": ing["name"],
+            "amount": ing.get("amount"),
+            "canonical_ids": sorted(canonical_ids(ing["name"])),
+        })
+    tag_rows = [{"position": pos, "label": label, "tag": _clean_tag(label)} for pos, label in enumerate(labels)]
+
+    title = recipe.get("title") or ""
+    words = [normalize(title), *(normalize(ing["name"]) for ing in ingredients), *sorted(ids),
+             *(row["tag"] for row in tag_rows)]
+    search_text = " ".join(dict.fromkeys(w for w in words if w))
+    row = {
+        "url": _recipe_url(recipe),
+        "title": title,
+        "steps": steps,
+        "cooking_time": _int(recipe.get("cooking_time")),
+        "servings": _int(recipe.get("servings")),
+        "step_count": len(recipe.get("steps") or []),
+        "ingredient_count": len(recipe.get("ingredients") or []),
+        "ingredient_ids": sorted(ids - PANTRY),
+        "search_text": search_text,
+    }
+    return row, ingredient_rows, tag_rows
+
+
+def ingest_recipes(recipes: Iterable[Dict[str, Any]], session_factory=None, chunk_size: int = INGEST_CHUNK) -> Dict[str, int]:
+    """把爬蟲輸出（recipes.json 的 recipes）寫入資料庫；url 相同者覆寫，食材與標籤整批替換
+
+    回傳 {"recipes": 寫入筆數, "ingredients": ..., "tags": ...}
+    """
+    from sqlalchemy import delete
+    from sqlalchemy.dialects.postgresql import insert
+    Recipe, RecipeIngredient, RecipeTag = _recipe_models()
+    if session_factory is None:
+        session_factory = _session_factory()
+
+    counts = {"recipes": 0, "ingredients": 0, "tags": 0}
+    batch: Dict[str, Tuple[Dict[str, Any], List[Dict[str, Any]], List[Dict[str, Any]]]] = {}
+
+    def flush() -> None:
+        if not batch:
+            return
+        stmt = insert(Recipe).values([row for row, _, _ in batch.values()])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["url"],
+            set_={name: stmt.excluded[name] for name in (
+                "title", "steps", "cooking_time", "servings", "step_count", "ingredient_count",
+                "ingredient_ids", "search_text")},
+        ).returning(Recipe.recipe_id, Recipe.url)
+        with session_factory() as s:
+            ids = {url: recipe_id for recipe_id, url in s.execute(stmt).all()}
+            s.execute(delete(RecipeIngredient).where(RecipeIngredient.recipe_id.in_(list(ids.values()))))
+            s.execute(delete(RecipeTag).where(RecipeTag.recipe_id.in_(list(ids.values()))))
+            ingredient_rows = [{**r, "recipe_id": ids[url]} for url, (_, ings, _) in batch.items() for r in ings]
+            tag_rows = [{**r, "recipe_id": ids[url]} for url, (_, _, tags) in batch.items() for r in tags]
+            if ingredient_rows:
+                s.execute(insert(RecipeIngredient), ingredient_rows)
+            if tag_rows:
+                s.execute(insert(RecipeTag), tag_rows)
+            s.commit()
+        counts["recipes"] += len(batch)
+        counts["ingredients"] += len(ingredient_rows)
+        counts["tags"] += len(tag_rows)
+        batch.clear()
+
+    for recipe in recipes:
+        row, ings, tags = recipe_row(recipe)
+        # 同一批內重複的 url 只留最後一筆（ON CONFLICT 不允許同一指令更新同一列兩次）
+        batch.pop(row["url"], None)
+        batch[row["url"]] = (row, ings, tags)
+        if len(batch) >= chunk_size:
+            flush()
+    flush()
+    return counts
+
+
+def _session_factory():
+    from db import SessionLocal
+    return SessionLocal
+
+
+class PostgresRecipeStore:
+    """以 Postgres 提供 planner 工具需要的查詢；回傳與 recipes.json 相同形狀的食譜 dict"""
+
+    def __init__(self, session_factory=None):
+        self.session_factory = session_factory or _session_factory()
+
+    # ---------- 查詢 ----------
+
+    def search_by_ingredients(self, ingredients: Sequence[str], max_results: int = 10) -> List[Dict[str, Any]]:
+        """任一食材符合即列入（與 JSON 後端相同：字典收錄者比對標準 ID，其餘以名稱子字串比對），依匯入順序"""
+        from sqlalchemy import exists, or_, select
+        Recipe, RecipeIngredient, _ = _recipe_models()
+        ids: set = set()
+        patterns: List[str] = []
+        for ing in ingredients:
+            found = canonical_ids(ing)
+            if found:
+                ids |= found
+            elif normalize(ing):
+                patterns.append(_like(normalize(ing)))
+        conditions = []
+        if ids:
+            conditions.append(RecipeIngredient.canonical_ids.overlap(sorted(ids)))
+        conditions.extend(RecipeIngredient.name.ilike(p, escape="\\") for p in patterns)
+        if not conditions:
+            return []
+        matched = exists().where(RecipeIngredient.recipe_id == Recipe.recipe_id, or_(*conditions))
+        stmt = select(Recipe.recipe_id).where(matched).order_by(Recipe.recipe_id).limit(max_results)
+        return self._fetch(stmt)
+
+    def search_by_tags(self, tags: Sequence[str], max_results: int = 10) -> List[Dict[str, Any]]:
+        """任一標籤互相包含即列入（「石斑」找得到「#石斑料理」，「龍膽石斑料理」也找得到「#石斑料理」）"""
+        from sqlalchemy import exists, func, literal, or_, select
+        Recipe, _, RecipeTag = _recipe_models()
+        terms = [_clean_tag(t) for t in tags if _clean_tag(t)]
+        if not terms:
+            return []
+        conditions = []
+        for term in terms:
+            conditions.append(RecipeTag.tag.like(_like(term), escape="\\"))
+            conditions.append(func.strpos(literal(term), RecipeTag.tag) > 0)
+        matched = exists().where(RecipeTag.recipe_id == Recipe.recipe_id, or_(*conditions))
+        stmt = select(Recipe.recipe_id).where(matched).order_by(Recipe.recipe_id).limit(max_results)
+        return self._fetch(stmt)
+
+    def search_text(self, query: str, max_results: int = 10) -> List[Dict[str, Any]]:
+        """全文檢索（標題、食材、標籤）加上標題模糊比對，依相關度排序"""
+        from sqlalchemy import func, or_, select
+        Recipe, _, _ = _recipe_models()
+        text = normalize(query)
+        if not text:
+            return []
+        tsquery = func.plainto_tsquery("simple", " ".join(normalize(w) for w in query.split()))
+        stmt = (
+            select(Recipe.recipe_id)
+            .where(or_(Recipe.search_tsv.op("@@")(tsquery), Recipe.title.ilike(_like(text), escape="\\")))
+            .order_by(func.ts_rank(Recipe.search_tsv, tsquery).desc(),
+                      func.similarity(Recipe.title, text).desc(),
+                      Recipe.recipe_id)
+            .limit(max_results)
+        )
+        return self._fetch(stmt)
+
+    def rank(self, fridge: Iterable[Tuple[str, Optional[int]]], top_k: int = 10,
+             max_missing: Optional[int] = None,
+             constraints: Optional[Dict[str, float]] = None) -> List[Dict[str, Any]]:
+        """依冰箱食材排序食譜；分數、覆蓋率與排序規則同 ranking.CoverageMatrix.rank
+
+        只有與冰箱有共同食材的食譜會被計分（ingredient_ids && 冰箱 ID 走 GIN 索引）
+        """
+        from sqlalchemy import bindparam, text
+        from sqlalchemy.dialects.postgresql import ARRAY
+        from sqlalchemy.types import Float, Text
+
+        weights: Dict[str, float] = {}
+        for name, days_left in fridge:
+            w = expiry_weight(days_left)
+            for cid in ingredient_ids(name):
+                weights[cid] = max(weights.get(cid, 0.0), w)
+        if not weights:
+            return []
+
+        where = ["r.ingredient_ids && :cids"]
+        params: Dict[str, Any] = {"cids": list(weights), "weights": list(weights.values()), "top_k": top_k,
+                                  "digits": SCORE_DIGITS}
+        for i, (key, value) in enumerate(sorted((constraints or {}).items())):
+            if key not in CONSTRAINTS:
+                continue
+            column, side = CONSTRAINTS[key]
+            where.append(f"r.{_COLUMNS[column]} {'<=' if side == 'max' else '>='} :c{i}")
+            params[f"c{i}"] = value
+        having = ""
+        if max_missing is not None:
+            having = "HAVING cardinality(r.ingredient_ids) - count(*) <= :max_missing"
+            params["max_missing"] = max_missing
+
+        stmt = text(f"""
+            WITH fridge AS (
+                SELECT * FROM unnest(:cids, :weights) AS f(cid, weight)
+            )
+            SELECT r.recipe_id,
+                   count(*) AS hits,
+                   cardinality(r.ingredient_ids) AS needed,
+                   sum(f.weight) / greatest(cardinality(r.ingredient_ids), 1) AS score,
+                   array_agg(f.cid ORDER BY u.ord) AS matched
+            FROM recipes r
+            CROSS JOIN LATERAL unnest(r.ingredient_ids) WITH ORDINALITY AS u(cid, ord)
+            JOIN fridge f ON f.cid = u.cid
+            WHERE {' AND '.join(where)}
+            GROUP BY r.recipe_id
+            {having}
+            ORDER BY round((sum(f.weight) / greatest(cardinality(r.ingredient_ids), 1))::numeric, :digits) DESC,
+                     cardinality(r.ingredient_ids) - count(*), r.recipe_id
+            LIMIT :top_k
+        """).bindparams(bindparam("cids", type_=ARRAY(Text)), bindparam("weights", type_=ARRAY(Float)))
+
+        with self.session_factory() as s:
+            rows = s.execute(stmt, params).all()
+            recipes = self._load(s, [row.recipe_id for row in rows])
+        ranked = []
+        for row in rows:
+            recipe = recipes[row.recipe_id]
+            needed = max(row.needed, 1)
+            matched = set(row.matched)
+            ranked.append({
+                **recipe["data"],
+                "score": round(float(row.score), 4),
+                "coverage": round(row.hits / needed, 4),
+                "missing_count": int(row.needed - row.hits),
+                "matched_ingredients": list(row.matched),
+                "missing_ingredients": [cid for cid in recipe["ingredient_ids"] if cid not in matched],
+            })
+        return ranked
+
+    def count(self) -> int:
+        from sqlalchemy import func, select
+        Recipe, _, _ = _recipe_models()
+        with self.session_factory() as s:
+            return s.execute(select(func.count()).select_from(Recipe)).scalar_one()
+
+    # ---------- 組回食譜 dict ----------
+
+    def _fetch(self, stmt) -> List[Dict[str, Any]]:
+        with self.session_factory() as s:
+            ids = s.execute(stmt).scalars().all()
+            recipes = self._load(s, ids)
+        return [recipes[i]["data"] for i in ids]
+
+    def _load(self, session, recipe_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+        """一次讀回多個食譜與其食材、標籤（三個查詢，不逐筆 lazy load）"""
+        from sqlalchemy import select
+        Recipe, RecipeIngredient, RecipeTag = _recipe_models()
+        if not recipe_ids:
+            return {}
+        rows = session.execute(select(Recipe).where(Recipe.recipe_id.in_(recipe_ids))).scalars().all()
+        ingredients: Dict[int, List[Dict[str, Any]]] = {}
+        for ing in session.execute(select(RecipeIngredient)
+                                   .where(RecipeIngredient.recipe_id.in_(recipe_ids))
+                                   .order_by(RecipeIngredient.recipe_id, RecipeIngredient.position)).scalars():
+            ingredients.setdefault(ing.recipe_id, []).append({"name": ing.name, "amount": ing.amount})
+        tags: Dict[int, List[str]] = {}
+        for tag in session.execute(select(RecipeTag)
+                                   .where(RecipeTag.recipe_id.in_(recipe_ids))
+                                   .order_by(RecipeTag.recipe_id, RecipeTag.position)).scalars():
+            tags.setdefault(tag.recipe_id, []).append(tag.label)
+        return {
+            r.recipe_id: {
+                "ingredient_ids": list(r.ingredient_ids or []),
+                "data": {
+                    "title": r.title,
+                    "ingredients": ingredients.get(r.recipe_id, []),
+                    "steps": list(r.steps or []),
+                    "cooking_time": r.cooking_time,
+                    "servings": r.servings,
+                    "url": "" if r.url.startswith("local:") else r.url,
+                    "tags": tags.get(r.recipe_id, []),
+                },
+            }
+            for r in rows
+        }
+
+
+_store: Optional[PostgresRecipeStore] = None
+_store_lock = threading.Lock()
+
+
+def get_recipe_store() -> PostgresRecipeStore:
+    """建立（並快取）Postgres 食譜語料"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = PostgresRecipeStore()
+        return _store
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """匯入爬蟲輸出：python -m agents.planner.store data/recipes.json [...]"""
+    import argparse
+    parser = argparse.ArgumentParser(description="匯入食譜 JSON 到 Postgres")
+    parser.add_argument("files", nargs="+", help="爬蟲輸出的 recipes.json")
+    parser.add_argument("--chunk-size", type=int, default=INGEST_CHUNK)
+    args = parser.parse_args(argv)
+    for path in args.files:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        recipes = data.get("recipes", []) if isinstance(data, dict) else data
+        counts = ingest_recipes(recipes, chunk_size=args.chunk_size)
+        print(f"{path}: 匯入 {counts['recipes']} 個食譜、{counts['ingredients']} 筆食材、{counts['tags']} 個標籤")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,8 +4,10 @@ Planner Agent 工具函式
 提供給 LangChain Agent 使用的工具
 """
 
+import heapq
 import json
 import os
+import re
 import sys
 from typing import List, Dict, Any, Optional
 from pathlib import Path
@@ -15,6 +17,15 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
 
 from langchain_core.tools import tool
 
+from agents.planner.canon import canonical_ids, normalize
+from agents.planner.features import CONSTRAINTS, filter_recipes, get_features
+from agents.planner.ranking import get_matrix, rank_recipes
+from agents.planner.store import get_recipe_store, recipe_backend
+from batch import shared
+from telemetry import get_logger, payload
+
+logger = get_logger("planner.tools")
+
 # 全局變量存儲食譜數據
 _recipes_data = None
 
@@ -31,50 +42,141 @@ def _load_recipes_data():
                         'recipes': data.get('recipes', []),
                         'pairings': data.get('pairings', [])
                     }
-                print(f"載入 {len(_recipes_data['recipes'])} 個食譜和 {len(_recipes_data['pairings'])} 個搭配")
+                    _ingredient_index(_recipes_data)
+                    get_matrix(_recipes_data)
+                    get_features(_recipes_data)
+                logger.info("載入 %d 個食譜和 %d 個搭配", len(_recipes_data['recipes']), len(_recipes_data['pairings']))
             else:
-                print(f"資料檔案 {recipes_file} 不存在")
+                logger.warning("資料檔案 %s 不存在", recipes_file)
                 _recipes_data = {'recipes': [], 'pairings': []}
         except Exception as e:
-            print(f"載入資料失敗: {e}")
+            logger.exception("載入資料失敗: %s", e)
             _recipes_data = {'recipes': [], 'pairings': []}
     return _recipes_data
 
+def _ingredient_index(data):
+    """每個食譜的標準食材 ID 與 ID → 食譜位置的倒排索引（見 canon.py），載入語料時建立一次"""
+    index = data.get('ingredient_index')
+    if index is None or index['recipes'] is not data['recipes'] or index['size'] != len(data['recipes']):
+        postings = {}
+        texts = []
+        for pos, recipe in enumerate(data['recipes']):
+            names = [ing.get('name', '') for ing in recipe.get('ingredients', [])]
+            ids = set()
+            for name in names:
+                ids |= canonical_ids(name)
+            for cid in ids:
+                postings.setdefault(cid, []).append(pos)
+            texts.append(' '.join(normalize(name) for name in names))
+        index = {'recipes': data['recipes'], 'size': len(data['recipes']), 'postings': postings, 'texts': texts}
+        data['ingredient_index'] = index
+    return index
+
+
 def _search_by_ingredients(ingredients, max_results=10):
-    """根據食材搜尋食譜"""
+    """根據食材搜尋食譜
+
+    字典收錄的食材以標準 ID 查倒排索引（「石斑魚」找得到「龍膽石斑魚塊」，「蛋」不會找到「皮蛋」）；
+    未收錄的食材退回名稱子字串比對；RECIPE_BACKEND=postgres 時改查資料庫（見 store.py）
+    """
+    if recipe_backend() == "postgres":
+        return get_recipe_store().search_by_ingredients(ingredients, max_results)
     data = _load_recipes_data()
     recipes = data['recipes']
-    
-    results = []
-    for recipe in recipes:
-        recipe_ingredients = [ing.get('name', '').lower() for ing in recipe.get('ingredients', [])]
-        # 檢查是否有任何食材匹配
-        if any(ing.lower() in ' '.join(recipe_ingredients) for ing in ingredients):
-            results.append(recipe)
-            if len(results) >= max_results:
-                break
-    return results
+    index = _ingredient_index(data)
+
+    matched = set()
+    for ing in ingredients:
+        ids = canonical_ids(ing)
+        if ids:
+            for cid in ids:
+                matched.update(index['postings'].get(cid, ()))
+            continue
+        text = normalize(ing)
+        if text:
+            matched.update(pos for pos, names in enumerate(index['texts']) if text in names)
+    # 維持語料順序
+    return [recipes[pos] for pos in heapq.nsmallest(max_results, matched)]
 
 
 def _filter_by_constraints(recipes, constraints):
-    """根據限制條件過濾食譜"""
-    filtered = []
-    for recipe in recipes:
-        # 檢查烹飪時間
-        if 'max_time' in constraints:
-            cooking_time = recipe.get('cooking_time')
-            if cooking_time and cooking_time > constraints['max_time']:
+    """根據限制條件過濾食譜（特徵欄與範圍索引見 features.py；沒有烹飪時間的食譜不符合 max_time）
+
+    Postgres 後端不載入 JSON 語料，直接以傳入的食譜建立特徵欄
+    """
+    if recipe_backend() == "postgres":
+        return filter_recipes(recipes, constraints)
+    return filter_recipes(recipes, constraints, get_features(_load_recipes_data()))
+
+
+def _search_by_tags(tags, max_results=10):
+    """根據標籤搜尋食譜：標籤互相包含即符合（不分大小寫、忽略 #），維持語料順序"""
+    if recipe_backend() == "postgres":
+        return get_recipe_store().search_by_tags(tags, max_results)
+    matched = []
+    for recipe in _load_recipes_data()['recipes']:
+        recipe_tags = [tag.replace('#', '').lower() for tag in recipe.get('tags', [])]
+        if any(search == tag or search in tag or tag in search
+               for search in (t.lower() for t in tags) for tag in recipe_tags):
+            matched.append(recipe)
+            if len(matched) >= max_results:
+                break
+    return matched
+
+
+def _search_text(query, max_results=10):
+    """以關鍵字搜尋食譜標題、食材與標籤
+
+    Postgres 後端用全文檢索與標題三元組相似度排序；JSON 語料退回正規化後的子字串比對，標題命中者優先
+    """
+    if recipe_backend() == "postgres":
+        return get_recipe_store().search_text(query, max_results)
+    words = [w for w in (normalize(w) for w in query.split()) if w]
+    if not words:
+        return []
+    data = _load_recipes_data()
+    texts = _ingredient_index(data)['texts']
+    hits = []
+    for pos, recipe in enumerate(data['recipes']):
+        title = normalize(recipe.get('title', ''))
+        haystack = ' '.join([title, texts[pos], *(t.replace('#', '').lower() for t in recipe.get('tags', []))])
+        if all(w in haystack for w in words):
+            hits.append((-sum(w in title for w in words), pos))
+    return [data['recipes'][pos] for _, pos in heapq.nsmallest(max_results, hits)]
+
+
+def _rank_recipes(fridge, top_k=10, max_missing=None, constraints=None):
+    """依冰箱食材 [(名稱, 剩餘天數)] 排序食譜（JSON 語料以稀疏矩陣計算，Postgres 後端在 SQL 計算）
+
+    top_k 限制在 1~100：負數會從結尾切片，Postgres 則變成 LIMIT -1
+    """
+    top_k = max(1, min(top_k, 100))
+    if recipe_backend() == "postgres":
+        return get_recipe_store().rank(fridge, top_k, max_missing, constraints)
+    return rank_recipes(_load_recipes_data(), fridge, top_k, max_missing, constraints)
+
+
+_NUMBER = re.compile(r'[-+]?\d+(?:\.\d+)?')
+
+
+def _parse_constraints(constraints):
+    """解析 "max_time:30,max_steps:5" 格式的限制條件
+
+    數值取開頭的數字（"max_time:30分鐘" 視為 30）；不認得的條件或無法解析的數值記錄後忽略，不中斷工具呼叫
+    """
+    parsed = {}
+    for constraint in (constraints or '').split(','):
+        if ':' in constraint:
+            key, value = constraint.split(':', 1)
+            key = key.strip()
+            if key not in CONSTRAINTS:
                 continue
-        
-        # 檢查步驟數 - 從 steps 陣列計算
-        if 'max_steps' in constraints:
-            steps = recipe.get('steps', [])
-            num_steps = len(steps)
-            if num_steps > constraints['max_steps']:
+            match = _NUMBER.match(value.strip())
+            if match is None:
+                logger.warning("忽略無法解析的限制條件: %s", constraint.strip())
                 continue
-        
-        filtered.append(recipe)
-    return filtered
+            parsed[key] = float(match.group())
+    return parsed
 
 @tool
 def search_recipe_by_ingredient(ingredients: str, max_results: int = 10) -> str:
@@ -89,13 +191,49 @@ def search_recipe_by_ingredient(ingredients: str, max_results: int = 10) -> str:
         JSON格式的食譜搜尋結果
     """
     ingredient_list = [ing.strip() for ing in ingredients.split(',')]
-    recipes = _search_by_ingredients(ingredient_list, max_results)
+    recipes = shared("search_recipe_by_ingredient", _search_by_ingredients, ingredient_list, max_results)
+    
+    result = {
+        "total_found": len(recipes),
+        "recipes": recipes
+    }
+    logger.debug("search_recipe_by_ingredient 搜尋食材: %s, 找到 %d 個", ingredient_list, len(recipes))
+    return json.dumps(result, ensure_ascii=False, indent=2)
+
+
+@tool
+def rank_recipes_by_fridge(ingredients: str, top_k: int = 10, max_missing: Optional[int] = None,
+                           constraints: str = "") -> str:
+    """
+    依現有食材一次排序所有食譜，優先使用快到期的食材
+    
+    Args:
+        ingredients: 現有食材，用逗號分隔，可用「名稱:剩餘天數」標示到期 (例如: "雞腿:1,洋蔥:5,番茄")
+        top_k: 回傳前幾名
+        max_missing: 最多允許缺少幾樣食材（不含鹽、糖、醬油等常備調味料），不指定則不限
+        constraints: 限制條件，格式同 filter_recipes_by_constraints，如 "max_time:30,max_steps:5" (可選)
     
+    Returns:
+        JSON格式的排序結果，每個食譜附 score、coverage、missing_count、missing_ingredients
+    """
+    fridge = []
+    for item in ingredients.split(','):
+        name, _, days = item.partition(':')
+        name = name.strip()
+        if not name:
+            continue
+        try:
+            fridge.append((name, int(days.strip())))
+        except ValueError:
+            fridge.append((name, None))
+    recipes = shared("rank_recipes_by_fridge", _rank_recipes,
+                     fridge, top_k, max_missing, _parse_constraints(constraints))
+    logger.debug("rank_recipes_by_fridge 食材: %s, 結果: %s", fridge,
+                 payload([(r.get('title'), r['score']) for r in recipes]))
     result = {
         "total_found": len(recipes),
         "recipes": recipes
     }
-    print(f"🔍 planner agent: search_recipe_by_ingredient, 搜尋食材: {ingredient_list}")
     return json.dumps(result, ensure_ascii=False, indent=2)
 
 
@@ -111,39 +249,13 @@ def search_recipes_by_tags(tags: str, max_results: int = 10) -> str:
     Returns:
         JSON格式的食譜搜尋結果
     """
-    data = _load_recipes_data()
-    recipes = data['recipes']
-    
     # 解析標籤
     tag_list = [tag.strip().replace('#', '') for tag in tags.split(',')]
     tag_list = [tag for tag in tag_list if tag]  # 移除空標籤
-    
-    print(f"🔍 planner agent: search_recipes_by_tags, 搜尋標籤: {tag_list}")
-    
-    filtered_recipes = []
-    for recipe in recipes:
-        recipe_tags = recipe.get('tags', [])
-        
-        # 檢查是否有任何標籤匹配
-        matched = False
-        for search_tag in tag_list:
-            for recipe_tag in recipe_tags:
-                clean_search = search_tag.lower()
-                clean_recipe = recipe_tag.replace('#', '').lower()
-                
-                if (clean_search == clean_recipe or 
-                    clean_search in clean_recipe or 
-                    clean_recipe in clean_search):
-                    matched = True
-                    break
-            if matched:
-                break
-        
-        if matched:
-            filtered_recipes.append(recipe)
-            if len(filtered_recipes) >= max_results:
-                break
-    print(f"🔍 planner agent: search_recipes_by_tags, 搜尋結果: {filtered_recipes}")
+
+    filtered_recipes = shared("search_recipes_by_tags", _search_by_tags, tag_list, max_results)
+    logger.debug("search_recipes_by_tags 搜尋標籤: %s, 結果: %s", tag_list,
+                 payload([r.get('title') for r in filtered_recipes]))
     result = {
         "total_found": len(filtered_recipes),
         "search_tags": tag_list,
@@ -159,7 +271,8 @@ def filter_recipes_by_constraints(recipes_json: str, constraints: str = "") -> s
     
     Args:
         recipes_json: JSON格式的食譜列表
-        constraints: 限制條件，格式: "max_time:30,max_steps:5" 或 "max_time:30" 或 "max_steps:5" (可選)
+        constraints: 限制條件，格式: "max_time:30,max_steps:5" 或 "max_time:30" 或 "max_steps:5" (可選)；
+            另支援 min_time、min_steps、min_servings、max_servings、min_ingredients、max_ingredients
     
     Returns:
         JSON格式的過濾後食譜列表
@@ -213,22 +326,8 @@ def filter_recipes_by_constraints(recipes_json: str, constraints: str = "") -> s
         else:
             recipes = []
         
-        # 解析限制條件
-        constraints_dict = {}
-        if constraints:
-            for constraint in constraints.split(','):
-                if ':' in constraint:
-                    key, value = constraint.split(':', 1)
-                    key = key.strip()
-                    value = value.strip()
-                    
-                    if key == 'max_time':
-                        constraints_dict['max_time'] = int(value)
-                    elif key == 'max_steps':
-                        constraints_dict['max_steps'] = int(value)
-        
-        # 過濾食譜
-        filtered_recipes = _filter_by_constraints(recipes, constraints_dict)
+        # 解析限制條件並過濾食譜
+        filtered_recipes = _filter_by_constraints(recipes, _parse_constraints(constraints))
         
         result = {
             "total_found": len(filtered_recipes),
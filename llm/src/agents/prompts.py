@@ -0,0 +1,199 @@
+# llm/src/agents/prompts.py
+"""
+提示詞組裝與大小分析
+- PromptLayout：system 訊息只由固定段落組成（角色、流程、輸出範例、規則），每次呼叫逐字相同，
+  可命中供應商的 prompt 前綴快取；每次請求不同的資料全部放在最後一則 user 訊息，且越常變動的段落越靠後
+- PromptProfiler：每次 LLM 呼叫依段落（工具定義、各固定段落、各請求段落、agent 中間步驟）估算 token 數，
+  寫入 menufest_prompt_tokens 指標與 debug 日誌
+"""
+from __future__ import annotations
+
+import json
+import os
+import re
+import threading
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from metrics import PROMPT_TOKENS
+from telemetry import get_logger
+
+logger = get_logger("prompts")
+
+# 每個 profiler 保留的最近呼叫數
+_MAX_CALLS = 200
+
+_CJK = re.compile(r"[⺀-鿿豈-﫿＀-￯]")
+
+
+def profiling_enabled() -> bool:
+    """PROMPT_PROFILE（預設開啟）：每次 LLM 呼叫記錄各段落的 token 數"""
+    return os.getenv("PROMPT_PROFILE", "1").lower() not in ("0", "false", "no")
+
+
+def compact_json(data: Any) -> str:
+    """單行、無多餘空白的 JSON；提示詞中的範例用這個格式，縮排空白也算 token"""
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+@lru_cache(maxsize=4)
+def _encoding(model: str):
+    """tiktoken 編碼；沒有安裝或無法下載編碼檔（離線環境）時為 None，改用估算"""
+    try:
+        import tiktoken
+
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        logger.info("無法載入 tiktoken 編碼（%s），token 數改用估算", type(e).__name__)
+        return None
+
+
+def count_tokens(text: str, model: str = "gpt-4o-mini") -> Tuple[int, bool]:
+    """(token 數, 是否為估算)；估算時中日韓字元一字一 token，其餘每 4 個字元一 token"""
+    if not text:
+        return 0, False
+    encoding = _encoding(model)
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=())), False
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4, True
+
+
+class PromptLayout:
+    """固定前綴 + 請求資料的提示詞版面
+
+    static:  [(段落名稱, 內容)]，依序組成 system 訊息，不含任何待填欄位
+    dynamic: [(段落名稱, 模板)]，依序組成 user 訊息；每個模板以固定的標題行開頭，
+             profiler 依標題把 user 訊息切回各段落，穩定的段落排前面、每次都不同的排最後
+    """
+
+    def __init__(self, agent: str, static: Sequence[Tuple[str, str]], dynamic: Sequence[Tuple[str, str]]):
+        self.agent = agent
+        self.static = [(name, text.strip()) for name, text in static]
+        self.dynamic = [(name, template.strip()) for name, template in dynamic]
+        self.system = "\n\n".join(text for _, text in self.static)
+        # 各段落在 user 訊息中的標題行（模板第一行）
+        self._headings = [(name, template.split("\n", 1)[0]) for name, template in self.dynamic]
+
+    @property
+    def system_template(self) -> str:
+        """給 ChatPromptTemplate 用的 system 內容（大括號跳脫）"""
+        return self.system.replace("{", "{{").replace("}", "}}")
+
+    def render(self, **values: Any) -> str:
+        return "\n\n".join(template.format(**values) for _, template in self.dynamic)
+
+    def split(self, text: str) -> List[Tuple[str, str]]:
+        """把 render 的結果切回 [(段落名稱, 內容)]；找不到標題時整段記為 request"""
+        starts = []
+        for name, heading in self._headings:
+            pos = text.find(heading)
+            if pos >= 0:
+                starts.append((pos, name))
+        if not starts:
+            return [("request", text)]
+        starts.sort()
+        sections = []
+        if text[:starts[0][0]].strip():
+            sections.append(("request", text[:starts[0][0]]))
+        for (pos, name), (end, _) in zip(starts, starts[1:] + [(len(text), "")]):
+            sections.append((name, text[pos:end]))
+        return sections
+
+
+def _tool_schemas(tools: Sequence[Any]) -> str:
+    from langchain_core.utils.function_calling import convert_to_openai_tool
+
+    return compact_json([convert_to_openai_tool(t) for t in tools])
+
+
+class PromptProfiler(BaseCallbackHandler):
+    """每次 LLM 呼叫依段落統計輸入 token
+
+    段落：tools（工具定義）、static.<名稱>（固定前綴）、request.<名稱>（請求資料）、
+    scratchpad（工具呼叫與結果等中間步驟）、other（與版面不符的訊息）。
+    固定前綴 = tools + static.*，是每次呼叫都相同、可被供應商快取的部分
+    """
+
+    def __init__(self, layout: PromptLayout, tools: Sequence[Any] = (), model: str = "gpt-4o-mini"):
+        self.layout = layout
+        self.model = model
+        self.calls: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        # 固定段落只算一次
+        counts = {f"static.{name}": count_tokens(text, model) for name, text in layout.static}
+        if tools:
+            counts["tools"] = count_tokens(_tool_schemas(tools), model)
+        self._static = {name: tokens for name, (tokens, _) in counts.items() if name != "tools"}
+        self._tools = counts["tools"][0] if tools else 0
+        self._estimated = any(approx for _, approx in counts.values())
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        for batch in messages:
+            try:
+                self.record(self.profile(batch))
+            except Exception:
+                # 分析失敗不影響模型呼叫
+                logger.debug("提示詞分析失敗", exc_info=True)
+
+    def profile(self, messages: Sequence[Any]) -> Dict[str, Any]:
+        """單次呼叫的各段落 token 數"""
+        sections: Dict[str, int] = {}
+        estimated = False
+
+        def add(name: str, text: str) -> None:
+            nonlocal estimated
+            tokens, approx = count_tokens(text, self.model)
+            estimated = estimated or approx
+            sections[name] = sections.get(name, 0) + tokens
+
+        if self._tools:
+            sections["tools"] = self._tools
+            estimated = self._estimated
+        seen_request = False
+        for m in messages:
+            content = m.content if isinstance(m.content, str) else compact_json(m.content)
+            if m.type == "system" and content.strip() == self.layout.system:
+                sections.update(self._static)
+                estimated = estimated or self._estimated
+            elif m.type == "human" and not seen_request:
+                seen_request = True
+                for name, text in self.layout.split(content):
+                    add(f"request.{name}", text)
+            elif m.type in ("ai", "tool") or (m.type == "human" and seen_request):
+                add("scratchpad", content)
+                for call in getattr(m, "tool_calls", None) or []:
+                    add("scratchpad", compact_json(call.get("args", {})))
+            else:
+                add("other", content)
+
+        static = sum(v for k, v in sections.items() if k == "tools" or k.startswith("static."))
+        total = sum(sections.values())
+        return {
+            "agent": self.layout.agent,
+            "sections": sections,
+            "static_prefix_tokens": static,
+            "total_tokens": total,
+            "static_ratio": round(static / total, 3) if total else 0.0,
+            "estimated": estimated,
+        }
+
+    def record(self, call: Dict[str, Any]) -> None:
+        for section, tokens in call["sections"].items():
+            PROMPT_TOKENS.labels(call["agent"], section).observe(tokens)
+        with self._lock:
+            self.calls.append(call)
+            del self.calls[:-_MAX_CALLS]
+        logger.debug("提示詞大小: agent=%s, 共 %d token（固定前綴 %d%s）, 段落 %s",
+                     call["agent"], call["total_tokens"], call["static_prefix_tokens"],
+                     "，估算" if call["estimated"] else "", call["sections"])
+
+
+def make_profiler(layout: PromptLayout, tools: Sequence[Any] = ()) -> Optional[PromptProfiler]:
+    """PROMPT_PROFILE 開啟時建立 agent 共用的 PromptProfiler（可跨呼叫、跨執行緒使用），否則為 None"""
+    return PromptProfiler(layout, tools) if profiling_enabled() else None
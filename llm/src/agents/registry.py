@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Agent Registry
+整個 process 共用一份 Selector / Planner / Orchestrator 與 ChatOpenAI client，第一次取用時才建立；
+服務啟動時以 warm() 預先載入 langchain / langgraph、食譜資料與 DB 連線池，/readyz 依此回報是否就緒
+"""
+
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from telemetry import get_logger
+
+logger = get_logger("registry")
+
+DEFAULT_MODEL = "gpt-4o-mini"
+
+
+class AgentRegistry:
+    """以名稱快取共用實例
+
+    get() 第一次取用時呼叫對應的 factory 建立實例，之後都回傳同一份；
+    override() 可直接放入實例（例如基準測試的假模型 agent）
+    """
+
+    def __init__(self):
+        # orchestrator 的 factory 會再取 selector / planner，因此用可重入鎖
+        self._lock = threading.RLock()
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        self._instances: Dict[str, Any] = {}
+        self._status: Dict[str, Dict[str, Any]] = {}
+        self._warm_thread: Optional[threading.Thread] = None
+
+    def register(self, name: str, factory: Callable[[], Any]) -> None:
+        with self._lock:
+            self._factories[name] = factory
+
+    def get(self, name: str) -> Any:
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+        with self._lock:
+            instance = self._instances.get(name)
+            if instance is None:
+                if name not in self._factories:
+                    raise KeyError(f"未註冊的元件: {name}")
+                start = time.perf_counter()
+                instance = self._factories[name]()
+                self._instances[name] = instance
+                logger.info("建立 %s 耗時 %.0fms", name, (time.perf_counter() - start) * 1000)
+            return instance
+
+    def override(self, name: str, instance: Any) -> None:
+        """直接指定實例，取代 factory 建立的版本"""
+        with self._lock:
+            self._instances[name] = instance
+
+    def reset(self, *names: str) -> None:
+        """清除快取的實例（不指定名稱則全部清除），下次 get() 時重新建立"""
+        with self._lock:
+            for name in names or list(self._instances):
+                self._instances.pop(name, None)
+
+    # ==================== 預熱 ====================
+
+    def warm(self) -> Dict[str, Dict[str, Any]]:
+        """依序執行所有預熱步驟，已成功的步驟不重跑；回傳各步驟狀態"""
+        for name, step in _warm_steps(self):
+            if self._status.get(name, {}).get("ready"):
+                continue
+            start = time.perf_counter()
+            try:
+                step()
+                self._status[name] = {"ready": True, "ms": round((time.perf_counter() - start) * 1000, 1)}
+            except Exception as e:
+                logger.warning("預熱 %s 失敗: %s", name, e)
+                self._status[name] = {"ready": False, "ms": round((time.perf_counter() - start) * 1000, 1),
+                                      "error": f"{type(e).__name__}: {e}"}
+        logger.info("預熱完成: %s", {k: v["ready"] for k, v in self._status.items()})
+        return self.status()
+
+    def start_warm(self) -> bool:
+        """在背景執行緒預熱；已有預熱在跑則不重複啟動"""
+        with self._lock:
+            if self._warm_thread is not None and self._warm_thread.is_alive():
+                return False
+            self._warm_thread = threading.Thread(target=self.warm, name="agent-registry-warm", daemon=True)
+            self._warm_thread.start()
+            return True
+
+    @property
+    def warming(self) -> bool:
+        thread = self._warm_thread
+        return thread is not None and thread.is_alive()
+
+    @property
+    def ready(self) -> bool:
+        names = [name for name, _ in _warm_steps(self)]
+        return all(self._status.get(name, {}).get("ready") for name in names)
+
+    def status(self) -> Dict[str, Dict[str, Any]]:
+        return {name: dict(self._status.get(name, {"ready": False})) for name, _ in _warm_steps(self)}
+
+
+# ==================== 預熱步驟 ====================
+
+def _load_recipes() -> None:
+    # JSON 語料整份載入並建立索引；Postgres 語料只確認資料表可查詢
+    from agents.planner.store import get_recipe_store, recipe_backend
+    from agents.planner.tools import _load_recipes_data
+    if recipe_backend() == "postgres":
+        get_recipe_store().count()
+    else:
+        _load_recipes_data()
+
+
+def _ping_database() -> None:
+    # 先建立一條連線放進連線池，第一個請求就不必付連線成本
+    from sqlalchemy import text
+    from db import engine
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+
+
+def _open_artifact_store() -> None:
+    from artifacts import get_artifact_store
+    get_artifact_store()
+
+
+def _warm_steps(reg: AgentRegistry) -> List[Tuple[str, Callable[[], Any]]]:
+    return [
+        ("recipes", _load_recipes),
+        ("database", _ping_database),
+        ("artifacts", _open_artifact_store),
+        ("selector", lambda: reg.get("selector")),
+        ("planner", lambda: reg.get("planner")),
+        ("orchestrator", lambda: reg.get("orchestrator")),
+    ]
+
+
+# ==================== 共用實例 ====================
+
+registry = AgentRegistry()
+
+_chat_models: Dict[Tuple[str, float], Any] = {}
+_chat_lock = threading.Lock()
+
+
+def get_chat_model(model: str = DEFAULT_MODEL, temperature: float = 0.0):
+    """同一組 (model, temperature) 共用一個 ChatOpenAI；所有 ChatOpenAI 共用同一組 HTTP client（見 http_client.py）
+
+    LLM_SCHEDULER（預設開啟）時重試交給排程器（見 scheduler.py），SDK 自己的重試關掉以免疊加
+    """
+    key = (model, temperature)
+    with _chat_lock:
+        if key not in _chat_models:
+            from langchain_openai import ChatOpenAI
+            from http_client import llm_timeout, shared_clients
+            from scheduler import scheduler_enabled
+            http_client, http_async_client = shared_clients()
+            _chat_models[key] = ChatOpenAI(
+                model=model,
+                temperature=temperature,
+                # stream_usage: 串流呼叫（structured 最後一步）也回報 token 用量
+                stream_usage=True,
+                timeout=llm_timeout(),
+                max_retries=0 if scheduler_enabled() else 2,
+                http_client=http_client,
+                http_async_client=http_async_client,
+            )
+        return _chat_models[key]
+
+
+def _build_selector():
+    from agents.selector.agent_react import IngredientSelectorReactAgent
+    # agent 未注入 llm 時自行取 get_chat_model() 的共用實例
+    return IngredientSelectorReactAgent(model_name=DEFAULT_MODEL)
+
+
+def _build_planner():
+    from agents.planner.agent import PlannerAgent
+    return PlannerAgent()
+
+
+def _build_orchestrator():
+    from agents.main import MenufestOrchestrator
+    return MenufestOrchestrator()
+
+
+registry.register("selector", _build_selector)
+registry.register("planner", _build_planner)
+registry.register("orchestrator", _build_orchestrator)
+
+
+def get_selector():
+    return registry.get("selector")
+
+
+def get_planner():
+    return registry.get("planner")
+
+
+def get_orchestrator():
+    return registry.get("orchestrator")
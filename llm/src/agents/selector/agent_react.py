@@ -2,20 +2,44 @@
 from __future__ import annotations
 from typing import List, Optional, Dict, Any
 from pydantic import BaseModel, Field
-from langchain_openai import ChatOpenAI
-from langgraph.prebuilt import create_react_agent   # ← 新的
-from langchain_core.prompts import ChatPromptTemplate
 from langsmith import traceable
 
 # 動態導入，避免相對導入問題
+import json
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
-try:
-    from agents.selector.tools import search_fridge
-except ImportError:
-    from .tools import search_fridge
+from agents.selector.tools import list_fridge, search_fridge
+from agents.selector.allocator import allocate, allocated_totals
+from agents.selector.validator import repair
+from agents.compaction import make_compactor
+from agents.json_utils import extract_json
+from agents.prompts import PromptLayout, compact_json, make_profiler
+from agents.structured import coerce_to_schema, default_output_mode, finalize_structured, stream_structured
+from metrics import SELECTOR_REPAIRS
+from telemetry import TracingCallbackHandler, get_logger, payload, span
+from usage import TokenBudgetExceeded, UsageCallbackHandler
+
+logger = get_logger("selector")
+
+# llm: ReAct agent 自行查冰箱並分配；hybrid: 求解器分配、模型只命名與微調分組；solver: 只用求解器，不呼叫模型
+SELECTOR_MODES = ("llm", "hybrid", "solver")
+
+# 求解器一次最多讀取的冰箱食材筆數
+_FRIDGE_PAGE = 200
+_FRIDGE_MAX_ROWS = 1000
+
+
+def default_selector_mode() -> str:
+    """由 SELECTOR_MODE 決定預設分配模式（llm / hybrid / solver）"""
+    mode = os.getenv("SELECTOR_MODE", "llm").lower()
+    return mode if mode in SELECTOR_MODES else "llm"
+
+
+def default_validate() -> bool:
+    """SELECTOR_VALIDATE（預設開啟）：模型產出的分配先對照冰箱檢查，有問題在本地修正"""
+    return os.getenv("SELECTOR_VALIDATE", "1").lower() not in ("0", "false", "no")
 
 
 # --------- I/O Schemas ---------
@@ -48,11 +72,59 @@ class SelectorOutput(BaseModel):
     daily_meals: List[DayMeal]  # 按日期排列
 
 # --------- Prompt ---------
-SYSTEM_ZH = """
+# system 只放固定內容（可命中供應商的 prompt 前綴快取），每次請求的資料都在最後的 user 訊息
+_EXAMPLE = {
+    "total_days": 2,
+    "total_people": 2,
+    "start_date": "2025-10-29",
+    "daily_meals": [
+        {
+            "date": "2025-10-29",
+            "breakfast": [
+                {"dish_name": "蔥花蛋餅", "ingredients": [
+                    {"name": "雞蛋", "allocated_quantity": 4.0}, {"name": "蔥花", "allocated_quantity": 20.0}]},
+                {"dish_name": "優格水果", "ingredients": [
+                    {"name": "優格", "allocated_quantity": 200.0}, {"name": "檸檬", "allocated_quantity": 1.0}]},
+            ],
+            "lunch": [
+                {"dish_name": "蒜香雞腿飯", "ingredients": [
+                    {"name": "雞腿", "allocated_quantity": 2.0}, {"name": "高麗菜", "allocated_quantity": 200.0}]},
+                {"dish_name": "清炒時蔬", "ingredients": [
+                    {"name": "高麗菜", "allocated_quantity": 150.0}, {"name": "洋蔥", "allocated_quantity": 50.0}]},
+            ],
+            "dinner": [
+                {"dish_name": "紅燒魚", "ingredients": [
+                    {"name": "石斑魚", "allocated_quantity": 300.0}, {"name": "茼蒿", "allocated_quantity": 100.0}]},
+                {"dish_name": "豆腐湯", "ingredients": [
+                    {"name": "豆腐", "allocated_quantity": 1.0}, {"name": "洋蔥", "allocated_quantity": 50.0}]},
+            ],
+        },
+        {
+            "date": "2025-10-30",
+            "breakfast": [{"dish_name": "蛋炒飯", "ingredients": [
+                {"name": "雞蛋", "allocated_quantity": 2.0}, {"name": "米飯", "allocated_quantity": 200.0}]}],
+            "lunch": [{"dish_name": "鮭魚飯", "ingredients": [
+                {"name": "鮭魚", "allocated_quantity": 200.0}, {"name": "米飯", "allocated_quantity": 200.0}]}],
+            "dinner": [{"dish_name": "麻婆豆腐", "ingredients": [
+                {"name": "豬絞肉", "allocated_quantity": 200.0}, {"name": "豆腐", "allocated_quantity": 1.0}]}],
+        },
+    ],
+}
+_EMPTY = {"total_days": 0, "total_people": 0, "start_date": "", "daily_meals": []}
+
+
+def _empty_output() -> SelectorOutput:
+    """沒有可用分配時的空輸出（與提示詞中要求模型輸出的空結果相同）"""
+    return SelectorOutput(**_EMPTY)
+
+PROMPT = PromptLayout(
+    "selector",
+    static=[
+        ("role", """
 你是「多天菜單規劃」專家。根據天數和人數，為未來幾天規劃每日三餐菜單。
 
 ## 工作流程：
-1) search_fridge 查詢冰箱食材，排出所有過期食材/過敏食材/排除食材
+1) search_fridge 查詢冰箱食材（user_id 見規劃需求），排出所有過期食材/過敏食材/排除食材
 2) 請優先挑選即期食材作為主食材，或是user的喜好食材，並依照Flavor Network Theorem挑選搭配食材
 3) 按天數規劃：每天三餐，每餐2-3個菜色
 4) 份量計算：根據人數計算實際需要份量
@@ -62,260 +134,239 @@ SYSTEM_ZH = """
 - 每人每餐約 200-400g 總食材
 - 每餐至少2個菜色，最多3個菜色
 - 確保食材數量足夠
-
+"""),
+        ("output_format", f"""
 ## 輸出格式：
-只輸出純 JSON，不要任何其他文字。
+查詢冰箱食材後直接輸出純 JSON，不要任何其他文字。
 使用食材名稱即可，不需要 ingredient_id。
 第一個食材為主食材。
 
-{
-  "total_days": 2,
-  "total_people": 2,
-  "start_date": "2025-10-29",
-  "daily_meals": [
-    {
-      "date": "2025-10-29",
-      "breakfast": [
-        {
-          "dish_name": "蔥花蛋餅",
-          "ingredients": [
-            {"name": "雞蛋", "allocated_quantity": 4.0},
-            {"name": "蔥花", "allocated_quantity": 20.0}
-          ]
-        },
-        {
-          "dish_name": "優格水果",
-          "ingredients": [
-            {"name": "優格", "allocated_quantity": 200.0},
-            {"name": "檸檬", "allocated_quantity": 1.0}
-          ]
-        }
-      ],
-      "lunch": [
-        {
-          "dish_name": "蒜香雞腿飯",
-          "ingredients": [
-            {"name": "雞腿", "allocated_quantity": 2.0},
-            {"name": "高麗菜", "allocated_quantity": 200.0}
-          ]
-        },
-        {
-          "dish_name": "清炒時蔬",
-          "ingredients": [
-            {"name": "高麗菜", "allocated_quantity": 150.0},
-            {"name": "洋蔥", "allocated_quantity": 50.0}
-          ]
-        }
-      ],
-      "dinner": [
-        {
-          "dish_name": "紅燒魚",
-          "ingredients": [
-            {"name": "石斑魚", "allocated_quantity": 300.0},
-            {"name": "茼蒿", "allocated_quantity": 100.0}
-          ]
-        },
-        {
-          "dish_name": "豆腐湯",
-          "ingredients": [
-            {"name": "豆腐", "allocated_quantity": 1.0},
-            {"name": "洋蔥", "allocated_quantity": 50.0}
-          ]
-        }
-      ]
-    },
-    {
-      "date": "2025-10-30",
-      "breakfast": [
-        {
-          "dish_name": "蛋炒飯",
-          "ingredients": [
-            {"name": "雞蛋", "allocated_quantity": 2.0},
-            {"name": "米飯", "allocated_quantity": 200.0}
-          ]
-        }
-      ],
-      "lunch": [
-        {
-          "dish_name": "鮭魚飯",
-          "ingredients": [
-            {"name": "鮭魚", "allocated_quantity": 200.0},
-            {"name": "米飯", "allocated_quantity": 200.0}
-          ]
-        }
-      ],
-      "dinner": [
-        {
-          "dish_name": "麻婆豆腐",
-          "ingredients": [
-            {"name": "豬絞肉", "allocated_quantity": 200.0},
-            {"name": "豆腐", "allocated_quantity": 1.0}
-          ]
-        }
-      ]
-    }
-  ]
-}
+範例（2 天、2 人）：
+{compact_json(_EXAMPLE)}
 
 若無足夠食材：
-{
-  "total_days": 0,
-  "total_people": 0,
-  "start_date": "",
-  "daily_meals": []
-}
-"""
-
-USER_ZH = """
+{compact_json(_EMPTY)}
+"""),
+    ],
+    # 越常變動的段落越靠後
+    dynamic=[
+        ("plan", """
 規劃需求：
-- user_id: {user_id}
-- 天數: {days} 天
-- 人數: {people} 人
 - 餐點: {meals}
+- 人數: {people} 人
+- 天數: {days} 天
 - 開始日期: {start_date}
+"""),
+        ("user", """
+使用者：
+- user_id: {user_id}
+"""),
+    ],
+)
+
+REFINE_PROMPT = PromptLayout(
+    "selector",
+    static=[("refine", """
+你是菜單命名助手。使用者會提供一份已經分配好份量的多天菜單 JSON（食材與數量由庫存求解器決定）。
 
-任務：為未來{days}天規劃每日三餐菜單，每餐2-3個菜色，根據人數計算份量。
-請查詢冰箱食材，然後直接輸出 JSON。
-"""
+## 規則：
+1) 為每道菜取一個具體、家常的中文菜名（dish_name）
+2) 可以在同一餐內調整哪些食材放在同一道菜，但第一個食材必須是該道菜的主食材
+3) 不可新增食材、不可改變任何食材在整份菜單中的總量、不可把食材移到其他餐
+4) date、total_days、total_people、start_date 維持原值
+
+只輸出與輸入相同結構的純 JSON，不要任何其他文字。
+""")],
+    dynamic=[
+        ("people", """
+菜單需求：
+- 人數: {people} 人
+"""),
+        ("draft", """
+已分配的菜單：
+{draft}
+"""),
+    ],
+)
 
 class IngredientSelectorReactAgent:
-    def __init__(self, model_name: str = "gpt-4o-mini"):
-        self.llm = ChatOpenAI(model=model_name, temperature=0.2)
+    def __init__(self, model_name: str = "gpt-4o-mini", output_mode: Optional[str] = None, llm=None,
+                 mode: Optional[str] = None, validate: Optional[bool] = None):
+        # langgraph 匯入成本高，延到建立 agent 時才載入（見 agents/registry.py）
+        from langgraph.prebuilt import create_react_agent
+
+        # llm 可注入（例如離線基準測試的假模型）
+        if llm is None:
+            # 未注入時取 registry 的共用 ChatOpenAI（共用 HTTP 連線池與 LLM 排程器）
+            from agents.registry import get_chat_model
+            llm = get_chat_model(model_name, 0.2)
+        self.llm = llm
         self.tools = [search_fridge]
+        # prompt: 只靠提示詞要求 JSON；structured: 最終輸出綁定 SelectorOutput schema
+        self.output_mode = output_mode or default_output_mode()
+        self.mode = mode if mode in SELECTOR_MODES else default_selector_mode()
+        self.validate = default_validate() if validate is None else validate
+
+        # 中間步驟超過 SCRATCHPAD_TOKEN_BUDGET 時，較早的工具結果精簡後再送給模型
+        self.compactor = make_compactor("selector")
 
         # LangGraph 預建 ReAct Agent，支援結構化工具參數
         self.agent = create_react_agent(
             self.llm,
             tools=self.tools,
-            state_modifier=SYSTEM_ZH
+            state_modifier=self.compactor.state_modifier(PROMPT.system) if self.compactor else PROMPT.system
         )
+        # 每次呼叫各提示詞段落的 token 數（PROMPT_PROFILE=0 時不建立）
+        self.profiler = make_profiler(PROMPT, self.tools)
+        self.refine_profiler = make_profiler(REFINE_PROMPT)
 
-        self.user_prompt = ChatPromptTemplate.from_messages([("user", USER_ZH)])
+    @traceable(name="IngredientSelector")
+    def run(self, user_id: str, people: int, days: int, meals: List[str], c: SelectorConstraints, start_date: str = None,
+            mode: Optional[str] = None) -> SelectorOutput:
+        """mode 未指定時用建立 agent 時的模式（SELECTOR_MODE）"""
+        mode = mode if mode in SELECTOR_MODES else self.mode
+        with span("selector", user_id=user_id, people=people, days=days, mode=mode):
+            if mode == "llm":
+                output = self._run(user_id, people, days, meals, c, start_date)
+                if self.validate and output.daily_meals:
+                    output = self._repair(output, user_id, c)
+                return output
+            return self._run_solver(user_id, people, days, meals, c, start_date, refine=(mode == "hybrid"))
 
-    def _extract_json_from_response(self, response: str) -> Optional[Dict[str, Any]]:
-        """從回應中提取 JSON，包含常見錯誤的自動修復"""
-        import json
-        import re
-        
-        def attempt_repairs(text: str) -> str:
-            """嘗試修復常見的 JSON 格式問題，不改動語意內容。"""
-            s = text.strip()
-            # 去除 markdown 圍欄
-            s = re.sub(r"^```json\s*|^```\s*|```\s*$", "", s, flags=re.IGNORECASE | re.MULTILINE)
-            # 移除 BOM 與不可見控制字元
-            s = s.replace("\ufeff", "")
-            s = re.sub(r"[\x00-\x08\x0b\x0c\x0e-\x1f]", "", s)
-            # 移除物件與陣列中的尾逗號
-            s = re.sub(r",\s*([}\]])", r"\1", s)
-            # 轉換 NaN/Infinity 為 null
-            s = re.sub(r"\bNaN\b|\bInfinity\b|-Infinity", "null", s)
-            return s
-        
-        # 打印原始回應以便調試
-        print(f"🔍 原始回應: {response[:500]}...")
-        
-        cleaned_response = attempt_repairs(response)
-        
-        # 1) 直接解析
+    def _fridge_rows(self, user_id: str) -> List[Dict[str, Any]]:
+        """分頁讀出所有可用的冰箱食材（已依到期日排序）"""
+        return list_fridge(user_id, max_rows=_FRIDGE_MAX_ROWS, page_size=_FRIDGE_PAGE)
+
+    def _run_solver(self, user_id: str, people: int, days: int, meals: List[str], c: SelectorConstraints,
+                    start_date: str = None, refine: bool = False) -> SelectorOutput:
+        """求解器分配份量；refine 時再以一次模型呼叫命名菜色並微調分組"""
+        from datetime import datetime
+
+        start_date = start_date or datetime.now().strftime("%Y-%m-%d")
+        rows = self._fridge_rows(user_id)
+        with span("selector.solver", items=len(rows)):
+            data = allocate(rows, people, days, meals, start_date,
+                            allergies=c.allergies, exclude_ingredients=c.exclude_ingredients)
+        output = SelectorOutput(**data)
+        if not refine or not output.daily_meals:
+            return output
+        return self._refine(output, people)
+
+    def _repair(self, output: SelectorOutput, user_id: str, c: SelectorConstraints) -> SelectorOutput:
+        """對照冰箱檢查模型的分配（超量、冰箱沒有、過期、過敏），有問題時在本地修正，不重跑 Selector"""
+        rows = self._fridge_rows(user_id)
+        with span("selector.validate", items=len(rows)) as s:
+            fixed, report = repair(output.model_dump(), rows,
+                                   allergies=c.allergies, exclude_ingredients=c.exclude_ingredients)
+            s.set(valid=report["valid"], **report["repairs"])
+        if report["valid"]:
+            return output
+        for problem in ("overdrawn", "unknown", "expired", "excluded", "invalid_quantity"):
+            if report[problem]:
+                SELECTOR_REPAIRS.labels(problem).inc(len(report[problem]))
+        logger.warning("Selector 分配不符冰箱庫存，已在本地修正: %s", payload(report))
+        return SelectorOutput(**fixed)
+
+    def _refine(self, draft: SelectorOutput, people: int) -> SelectorOutput:
+        """模型只負責命名與同餐內重新分組；結果若新增食材或超出分配量則沿用求解器輸出"""
+        from langchain_core.messages import HumanMessage, SystemMessage
+
+        draft_data = draft.model_dump()
+        messages = [SystemMessage(REFINE_PROMPT.system),
+                    HumanMessage(REFINE_PROMPT.render(people=people, draft=compact_json(draft_data)))]
+        callbacks = [TracingCallbackHandler("selector"), UsageCallbackHandler("selector")]
+        if self.refine_profiler:
+            callbacks.append(self.refine_profiler)
         try:
-            result = json.loads(cleaned_response)
-            print(f"✅ 直接解析 JSON 成功: {type(result)}")
-            return result
-        except Exception:
-            pass
-        
-        # 2) 尋找代碼塊中的 JSON
-        code_block = re.search(r"```json\s*(\{[\s\S]*?\})\s*```", response, flags=re.IGNORECASE)
-        if code_block:
-            try:
-                result = json.loads(attempt_repairs(code_block.group(1)))
-                print("✅ 從代碼塊解析成功")
-                return result
-            except Exception as e:
-                print(f"❌ 代碼塊解析失敗: {e}")
-        
-        # 3) 從最大的大括號範圍擷取
-        text = response
-        brace_positions = [m.start() for m in re.finditer(r"\{", text)]
-        for start_pos in reversed(brace_positions):
-            brace_count = 0
-            end_pos = start_pos
-            for i, ch in enumerate(text[start_pos:], start_pos):
-                if ch == '{':
-                    brace_count += 1
-                elif ch == '}':
-                    brace_count -= 1
-                    if brace_count == 0:
-                        end_pos = i + 1
-                        break
-            if brace_count == 0 and end_pos > start_pos:
-                candidate = attempt_repairs(text[start_pos:end_pos])
-                try:
-                    result = json.loads(candidate)
-                    print("✅ 從最大括號範圍解析成功")
-                    return result
-                except Exception as e:
-                    print(f"❌ 括號範圍解析失敗: {e}")
-                    continue
-        
-        print("❌ 無法從回應中提取有效的 JSON")
-        return None
+            if self.output_mode == "structured":
+                refined, _ = stream_structured(self.llm, SelectorOutput, messages, callbacks)
+            else:
+                content = self.llm.invoke(messages, config={"callbacks": callbacks}).content
+                data = extract_json(content) if content else None
+                refined = coerce_to_schema(SelectorOutput, data) if data else None
+        except TokenBudgetExceeded as e:
+            logger.warning("Selector 命名中止，沿用求解器分配: %s", e)
+            return draft
+        if refined is None or not _within_allocation(refined.model_dump(), draft_data):
+            logger.warning("模型調整後的分配不符合求解器結果，沿用求解器分配")
+            return draft
+        return refined
 
-    @traceable(name="IngredientSelector")
-    def run(self, user_id: str, people: int, days: int, meals: List[str], c: SelectorConstraints, start_date: str = None) -> SelectorOutput:
+    def _run(self, user_id: str, people: int, days: int, meals: List[str], c: SelectorConstraints, start_date: str = None) -> SelectorOutput:
         from datetime import datetime
         
         # 如果沒有提供 start_date，使用今天
         if start_date is None:
             start_date = datetime.now().strftime("%Y-%m-%d")
-        user_msg = self.user_prompt.format_messages(
+        user_msg = PROMPT.render(
             user_id=user_id,
             days=days,
             people=people,
             meals=", ".join(meals),
             start_date=start_date,
-            allergies=c.allergies,
-            exclude_ingredients=c.exclude_ingredients,
-            current_date=start_date
-        )[-1].content
-        
-        result = self.agent.invoke(
-                {"messages": [{"role": "user", "content": user_msg}]},
-                config={"recursion_limit": 25}  # ← 限制步數，避免無限循環
         )
+        
+        callbacks = [TracingCallbackHandler("selector"), UsageCallbackHandler("selector")]
+        if self.profiler:
+            callbacks.append(self.profiler)
+        # 以 values 串流保留每一步的狀態，預算用盡中止時仍可用最後一步的訊息
+        msgs = []
+        budget_exceeded = False
+        try:
+            for state in self.agent.stream(
+                    {"messages": [{"role": "user", "content": user_msg}]},
+                    config={
+                        "recursion_limit": 25,  # ← 限制步數，避免無限循環
+                        "callbacks": callbacks,
+                    },
+                    stream_mode="values"):
+                msgs = state["messages"]
+        except TokenBudgetExceeded as e:
+            budget_exceeded = True
+            logger.warning("Selector 中止: %s", e)
 
         # 取最後一則模型訊息
-        msgs = result["messages"]
-        print("=== Agent Messages ===")
-        print(msgs)
-        content = msgs[-1].content if msgs else ""
-        print("=== Final Content ===")
-        print(content)
+        logger.debug("Agent messages: %s", payload([m.content for m in msgs]))
+        content = msgs[-1].content if msgs and msgs[-1].type == "ai" else ""
+        logger.debug("Final content: %s", payload(content))
         
-        # 解析 JSON（兜底）
-        import json
-        import re
+        if self.output_mode == "structured" and not budget_exceeded:
+            try:
+                return finalize_structured(self.llm, SelectorOutput, content, msgs, callbacks) or _empty_output()
+            except TokenBudgetExceeded as e:
+                budget_exceeded = True
+                logger.warning("Selector 最終整理中止: %s", e)
+        if budget_exceeded:
+            # 不再呼叫模型，只在本地解析已有的輸出；沒有可用的分配時改由求解器在本地分配（不命名菜色）
+            data = extract_json(content) if content else None
+            output = coerce_to_schema(SelectorOutput, data) if data else None
+            if output is not None and output.daily_meals:
+                return output
+            logger.warning("Selector 預算用盡且沒有可用的輸出，改用求解器分配")
+            return self._run_solver(user_id, people, days, meals, c, start_date)
         
-        # 嘗試從回應中提取 JSON
-        json_data = self._extract_json_from_response(content)
+        # 解析 JSON（兜底）
+        json_data = extract_json(content)
         if json_data:
             try:
                 return SelectorOutput(**json_data)
             except Exception as e:
-                print(f"❌ SelectorOutput 解析失敗: {e}")
-                return SelectorOutput(
-                    total_days=0,
-                    total_people=0,
-                    start_date="",
-                    daily_meals=[]
-                )
-        else:
-            return SelectorOutput(
-                total_days=0,
-                total_people=0,
-                start_date="",
-                daily_meals=[]
-            )
+                logger.warning("SelectorOutput 解析失敗: %s", e)
+        return _empty_output()
+
+def _within_allocation(refined: Dict[str, Any], draft: Dict[str, Any]) -> bool:
+    """模型調整後：天數與日期不變、每一餐的食材總量都不超過求解器分配"""
+    if len(refined["daily_meals"]) != len(draft["daily_meals"]):
+        return False
+    for new_day, old_day in zip(refined["daily_meals"], draft["daily_meals"]):
+        if new_day["date"] != old_day["date"]:
+            return False
+        for meal in ("breakfast", "lunch", "dinner"):
+            allowed = allocated_totals({"daily_meals": [{meal: old_day[meal]}]})
+            used = allocated_totals({"daily_meals": [{meal: new_day[meal]}]})
+            if any(qty > allowed.get(name, 0.0) + 1e-6 for name, qty in used.items()):
+                return False
+    return True
 
 def test_selector_format():
     """測試 Selector Agent 的簡化格式輸出"""
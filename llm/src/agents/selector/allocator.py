@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+食材分配求解器（Selector 的確定性快速路徑）
+輸入 search_fridge 的食材列、人數、天數與餐點，輸出與 SelectorOutput 同形的每餐分配：
+- 依時間順序填每一餐，每道菜的主食材挑「在該餐日期前仍未過期、最早到期」的食材（Earliest Deadline First）
+- 份量依人數與單位換算，絕不超過剩餘庫存；同一天避免重複主食材
+- 過敏與排除食材先行剔除
+純函式、不呼叫模型，數百筆食材也只需數毫秒
+"""
+
+import math
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+MEAL_FIELDS = (("breakfast", "早餐"), ("lunch", "午餐"), ("dinner", "晚餐"))
+MEAL_FIELD_BY_NAME = {name: field_name for field_name, name in MEAL_FIELDS}
+
+# 每人每道菜的份量（克 / 毫升）；早餐份量較少
+MAIN_GRAMS_PER_PERSON = 120.0
+SUPPORTING_GRAMS_PER_PERSON = 40.0
+MEAL_FACTOR = {"早餐": 0.6, "午餐": 1.0, "晚餐": 1.0}
+
+# 計數單位：每人每道菜主食材 1 個、配料 0.5 個（向上取整）
+COUNT_UNITS = {"個", "顆", "隻", "只", "片", "條", "根", "塊", "盒", "包", "瓶", "罐", "把", "份", "粒", "顆粒"}
+# 重量 / 容量單位換算成克（毫升視同克）
+GRAM_SCALE = {"克": 1.0, "g": 1.0, "公克": 1.0, "毫升": 1.0, "ml": 1.0, "mL": 1.0,
+              "公斤": 1000.0, "kg": 1000.0, "公升": 1000.0, "L": 1000.0, "l": 1000.0, "斤": 600.0, "兩": 37.5}
+
+DISHES_PER_MEAL = 2
+SUPPORTING_PER_DISH = 1
+# 主食材剩餘量至少要有一份的這個比例，否則只當配料
+MIN_MAIN_FRACTION = 0.25
+
+_FAR_FUTURE = date.max
+
+
+@dataclass
+class _Stock:
+    name: str
+    unit: str
+    remaining: float
+    expiry: date
+    order: int
+    used_days: set = field(default_factory=set)
+
+    def usable_on(self, day: date) -> bool:
+        return self.remaining > 1e-9 and self.expiry >= day
+
+
+def _parse_date(value: Optional[str]) -> Optional[date]:
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value[:10], "%Y-%m-%d").date()
+    except ValueError:
+        return None
+
+
+def is_excluded(name: str, terms: Iterable[str]) -> bool:
+    """名稱包含任一過敏 / 排除詞（或反之）即剔除，例如「蝦」排除「草蝦」"""
+    return any(t and (t in name or name in t) for t in (s.strip() for s in terms))
+
+
+def portion(unit: str, people: int, meal: str, main: bool) -> float:
+    """一道菜在該單位下的份量"""
+    factor = MEAL_FACTOR.get(meal, 1.0)
+    if unit in COUNT_UNITS:
+        return float(max(1, math.ceil(people * (1.0 if main else 0.5) * factor)))
+    grams = (MAIN_GRAMS_PER_PERSON if main else SUPPORTING_GRAMS_PER_PERSON) * people * factor
+    return round(grams / GRAM_SCALE.get(unit, 1.0), 2)
+
+
+def _take(stock: _Stock, target: float) -> float:
+    amount = min(stock.remaining, target)
+    if stock.unit in COUNT_UNITS:
+        amount = math.floor(amount) or amount  # 剩不到 1 個時全部用掉
+    stock.remaining -= amount
+    return round(amount, 2)
+
+
+def _pick(stocks: Sequence[_Stock], day: date, exclude: set, avoid_repeat: bool = False,
+          min_amount: Optional[Callable[[_Stock], float]] = None) -> Optional[_Stock]:
+    """最早到期的可用食材
+
+    avoid_repeat: 優先挑當天還沒當過主食材的（當天就到期的不受此限，要盡量用完）
+    min_amount: 剩餘量低於此值的不挑（避免只剩零頭的食材當主菜）
+    """
+    best = None
+    for s in stocks:
+        if s.name in exclude or not s.usable_on(day):
+            continue
+        if min_amount is not None and s.remaining < min_amount(s):
+            continue
+        repeated = avoid_repeat and day in s.used_days and s.expiry > day
+        key = (repeated, s.expiry, s.order)
+        if best is None or key < best[0]:
+            best = (key, s)
+    return best[1] if best else None
+
+
+def allocate(items: List[Dict[str, Any]],
+             people: int,
+             days: int,
+             meals: List[str],
+             start_date: str,
+             allergies: Iterable[str] = (),
+             exclude_ingredients: Iterable[str] = (),
+             dishes_per_meal: int = DISHES_PER_MEAL,
+             supporting_per_dish: int = SUPPORTING_PER_DISH) -> Dict[str, Any]:
+    """把冰箱食材分配到每一餐，回傳 SelectorOutput 形狀的 dict
+
+    items 為 search_fridge 的 items（name / unit / quantity_available / expiry_date）；
+    同名且同單位的食材合併為一筆、到期日取最早者。沒有可用食材時回傳 total_days=0 的空結果
+    """
+    start = _parse_date(start_date) or date.today()
+    terms = list(allergies) + list(exclude_ingredients)
+
+    # 單位不同的數量不能相加（300g 與 2 個），同名不同單位的食材分開成兩筆
+    merged: Dict[Tuple[str, str], _Stock] = {}
+    for i, it in enumerate(items):
+        name = (it.get("name") or "").strip()
+        quantity = float(it.get("quantity_available") or 0)
+        if not name or quantity <= 0 or is_excluded(name, terms):
+            continue
+        expiry = _parse_date(it.get("expiry_date")) or _FAR_FUTURE
+        key = (name, it.get("unit") or "")
+        if key in merged:
+            merged[key].remaining += quantity
+            merged[key].expiry = min(merged[key].expiry, expiry)
+        else:
+            merged[key] = _Stock(name, key[1], quantity, expiry, i)
+    stocks = sorted(merged.values(), key=lambda s: (s.expiry, s.order))
+    if not stocks:
+        return {"total_days": 0, "total_people": 0, "start_date": "", "daily_meals": []}
+
+    wanted = [m for m in meals if m in MEAL_FIELD_BY_NAME] or [name for _, name in MEAL_FIELDS]
+    daily_meals = []
+    for d in range(days):
+        day = start + timedelta(days=d)
+        entry: Dict[str, Any] = {"date": day.isoformat(), "breakfast": [], "lunch": [], "dinner": []}
+        for field_name, meal in MEAL_FIELDS:
+            if meal not in wanted:
+                continue
+            dishes = []
+            used_in_meal: set = set()
+            for _ in range(dishes_per_meal):
+                main = _pick(stocks, day, used_in_meal, avoid_repeat=True,
+                             min_amount=lambda s: MIN_MAIN_FRACTION * portion(s.unit, people, meal, True))
+                if main is None:
+                    break
+                used_in_meal.add(main.name)
+                main.used_days.add(day)
+                ingredients = [{"name": main.name,
+                                "allocated_quantity": _take(main, portion(main.unit, people, meal, True))}]
+                supporting = []
+                for _ in range(supporting_per_dish):
+                    s = _pick(stocks, day, used_in_meal)
+                    if s is None:
+                        break
+                    used_in_meal.add(s.name)
+                    supporting.append(s.name)
+                    ingredients.append({"name": s.name,
+                                        "allocated_quantity": _take(s, portion(s.unit, people, meal, False))})
+                dish_name = f"{main.name}佐{supporting[0]}" if supporting else f"{main.name}料理"
+                dishes.append({"dish_name": dish_name, "ingredients": ingredients})
+            entry[field_name] = dishes
+        daily_meals.append(entry)
+
+    return {
+        "total_days": days,
+        "total_people": people,
+        "start_date": start.isoformat(),
+        "daily_meals": daily_meals,
+    }
+
+
+def allocated_totals(output: Dict[str, Any]) -> Dict[str, float]:
+    """各食材在整份分配中的總量"""
+    totals: Dict[str, float] = {}
+    for day in output.get("daily_meals") or []:
+        for field_name, _ in MEAL_FIELDS:
+            for dish in day.get(field_name) or []:
+                for ing in dish.get("ingredients") or []:
+                    totals[ing["name"]] = totals.get(ing["name"], 0.0) + float(ing.get("allocated_quantity") or 0)
+    return totals
@@ -3,20 +3,27 @@ from typing import Optional, List, Dict
 from datetime import date
 from sqlalchemy import select, and_, func, or_
 from langchain_core.tools import tool
-from langchain_openai import ChatOpenAI
 
 # 動態導入，避免相對導入問題
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
-try:
-    from db import SessionLocal
-    from models import Ingredient
-except ImportError:
-    # 如果直接運行，嘗試相對導入
-    from ...db import SessionLocal
-    from ...models import Ingredient
+from db import SessionLocal
+from models import Ingredient
+from telemetry import span
+
+def _available_conds(user_id: str, today: date) -> list:
+    """使用者目前可用的食材：數量大於 0 且未過期"""
+    return [
+        Ingredient.user_id == user_id,
+        (Ingredient.quantity == None) | (Ingredient.quantity > 0),
+        # 排除今日之前的過期食材：expiry_date 為 NULL 或 expiry_date >= 今天
+        or_(
+            Ingredient.expiry_date.is_(None),
+            Ingredient.expiry_date >= today
+        )
+    ]
 
 @tool("search_fridge", return_direct=False)
 def search_fridge(user_id: str,
@@ -28,17 +35,8 @@ def search_fridge(user_id: str,
     名稱模糊、分頁。
     回傳：{items: [...], total, page, pages}
     """
-    with SessionLocal() as s:
-        today = date.today()
-        conds = [
-            Ingredient.user_id == user_id,
-            (Ingredient.quantity == None) | (Ingredient.quantity > 0),
-            # 排除今日之前的過期食材：expiry_date 為 NULL 或 expiry_date >= 今天
-            or_(
-                Ingredient.expiry_date.is_(None),
-                Ingredient.expiry_date >= today
-            )
-        ]
+    with span("db.search_fridge", user_id=user_id, limit=limit, offset=offset), SessionLocal() as s:
+        conds = _available_conds(user_id, date.today())
         if name_contains:
             conds.append(Ingredient.ingredient_name.ilike(f"%{name_contains}%"))
 
@@ -61,3 +59,27 @@ def search_fridge(user_id: str,
     return {"items": items, "total": int(total), "page": offset // limit + 1, "pages": pages}
 
 
+def list_fridge(user_id: str, max_rows: int = 1000, page_size: int = 200) -> List[Dict]:
+    """分頁讀出使用者所有可用的冰箱食材（非工具，依到期日排序），最多 max_rows 筆"""
+    rows: List[Dict] = []
+    while len(rows) < max_rows:
+        page = search_fridge.func(user_id=user_id, limit=page_size, offset=len(rows))
+        rows.extend(page["items"])
+        if len(rows) >= page["total"] or not page["items"]:
+            break
+    return rows[:max_rows]
+
+
+def fridge_version(user_id: str) -> str:
+    """冰箱內容的版本字串（非工具），供請求合併判斷兩次請求看到的冰箱是否相同
+
+    以使用者所有食材的筆數與最新 updated_at（資料庫 trigger 於每次更新時改寫）組成，加上日期；
+    新增、修改、刪除或跨日過期都會改變。不只看可用食材，扣到 0 的那筆更新也要算進去
+    """
+    with span("db.fridge_version", user_id=user_id), SessionLocal() as s:
+        today = date.today()
+        count, latest = s.execute(
+            select(func.count(), func.max(Ingredient.updated_at))
+            .where(Ingredient.user_id == user_id)
+        ).one()
+    return f"{today.isoformat()}:{count}:{latest}"
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+SelectorOutput 分配檢查與本地修補
+把冰箱庫存與每一餐的分配攤平成 NumPy 陣列，一次算出：
+- overdrawn: 同一食材分配總量超過冰箱數量
+- unknown: 冰箱裡沒有的食材（名稱對不上）
+- expired: 分配到的日期已超過該食材到期日
+- excluded: 命中過敏 / 排除詞
+- invalid_quantity: 份量不是正數
+repair() 在本地修正，不再呼叫模型：名稱可唯一對應冰箱食材者改回冰箱名稱，無法使用的分配移除，
+超量的食材依比例縮減到庫存內（計數單位取整），沒有食材的菜色一併移除
+"""
+
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from agents.selector.allocator import COUNT_UNITS, MEAL_FIELDS, is_excluded
+
+# 浮點誤差容許量
+_EPS = 1e-6
+# 沒有到期日的食材視為永不過期
+_NO_EXPIRY = date.max.toordinal()
+
+
+def _ordinal(value: Optional[str], default: int) -> int:
+    if not value:
+        return default
+    try:
+        return datetime.strptime(value[:10], "%Y-%m-%d").date().toordinal()
+    except ValueError:
+        return default
+
+
+class _Stock:
+    """冰箱庫存（同名食材合併；到期日取最晚的一批，只要還有一批可用就不算過期）"""
+
+    def __init__(self, items: List[Dict[str, Any]], terms: Iterable[str]):
+        self.index: Dict[str, int] = {}
+        self.units: List[str] = []
+        quantity: List[float] = []
+        expiry: List[int] = []
+        for it in items:
+            name = (it.get("name") or "").strip()
+            if not name:
+                continue
+            qty = float(it.get("quantity_available") or 0)
+            exp = _ordinal(it.get("expiry_date"), _NO_EXPIRY)
+            i = self.index.get(name)
+            if i is None:
+                self.index[name] = len(self.units)
+                self.units.append(it.get("unit") or "")
+                quantity.append(qty)
+                expiry.append(exp)
+            else:
+                quantity[i] += qty
+                expiry[i] = max(expiry[i], exp)
+        self.names = list(self.index)
+        self.quantity = np.array(quantity, dtype=float)
+        self.expiry = np.array(expiry, dtype=np.int64)
+        terms = list(terms)
+        self.excluded = np.array([is_excluded(n, terms) for n in self.names], dtype=bool)
+        self.counted = np.array([u in COUNT_UNITS for u in self.units], dtype=bool)
+
+    def resolve(self, name: str) -> int:
+        """精確比對冰箱名稱，找不到回傳 -1"""
+        return self.index.get(name.strip(), -1)
+
+    def match(self, name: str) -> int:
+        """名稱互相包含且只有一個候選時視為同一食材（例如「雞胸」→「雞胸肉」），否則 -1"""
+        name = name.strip()
+        if not name:
+            return -1
+        candidates = [i for n, i in self.index.items() if name in n or n in name]
+        return candidates[0] if len(candidates) == 1 else -1
+
+
+class _Slots:
+    """每一筆菜色食材攤平成一列：(天, 餐, 菜, 食材) 位置、名稱、份量、日期"""
+
+    def __init__(self, output: Dict[str, Any], stock: _Stock):
+        start = _ordinal(output.get("start_date"), date.today().toordinal())
+        self.positions: List[Tuple[int, str, int, int]] = []
+        self.names: List[str] = []
+        quantity: List[float] = []
+        days: List[int] = []
+        for d, day in enumerate(output.get("daily_meals") or []):
+            ordinal = _ordinal(day.get("date"), start + d)
+            for field_name, _ in MEAL_FIELDS:
+                for k, dish in enumerate(day.get(field_name) or []):
+                    for j, ing in enumerate(dish.get("ingredients") or []):
+                        self.positions.append((d, field_name, k, j))
+                        self.names.append(ing.get("name") or "")
+                        quantity.append(_float(ing.get("allocated_quantity")))
+                        days.append(ordinal)
+        self.item = np.array([stock.resolve(n) for n in self.names], dtype=np.int64)
+        self.quantity = np.array(quantity, dtype=float)
+        self.day = np.array(days, dtype=np.int64)
+
+
+def _float(value: Any) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float("nan")
+
+
+def _check(slots: _Slots, stock: _Stock) -> Dict[str, np.ndarray]:
+    """各類問題的布林遮罩與每項食材的分配總量"""
+    known = slots.item >= 0
+    expired = np.zeros(len(slots.item), dtype=bool)
+    excluded = np.zeros(len(slots.item), dtype=bool)
+    expired[known] = slots.day[known] > stock.expiry[slots.item[known]]
+    excluded[known] = stock.excluded[slots.item[known]]
+    invalid_quantity = ~(slots.quantity > 0)  # 同時涵蓋 NaN
+    usable = known & ~expired & ~excluded & ~invalid_quantity
+    totals = np.bincount(slots.item[usable], weights=slots.quantity[usable], minlength=len(stock.names))
+    return {
+        "unknown": ~known,
+        "expired": expired,
+        "excluded": excluded,
+        "invalid_quantity": invalid_quantity,
+        "usable": usable,
+        "totals": totals,
+        "overdrawn": totals > stock.quantity + _EPS,
+    }
+
+
+def _report(slots: _Slots, stock: _Stock, masks: Dict[str, np.ndarray]) -> Dict[str, Any]:
+    def slot_list(mask: np.ndarray) -> List[Dict[str, Any]]:
+        return [{"date": date.fromordinal(int(slots.day[i])).isoformat(), "name": slots.names[i]}
+                for i in np.flatnonzero(mask)]
+
+    overdrawn = {stock.names[i]: {"allocated": round(float(masks["totals"][i]), 2),
+                                  "available": round(float(stock.quantity[i]), 2)}
+                 for i in np.flatnonzero(masks["overdrawn"])}
+    report = {
+        "overdrawn": overdrawn,
+        "unknown": sorted({slots.names[i] for i in np.flatnonzero(masks["unknown"])}),
+        "expired": slot_list(masks["expired"]),
+        "excluded": slot_list(masks["excluded"]),
+        "invalid_quantity": slot_list(masks["invalid_quantity"] & ~masks["unknown"]),
+    }
+    report["valid"] = not any(report.values())
+    return report
+
+
+def validate(output: Dict[str, Any], items: List[Dict[str, Any]],
+             allergies: Iterable[str] = (), exclude_ingredients: Iterable[str] = ()) -> Dict[str, Any]:
+    """檢查 SelectorOutput（dict）與冰箱食材（search_fridge 的 items），回傳問題報告；valid 為 True 表示可直接使用"""
+    stock = _Stock(items, list(allergies) + list(exclude_ingredients))
+    slots = _Slots(output, stock)
+    return _report(slots, stock, _check(slots, stock))
+
+
+def repair(output: Dict[str, Any], items: List[Dict[str, Any]],
+           allergies: Iterable[str] = (), exclude_ingredients: Iterable[str] = ()) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """在本地修正分配，回傳 (修正後的 SelectorOutput dict, 報告)
+
+    報告為修正前的 validate() 結果，另附 repairs（renamed / dropped / scaled 筆數）與修正後的 valid
+    """
+    stock = _Stock(items, list(allergies) + list(exclude_ingredients))
+    slots = _Slots(output, stock)
+    masks = _check(slots, stock)
+    report = _report(slots, stock, masks)
+    if report["valid"]:
+        report["repairs"] = {"renamed": 0, "dropped": 0, "scaled": 0}
+        return output, report
+
+    # 1. 名稱對不上但能唯一對應冰箱食材者，改用冰箱名稱
+    renamed = 0
+    for i in np.flatnonzero(masks["unknown"]):
+        match = stock.match(slots.names[i])
+        if match >= 0:
+            slots.item[i] = match
+            slots.names[i] = stock.names[match]
+            renamed += 1
+    if renamed:
+        masks = _check(slots, stock)
+
+    # 2. 超量的食材依比例縮減；其餘無法使用的分配歸零
+    usable = masks["usable"]
+    item = slots.item[usable]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        factor = np.where(masks["overdrawn"], stock.quantity / masks["totals"], 1.0)
+    scaled = np.zeros(len(slots.item), dtype=bool)
+    scaled[usable] = factor[item] < 1.0
+    exact = np.zeros(len(slots.item))
+    exact[usable] = slots.quantity[usable] * factor[item]
+    counted = np.zeros(len(slots.item), dtype=bool)
+    counted[usable] = stock.counted[item]
+    # 向下取整，避免四捨五入後又超出庫存
+    quantity = np.where(counted, np.floor(exact + _EPS), np.floor(exact * 100 + _EPS) / 100)
+    # 計數單位取整後剩下的個數，依小數部分由大到小補回（最大餘數法），避免全部被捨去
+    for i in np.flatnonzero(masks["overdrawn"] & stock.counted):
+        idx = np.flatnonzero(usable & (slots.item == i))
+        left = int(np.floor(stock.quantity[i] - quantity[idx].sum() + _EPS))
+        if left > 0:
+            order = np.argsort(quantity[idx] - exact[idx], kind="stable")[:left]
+            quantity[idx[order]] += 1
+    keep = quantity > 0
+
+    repaired = _rebuild(output, slots, quantity, keep)
+    report["repairs"] = {
+        "renamed": renamed,
+        "dropped": int((~keep).sum()),
+        "scaled": int((scaled & keep).sum()),
+    }
+    report["valid_after"] = validate(repaired, items, allergies, exclude_ingredients)["valid"]
+    return repaired, report
+
+
+def _rebuild(output: Dict[str, Any], slots: _Slots, quantity: np.ndarray, keep: np.ndarray) -> Dict[str, Any]:
+    """依修正後的份量重建輸出；移除歸零的食材與沒有食材的菜色"""
+    kept: Dict[Tuple[int, str, int], List[Dict[str, Any]]] = {}
+    for i, (d, field_name, k, _) in enumerate(slots.positions):
+        if keep[i]:
+            kept.setdefault((d, field_name, k), []).append(
+                {"name": slots.names[i], "allocated_quantity": round(float(quantity[i]), 2)})
+
+    daily_meals = []
+    for d, day in enumerate(output.get("daily_meals") or []):
+        entry = dict(day)
+        for field_name, _ in MEAL_FIELDS:
+            entry[field_name] = [
+                {**dish, "ingredients": kept[(d, field_name, k)]}
+                for k, dish in enumerate(day.get(field_name) or [])
+                if (d, field_name, k) in kept
+            ]
+        daily_meals.append(entry)
+    return {**output, "daily_meals": daily_meals}
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Schema 約束輸出模式
+最後一次模型呼叫綁定 JSON Schema（OpenAI structured outputs），串流時逐段檢查 JSON 結構，
+格式一壞就提前中止並在本地修復，避免整條流程重跑
+"""
+
+import os
+from typing import Any, Dict, List, Optional, Tuple, Type, TypeVar
+
+from pydantic import BaseModel, ValidationError
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+
+from agents.json_utils import JSONScanner, extract_json
+from metrics import STRUCTURED_ITEMS_DROPPED
+from telemetry import get_logger
+
+logger = get_logger("structured")
+
+T = TypeVar("T", bound=BaseModel)
+
+OUTPUT_MODES = ("prompt", "structured")
+
+# 本地修復最多刪除幾輪無效的項目
+_MAX_REPAIR_ROUNDS = 5
+
+# 可在本地刪除的項目所在清單：MenuPlan 與 SelectorOutput 每一餐的食譜 / 菜色
+_ITEM_LISTS = ("breakfast", "lunch", "dinner")
+
+FINALIZE_SYSTEM_ZH = """你是 JSON 整理助手。根據對話中已取得的資料與草稿，輸出符合指定 JSON Schema 的最終結果。
+不得加入對話中沒有的食材或資訊，只輸出 JSON。"""
+
+FINALIZE_USER_ZH = "請依照指定的 JSON Schema 輸出最終結果。"
+
+
+def default_output_mode() -> str:
+    """由 LLM_OUTPUT_MODE 決定預設輸出模式（prompt / structured）"""
+    mode = os.getenv("LLM_OUTPUT_MODE", "prompt").lower()
+    return mode if mode in OUTPUT_MODES else "prompt"
+
+
+def response_format_for(schema: Type[BaseModel]) -> Dict[str, Any]:
+    """pydantic schema 轉為 OpenAI response_format
+
+    schema 含預設值與 Optional 欄位，strict 模式不接受，因此以非 strict 綁定並在本地驗證
+    """
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": schema.__name__,
+            "schema": schema.model_json_schema(),
+            "strict": False,
+        },
+    }
+
+
+class IncrementalJSONValidator:
+    """串流過程中檢查輸出是否仍可能是單一合法 JSON 物件"""
+
+    def __init__(self):
+        self.scanner = JSONScanner()
+        self.error: Optional[str] = None
+        self._started = False
+
+    @property
+    def complete(self) -> bool:
+        return self._started and self.scanner.depth == 0
+
+    def feed(self, chunk: str) -> bool:
+        """餵入一段輸出，回傳目前是否仍然合法"""
+        if self.error or not chunk:
+            return self.error is None
+        if self.complete and chunk.strip():
+            self.error = "根物件之後仍有輸出"
+            return False
+        if not self._started:
+            head = chunk.lstrip()
+            if not head:
+                return True
+            if head[0] != "{":
+                self.error = f"輸出不是以 {{ 開頭: {head[:20]!r}"
+                return False
+            self._started = True
+        self.scanner.feed(chunk)
+        if self.scanner.mismatches:
+            self.error = "括號不成對"
+            return False
+        return True
+
+
+def _item_path(loc: Tuple[Any, ...]) -> Optional[Tuple[Any, ...]]:
+    """驗證錯誤位置所屬的食譜 / 菜色項目路徑；不在某一餐的清單內時回傳 None"""
+    for i in range(1, len(loc)):
+        if isinstance(loc[i], int) and loc[i - 1] in _ITEM_LISTS:
+            return tuple(loc[:i + 1])
+    return None
+
+
+def _drop_invalid_items(schema_name: str, data: Any, errors: List[Dict[str, Any]]) -> int:
+    """刪除驗證錯誤所在的食譜 / 菜色項目，回傳刪除數
+
+    只刪某一餐清單中的單一項目；錯誤落在天、餐或根物件層級時不刪，交由呼叫端判定失敗，
+    避免整天或整餐被默默刪掉
+    """
+    items: Dict[Tuple[Any, ...], Dict[int, str]] = {}
+    for err in errors:
+        path = _item_path(tuple(err.get("loc", ())))
+        if path is None:
+            return 0
+        items.setdefault(path[:-1], {}).setdefault(path[-1], err.get("msg", ""))
+    dropped = 0
+    # loc 混有 int 與 str，以字串排序；同一清單內由大到小刪，避免前面的刪除改變後面元素的索引
+    for parent in sorted(items, key=lambda loc: tuple(map(str, loc))):
+        node = data
+        try:
+            for part in parent:
+                node = node[part]
+        except (KeyError, IndexError, TypeError):
+            continue
+        for index in sorted(items[parent], reverse=True):
+            if not isinstance(node, list) or index >= len(node):
+                continue
+            del node[index]
+            dropped += 1
+            STRUCTURED_ITEMS_DROPPED.labels(schema=schema_name).inc()
+            logger.warning("%s 刪除無效項目 %s: %s", schema_name,
+                           "/".join(map(str, (*parent, index))), items[parent][index])
+    return dropped
+
+
+def coerce_to_schema(schema: Type[T], data: Any) -> Optional[T]:
+    """本地驗證並修復：型別由 pydantic 寬鬆轉換，無法修復的食譜 / 菜色項目直接刪除"""
+    if not isinstance(data, dict):
+        return None
+    for _ in range(_MAX_REPAIR_ROUNDS + 1):
+        try:
+            return schema.model_validate(data)
+        except ValidationError as e:
+            errors = e.errors()
+            logger.warning("%s 驗證失敗 %d 處，嘗試本地修復", schema.__name__, len(errors))
+            if not _drop_invalid_items(schema.__name__, data, errors):
+                return None
+    return None
+
+
+def stream_structured(llm,
+                      schema: Type[T],
+                      messages: List[BaseMessage],
+                      callbacks: Optional[List[Any]] = None) -> Tuple[Optional[T], str]:
+    """綁定 schema 串流呼叫模型，邊收邊驗證；格式出錯即中止並本地修復"""
+    bound = llm.bind(response_format=response_format_for(schema))
+    validator = IncrementalJSONValidator()
+    parts: List[str] = []
+    for chunk in bound.stream(messages, config={"callbacks": callbacks or []}):
+        if chunk.additional_kwargs.get("refusal"):
+            logger.warning("模型拒絕輸出: %s", chunk.additional_kwargs["refusal"])
+            break
+        text = chunk.content if isinstance(chunk.content, str) else ""
+        parts.append(text)
+        if not validator.feed(text):
+            logger.warning("串流輸出格式錯誤，提前中止: %s", validator.error)
+            break
+    raw = "".join(parts)
+    data = extract_json(raw)
+    return (coerce_to_schema(schema, data) if data is not None else None), raw
+
+
+def finalize_structured(llm,
+                        schema: Type[T],
+                        draft: str,
+                        context: List[BaseMessage],
+                        callbacks: Optional[List[Any]] = None) -> Optional[T]:
+    """取得符合 schema 的最終輸出
+
+    先在本地解析並修復 agent 的草稿；仍不合格時才以綁定 schema 的呼叫重新整理，
+    只重做最後一步而不是整條流程
+    """
+    data = extract_json(draft) if draft else None
+    if data is not None:
+        result = coerce_to_schema(schema, data)
+        if result is not None:
+            return result
+
+    logger.info("草稿無法通過 %s 驗證，以 schema 約束重新輸出", schema.__name__)
+    messages = [SystemMessage(FINALIZE_SYSTEM_ZH), *context, HumanMessage(FINALIZE_USER_ZH)]
+    result, _ = stream_structured(llm, schema, messages, callbacks)
+    return result
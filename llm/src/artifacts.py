@@ -0,0 +1,433 @@
+# llm/src/artifacts.py
+"""
+Run Artifact Store
+以 run_id 為鍵保存每次流程的 selector / planner 輸出
+後端可選 Postgres JSONB（多節點共享）或 gzip 壓縮檔案（單機），皆支援保留期限與數量上限淘汰
+"""
+from __future__ import annotations
+
+import gzip
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+# run_id 只允許英數、底線與連字號，避免檔案後端被路徑穿越
+_RUN_ID_RE = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+# artifact 種類：流程兩個階段的輸出，以及背景工作的狀態紀錄（見 jobs.py）
+JOB_KIND = "job"
+KINDS = ("selector", "planner", JOB_KIND)
+# 未完成的背景工作：以租約（owner + lease_expires_at）認領，淘汰時保留
+PENDING_JOB_STATUSES = ("queued", "running")
+
+# 檔案後端工作紀錄的互斥鎖檔；持有時間只有讀寫一份紀錄，超過這個秒數視為持有者已當掉
+_LOCK_STALE_SECONDS = 30
+_LOCK_TIMEOUT_SECONDS = 5
+
+# 每寫入幾次執行一次淘汰，讓淘汰成本攤提到多次寫入
+_EVICT_EVERY = 20
+
+
+def new_run_id() -> str:
+    """產生新的 run_id"""
+    return uuid.uuid4().hex
+
+
+def _check_run_id(run_id: str) -> str:
+    if not run_id or not _RUN_ID_RE.fullmatch(run_id):
+        raise ValueError(f"無效的 run_id: {run_id!r}")
+    return run_id
+
+
+def _check_kind(kind: str) -> str:
+    if kind not in KINDS:
+        raise ValueError(f"無效的 artifact 種類: {kind!r}（可用: {', '.join(KINDS)}）")
+    return kind
+
+
+def _lease_until(lease_seconds: float) -> str:
+    return (datetime.now(timezone.utc) + timedelta(seconds=lease_seconds)).isoformat()
+
+
+def _owned_by(record: Optional[Dict[str, Any]], owner: str) -> bool:
+    """工作紀錄不存在、沒有持有者或由 owner 持有"""
+    return not record or record.get("owner") in (None, owner)
+
+
+def _claimable(record: Optional[Dict[str, Any]], owner: str) -> bool:
+    """未完成，且沒有持有者、租約已過期或本來就是 owner 持有"""
+    if not record or record.get("status") not in PENDING_JOB_STATUSES:
+        return False
+    if record.get("owner") in (None, owner):
+        return True
+    try:
+        expires = datetime.fromisoformat(record["lease_expires_at"])
+    except (KeyError, TypeError, ValueError):
+        return True
+    return expires < datetime.now(timezone.utc)
+
+
+class ArtifactStore(ABC):
+    """Artifact Store 介面"""
+
+    def __init__(self, retention_days: float = 7, max_runs: int = 1000):
+        self.retention_days = retention_days
+        self.max_runs = max_runs
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def put(self, run_id: str, kind: str, payload: Dict[str, Any]) -> str:
+        """保存一份 artifact，回傳 run_id"""
+        _check_run_id(run_id)
+        _check_kind(kind)
+        self._put(run_id, kind, payload)
+        self._written()
+        return run_id
+
+    def put_job(self, run_id: str, owner: str, payload: Dict[str, Any]) -> bool:
+        """寫入背景工作紀錄，但只在紀錄不存在、沒有持有者或仍由 owner 持有時寫入
+
+        租約過期後被其他節點認領的工作，原持有者遲來的狀態更新不會蓋掉新持有者的租約；回傳是否寫入
+        """
+        written = self._put_job(_check_run_id(run_id), owner, payload)
+        if written:
+            self._written()
+        return written
+
+    def _written(self) -> None:
+        with self._lock:
+            self._writes += 1
+            due = self._writes % _EVICT_EVERY == 0
+        if due:
+            self.evict()
+
+    def get(self, run_id: str, kind: str) -> Optional[Dict[str, Any]]:
+        """依 run_id 讀取 artifact，不存在回傳 None"""
+        return self._get(_check_run_id(run_id), _check_kind(kind))
+
+    def claim_job(self, run_id: str, owner: str, lease_seconds: float) -> Optional[Dict[str, Any]]:
+        """以 owner 認領（或續約）未完成的背景工作，租約延長為 lease_seconds
+
+        只有沒有持有者、租約已過期或本來就由 owner 持有的工作會成功，回傳更新後的工作紀錄；否則回傳 None。
+        多個節點同時認領時只有一個成功
+        """
+        return self._claim_job(_check_run_id(run_id), owner, lease_seconds)
+
+    @abstractmethod
+    def _claim_job(self, run_id: str, owner: str, lease_seconds: float) -> Optional[Dict[str, Any]]:
+        """原子地檢查並更新工作紀錄的 owner 與 lease_expires_at"""
+
+    @abstractmethod
+    def _put_job(self, run_id: str, owner: str, payload: Dict[str, Any]) -> bool:
+        """原子地檢查持有者並寫入工作紀錄"""
+
+    @abstractmethod
+    def pending_jobs(self, limit: int = 1000) -> List[str]:
+        """未完成（排隊中或執行中）背景工作的 run_id，舊到新"""
+
+    @abstractmethod
+    def list_runs(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """列出最近的 run（新到舊）"""
+
+    @abstractmethod
+    def evict(self) -> int:
+        """淘汰過期與超量的 run，回傳刪除的 run 數；有未完成背景工作的 run 不淘汰"""
+
+    @abstractmethod
+    def _put(self, run_id: str, kind: str, payload: Dict[str, Any]) -> None:
+        """寫入一份已檢查過 run_id 與種類的 artifact"""
+
+    @abstractmethod
+    def _get(self, run_id: str, kind: str) -> Optional[Dict[str, Any]]:
+        """讀取一份已檢查過 run_id 與種類的 artifact"""
+
+
+class FileArtifactStore(ArtifactStore):
+    """壓縮檔案後端：{root}/{run_id}/{kind}.json.gz"""
+
+    def __init__(self, root: str = "data", **kwargs):
+        super().__init__(**kwargs)
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, run_id: str, kind: str) -> Path:
+        return self.root / run_id / f"{kind}.json.gz"
+
+    @contextmanager
+    def _job_lock(self, run_id: str) -> Iterator[None]:
+        """工作紀錄的互斥鎖：以 O_EXCL 建立 {run_id}/job.lock，讀寫完即刪除"""
+        path = self.root / run_id / f"{JOB_KIND}.lock"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        deadline = time.monotonic() + _LOCK_TIMEOUT_SECONDS
+        while True:
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except FileExistsError:
+                try:
+                    if time.time() - path.stat().st_mtime > _LOCK_STALE_SECONDS:
+                        path.unlink()
+                        continue
+                except FileNotFoundError:
+                    continue
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"等待工作紀錄鎖逾時: {run_id}")
+                time.sleep(0.01)
+        try:
+            os.close(fd)
+            yield
+        finally:
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def _put(self, run_id: str, kind: str, payload: Dict[str, Any]) -> None:
+        if kind == JOB_KIND:
+            # 與 claim_job 互斥，續約不會蓋掉 worker 剛寫入的狀態
+            with self._job_lock(run_id):
+                self._write(run_id, kind, payload)
+        else:
+            self._write(run_id, kind, payload)
+
+    def _put_job(self, run_id: str, owner: str, payload: Dict[str, Any]) -> bool:
+        with self._job_lock(run_id):
+            if not _owned_by(self._get(run_id, JOB_KIND), owner):
+                return False
+            self._write(run_id, JOB_KIND, payload)
+            return True
+
+    def _claim_job(self, run_id: str, owner: str, lease_seconds: float) -> Optional[Dict[str, Any]]:
+        with self._job_lock(run_id):
+            record = self._get(run_id, JOB_KIND)
+            if not _claimable(record, owner):
+                return None
+            record.update(owner=owner, lease_expires_at=_lease_until(lease_seconds))
+            self._write(run_id, JOB_KIND, record)
+            return record
+
+    def _write(self, run_id: str, kind: str, payload: Dict[str, Any]) -> None:
+        path = self._path(run_id, kind)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # 先寫暫存檔再 rename，避免並發讀到半份檔案
+        tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}")
+        data = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        with gzip.open(tmp, "wb", compresslevel=5) as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def _get(self, run_id: str, kind: str) -> Optional[Dict[str, Any]]:
+        path = self._path(run_id, kind)
+        try:
+            with gzip.open(path, "rb") as f:
+                return json.loads(f.read().decode("utf-8"))
+        except FileNotFoundError:
+            return None
+
+    def _run_dirs(self) -> List[Path]:
+        dirs = [p for p in self.root.iterdir() if p.is_dir() and _RUN_ID_RE.fullmatch(p.name)]
+        return sorted(dirs, key=lambda p: p.stat().st_mtime, reverse=True)
+
+    def list_runs(self, limit: int = 50) -> List[Dict[str, Any]]:
+        runs = []
+        for p in self._run_dirs()[:limit]:
+            runs.append({
+                "run_id": p.name,
+                "kinds": sorted(f.name[:-len(".json.gz")] for f in p.glob("*.json.gz")),
+                "created_at": datetime.fromtimestamp(p.stat().st_mtime, timezone.utc).isoformat(),
+            })
+        return runs
+
+    def pending_jobs(self, limit: int = 1000) -> List[str]:
+        dirs = [p for p in self._run_dirs() if self._path(p.name, JOB_KIND).exists()]
+        return [p.name for p in reversed(dirs) if self._job_pending(p.name)][:limit]
+
+    def _job_pending(self, run_id: str) -> bool:
+        try:
+            record = self._get(run_id, JOB_KIND)
+        except (OSError, ValueError):
+            return False
+        return bool(record) and record.get("status") in PENDING_JOB_STATUSES
+
+    def evict(self) -> int:
+        cutoff = time.time() - self.retention_days * 86400
+        removed = 0
+        for i, p in enumerate(self._run_dirs()):
+            if i >= self.max_runs or p.stat().st_mtime < cutoff:
+                if self._job_pending(p.name):
+                    continue
+                shutil.rmtree(p, ignore_errors=True)
+                removed += 1
+        return removed
+
+
+class PostgresArtifactStore(ArtifactStore):
+    """Postgres JSONB 後端（run_artifacts 表），多個節點共享"""
+
+    def __init__(self, session_factory=None, **kwargs):
+        super().__init__(**kwargs)
+        if session_factory is None:
+            from db import SessionLocal
+            session_factory = SessionLocal
+        self.session_factory = session_factory
+
+    def _put(self, run_id: str, kind: str, payload: Dict[str, Any]) -> None:
+        from sqlalchemy.dialects.postgresql import insert
+        stmt = insert(_run_artifact_model()).values(run_id=run_id, kind=kind, payload=payload)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["run_id", "kind"],
+            set_={"payload": stmt.excluded.payload, "created_at": datetime.now(timezone.utc)},
+        )
+        with self.session_factory() as s:
+            s.execute(stmt)
+            s.commit()
+
+    def _put_job(self, run_id: str, owner: str, payload: Dict[str, Any]) -> bool:
+        from sqlalchemy import or_
+        from sqlalchemy.dialects.postgresql import insert
+        RunArtifact = _run_artifact_model()
+        stmt = insert(RunArtifact).values(run_id=run_id, kind=JOB_KIND, payload=payload)
+        # 衝突時只覆寫沒有持有者或仍由 owner 持有的紀錄；條件與寫入在同一列鎖內完成
+        current = RunArtifact.payload["owner"].astext
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["run_id", "kind"],
+            set_={"payload": stmt.excluded.payload, "created_at": datetime.now(timezone.utc)},
+            where=or_(current.is_(None), current == owner),
+        ).returning(RunArtifact.run_id)
+        with self.session_factory() as s:
+            row = s.execute(stmt).first()
+            s.commit()
+        return row is not None
+
+    def pending_jobs(self, limit: int = 1000) -> List[str]:
+        from sqlalchemy import select
+        RunArtifact = _run_artifact_model()
+        stmt = (
+            select(RunArtifact.run_id)
+            .where(RunArtifact.kind == JOB_KIND,
+                   RunArtifact.payload["status"].astext.in_(PENDING_JOB_STATUSES))
+            .order_by(RunArtifact.created_at)
+            .limit(limit)
+        )
+        with self.session_factory() as s:
+            return list(s.execute(stmt).scalars().all())
+
+    def _get(self, run_id: str, kind: str) -> Optional[Dict[str, Any]]:
+        RunArtifact = _run_artifact_model()
+        with self.session_factory() as s:
+            row = s.get(RunArtifact, (run_id, kind))
+            return row.payload if row else None
+
+    def _claim_job(self, run_id: str, owner: str, lease_seconds: float) -> Optional[Dict[str, Any]]:
+        from sqlalchemy import text
+        # 單一 UPDATE 的條件判斷與寫入在同一列鎖內完成，多個節點同時認領只有一個更新得到
+        stmt = text("""
+            UPDATE run_artifacts
+               SET payload = payload || jsonb_build_object('owner', CAST(:owner AS text),
+                                                           'lease_expires_at', CAST(:lease AS text))
+             WHERE run_id = :run_id AND kind = :kind
+               AND payload->>'status' = ANY(:statuses)
+               AND (payload->>'owner' IS NULL OR payload->>'owner' = :owner
+                    OR payload->>'lease_expires_at' IS NULL
+                    OR CAST(payload->>'lease_expires_at' AS timestamptz) < now())
+            RETURNING payload
+        """)
+        with self.session_factory() as s:
+            row = s.execute(stmt, {"run_id": run_id, "kind": JOB_KIND, "owner": owner,
+                                   "lease": _lease_until(lease_seconds),
+                                   "statuses": list(PENDING_JOB_STATUSES)}).first()
+            s.commit()
+        return row[0] if row else None
+
+    def list_runs(self, limit: int = 50) -> List[Dict[str, Any]]:
+        from sqlalchemy import select, func
+        RunArtifact = _run_artifact_model()
+        stmt = (
+            select(RunArtifact.run_id,
+                   func.array_agg(RunArtifact.kind),
+                   func.min(RunArtifact.created_at).label("created_at"))
+            .group_by(RunArtifact.run_id)
+            .order_by(func.min(RunArtifact.created_at).desc())
+            .limit(limit)
+        )
+        with self.session_factory() as s:
+            rows = s.execute(stmt).all()
+        return [{"run_id": r[0], "kinds": sorted(r[1]), "created_at": r[2].isoformat()} for r in rows]
+
+    def evict(self) -> int:
+        from sqlalchemy import select, delete, func
+        RunArtifact = _run_artifact_model()
+        cutoff = datetime.now(timezone.utc) - timedelta(days=self.retention_days)
+        # 過期的 run：整個 run 最後一次寫入都早於 cutoff，不會只刪掉舊的 selector 而留下較新的 planner / job
+        expired_runs = (
+            select(RunArtifact.run_id)
+            .group_by(RunArtifact.run_id)
+            .having(func.max(RunArtifact.created_at) < cutoff)
+        )
+        # 超過 max_runs 的舊 run：依每個 run 最早寫入時間排序後取 offset 之後
+        overflow = (
+            select(RunArtifact.run_id)
+            .group_by(RunArtifact.run_id)
+            .order_by(func.min(RunArtifact.created_at).desc())
+            .offset(self.max_runs)
+        )
+        # 有未完成背景工作的 run 整個保留（工作紀錄與已完成的 selector 輸出都還要用）
+        pending = (
+            select(RunArtifact.run_id)
+            .where(RunArtifact.kind == JOB_KIND,
+                   RunArtifact.payload["status"].astext.in_(PENDING_JOB_STATUSES))
+            .scalar_subquery()
+        )
+        with self.session_factory() as s:
+            expired = s.execute(
+                delete(RunArtifact)
+                .where(RunArtifact.run_id.in_(expired_runs.scalar_subquery()), RunArtifact.run_id.not_in(pending))
+                .returning(RunArtifact.run_id)
+            ).scalars().all()
+            stale = s.execute(
+                delete(RunArtifact)
+                .where(RunArtifact.run_id.in_(overflow.scalar_subquery()), RunArtifact.run_id.not_in(pending))
+                .returning(RunArtifact.run_id)
+            ).scalars().all()
+            s.commit()
+        return len(set(expired) | set(stale))
+
+
+def _run_artifact_model():
+    from models import RunArtifact
+    return RunArtifact
+
+
+_store: Optional[ArtifactStore] = None
+_store_lock = threading.Lock()
+
+
+def get_artifact_store() -> ArtifactStore:
+    """依環境變數建立（並快取）Artifact Store
+
+    ARTIFACT_BACKEND: file（預設）或 postgres
+    ARTIFACT_DIR: 檔案後端根目錄，預設 data
+    ARTIFACT_RETENTION_DAYS / ARTIFACT_MAX_RUNS: 保留天數與 run 數上限
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            backend = os.getenv("ARTIFACT_BACKEND", "file").lower()
+            kwargs = {
+                "retention_days": float(os.getenv("ARTIFACT_RETENTION_DAYS", "7")),
+                "max_runs": int(os.getenv("ARTIFACT_MAX_RUNS", "1000")),
+            }
+            if backend == "postgres":
+                _store = PostgresArtifactStore(**kwargs)
+            else:
+                _store = FileArtifactStore(os.getenv("ARTIFACT_DIR", "data"), **kwargs)
+        return _store
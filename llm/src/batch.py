@@ -0,0 +1,130 @@
+# llm/src/batch.py
+"""
+批次規劃
+一次送入多個家庭的完整流程請求，在同一個並發預算下同時執行，每完成一項就串流回傳（NDJSON）：
+- 完全相同的請求只跑一次，其餘項目共用結果（coalesced=True）
+- 批次內的食譜檢索（食材 / 標籤 / 關鍵字搜尋、冰箱覆蓋率排序）以參數為 key 共用，同一查詢只算一次
+- 並發名額由 process 內所有批次共用（BATCH_MAX_CONCURRENCY），LLM 呼叫另受 scheduler 的 AIMD 視窗節流
+"""
+from __future__ import annotations
+
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from coalesce import SharedResults, request_key
+from metrics import BATCH_ITEMS, BATCH_RETRIEVAL
+from telemetry import get_logger, span
+
+logger = get_logger("batch")
+
+# 單一批次預設同時執行的項目數；所有批次合計不超過 BATCH_MAX_CONCURRENCY
+DEFAULT_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", os.getenv("LLM_MAX_CONCURRENCY", "16")))
+MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "200"))
+
+_slots = threading.BoundedSemaphore(MAX_CONCURRENCY)
+_retrieval: contextvars.ContextVar[Optional[SharedResults]] = contextvars.ContextVar(
+    "menufest_batch_retrieval", default=None)
+
+
+def shared(tool: str, fn: Callable[..., Any], *args: Any) -> Any:
+    """在批次內以 (tool, 參數) 共用 fn(*args) 的結果；不在批次中時直接執行
+
+    結果會被多個項目共用，呼叫端不可修改
+    """
+    results = _retrieval.get()
+    if results is None:
+        return fn(*args)
+    value, hit = results.get(request_key(tool, *args), lambda: fn(*args))
+    BATCH_RETRIEVAL.labels(tool, "hit" if hit else "miss").inc()
+    return value
+
+
+def _orchestrator():
+    from agents.registry import get_orchestrator
+    return get_orchestrator()
+
+
+def _run_item(orchestrator, request: Dict[str, Any], index: int) -> Dict[str, Any]:
+    from agents.selector.agent_react import SelectorConstraints
+
+    with _slots, span("batch.item", index=index, user_id=request.get("user_id")):
+        try:
+            return orchestrator.run_full_pipeline(
+                user_id=request["user_id"],
+                people=request["people"],
+                days=request["days"],
+                meals=request["meals"],
+                constraints=SelectorConstraints(**request.get("constraints") or {}),
+                planner_preferences=request.get("planner_preferences"),
+                max_cooking_time=request.get("max_cooking_time"),
+                max_steps=request.get("max_steps"),
+                start_date=request.get("start_date"),
+                token_budget=request.get("token_budget"),
+                selector_mode=request.get("selector_mode"),
+            )
+        except Exception as e:
+            logger.exception("批次項目執行失敗: index=%d, user_id=%s", index, request.get("user_id"))
+            return {"success": False, "error": f"批次項目執行失敗: {str(e)}"}
+
+
+def run_batch(requests: List[Dict[str, Any]],
+              concurrency: Optional[int] = None,
+              orchestrator=None) -> Iterator[Dict[str, Any]]:
+    """執行多個完整流程請求（FullPipelineRequest 的 dict），依完成順序逐項產出結果
+
+    每項為 {"type": "item", "index": 請求位置, **run_full_pipeline 結果}，最後一筆為
+    {"type": "summary", ...}：項目數、去重後實際執行數、成功 / 失敗數、檢索共用次數與每分鐘完成的家庭數。
+    產生器被關閉時（client 中斷）尚未開始的項目會取消
+    """
+    if len(requests) > MAX_ITEMS:
+        raise ValueError(f"批次最多 {MAX_ITEMS} 項，收到 {len(requests)} 項")
+    orchestrator = orchestrator or _orchestrator()
+
+    # 相同請求只執行一次：key → 所有相同請求的位置
+    groups: Dict[str, List[int]] = {}
+    for index, request in enumerate(requests):
+        groups.setdefault(request_key("batch", request), []).append(index)
+
+    results = SharedResults()
+    workers = max(1, min(concurrency or DEFAULT_CONCURRENCY, MAX_CONCURRENCY, len(groups) or 1))
+    counts = {"succeeded": 0, "failed": 0}
+    started = time.perf_counter()
+    logger.info("開始批次規劃: %d 項（去重後 %d 項），並發 %d", len(requests), len(groups), workers)
+
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch")
+    try:
+        futures = {}
+        for indexes in groups.values():
+            # 每個項目一份 context 副本（帶著本批次的檢索共用表與目前 span），不互相干擾
+            ctx = contextvars.copy_context()
+            ctx.run(_retrieval.set, results)
+            first = indexes[0]
+            futures[pool.submit(ctx.run, _run_item, orchestrator, requests[first], first)] = indexes
+        for future in as_completed(futures):
+            result = future.result()
+            status = "succeeded" if result.get("success") else "failed"
+            for n, index in enumerate(futures[future]):
+                counts[status] += 1
+                BATCH_ITEMS.labels(status).inc()
+                yield {"type": "item", "index": index, **result, **({"coalesced": True} if n else {})}
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    elapsed = time.perf_counter() - started
+    summary = {
+        "type": "summary",
+        "total": len(requests),
+        "executed": len(groups),
+        **counts,
+        "retrieval": results.stats(),
+        "concurrency": workers,
+        "elapsed_ms": round(elapsed * 1000, 1),
+        "households_per_minute": round(len(requests) / elapsed * 60, 1) if elapsed > 0 else None,
+    }
+    logger.info("批次規劃完成: %s", summary)
+    yield summary
@@ -0,0 +1,105 @@
+# llm/src/coalesce.py
+"""
+Single-flight 請求合併
+同一個 key 同時只執行一次：執行中再進來的相同請求不另外執行，等待並取得同一份結果（或同一個例外）；
+執行結束即移除，不做結果快取。
+SharedResults 另外把結果保留到自身被丟棄為止，供一次批次內的多個流程共用（見 batch.py）
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """以 key 合併同時進行的相同工作（執行緒安全）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """執行 fn 或等待進行中的同 key 工作；回傳 (結果, 是否為併入的重複請求)"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result, False
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+
+class SharedResults:
+    """有範圍的結果共用：同 key 只算一次（進行中者以 SingleFlight 合併），結果保留到本物件被丟棄；例外不保留"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._results: Dict[str, Any] = {}
+        self._flights = SingleFlight()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """回傳 (結果, 是否共用既有結果)"""
+        with self._lock:
+            if key in self._results:
+                self.hits += 1
+                return self._results[key], True
+
+        def compute() -> Tuple[Any, bool]:
+            # 等鎖期間可能已有其他執行緒算完並離開 single-flight
+            with self._lock:
+                if key in self._results:
+                    return self._results[key], True
+            result = fn()
+            with self._lock:
+                self._results[key] = result
+            return result, False
+
+        (result, cached), joined = self._flights.do(key, compute)
+        hit = cached or joined
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return result, hit
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+
+def request_key(*parts: Any) -> str:
+    """將已正規化的請求欄位雜湊成 key"""
+    raw = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
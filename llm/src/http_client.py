@@ -0,0 +1,164 @@
+# llm/src/http_client.py
+"""
+LLM 共用 HTTP client
+整個 process 只有一組 httpx client（同步 / 非同步各一）注入所有 ChatOpenAI：
+連線池與 keep-alive 讓一條流程的 10~50 次 LLM 呼叫共用已建立的 TLS 連線，HTTP/2 時多個呼叫共用同一條連線；
+transport 由內而外為 連線池 → 連線重用指標 → LLM 排程器（見 scheduler.py）
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+
+from telemetry import get_logger
+from metrics import LLM_HTTP_CONNECT_SECONDS, LLM_HTTP_REQUESTS
+from scheduler import AsyncSchedulingTransport, SchedulingTransport, get_scheduler, scheduler_enabled
+
+logger = get_logger("http")
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.getenv(name, str(default)))
+
+
+def llm_timeout() -> httpx.Timeout:
+    """LLM 呼叫逾時：連線與取得連線池名額要快，讀取要等得起長回應
+
+    LLM_CONNECT_TIMEOUT / LLM_READ_TIMEOUT / LLM_WRITE_TIMEOUT / LLM_POOL_TIMEOUT（秒）
+    """
+    return httpx.Timeout(
+        connect=_env_float("LLM_CONNECT_TIMEOUT", 10),
+        read=_env_float("LLM_READ_TIMEOUT", 120),
+        write=_env_float("LLM_WRITE_TIMEOUT", 30),
+        pool=_env_float("LLM_POOL_TIMEOUT", 30),
+    )
+
+
+def llm_limits() -> httpx.Limits:
+    """連線池大小：LLM_MAX_CONNECTIONS / LLM_MAX_KEEPALIVE / LLM_KEEPALIVE_EXPIRY（秒）"""
+    return httpx.Limits(
+        max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", "32")),
+        max_keepalive_connections=int(os.getenv("LLM_MAX_KEEPALIVE", "16")),
+        keepalive_expiry=_env_float("LLM_KEEPALIVE_EXPIRY", 90),
+    )
+
+
+def http2_enabled() -> bool:
+    """LLM_HTTP2（預設開啟）；需要 h2 套件（httpx[http2]），沒有時退回 HTTP/1.1"""
+    if os.getenv("LLM_HTTP2", "1").lower() in ("0", "false", "no"):
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        logger.warning("未安裝 h2，LLM client 改用 HTTP/1.1（pip install 'httpx[http2]'）")
+        return False
+    return True
+
+
+# ==================== 連線重用指標 ====================
+
+class _ConnectionTrace:
+    """httpcore trace 回呼：記錄這次請求是否新建連線、TCP / TLS 建立耗時"""
+
+    __slots__ = ("new_connection", "_started", "_parent")
+
+    def __init__(self, parent=None):
+        self.new_connection = False
+        self._started: Dict[str, float] = {}
+        self._parent = parent
+
+    def _event(self, name: str) -> None:
+        prefix, _, phase = name.rpartition(".")
+        if prefix in ("connection.connect_tcp", "connection.start_tls"):
+            if phase == "started":
+                self._started[prefix] = time.perf_counter()
+            elif phase == "complete" and prefix in self._started:
+                self.new_connection = True
+                step = "tcp" if prefix.endswith("connect_tcp") else "tls"
+                LLM_HTTP_CONNECT_SECONDS.labels(step).observe(time.perf_counter() - self._started.pop(prefix))
+
+    def __call__(self, name: str, info: Dict[str, Any]) -> None:
+        self._event(name)
+        if self._parent is not None:
+            self._parent(name, info)
+
+    async def atrace(self, name: str, info: Dict[str, Any]) -> None:
+        self._event(name)
+        if self._parent is not None:
+            await self._parent(name, info)
+
+
+def _record(trace: _ConnectionTrace, response: httpx.Response) -> None:
+    version = response.extensions.get("http_version", b"").decode("ascii", "replace") or "unknown"
+    LLM_HTTP_REQUESTS.labels("new" if trace.new_connection else "reused", version).inc()
+
+
+class ConnectionMetricsTransport(httpx.BaseTransport):
+    """在 httpcore 連線池外層統計每次請求新建或重用連線"""
+
+    def __init__(self, transport: httpx.BaseTransport):
+        self.transport = transport
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        trace = _ConnectionTrace(request.extensions.get("trace"))
+        request.extensions["trace"] = trace
+        response = self.transport.handle_request(request)
+        _record(trace, response)
+        return response
+
+    def close(self) -> None:
+        self.transport.close()
+
+
+class AsyncConnectionMetricsTransport(httpx.AsyncBaseTransport):
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self.transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        trace = _ConnectionTrace(request.extensions.get("trace"))
+        request.extensions["trace"] = trace.atrace
+        response = await self.transport.handle_async_request(request)
+        _record(trace, response)
+        return response
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+# ==================== 共用 client ====================
+
+_clients: Optional[Tuple[httpx.Client, httpx.AsyncClient]] = None
+_clients_lock = threading.Lock()
+
+
+def _build_clients() -> Tuple[httpx.Client, httpx.AsyncClient]:
+    from openai import DefaultAsyncHttpxClient, DefaultHttpxClient
+
+    http2 = http2_enabled()
+    limits = llm_limits()
+    sync_transport: httpx.BaseTransport = ConnectionMetricsTransport(
+        httpx.HTTPTransport(http2=http2, limits=limits))
+    async_transport: httpx.AsyncBaseTransport = AsyncConnectionMetricsTransport(
+        httpx.AsyncHTTPTransport(http2=http2, limits=limits))
+    if scheduler_enabled():
+        scheduler = get_scheduler()
+        sync_transport = SchedulingTransport(scheduler, sync_transport)
+        async_transport = AsyncSchedulingTransport(scheduler, async_transport)
+    logger.info("LLM HTTP client: http2=%s, max_connections=%s, scheduler=%s",
+                http2, limits.max_connections, scheduler_enabled())
+    timeout = llm_timeout()
+    return (DefaultHttpxClient(transport=sync_transport, timeout=timeout),
+            DefaultAsyncHttpxClient(transport=async_transport, timeout=timeout))
+
+
+def shared_clients() -> Tuple[httpx.Client, httpx.AsyncClient]:
+    """(httpx.Client, httpx.AsyncClient)，供所有 ChatOpenAI 的 http_client / http_async_client 共用"""
+    global _clients
+    with _clients_lock:
+        if _clients is None:
+            _clients = _build_clients()
+        return _clients
@@ -0,0 +1,340 @@
+# llm/src/jobs.py
+"""
+背景工作（Job）
+完整流程可能跑上數分鐘，超過 gateway 的請求逾時；改為送出後立即回傳 job_id，由固定大小的 worker pool 執行，
+client 輪詢狀態，Selector 完成後即可讀到部分結果。
+工作狀態以 kind="job" 存在 Artifact Store（job_id 即 run_id），服務重啟後未完成的工作重新排入：
+Selector 輸出已保存者從 Planner 接續，否則整條重跑。
+多個副本共用同一個 Store 時，每個工作由一個節點以租約（owner + lease_expires_at）持有：
+送出或認領時取得租約，排隊與執行期間定期續約，寫回工作紀錄時只在仍由本節點持有時寫入；
+resume() 只認領租約已過期（持有節點已停機）的工作，續約執行緒每次續約後都再呼叫一次，
+重啟前自己持有、租約還沒到期的工作也會在到期後被接手
+"""
+from __future__ import annotations
+
+import os
+import queue
+import socket
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from artifacts import JOB_KIND, PENDING_JOB_STATUSES, ArtifactStore, get_artifact_store, new_run_id
+from metrics import JOBS_FINISHED, JOBS_QUEUED, JOBS_RUNNING
+from telemetry import get_logger, span
+
+logger = get_logger("jobs")
+
+PENDING_STATUSES = PENDING_JOB_STATUSES
+FINAL_STATUSES = ("succeeded", "failed")
+
+
+class JobQueueFull(Exception):
+    """排隊中的工作已達上限"""
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class JobManager:
+    """背景工作管理：送出、輪詢與重啟後接續
+
+    workers: 同時執行的工作數（JOB_WORKERS，預設 2）
+    queue_limit: 排隊上限，超過時 submit() 拋出 JobQueueFull（JOB_QUEUE_LIMIT，預設 100）
+    max_attempts: 同一工作最多執行幾次，避免每次重啟都讓同一個工作把服務弄掛（JOB_MAX_ATTEMPTS，預設 3）
+    lease_seconds: 工作租約長度，每 1/3 租約續約一次（JOB_LEASE_SECONDS，預設 60）
+    owner: 本節點的租約持有者名稱（JOB_OWNER，預設 主機名稱-pid-隨機碼）
+    resume: 續約執行緒是否定期接手租約已過期的工作（JOB_RESUME_ON_STARTUP，預設開啟）
+    """
+
+    def __init__(self,
+                 store: Optional[ArtifactStore] = None,
+                 workers: Optional[int] = None,
+                 queue_limit: Optional[int] = None,
+                 max_attempts: Optional[int] = None,
+                 orchestrator_factory: Optional[Callable[[], Any]] = None,
+                 lease_seconds: Optional[float] = None,
+                 owner: Optional[str] = None,
+                 resume: Optional[bool] = None):
+        self._store = store
+        self.workers = workers or int(os.getenv("JOB_WORKERS", "2"))
+        self.queue_limit = queue_limit or int(os.getenv("JOB_QUEUE_LIMIT", "100"))
+        self.max_attempts = max_attempts or int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+        self.lease_seconds = lease_seconds or float(os.getenv("JOB_LEASE_SECONDS", "60"))
+        self.owner = owner or os.getenv("JOB_OWNER") or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        if resume is None:
+            resume = os.getenv("JOB_RESUME_ON_STARTUP", "1").lower() not in ("0", "false", "no")
+        self.resume_jobs = resume
+        self._orchestrator_factory = orchestrator_factory
+        # 上限只在 submit() 檢查，重啟接續的工作一律排入
+        self._queue: "queue.Queue[str]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+        self._running = 0
+        # 本節點持有租約（排隊中或執行中）的工作，由續約執行緒定期延長
+        self._owned: Set[str] = set()
+        self._stopping = threading.Event()
+
+    @property
+    def store(self) -> ArtifactStore:
+        if self._store is None:
+            self._store = get_artifact_store()
+        return self._store
+
+    def _orchestrator(self):
+        if self._orchestrator_factory is not None:
+            return self._orchestrator_factory()
+        from agents.registry import get_orchestrator
+        return get_orchestrator()
+
+    # ==================== 生命週期 ====================
+
+    def start(self) -> None:
+        """啟動 worker 執行緒（重複呼叫無作用）"""
+        with self._lock:
+            if self._threads:
+                return
+            self._stopping.clear()
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            thread = threading.Thread(target=self._heartbeat, name="job-heartbeat", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info("背景工作 worker 啟動: %d 個, owner=%s", self.workers, self.owner)
+
+    def stop(self) -> None:
+        """停止續約與 worker 執行緒（執行中的工作做完才結束）；未完成的工作在租約到期後由其他節點接手"""
+        with self._lock:
+            threads, self._threads = self._threads, []
+        if not threads:
+            return
+        self._stopping.set()
+        for _ in range(self.workers):
+            self._queue.put(None)
+
+    def resume(self) -> int:
+        """認領 Artifact Store 中租約已過期的未完成工作並排入，回傳排入數
+
+        其他副本仍在續約的工作不會被認領；多個副本同時啟動時，每個工作只會被其中一個認領
+        """
+        resumed = 0
+        for job_id in self.store.pending_jobs(limit=self.store.max_runs):
+            with self._lock:
+                if job_id in self._owned:
+                    continue
+            if self._claim(job_id) is not None:
+                self._enqueue(job_id)
+                resumed += 1
+        if resumed:
+            logger.info("接續未完成的背景工作: %d 個", resumed)
+        return resumed
+
+    # ==================== API ====================
+
+    def submit(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """建立工作並排入佇列，回傳工作狀態"""
+        if self._queue.qsize() >= self.queue_limit:
+            raise JobQueueFull(f"排隊中的工作已達上限 {self.queue_limit}")
+        self.start()
+        job_id = new_run_id()
+        record = {
+            "job_id": job_id,
+            "status": "queued",
+            "request": request,
+            "attempts": 0,
+            "created_at": _now(),
+            "updated_at": _now(),
+            "owner": self.owner,
+        }
+        with self._lock:
+            self._owned.add(job_id)
+        self._update(record)
+        self._enqueue(job_id)
+        logger.info("送出背景工作: job_id=%s, user_id=%s", job_id, request.get("user_id"))
+        return self.status(job_id)
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """工作狀態與目前可取得的結果；Selector 完成後即附上 selector_output"""
+        record = self.store.get(job_id, JOB_KIND)
+        if record is None:
+            return None
+        result = record.get("result") or {}
+        run_id = result.get("run_id") or job_id
+        selector_output = self.store.get(run_id, "selector")
+        planner_output = self.store.get(run_id, "planner") if record["status"] in FINAL_STATUSES else None
+        return {
+            "job_id": job_id,
+            "status": record["status"],
+            "stage": "planner" if selector_output is not None else "selector",
+            "attempts": record.get("attempts", 0),
+            "created_at": record.get("created_at"),
+            "updated_at": record.get("updated_at"),
+            "error": record.get("error"),
+            "request": record.get("request"),
+            "run_id": run_id,
+            "usage": result.get("usage"),
+            "budget_exceeded": result.get("budget_exceeded", False),
+            "coalesced": result.get("coalesced", False),
+            "selector_output": selector_output,
+            "planner_output": planner_output,
+        }
+
+    def depth(self) -> Dict[str, int]:
+        with self._lock:
+            running = self._running
+        return {"queued": self._queue.qsize(), "running": running, "workers": self.workers}
+
+    # ==================== 執行 ====================
+
+    def _enqueue(self, job_id: str) -> None:
+        self._queue.put(job_id)
+        JOBS_QUEUED.set(self._queue.qsize())
+
+    def _update(self, record: Dict[str, Any], **fields) -> bool:
+        """寫回工作紀錄；工作已被其他節點接手時不寫入並回傳 False"""
+        record.update(fields, updated_at=_now(), owner=self.owner)
+        if record.get("status") in PENDING_STATUSES:
+            # 整份紀錄寫回時一併延長租約，不會把續約執行緒延長過的租約改回舊值
+            record["lease_expires_at"] = (datetime.now(timezone.utc)
+                                          + timedelta(seconds=self.lease_seconds)).isoformat()
+        else:
+            record.pop("lease_expires_at", None)
+        if self.store.put_job(record["job_id"], self.owner, record):
+            return True
+        logger.warning("背景工作已由其他節點接手，不寫入: job_id=%s", record["job_id"])
+        self._release(record["job_id"])
+        return False
+
+    def _claim(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """認領或續約工作；成功時記為本節點持有"""
+        try:
+            record = self.store.claim_job(job_id, self.owner, self.lease_seconds)
+        except Exception:
+            logger.exception("認領背景工作失敗: job_id=%s", job_id)
+            record = None
+        with self._lock:
+            if record is None:
+                self._owned.discard(job_id)
+            else:
+                self._owned.add(job_id)
+        return record
+
+    def _release(self, job_id: str) -> None:
+        with self._lock:
+            self._owned.discard(job_id)
+
+    def _heartbeat(self) -> None:
+        """每 1/3 租約為本節點持有的工作續約；續約失敗（已結束或被其他節點接手）即不再持有。
+        續約後接手租約已過期的工作：持有節點停機（包括重啟前的本節點）後，工作最晚在租約到期後 1/3 租約內被接手
+        """
+        while not self._stopping.wait(self.lease_seconds / 3):
+            with self._lock:
+                owned = list(self._owned)
+            for job_id in owned:
+                if self._claim(job_id) is None:
+                    logger.info("背景工作租約已不屬於本節點: job_id=%s", job_id)
+            if self.resume_jobs:
+                try:
+                    self.resume()
+                except Exception:
+                    logger.exception("接續背景工作失敗")
+
+    def _worker(self) -> None:
+        while True:
+            job_id = self._queue.get()
+            if job_id is None:
+                self._queue.task_done()
+                return
+            JOBS_QUEUED.set(self._queue.qsize())
+            with self._lock:
+                self._running += 1
+            JOBS_RUNNING.inc()
+            try:
+                self._execute(job_id)
+            except Exception:
+                logger.exception("背景工作執行失敗: job_id=%s", job_id)
+            finally:
+                JOBS_RUNNING.dec()
+                with self._lock:
+                    self._running -= 1
+                self._queue.task_done()
+
+    def _execute(self, job_id: str) -> None:
+        # 執行前再確認一次租約：排隊期間若已被其他節點接手（例如本節點曾長時間停頓）就不執行
+        record = self._claim(job_id)
+        if record is None:
+            return
+        if record.get("attempts", 0) >= self.max_attempts:
+            self._finish(record, {"success": False, "error": f"已執行 {record['attempts']} 次仍未完成，放棄"})
+            return
+
+        if not self._update(record, status="running", attempts=record.get("attempts", 0) + 1, started_at=_now()):
+            return
+        with span("job", job_id=job_id, attempt=record["attempts"]):
+            try:
+                result = self._run(job_id, record["request"])
+            except Exception as e:
+                logger.exception("背景工作執行失敗: job_id=%s", job_id)
+                result = {"success": False, "error": f"背景工作執行失敗: {str(e)}"}
+        self._finish(record, result)
+
+    def _run(self, job_id: str, request: Dict[str, Any]) -> Dict[str, Any]:
+        from agents.selector.agent_react import SelectorConstraints
+
+        orchestrator = self._orchestrator()
+        if self.store.get(job_id, "selector") is not None:
+            # 上次執行已完成 Selector：只重跑 Planner
+            logger.info("背景工作從 Planner 接續: job_id=%s", job_id)
+            return orchestrator.run_from_selector_run(
+                run_id=job_id,
+                people=request["people"],
+                days=request["days"],
+                meals=request["meals"],
+                planner_preferences=request.get("planner_preferences"),
+                max_cooking_time=request.get("max_cooking_time"),
+                max_steps=request.get("max_steps"),
+                start_date=request.get("start_date"),
+                token_budget=request.get("token_budget"),
+            )
+        return orchestrator.run_full_pipeline(
+            user_id=request["user_id"],
+            people=request["people"],
+            days=request["days"],
+            meals=request["meals"],
+            constraints=SelectorConstraints(**request.get("constraints") or {}),
+            planner_preferences=request.get("planner_preferences"),
+            max_cooking_time=request.get("max_cooking_time"),
+            max_steps=request.get("max_steps"),
+            start_date=request.get("start_date"),
+            token_budget=request.get("token_budget"),
+            run_id=job_id,
+            selector_mode=request.get("selector_mode"),
+        )
+
+    def _finish(self, record: Dict[str, Any], result: Dict[str, Any]) -> None:
+        status = "succeeded" if result.get("success") else "failed"
+        # selector / planner 輸出已另存為 artifact，工作紀錄只留摘要
+        summary = {k: result.get(k) for k in ("success", "run_id", "usage", "budget_exceeded", "coalesced")
+                   if k in result}
+        written = self._update(record, status=status, error=result.get("error"), result=summary, finished_at=_now())
+        self._release(record["job_id"])
+        if written:
+            JOBS_FINISHED.labels(status).inc()
+            logger.info("背景工作結束: job_id=%s, status=%s", record["job_id"], status)
+
+
+_manager: Optional[JobManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_job_manager() -> JobManager:
+    """process 共用的 JobManager"""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = JobManager()
+        return _manager
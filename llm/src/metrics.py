@@ -0,0 +1,117 @@
+# llm/src/metrics.py
+"""
+Prometheus 指標
+由 telemetry 的 span 結束事件換算延遲與次數；/metrics 端點輸出文字格式
+"""
+from __future__ import annotations
+
+from typing import Tuple
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+from telemetry import Span, add_span_listener, current_span
+
+# LLM 與整條流程以秒到分鐘計，DB 與工具以毫秒計
+_SLOW_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+_FAST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+_TOKEN_BUCKETS = (50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000)
+
+REQUEST_SECONDS = Histogram(
+    "menufest_request_seconds", "HTTP 請求延遲", ["method", "path", "status"], buckets=_SLOW_BUCKETS)
+STAGE_SECONDS = Histogram(
+    "menufest_stage_seconds", "流程階段延遲", ["stage"], buckets=_SLOW_BUCKETS)
+PIPELINES_IN_FLIGHT = Gauge(
+    "menufest_pipelines_in_flight", "執行中的完整流程數")
+PIPELINES_COALESCED = Counter(
+    "menufest_pipelines_coalesced_total", "併入執行中相同流程的重複請求數")
+BATCH_ITEMS = Counter(
+    "menufest_batch_items_total", "批次規劃的項目數", ["status"])
+BATCH_RETRIEVAL = Counter(
+    "menufest_batch_retrieval_total", "批次內食譜檢索（hit 為共用其他項目的結果）", ["tool", "result"])
+JOBS_QUEUED = Gauge(
+    "menufest_jobs_queued", "排隊中的背景工作數（可作為擴縮依據）")
+JOBS_RUNNING = Gauge(
+    "menufest_jobs_running", "執行中的背景工作數")
+JOBS_FINISHED = Counter(
+    "menufest_jobs_finished_total", "結束的背景工作數", ["status"])
+LLM_CALLS = Counter(
+    "menufest_llm_calls_total", "LLM 呼叫次數", ["agent", "status"])
+LLM_SECONDS = Histogram(
+    "menufest_llm_seconds", "LLM 呼叫延遲", ["agent"], buckets=_SLOW_BUCKETS)
+LLM_TOKENS = Counter(
+    "menufest_llm_tokens_total", "LLM token 用量", ["agent", "kind"])
+PROMPT_TOKENS = Histogram(
+    "menufest_prompt_tokens", "每次 LLM 呼叫各提示詞段落的輸入 token 數", ["agent", "section"],
+    buckets=_TOKEN_BUCKETS)
+SCRATCHPAD_COMPACTIONS = Counter(
+    "menufest_scratchpad_compactions_total", "送給模型前被精簡的 agent 中間步驟回合數", ["agent"])
+SCRATCHPAD_TOKENS_SAVED = Counter(
+    "menufest_scratchpad_tokens_saved_total", "中間步驟精簡省下的輸入 token（每次 LLM 呼叫分別計算）", ["agent"])
+TOOL_CALLS = Counter(
+    "menufest_tool_calls_total", "工具呼叫次數", ["tool", "status"])
+TOOL_SECONDS = Histogram(
+    "menufest_tool_seconds", "工具呼叫延遲", ["tool"], buckets=_FAST_BUCKETS)
+JSON_PARSE_FAILURES = Counter(
+    "menufest_json_parse_failures_total", "LLM 回應 JSON 解析失敗次數", ["stage"])
+STRUCTURED_ITEMS_DROPPED = Counter(
+    "menufest_structured_items_dropped_total", "本地修復輸出時因驗證失敗刪除的食譜 / 菜色項目數", ["schema"])
+DB_QUERY_SECONDS = Histogram(
+    "menufest_db_query_seconds", "DB 查詢延遲", ["query"], buckets=_FAST_BUCKETS)
+SELECTOR_REPAIRS = Counter(
+    "menufest_selector_repairs_total", "Selector 輸出檢查發現並在本地修正的問題數", ["problem"])
+PLANNER_SLOT_REPAIRS = Counter(
+    "menufest_planner_slot_repairs_total", "Planner 菜單中缺少或格式錯誤而局部重新規劃的餐",
+    ["result"])
+LLM_SCHEDULER_WINDOW = Gauge(
+    "menufest_llm_scheduler_window", "LLM 排程器的 AIMD 並發視窗")
+LLM_SCHEDULER_IN_FLIGHT = Gauge(
+    "menufest_llm_scheduler_in_flight", "在途的 LLM HTTP 請求數")
+LLM_SCHEDULER_QUEUED = Gauge(
+    "menufest_llm_scheduler_queued", "等待 LLM 排程名額的請求數")
+LLM_SCHEDULER_WAIT_SECONDS = Histogram(
+    "menufest_llm_scheduler_wait_seconds", "等待 LLM 排程名額的時間", buckets=_SLOW_BUCKETS)
+LLM_SCHEDULER_THROTTLED = Counter(
+    "menufest_llm_scheduler_throttled_total", "LLM 限流 / 過載回應次數", ["status"])
+LLM_SCHEDULER_RETRIES = Counter(
+    "menufest_llm_scheduler_retries_total", "排程器重試次數", ["reason"])
+LLM_HTTP_REQUESTS = Counter(
+    "menufest_llm_http_requests_total", "LLM HTTP 請求數（依是否新建連線與 HTTP 版本）", ["connection", "http_version"])
+LLM_HTTP_CONNECT_SECONDS = Histogram(
+    "menufest_llm_http_connect_seconds", "LLM 連線建立耗時", ["step"], buckets=_FAST_BUCKETS)
+
+
+def _observe_span(s: Span) -> None:
+    seconds = (s.duration_ms or 0) / 1000
+    attrs = s.attrs
+    if s.name == "http":
+        REQUEST_SECONDS.labels(attrs.get("method", ""), attrs.get("path", ""),
+                               str(attrs.get("status_code", ""))).observe(seconds)
+    elif s.name in ("selector", "planner"):
+        STAGE_SECONDS.labels(s.name).observe(seconds)
+    elif s.name == "llm":
+        agent = attrs.get("agent") or s.stage
+        LLM_CALLS.labels(agent, s.status).inc()
+        LLM_SECONDS.labels(agent).observe(seconds)
+        for kind in ("prompt", "completion", "cached"):
+            tokens = attrs.get(f"{kind}_tokens")
+            if tokens:
+                LLM_TOKENS.labels(agent, kind).inc(tokens)
+    elif s.name == "tool":
+        tool = attrs.get("tool") or "unknown"
+        TOOL_CALLS.labels(tool, s.status).inc()
+        TOOL_SECONDS.labels(tool).observe(seconds)
+    elif s.name.startswith("db."):
+        DB_QUERY_SECONDS.labels(s.name[3:]).observe(seconds)
+
+
+add_span_listener(_observe_span)
+
+
+def record_json_parse_failure() -> None:
+    span = current_span()
+    JSON_PARSE_FAILURES.labels(span.stage if span else "other").inc()
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """Prometheus 文字格式與對應的 Content-Type"""
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -1,12 +1,10 @@
 # llm/src/models.py
 from datetime import date, datetime
 from sqlalchemy.orm import Mapped, mapped_column
-from sqlalchemy import String, Numeric, Date, TIMESTAMP, ForeignKey, text, UUID
-from sqlalchemy.dialects.postgresql import UUID as PostgresUUID
-try:
-    from .db import Base
-except ImportError:
-    from db import Base
+from sqlalchemy import String, Numeric, Date, TIMESTAMP, ForeignKey, text, UUID, Computed, BigInteger, Integer, Text
+from sqlalchemy.dialects.postgresql import UUID as PostgresUUID, JSONB, ARRAY, TSVECTOR
+
+from db import Base
 
 class User(Base):
     __tablename__ = "users"
@@ -27,3 +25,50 @@ class Ingredient(Base):
     quantity: Mapped[float] = mapped_column(Numeric(12, 2), nullable=False)
     unit: Mapped[str] = mapped_column(String, nullable=False)
     created_at: Mapped[datetime] = mapped_column(TIMESTAMP(timezone=True), server_default=text("now()"))
+    # 由 trg_ingredients_updated_at 在每次 UPDATE 時改寫（見 db/init.sql）
+    updated_at: Mapped[datetime] = mapped_column(TIMESTAMP(timezone=True), server_default=text("now()"))
+
+class RunArtifact(Base):
+    __tablename__ = "run_artifacts"
+
+    run_id: Mapped[str] = mapped_column(String, primary_key=True)
+    kind: Mapped[str] = mapped_column(String, primary_key=True)  # selector / planner
+    payload: Mapped[dict] = mapped_column(JSONB, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(TIMESTAMP(timezone=True), server_default=text("now()"))
+
+class Recipe(Base):
+    """食譜語料（RECIPE_BACKEND=postgres 時 planner 工具的資料來源，見 agents/planner/store.py）"""
+    __tablename__ = "recipes"
+
+    recipe_id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
+    url: Mapped[str] = mapped_column(Text, nullable=False, unique=True)
+    title: Mapped[str] = mapped_column(Text, nullable=False)
+    steps: Mapped[list] = mapped_column(JSONB, nullable=False, server_default=text("'[]'::jsonb"))
+    cooking_time: Mapped[int | None] = mapped_column(Integer)
+    servings: Mapped[int | None] = mapped_column(Integer)
+    step_count: Mapped[int] = mapped_column(Integer, nullable=False, server_default=text("0"))
+    ingredient_count: Mapped[int] = mapped_column(Integer, nullable=False, server_default=text("0"))
+    # 去重後、不含常備調味料的標準食材 ID（覆蓋率排序用）
+    ingredient_ids: Mapped[list] = mapped_column(ARRAY(Text), nullable=False, server_default=text("'{}'"))
+    search_text: Mapped[str] = mapped_column(Text, nullable=False, server_default=text("''"))
+    # 全文檢索欄位由資料庫依 search_text 產生（見 db/init.sql）
+    search_tsv: Mapped[str | None] = mapped_column(TSVECTOR, Computed("to_tsvector('simple', search_text)", persisted=True), deferred=True)
+    created_at: Mapped[datetime] = mapped_column(TIMESTAMP(timezone=True), server_default=text("now()"))
+    updated_at: Mapped[datetime] = mapped_column(TIMESTAMP(timezone=True), server_default=text("now()"))
+
+class RecipeIngredient(Base):
+    __tablename__ = "recipe_ingredients"
+
+    recipe_id: Mapped[int] = mapped_column(BigInteger, ForeignKey("recipes.recipe_id", ondelete="CASCADE"), primary_key=True)
+    position: Mapped[int] = mapped_column(Integer, primary_key=True)
+    name: Mapped[str] = mapped_column(Text, nullable=False)
+    amount: Mapped[str | None] = mapped_column(Text)
+    canonical_ids: Mapped[list] = mapped_column(ARRAY(Text), nullable=False, server_default=text("'{}'"))
+
+class RecipeTag(Base):
+    __tablename__ = "recipe_tags"
+
+    recipe_id: Mapped[int] = mapped_column(BigInteger, ForeignKey("recipes.recipe_id", ondelete="CASCADE"), primary_key=True)
+    position: Mapped[int] = mapped_column(Integer, primary_key=True)
+    label: Mapped[str] = mapped_column(Text, nullable=False)  # 原始標籤，如 #石斑料理
+    tag: Mapped[str] = mapped_column(Text, nullable=False)  # 去掉 # 並轉小寫，比對用
@@ -0,0 +1,404 @@
+# llm/src/scheduler.py
+"""
+LLM 呼叫排程器（整個 process 共用）
+掛在 OpenAI client 的 httpx transport 上，所有 agent 的模型呼叫都經過這裡：
+- AIMD 並發視窗：成功時加法增加，429 / 過載時減半，讓整體吞吐在限流邊緣緩慢退讓而非一起崩潰
+- 遵守 retry-after 與 x-ratelimit-* 標頭：額度用盡時全域暫停到重置時間，而不是每個請求各自盲目重試
+- 依階段排優先序：預設 planner 先於 selector，已走到後段的流程先完成（已花掉的 selector 成本不白費）
+- 由排程器負責重試（ChatOpenAI 設 max_retries=0），佇列深度與視窗大小輸出為指標
+"""
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import os
+import random
+import re
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, Iterator, List, Optional
+
+import httpx
+
+from telemetry import current_span, get_logger
+from metrics import (LLM_SCHEDULER_IN_FLIGHT, LLM_SCHEDULER_QUEUED, LLM_SCHEDULER_RETRIES,
+                     LLM_SCHEDULER_THROTTLED, LLM_SCHEDULER_WAIT_SECONDS, LLM_SCHEDULER_WINDOW)
+
+logger = get_logger("scheduler")
+
+# 視為限流 / 過載、需要縮小視窗並重試的狀態碼
+THROTTLE_STATUSES = (429, 503, 529)
+RETRY_STATUSES = THROTTLE_STATUSES + (500, 502, 504)
+
+_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+class LLMQueueTimeout(httpx.TimeoutException):
+    """在排程佇列中等待過久（OpenAI SDK 會轉為 APITimeoutError）"""
+
+
+def _parse_duration(value: str) -> Optional[float]:
+    """x-ratelimit-reset-* 的格式，例如 20ms、1s、6m0s"""
+    parts = _DURATION_RE.findall(value or "")
+    if not parts:
+        return None
+    return sum(float(n) * _DURATION_UNITS[unit] for n, unit in parts)
+
+
+def retry_delay(headers: httpx.Headers) -> Optional[float]:
+    """回應標頭要求的等待秒數：retry-after-ms、retry-after（秒數或 HTTP 日期）"""
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if value:
+        try:
+            return float(value)
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    return None
+
+
+def exhausted_delay(headers: httpx.Headers) -> Optional[float]:
+    """請求數或 token 額度已用完時，到重置為止的秒數"""
+    delays = []
+    for kind in ("requests", "tokens"):
+        remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+        if remaining is not None and remaining.strip() == "0":
+            delay = _parse_duration(headers.get(f"x-ratelimit-reset-{kind}", ""))
+            if delay:
+                delays.append(delay)
+    return max(delays) if delays else None
+
+
+def _env_priorities() -> Dict[str, int]:
+    order = [s.strip() for s in os.getenv("LLM_PRIORITY", "planner,selector").split(",") if s.strip()]
+    return {stage: i for i, stage in enumerate(order)}
+
+
+class LLMScheduler:
+    """AIMD 並發視窗 + 優先序佇列 + 全域暫停
+
+    acquire() 取得一個執行名額，release() 依結果調整視窗；
+    同一時間最多 floor(window) 個呼叫在途，等待者依 (優先序, 先來後到) 放行
+    """
+
+    def __init__(self,
+                 initial: Optional[float] = None,
+                 min_window: float = 1.0,
+                 max_window: Optional[float] = None,
+                 queue_timeout: Optional[float] = None,
+                 priorities: Optional[Dict[str, int]] = None):
+        self.max_window = max_window or float(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+        self.min_window = min_window
+        self.window = min(initial or float(os.getenv("LLM_INITIAL_CONCURRENCY", "4")), self.max_window)
+        self.queue_timeout = queue_timeout or float(os.getenv("LLM_QUEUE_TIMEOUT", "120"))
+        self.priorities = priorities or _env_priorities()
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+        self._waiters: List[tuple] = []
+        self._seq = itertools.count()
+        LLM_SCHEDULER_WINDOW.set(self.window)
+
+    def priority_for(self, stage: Optional[str] = None) -> int:
+        if stage is None:
+            span = current_span()
+            stage = span.stage if span else "other"
+        return self.priorities.get(stage, len(self.priorities))
+
+    # ==================== 名額 ====================
+
+    def acquire(self, priority: int, timeout: Optional[float] = None) -> float:
+        """等待執行名額，回傳取得名額的時間（monotonic，供 release 判斷是否需要減窗）"""
+        timeout = self.queue_timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        entry = (priority, next(self._seq))
+        with self._cond:
+            heapq.heappush(self._waiters, entry)
+            LLM_SCHEDULER_QUEUED.set(len(self._waiters))
+            try:
+                while True:
+                    now = time.monotonic()
+                    if (self._waiters[0] == entry and now >= self.paused_until
+                            and self.in_flight < max(int(self.window), 1)):
+                        break
+                    if now >= deadline:
+                        raise LLMQueueTimeout(f"LLM 排程等待超過 {timeout:.0f}s")
+                    wait = deadline - now
+                    if self.paused_until > now:
+                        wait = min(wait, self.paused_until - now)
+                    self._cond.wait(wait)
+                heapq.heappop(self._waiters)
+                self.in_flight += 1
+            except BaseException:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+                self._cond.notify_all()
+                raise
+            finally:
+                LLM_SCHEDULER_QUEUED.set(len(self._waiters))
+            LLM_SCHEDULER_IN_FLIGHT.set(self.in_flight)
+            # 下一位可能也能放行（視窗內還有名額）
+            self._cond.notify_all()
+        acquired = time.monotonic()
+        LLM_SCHEDULER_WAIT_SECONDS.observe(acquired - start)
+        return acquired
+
+    def release(self, acquired: float, throttled: bool = False, pause: Optional[float] = None,
+                completed: bool = True) -> None:
+        """歸還名額並調整視窗；pause 為標頭要求的全域暫停秒數，completed=False（連線錯誤）時視窗不變"""
+        with self._cond:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if throttled:
+                # 同一波限流只減一次：只有在上次減窗之後才送出的請求會再觸發減窗
+                if acquired > self._last_decrease:
+                    self.window = max(self.min_window, self.window / 2)
+                    self._last_decrease = now
+                    logger.warning("LLM 限流，並發視窗降為 %.1f", self.window)
+            elif completed:
+                self.window = min(self.max_window, self.window + 1 / self.window)
+            if pause:
+                self.paused_until = max(self.paused_until, now + pause)
+            LLM_SCHEDULER_WINDOW.set(self.window)
+            LLM_SCHEDULER_IN_FLIGHT.set(self.in_flight)
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, float]:
+        with self._cond:
+            return {
+                "window": round(self.window, 2),
+                "in_flight": self.in_flight,
+                "queued": len(self._waiters),
+                "paused_for": round(max(0.0, self.paused_until - time.monotonic()), 3),
+            }
+
+
+# ==================== httpx transport ====================
+
+class _Attempts:
+    """重試策略：指數退避加隨機抖動，標頭指定的等待優先"""
+
+    def __init__(self, max_retries: Optional[int] = None, base: float = 0.5, cap: float = 30.0):
+        self.max_retries = int(os.getenv("LLM_MAX_RETRIES", "4")) if max_retries is None else max_retries
+        self.base = base
+        self.cap = cap
+
+    def backoff(self, attempt: int, headers: Optional[httpx.Headers]) -> float:
+        hinted = retry_delay(headers) if headers is not None else None
+        if hinted is not None:
+            return min(hinted, self.cap * 4)
+        return random.uniform(0, min(self.cap, self.base * 2 ** attempt))
+
+
+class _ReleasingStream(httpx.SyncByteStream):
+    """回應本文讀完或關閉時才歸還名額（串流回應在標頭回來後仍佔用連線）"""
+
+    def __init__(self, stream, on_close):
+        self._stream = stream
+        self._on_close = on_close
+
+    def __iter__(self) -> Iterator[bytes]:
+        yield from self._stream
+
+    def close(self) -> None:
+        try:
+            self._stream.close()
+        finally:
+            self._on_close()
+
+
+class _AsyncReleasingStream(httpx.AsyncByteStream):
+    def __init__(self, stream, on_close):
+        self._stream = stream
+        self._on_close = on_close
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            self._on_close()
+
+
+def _outcome(response: httpx.Response):
+    """(是否限流, 全域暫停秒數)"""
+    throttled = response.status_code in THROTTLE_STATUSES
+    pause = retry_delay(response.headers) if throttled else None
+    return throttled, pause or exhausted_delay(response.headers)
+
+
+class SchedulingTransport(httpx.BaseTransport):
+    """同步 transport：每次送出前向排程器取名額，並處理重試"""
+
+    def __init__(self, scheduler: LLMScheduler, transport: Optional[httpx.BaseTransport] = None,
+                 max_retries: Optional[int] = None):
+        self.scheduler = scheduler
+        self.transport = transport or httpx.HTTPTransport()
+        self.attempts = _Attempts(max_retries)
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        priority = self.scheduler.priority_for()
+        attempt = 0
+        while True:
+            acquired = self.scheduler.acquire(priority)
+            try:
+                response = self.transport.handle_request(request)
+            except httpx.TransportError:
+                self.scheduler.release(acquired, completed=False)
+                if attempt >= self.attempts.max_retries:
+                    raise
+                LLM_SCHEDULER_RETRIES.labels("connection").inc()
+                time.sleep(self.attempts.backoff(attempt, None))
+                attempt += 1
+                continue
+            except BaseException:
+                # 非連線錯誤（或 KeyboardInterrupt）：名額仍要歸還，否則並發視窗永久縮小
+                self.scheduler.release(acquired, completed=False)
+                raise
+
+            throttled, pause = _outcome(response)
+            if response.status_code in RETRY_STATUSES and attempt < self.attempts.max_retries:
+                try:
+                    response.read()
+                    response.close()
+                finally:
+                    self.scheduler.release(acquired, throttled, pause)
+                if throttled:
+                    LLM_SCHEDULER_THROTTLED.labels(str(response.status_code)).inc()
+                LLM_SCHEDULER_RETRIES.labels(str(response.status_code)).inc()
+                delay = self.attempts.backoff(attempt, response.headers)
+                logger.info("LLM 回應 %d，%.2fs 後重試（第 %d 次）", response.status_code, delay, attempt + 1)
+                time.sleep(delay)
+                attempt += 1
+                continue
+
+            released = threading.Event()
+
+            def release(acquired=acquired, throttled=throttled, pause=pause):
+                if not released.is_set():
+                    released.set()
+                    self.scheduler.release(acquired, throttled, pause)
+
+            return httpx.Response(
+                status_code=response.status_code,
+                headers=response.headers,
+                stream=_ReleasingStream(response.stream, release),
+                extensions=response.extensions,
+                request=request,
+            )
+
+    def close(self) -> None:
+        self.transport.close()
+
+
+class AsyncSchedulingTransport(httpx.AsyncBaseTransport):
+    """非同步 transport：等待名額改在執行緒中進行，不阻塞 event loop
+
+    請求被取消時名額一定歸還：等待中的執行緒無法中斷，取得名額後由 done callback 立刻歸還；
+    已送出或讀取重試回應時被取消則當場歸還
+    """
+
+    def __init__(self, scheduler: LLMScheduler, transport: Optional[httpx.AsyncBaseTransport] = None,
+                 max_retries: Optional[int] = None):
+        self.scheduler = scheduler
+        self.transport = transport or httpx.AsyncHTTPTransport()
+        self.attempts = _Attempts(max_retries)
+
+    def _release_abandoned(self, task: "asyncio.Future[float]") -> None:
+        """取消後才取得的名額直接歸還（視窗不變）"""
+        if not task.cancelled() and task.exception() is None:
+            self.scheduler.release(task.result(), completed=False)
+
+    async def _acquire(self, priority: int) -> float:
+        task = asyncio.ensure_future(asyncio.to_thread(self.scheduler.acquire, priority))
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            task.add_done_callback(self._release_abandoned)
+            raise
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        priority = self.scheduler.priority_for()
+        attempt = 0
+        while True:
+            acquired = await self._acquire(priority)
+            try:
+                response = await self.transport.handle_async_request(request)
+            except httpx.TransportError:
+                self.scheduler.release(acquired, completed=False)
+                if attempt >= self.attempts.max_retries:
+                    raise
+                LLM_SCHEDULER_RETRIES.labels("connection").inc()
+                await asyncio.sleep(self.attempts.backoff(attempt, None))
+                attempt += 1
+                continue
+            except BaseException:
+                # 取消或非連線錯誤：名額仍要歸還
+                self.scheduler.release(acquired, completed=False)
+                raise
+
+            throttled, pause = _outcome(response)
+            if response.status_code in RETRY_STATUSES and attempt < self.attempts.max_retries:
+                try:
+                    await response.aread()
+                    await response.aclose()
+                finally:
+                    self.scheduler.release(acquired, throttled, pause)
+                if throttled:
+                    LLM_SCHEDULER_THROTTLED.labels(str(response.status_code)).inc()
+                LLM_SCHEDULER_RETRIES.labels(str(response.status_code)).inc()
+                await asyncio.sleep(self.attempts.backoff(attempt, response.headers))
+                attempt += 1
+                continue
+
+            released = threading.Event()
+
+            def release(acquired=acquired, throttled=throttled, pause=pause):
+                if not released.is_set():
+                    released.set()
+                    self.scheduler.release(acquired, throttled, pause)
+
+            return httpx.Response(
+                status_code=response.status_code,
+                headers=response.headers,
+                stream=_AsyncReleasingStream(response.stream, release),
+                extensions=response.extensions,
+                request=request,
+            )
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+_scheduler: Optional[LLMScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> LLMScheduler:
+    """process 共用的 LLMScheduler"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = LLMScheduler()
+        return _scheduler
+
+
+def scheduler_enabled() -> bool:
+    """LLM_SCHEDULER（預設開啟）"""
+    return os.getenv("LLM_SCHEDULER", "1").lower() not in ("0", "false", "no")
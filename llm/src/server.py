@@ -1,34 +1,96 @@
 # llm/src/server.py
+import json
+import os
 import sys
-from fastapi import FastAPI
-from pydantic import BaseModel
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field
 from typing import List, Optional
 from datetime import date, datetime
-from .agents.selector.agent_react import (
-    IngredientSelectorReactAgent,
+
+# 唯一的匯入根目錄是 llm/src：不論以 uvicorn src.server:app 或 --app-dir src 啟動，
+# 所有模組都以 agents.* / telemetry / db … 的名稱匯入，每個模組只載入一份
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from agents.selector.agent_react import (
     SelectorConstraints,
     SelectorOutput,
 )
-from .agents.planner.agent import (
-    PlannerAgent,
+from agents.planner.agent import (
     PlannerRequest as PlannerRequestSchema,
     PlannerResponse,
     IngredientGroup as IngredientGroupSchema
 )
-from .agents.main import MenufestOrchestrator
-from .models import Ingredient
-from .db import SessionLocal
+from agents.planner.ranking import days_left
+from agents.planner.tools import _rank_recipes, _search_text
+from agents.selector.tools import list_fridge
+from agents.registry import get_orchestrator, get_planner, get_selector, registry
+from artifacts import get_artifact_store
+from batch import MAX_ITEMS as BATCH_MAX_ITEMS, run_batch
+from jobs import JobQueueFull, get_job_manager
+from models import Ingredient
+from db import SessionLocal
+from telemetry import get_logger, span
+from metrics import render_metrics
+from usage import usage_scope
+
+logger = get_logger("server")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # agent 與 client 由 registry 共用、第一次取用時才建立；
+    # 啟動時在背景預熱，/healthz 立即可用，/readyz 在預熱完成後才回 200
+    if os.getenv("WARM_ON_STARTUP", "1").lower() not in ("0", "false", "no"):
+        registry.start_warm()
+    # 背景工作：啟動 worker，並接續上次停機時未完成的工作（之後每次續約時再接手租約已過期的工作）
+    jobs = get_job_manager()
+    jobs.start()
+    if jobs.resume_jobs:
+        try:
+            jobs.resume()
+        except Exception:
+            logger.exception("接續背景工作失敗")
+    yield
+    jobs.stop()
 
-app = FastAPI(title="Menufest LLM")
-_selector = IngredientSelectorReactAgent()
-_planner = PlannerAgent()
-_orchestrator = MenufestOrchestrator()
+
+app = FastAPI(title="Menufest LLM", lifespan=lifespan)
+
+# 每個請求一個根 span，底下掛 selector / tool / DB / planner / LLM 的子 span
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    # 以路由樣板作為 path，避免 run_id 之類的參數撐爆指標基數；沒有對到路由（404、掃描）時一律記為 unmatched
+    with span("http", method=request.method, path="unmatched") as s:
+        try:
+            response = await call_next(request)
+        finally:
+            route = request.scope.get("route")
+            s.set(path=getattr(route, "path", "unmatched"))
+        s.set(status_code=response.status_code)
+        return response
 
 # 加上健康檢查路由
 @app.get("/healthz")
 def healthz():
     return {"status": "ok"}
 
+# 就緒檢查：agent、食譜資料與 DB 連線池都預熱完成才回 200；有步驟失敗時重新觸發預熱
+@app.get("/readyz")
+def readyz():
+    if registry.ready:
+        return {"status": "ready", "components": registry.status()}
+    if not registry.warming:
+        registry.start_warm()
+    return JSONResponse(status_code=503, content={"status": "warming", "components": registry.status()})
+
+# Prometheus 指標
+@app.get("/metrics")
+def metrics():
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
 # 請求 body
 class SelectBody(BaseModel):
     user_id: str
@@ -37,6 +99,7 @@ class SelectBody(BaseModel):
     meals: List[str]  # 改為餐點名稱列表，如 ["早餐", "午餐", "晚餐"]
     constraints: SelectorConstraints
     start_date: Optional[str] = None  # 開始日期 YYYY-MM-DD
+    selector_mode: Optional[str] = None  # llm / hybrid / solver，未指定時用 SELECTOR_MODE
 
 class IngredientInput(BaseModel):
     name: str
@@ -71,6 +134,21 @@ class FullPipelineRequest(BaseModel):
     max_cooking_time: Optional[int] = 30  # 最大烹飪時間（分鐘）
     max_steps: Optional[int] = 5  # 最大步驟數
     start_date: Optional[str] = None  # 開始日期 YYYY-MM-DD
+    token_budget: Optional[int] = None  # 本次請求 token 上限，未指定時用 TOKEN_BUDGET_PER_REQUEST
+    selector_mode: Optional[str] = None  # llm / hybrid / solver，未指定時用 SELECTOR_MODE
+
+# 批次規劃請求
+class BatchPipelineRequest(BaseModel):
+    items: List[FullPipelineRequest]
+    concurrency: Optional[int] = None  # 本批次同時執行的項目數，未指定時用 BATCH_CONCURRENCY
+
+# 食譜排序請求
+class RankRecipesBody(BaseModel):
+    user_id: str
+    top_k: int = Field(10, ge=1, le=100)
+    max_missing: Optional[int] = None  # 最多缺少幾樣食材（不含常備調味料），未指定則不限
+    max_cooking_time: Optional[int] = None  # 最大烹飪時間（分鐘），沒有烹飪時間的食譜不列入
+    max_steps: Optional[int] = None  # 最大步驟數
 
 # 食材插入端點
 @app.post("/ingredients")
@@ -117,13 +195,14 @@ def select_react(body: SelectBody):
     # 如果沒有提供 start_date，使用今天
     start_date = body.start_date or datetime.now().strftime("%Y-%m-%d")
     
-    return _selector.run(
+    return get_selector().run(
         user_id=body.user_id,
         people=body.people,
         days=body.days,
         meals=body.meals,
         c=body.constraints,
-        start_date=start_date
+        start_date=start_date,
+        mode=body.selector_mode
     )
 
 # Planner Agent 端點
@@ -145,22 +224,26 @@ def plan_menu(body: PlannerRequest):
         )
         
         # 調用 Planner Agent
-        result = _planner.plan_menu_with_params(planner_request)
+        with usage_scope() as usage:
+            result = get_planner().plan_menu_with_params(planner_request)
         
         if result.success:
             return {
                 "status": "success",
-                "message": f"成功規劃 {body.days} 天菜單",
-                "menu_plan": result.menu_plan.model_dump() if result.menu_plan else None
+                "message": result.message if result.budget_exceeded else f"成功規劃 {body.days} 天菜單",
+                "menu_plan": result.menu_plan.model_dump() if result.menu_plan else None,
+                "usage": usage.to_dict()
             }
         else:
             return {
                 "status": "error",
                 "message": f"菜單規劃失敗: {result.error or '未知錯誤'}",
-                "raw_response": result.raw_response
+                "raw_response": result.raw_response,
+                "usage": usage.to_dict()
             }
         
     except Exception as e:
+        logger.exception("菜單規劃失敗")
         return {
             "status": "error",
             "message": f"菜單規劃失敗: {str(e)}"
@@ -171,10 +254,8 @@ def plan_menu(body: PlannerRequest):
 def run_full_pipeline(body: FullPipelineRequest):
     """運行完整的 Menufest 流程：Selector Agent + Planner Agent"""
     try:
-        print(f"🚀 開始完整流程: {body.people}人, {body.days}天, 餐點: {body.meals}")
-        
         # 調用 Main Orchestrator
-        result = _orchestrator.run_full_pipeline(
+        result = get_orchestrator().run_full_pipeline(
             user_id=body.user_id,
             people=body.people,
             days=body.days,
@@ -183,76 +264,194 @@ def run_full_pipeline(body: FullPipelineRequest):
             planner_preferences=body.planner_preferences,
             max_cooking_time=body.max_cooking_time,
             max_steps=body.max_steps,
-            start_date=body.start_date
+            start_date=body.start_date,
+            token_budget=body.token_budget,
+            selector_mode=body.selector_mode
         )
-        
-        if result["success"]:
-            return {
-                "status": "success",
-                "message": f"成功完成完整流程：{body.people}人 {body.days}天菜單",
-                "selector_file": result.get("selector_file"),
-                "planner_file": result.get("planner_file"),
-                "selector_output": result.get("selector_output"),
-                "planner_output": result.get("planner_output")
-            }
-        else:
-            return {
-                "status": "error",
-                "message": f"完整流程失敗: {result.get('error', '未知錯誤')}",
-                "selector_output": result.get("selector_output"),
-                "planner_output": result.get("planner_output")
-            }
+        return _pipeline_response(body, result)
         
     except Exception as e:
+        logger.exception("完整流程執行失敗")
         return {
             "status": "error",
             "message": f"完整流程執行失敗: {str(e)}"
         }
 
-# 從 Selector 文件開始的 Planner 端點
+def _pipeline_response(body: FullPipelineRequest, result: dict) -> dict:
+    """完整流程結果轉成回應格式（/full_pipeline 與批次的每一項共用）"""
+    if result["success"]:
+        message = f"成功完成完整流程：{body.people}人 {body.days}天菜單"
+    else:
+        message = f"完整流程失敗: {result.get('error', '未知錯誤')}"
+    return {
+        "status": "success" if result["success"] else "error",
+        "message": message,
+        "run_id": result.get("run_id"),
+        "selector_output": result.get("selector_output"),
+        "planner_output": result.get("planner_output"),
+        "usage": result.get("usage"),
+        "budget_exceeded": result.get("budget_exceeded", False),
+        "coalesced": result.get("coalesced", False)
+    }
+
+# 批次完整流程端點：多個家庭一次送入，每完成一項即以 NDJSON 串流回傳
+@app.post("/full_pipeline/batch")
+def run_full_pipeline_batch(body: BatchPipelineRequest):
+    """批次運行完整流程；相同請求與相同的食譜檢索只做一次，最後一行為彙總"""
+    if len(body.items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"批次最多 {BATCH_MAX_ITEMS} 項，收到 {len(body.items)} 項")
+    requests = [item.model_dump() for item in body.items]
+
+    def stream():
+        for line in run_batch(requests, body.concurrency):
+            if line["type"] == "item":
+                line = {"type": "item", "index": line["index"], **_pipeline_response(body.items[line["index"]], line)}
+            yield json.dumps(line, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+# 從既有 run 的 Selector 輸出開始的 Planner 端點
 @app.post("/plan_from_selector_file")
 def plan_from_selector_file(
-    selector_file: str,
+    run_id: str,
     people: int,
     days: int,
     meals: List[str],
     planner_preferences: Optional[List[str]] = None,
     max_cooking_time: Optional[int] = 30,
     max_steps: Optional[int] = 5,
-    start_date: Optional[str] = None
+    start_date: Optional[str] = None,
+    token_budget: Optional[int] = None
 ):
-    """從現有的 Selector 文件開始運行 Planner"""
+    """依 run_id 讀取已保存的 Selector 輸出並運行 Planner"""
     try:
-        print(f"🔄 從 Selector 文件開始: {selector_file}")
-        
-        # 調用 Main Orchestrator 的 run_from_selector_file 方法
-        result = _orchestrator.run_from_selector_file(
-            selector_file=selector_file,
+        # 調用 Main Orchestrator 的 run_from_selector_run 方法
+        result = get_orchestrator().run_from_selector_run(
+            run_id=run_id,
             people=people,
             days=days,
             meals=meals,
             planner_preferences=planner_preferences,
             max_cooking_time=max_cooking_time,
             max_steps=max_steps,
-            start_date=start_date
+            start_date=start_date,
+            token_budget=token_budget
         )
         
         if result["success"]:
             return {
                 "status": "success",
-                "message": f"成功從 Selector 文件規劃菜單",
-                "planner_file": result.get("planner_file"),
-                "planner_output": result.get("planner_output")
+                "message": f"成功從 Selector 輸出規劃菜單",
+                "run_id": result.get("run_id"),
+                "planner_output": result.get("planner_output"),
+                "usage": result.get("usage")
             }
         else:
             return {
                 "status": "error",
-                "message": f"從 Selector 文件規劃失敗: {result.get('error', '未知錯誤')}",
-                "planner_output": result.get("planner_output")
+                "message": f"從 Selector 輸出規劃失敗: {result.get('error', '未知錯誤')}",
+                "planner_output": result.get("planner_output"),
+                "usage": result.get("usage")
             }
         
     except Exception as e:
+        logger.exception("從 Selector 輸出規劃執行失敗")
         return {
             "status": "error",
-            "message": f"從 Selector 文件規劃執行失敗: {str(e)}"
-        }
\ No newline at end of file
+            "message": f"從 Selector 輸出規劃執行失敗: {str(e)}"
+        }
+
+# 背景工作端點：送出後立即回傳 job_id，以輪詢取得狀態與結果，不受 gateway 請求逾時限制
+@app.post("/jobs", status_code=202)
+def submit_job(body: FullPipelineRequest):
+    """送出完整流程背景工作"""
+    try:
+        job = get_job_manager().submit(body.model_dump())
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    return {**job, "queue": get_job_manager().depth()}
+
+@app.get("/jobs")
+def job_queue():
+    """排隊與執行中的工作數"""
+    return get_job_manager().depth()
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    """工作狀態；Selector 完成後即附上 selector_output（部分結果）"""
+    try:
+        job = get_job_manager().status(job_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"找不到 job_id={job_id}")
+    return job
+
+@app.get("/jobs/{job_id}/result")
+def get_job_result(job_id: str):
+    """工作結束後回傳與 /full_pipeline 相同格式的結果；未結束時回 202 與目前狀態"""
+    job = get_job(job_id)
+    if job["status"] not in ("succeeded", "failed"):
+        return JSONResponse(status_code=202, content=job)
+    if job["status"] == "succeeded":
+        request = job["request"]
+        message = f"成功完成完整流程：{request['people']}人 {request['days']}天菜單"
+    else:
+        message = f"完整流程失敗: {job.get('error') or '未知錯誤'}"
+    return {
+        "status": "success" if job["status"] == "succeeded" else "error",
+        "message": message,
+        "job_id": job_id,
+        "run_id": job["run_id"],
+        "selector_output": job["selector_output"],
+        "planner_output": job["planner_output"],
+        "usage": job["usage"],
+        "budget_exceeded": job["budget_exceeded"],
+        "coalesced": job["coalesced"]
+    }
+
+# 依冰箱食材排序食譜
+@app.post("/recipes/rank")
+def rank_recipes_for_fridge(body: RankRecipesBody):
+    """以使用者冰箱現有食材排序食譜：覆蓋率高、用到快到期食材者優先，附缺少的食材"""
+    with span("recipes.rank", user_id=body.user_id, top_k=body.top_k):
+        items = list_fridge(body.user_id)
+        fridge = [(item["name"], days_left(item["expiry_date"])) for item in items]
+        constraints = {k: v for k, v in (("max_time", body.max_cooking_time), ("max_steps", body.max_steps))
+                       if v is not None}
+        recipes = _rank_recipes(fridge, body.top_k, body.max_missing, constraints)
+    return {
+        "status": "success",
+        "fridge_items": len(items),
+        "total_found": len(recipes),
+        "recipes": recipes
+    }
+
+# 關鍵字搜尋食譜
+@app.get("/recipes/search")
+def search_recipes(q: str, limit: int = 10):
+    """以關鍵字搜尋食譜（標題、食材、標籤）；RECIPE_BACKEND=postgres 時為全文檢索"""
+    with span("recipes.search", limit=limit):
+        recipes = _search_text(q, max(1, min(limit, 100)))
+    return {
+        "status": "success",
+        "total_found": len(recipes),
+        "recipes": recipes
+    }
+
+# Run artifact 查詢端點
+@app.get("/runs")
+def list_runs(limit: int = 50):
+    """列出最近的 run"""
+    return {"runs": get_artifact_store().list_runs(limit=limit)}
+
+@app.get("/runs/{run_id}/{kind}")
+def get_run_artifact(run_id: str, kind: str):
+    """依 run_id 讀取 selector / planner 輸出或背景工作紀錄（job）；種類不在 KINDS 內時回 400"""
+    try:
+        payload = get_artifact_store().get(run_id, kind)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if payload is None:
+        raise HTTPException(status_code=404, detail=f"找不到 run_id={run_id} 的 {kind} 輸出")
+    return payload
@@ -0,0 +1,238 @@
+# llm/src/telemetry.py
+"""
+結構化日誌與追蹤
+- 日誌：JSON 或文字格式、等級由 LOG_LEVEL 控制、% 參數惰性格式化，大型 payload 以 payload() 包裝並截斷
+- 追蹤：每個請求一棵 span 樹（selector、tool、DB 查詢、planner、LLM 呼叫），結束時記錄耗時
+"""
+from __future__ import annotations
+
+import contextvars
+import json
+import logging
+import os
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+LOGGER_NAME = "menufest"
+PAYLOAD_LIMIT = int(os.getenv("LOG_PAYLOAD_LIMIT", "2000"))
+STAGE_SPANS = ("selector", "planner")
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("menufest_span", default=None)
+_span_listeners: List[Callable[["Span"], None]] = []
+_configured = False
+
+
+# ==================== 日誌 ====================
+
+class _Payload:
+    """延遲序列化的 payload，只有真的輸出時才轉字串並截斷"""
+    __slots__ = ("obj", "limit")
+
+    def __init__(self, obj: Any, limit: int):
+        self.obj = obj
+        self.limit = limit
+
+    def __str__(self) -> str:
+        obj = self.obj
+        if hasattr(obj, "model_dump"):
+            obj = obj.model_dump()
+        if isinstance(obj, str):
+            text = obj
+        else:
+            try:
+                text = json.dumps(obj, ensure_ascii=False, default=str)
+            except (TypeError, ValueError):
+                text = repr(obj)
+        if len(text) > self.limit:
+            return f"{text[:self.limit]}…(+{len(text) - self.limit} chars)"
+        return text
+
+
+def payload(obj: Any, limit: Optional[int] = None) -> _Payload:
+    """包裝大型物件作為日誌參數：logger.debug("x=%s", payload(obj))"""
+    return _Payload(obj, limit or PAYLOAD_LIMIT)
+
+
+class JSONFormatter(logging.Formatter):
+    """一行一筆 JSON，附上目前 span 的 trace_id / span_id"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        span = getattr(record, "span", None)
+        if span is not None:
+            entry["trace_id"] = span.trace_id
+            entry["span"] = span.name
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _SpanFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.span = _current_span.get()
+        return True
+
+
+def configure_logging() -> None:
+    """依 LOG_LEVEL / LOG_FORMAT（json 或 text）設定 menufest logger，只執行一次"""
+    global _configured
+    if _configured:
+        return
+    _configured = True
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    handler = logging.StreamHandler(sys.stdout)
+    if os.getenv("LOG_FORMAT", "json").lower() == "json":
+        handler.setFormatter(JSONFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    handler.addFilter(_SpanFilter())
+    logger.addHandler(handler)
+    logger.propagate = False
+
+
+def get_logger(name: str) -> logging.Logger:
+    """取得 menufest.<name> logger"""
+    configure_logging()
+    return logging.getLogger(f"{LOGGER_NAME}.{name}")
+
+
+_log = get_logger("trace")
+
+
+# ==================== 追蹤 ====================
+
+class Span:
+    """一段有耗時的工作，parent 為建立時的目前 span"""
+    __slots__ = ("name", "trace_id", "span_id", "parent", "attrs", "start", "duration_ms", "status")
+
+    def __init__(self, name: str, parent: Optional["Span"] = None, **attrs: Any):
+        self.name = name
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex[:16]
+        self.span_id = uuid.uuid4().hex[:8]
+        self.attrs = attrs
+        self.start = time.perf_counter()
+        self.duration_ms: Optional[float] = None
+        self.status = "ok"
+
+    @property
+    def stage(self) -> str:
+        """所屬的流程階段（最近的 selector / planner 祖先），供指標分組"""
+        node = self
+        while node is not None:
+            if node.name in STAGE_SPANS:
+                return node.name
+            node = node.parent
+        return "other"
+
+    def set(self, **attrs: Any) -> None:
+        self.attrs.update(attrs)
+
+    def end(self, status: Optional[str] = None) -> None:
+        if self.duration_ms is not None:
+            return
+        self.duration_ms = (time.perf_counter() - self.start) * 1000
+        if status:
+            self.status = status
+        level = logging.INFO if self.parent is None or self.status != "ok" else logging.DEBUG
+        if _log.isEnabledFor(level):
+            _log.log(level, "span %s %.1fms", self.name, self.duration_ms, extra={"fields": {
+                "span_id": self.span_id,
+                "parent_id": self.parent.span_id if self.parent else None,
+                "span_name": self.name,
+                "duration_ms": round(self.duration_ms, 2),
+                "status": self.status,
+                **self.attrs,
+            }})
+        for listener in _span_listeners:
+            try:
+                listener(self)
+            except Exception:
+                _log.exception("span listener 失敗")
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def start_span(name: str, **attrs: Any) -> Span:
+    """建立子 span 但不切換目前 span（供 callback 這類跨呼叫的起訖使用）"""
+    return Span(name, _current_span.get(), **attrs)
+
+
+@contextmanager
+def span(name: str, **attrs: Any) -> Iterator[Span]:
+    """建立 span 並設為目前 span，離開時記錄耗時"""
+    s = start_span(name, **attrs)
+    token = _current_span.set(s)
+    try:
+        yield s
+    except BaseException:
+        s.end("error")
+        raise
+    finally:
+        _current_span.reset(token)
+        s.end()
+
+
+def add_span_listener(listener: Callable[[Span], None]) -> None:
+    """註冊 span 結束時的回呼（例如指標收集）"""
+    _span_listeners.append(listener)
+
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """把 LangChain 的 LLM 與 tool 呼叫記錄成 span"""
+
+    def __init__(self, agent: str):
+        self.agent = agent
+        self._spans: Dict[uuid.UUID, Span] = {}
+        self._parent = _current_span.get()
+
+    def _start(self, run_id: uuid.UUID, name: str, **attrs: Any) -> None:
+        self._spans[run_id] = Span(name, self._parent, agent=self.agent, **attrs)
+
+    def _end(self, run_id: uuid.UUID, status: str = "ok", **attrs: Any) -> None:
+        s = self._spans.pop(run_id, None)
+        if s is not None:
+            s.set(**attrs)
+            s.end(status)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._start(run_id, "llm", model=(kwargs.get("invocation_params") or {}).get("model_name"))
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._start(run_id, "llm")
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        self._end(run_id,
+                  prompt_tokens=usage.get("prompt_tokens"),
+                  completion_tokens=usage.get("completion_tokens"),
+                  # 命中供應商 prompt 前綴快取的輸入 token
+                  cached_tokens=(usage.get("prompt_tokens_details") or {}).get("cached_tokens"))
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, "error", error=type(error).__name__)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        self._start(run_id, "tool", tool=(serialized or {}).get("name"))
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, "error", error=type(error).__name__)
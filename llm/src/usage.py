@@ -0,0 +1,194 @@
+# llm/src/usage.py
+"""
+Token 用量與預算
+- 每次 run 彙總所有 LLM 呼叫的 prompt / completion token 與估計成本（依 agent 分列）
+- 每個請求與每個使用者（滾動時間窗）可設定 token 預算，超過時中止 agent 並改回傳盡力而為的結果
+"""
+from __future__ import annotations
+
+import contextvars
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, Optional, Tuple
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# 每百萬 token 美金價格 (input, output)
+MODEL_PRICES: Dict[str, Tuple[float, float]] = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+}
+
+
+def _env_int(name: str) -> Optional[int]:
+    value = os.getenv(name)
+    return int(value) if value and int(value) > 0 else None
+
+
+# 0 或未設定表示不限制
+DEFAULT_REQUEST_BUDGET = _env_int("TOKEN_BUDGET_PER_REQUEST")
+DEFAULT_USER_BUDGET = _env_int("TOKEN_BUDGET_PER_USER")
+USER_BUDGET_WINDOW = int(os.getenv("TOKEN_BUDGET_USER_WINDOW", str(24 * 3600)))
+
+
+class TokenBudgetExceeded(Exception):
+    """token 預算用盡"""
+
+    def __init__(self, used: int, budget: int, scope: str = "request"):
+        super().__init__(f"token 預算用盡 ({scope}): {used}/{budget}")
+        self.used = used
+        self.budget = budget
+        self.scope = scope
+
+
+def _price_for(model: Optional[str]) -> Tuple[float, float]:
+    if not model:
+        return (0.0, 0.0)
+    # 回傳的 model 名稱可能帶日期後綴，例如 gpt-4o-mini-2024-07-18
+    for name in sorted(MODEL_PRICES, key=len, reverse=True):
+        if model.startswith(name):
+            return MODEL_PRICES[name]
+    return (0.0, 0.0)
+
+
+class RunUsage:
+    """單次 run 的 token 用量（執行緒安全）"""
+
+    def __init__(self, budget: Optional[int] = None):
+        self.budget = budget
+        self.by_agent: Dict[str, Dict[str, Any]] = defaultdict(
+            lambda: {"calls": 0, "prompt_tokens": 0, "cached_prompt_tokens": 0, "completion_tokens": 0,
+                     "cost_usd": 0.0})
+        self._lock = threading.Lock()
+
+    @property
+    def total_tokens(self) -> int:
+        return sum(a["prompt_tokens"] + a["completion_tokens"] for a in self.by_agent.values())
+
+    @property
+    def exceeded(self) -> bool:
+        return self.budget is not None and self.total_tokens >= self.budget
+
+    def record(self, agent: str, model: Optional[str], prompt_tokens: int, completion_tokens: int,
+               cached_tokens: int = 0) -> None:
+        """cached_tokens：prompt_tokens 中命中供應商前綴快取的部分（另外列出，成本仍以全價估計）"""
+        price_in, price_out = _price_for(model)
+        with self._lock:
+            entry = self.by_agent[agent]
+            entry["calls"] += 1
+            entry["prompt_tokens"] += prompt_tokens
+            entry["cached_prompt_tokens"] += cached_tokens
+            entry["completion_tokens"] += completion_tokens
+            entry["cost_usd"] += (prompt_tokens * price_in + completion_tokens * price_out) / 1_000_000
+
+    def check(self) -> None:
+        if self.exceeded:
+            raise TokenBudgetExceeded(self.total_tokens, self.budget)
+
+    def to_dict(self) -> Dict[str, Any]:
+        agents = {name: {**v, "cost_usd": round(v["cost_usd"], 6)} for name, v in self.by_agent.items()}
+        return {
+            "prompt_tokens": sum(a["prompt_tokens"] for a in agents.values()),
+            "cached_prompt_tokens": sum(a["cached_prompt_tokens"] for a in agents.values()),
+            "completion_tokens": sum(a["completion_tokens"] for a in agents.values()),
+            "total_tokens": self.total_tokens,
+            "cost_usd": round(sum(a["cost_usd"] for a in agents.values()), 6),
+            "llm_calls": sum(a["calls"] for a in agents.values()),
+            "budget": self.budget,
+            "budget_exceeded": self.exceeded,
+            "by_agent": agents,
+        }
+
+
+class UserBudgetLedger:
+    """每個使用者在滾動時間窗內的 token 用量（行程內記憶體）"""
+
+    def __init__(self, window_seconds: int = USER_BUDGET_WINDOW):
+        self.window = window_seconds
+        self._entries: Dict[str, Deque[Tuple[float, int]]] = defaultdict(deque)
+        self._lock = threading.Lock()
+
+    def used(self, user_id: str) -> int:
+        cutoff = time.time() - self.window
+        with self._lock:
+            entries = self._entries[user_id]
+            while entries and entries[0][0] < cutoff:
+                entries.popleft()
+            return sum(tokens for _, tokens in entries)
+
+    def charge(self, user_id: str, tokens: int) -> None:
+        if tokens:
+            with self._lock:
+                self._entries[user_id].append((time.time(), tokens))
+
+
+user_ledger = UserBudgetLedger()
+_current_usage: contextvars.ContextVar[Optional[RunUsage]] = contextvars.ContextVar("menufest_usage", default=None)
+
+
+def current_usage() -> Optional[RunUsage]:
+    return _current_usage.get()
+
+
+@contextmanager
+def usage_scope(user_id: Optional[str] = None,
+                budget: Optional[int] = None,
+                user_budget: Optional[int] = None) -> Iterator[RunUsage]:
+    """開啟一次 run 的用量統計，結束時記入使用者帳本
+
+    實際預算取「請求預算」與「使用者剩餘額度」較小者；使用者額度已用盡時直接拋出 TokenBudgetExceeded
+    """
+    budget = budget or DEFAULT_REQUEST_BUDGET
+    user_budget = user_budget or DEFAULT_USER_BUDGET
+    if user_id and user_budget:
+        used = user_ledger.used(user_id)
+        if used >= user_budget:
+            raise TokenBudgetExceeded(used, user_budget, scope="user")
+        remaining = user_budget - used
+        budget = min(budget, remaining) if budget else remaining
+
+    usage = RunUsage(budget)
+    token = _current_usage.set(usage)
+    try:
+        yield usage
+    finally:
+        _current_usage.reset(token)
+        if user_id:
+            user_ledger.charge(user_id, usage.total_tokens)
+
+
+class UsageCallbackHandler(BaseCallbackHandler):
+    """記錄每次 LLM 呼叫的 token，預算用盡時在下一次呼叫前中止 agent"""
+
+    raise_error = True
+
+    def __init__(self, agent: str, usage: Optional[RunUsage] = None):
+        self.agent = agent
+        # 不在 usage_scope 內（例如單獨呼叫 selector 端點）時，只套用預設的請求預算
+        self.usage = usage or current_usage() or RunUsage(DEFAULT_REQUEST_BUDGET)
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        self.usage.check()
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        self.usage.check()
+
+    def on_llm_end(self, response, **kwargs):
+        llm_output = response.llm_output or {}
+        token_usage = llm_output.get("token_usage") or {}
+        prompt = token_usage.get("prompt_tokens")
+        completion = token_usage.get("completion_tokens")
+        cached = (token_usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+        if prompt is None:
+            # 串流呼叫沒有 llm_output，改讀訊息上的 usage_metadata
+            prompt = completion = 0
+            for generations in response.generations:
+                for gen in generations:
+                    meta = getattr(getattr(gen, "message", None), "usage_metadata", None) or {}
+                    prompt += meta.get("input_tokens", 0)
+                    completion += meta.get("output_tokens", 0)
+                    cached += (meta.get("input_token_details") or {}).get("cache_read", 0) or 0
+        self.usage.record(self.agent, llm_output.get("model_name"), prompt or 0, completion or 0, cached)
@@ -0,0 +1,63 @@
+# llm/tests/conftest.py
+"""
+單元測試共用設定
+匯入任何模組前先設好環境變數：資料庫用記憶體內 SQLite、不需要真的 OpenAI 金鑰、關閉啟動時的預熱與工作續跑。
+需要 Postgres 的測試使用 pg_session_factory：只有設定 TEST_DATABASE_URL 時才執行
+"""
+import os
+import uuid
+
+import pytest
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("LOG_LEVEL", "ERROR")
+os.environ.setdefault("WARM_ON_STARTUP", "0")
+os.environ.setdefault("JOB_RESUME_ON_STARTUP", "0")
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+MIGRATION = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..",
+                         "db", "migrations", "001_llm_service.sql")
+
+
+@pytest.fixture(scope="session")
+def pg_session_factory():
+    """以 db/migrations/001_llm_service.sql 在暫時的 schema 建好 LLM 服務資料表，測試結束即刪除"""
+    if not TEST_DATABASE_URL:
+        pytest.skip("需要 TEST_DATABASE_URL 指向 Postgres")
+    from sqlalchemy import create_engine, text
+    from sqlalchemy.orm import sessionmaker
+
+    schema = f"test_{uuid.uuid4().hex[:12]}"
+    admin = create_engine(TEST_DATABASE_URL)
+    with admin.begin() as conn:
+        conn.execute(text(f'CREATE SCHEMA "{schema}"'))
+    engine = create_engine(TEST_DATABASE_URL, connect_args={"options": f"-csearch_path={schema},public"})
+    try:
+        with open(MIGRATION, encoding="utf-8") as f:
+            migration = f.read()
+        # 升級腳本可重複執行
+        for _ in range(2):
+            with engine.begin() as conn:
+                conn.exec_driver_sql(migration)
+        yield sessionmaker(bind=engine)
+    finally:
+        engine.dispose()
+        with admin.begin() as conn:
+            conn.execute(text(f'DROP SCHEMA "{schema}" CASCADE'))
+        admin.dispose()
+
+
+@pytest.fixture(params=["file", "postgres"])
+def artifact_store(request, tmp_path):
+    """檔案後端，以及設定 TEST_DATABASE_URL 時的 Postgres 後端（每個測試前清空）"""
+    from artifacts import FileArtifactStore, PostgresArtifactStore
+
+    if request.param == "file":
+        return FileArtifactStore(str(tmp_path))
+    from sqlalchemy import text
+    session_factory = request.getfixturevalue("pg_session_factory")
+    with session_factory() as s:
+        s.execute(text("TRUNCATE run_artifacts"))
+        s.commit()
+    return PostgresArtifactStore(session_factory)
@@ -0,0 +1,62 @@
+# llm/tests/test_allocator.py
+from agents.selector.allocator import allocate, allocated_totals, is_excluded, portion
+
+ITEMS = [
+    {"name": "雞腿", "unit": "隻", "quantity_available": 4, "expiry_date": "2025-11-02"},
+    {"name": "高麗菜", "unit": "克", "quantity_available": 600, "expiry_date": "2025-11-05"},
+    {"name": "豆腐", "unit": "盒", "quantity_available": 2, "expiry_date": "2025-11-01"},
+    {"name": "草蝦", "unit": "克", "quantity_available": 300, "expiry_date": "2025-11-03"},
+]
+
+
+def test_is_excluded():
+    assert is_excluded("草蝦", ["蝦"])
+    assert not is_excluded("雞腿", ["蝦", ""])
+
+
+def test_portion():
+    assert portion("隻", 2, "午餐", True) == 2.0
+    assert portion("隻", 2, "早餐", False) == 1.0
+    assert portion("克", 2, "晚餐", True) == 240.0
+    assert portion("公斤", 2, "晚餐", True) == 0.24
+
+
+def test_allocate_within_stock_and_expiry():
+    result = allocate(ITEMS, people=2, days=3, meals=["午餐", "晚餐"], start_date="2025-11-01",
+                      allergies=["蝦"])
+    assert result["total_days"] == 3 and result["start_date"] == "2025-11-01"
+    assert [d["date"] for d in result["daily_meals"]] == ["2025-11-01", "2025-11-02", "2025-11-03"]
+    assert all(d["breakfast"] == [] for d in result["daily_meals"])
+
+    totals = allocated_totals(result)
+    stock = {it["name"]: it["quantity_available"] for it in ITEMS}
+    assert "草蝦" not in totals
+    assert all(totals[name] <= stock[name] for name in totals)
+
+    expiry = {it["name"]: it["expiry_date"] for it in ITEMS}
+    for day in result["daily_meals"]:
+        for field in ("lunch", "dinner"):
+            for dish in day[field]:
+                assert all(expiry[i["name"]] >= day["date"] for i in dish["ingredients"])
+
+
+def test_allocate_earliest_deadline_first():
+    result = allocate(ITEMS, people=2, days=1, meals=["午餐"], start_date="2025-11-01")
+    first = result["daily_meals"][0]["lunch"][0]
+    assert first["ingredients"][0]["name"] == "豆腐"
+
+
+def test_allocate_empty():
+    assert allocate([], people=2, days=2, meals=["午餐"], start_date="2025-11-01")["daily_meals"] == []
+
+
+def test_allocate_keeps_units_apart():
+    items = [{"name": "雞腿", "unit": "隻", "quantity_available": 2, "expiry_date": "2025-11-01"},
+             {"name": "雞腿", "unit": "克", "quantity_available": 1000, "expiry_date": "2025-11-05"}]
+    result = allocate(items, people=2, days=3, meals=["午餐", "晚餐"], start_date="2025-11-01")
+    amounts = [i["allocated_quantity"] for d in result["daily_meals"] for f in ("lunch", "dinner")
+               for dish in d[f] for i in dish["ingredients"]]
+    # 以隻計的份量不超過 2 隻，以克計的一批另外依克數分配
+    assert sum(a for a in amounts if a < 100) <= 2
+    assert sum(a for a in amounts if a >= 100) <= 1000
+    assert any(a >= 100 for a in amounts)
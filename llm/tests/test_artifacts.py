@@ -0,0 +1,66 @@
+# llm/tests/test_artifacts.py
+import os
+import time
+
+import pytest
+
+from artifacts import JOB_KIND, FileArtifactStore, new_run_id
+
+
+def _age(store, run_id, kind, days):
+    """把一份 artifact 的寫入時間改成 days 天前"""
+    if isinstance(store, FileArtifactStore):
+        # 檔案後端以 run 目錄的修改時間判斷：目錄時間跟著最後寫入的檔案
+        stamp = time.time() - days * 86400
+        os.utime(store._path(run_id, kind), (stamp, stamp))
+        latest = max(f.stat().st_mtime for f in (store.root / run_id).iterdir())
+        os.utime(store.root / run_id, (latest, latest))
+        return
+    from sqlalchemy import text
+    with store.session_factory() as s:
+        s.execute(text("UPDATE run_artifacts SET created_at = now() - make_interval(days => :days) "
+                       "WHERE run_id = :run_id AND kind = :kind"), {"days": days, "run_id": run_id, "kind": kind})
+        s.commit()
+
+
+def test_put_get_and_kind_validation(artifact_store):
+    run_id = new_run_id()
+    artifact_store.put(run_id, "selector", {"a": 1})
+    assert artifact_store.get(run_id, "selector") == {"a": 1}
+    assert artifact_store.get(run_id, "planner") is None
+    with pytest.raises(ValueError):
+        artifact_store.put(run_id, "other", {})
+    with pytest.raises(ValueError):
+        artifact_store.get("../etc", "selector")
+
+
+def test_evict_keeps_runs_with_recent_writes(artifact_store):
+    artifact_store.retention_days = 1
+    partial = new_run_id()
+    artifact_store.put(partial, "selector", {"a": 1})
+    artifact_store.put(partial, "planner", {"b": 2})
+    _age(artifact_store, partial, "selector", 3)
+    old = new_run_id()
+    artifact_store.put(old, "selector", {"a": 1})
+    artifact_store.put(old, "planner", {"b": 2})
+    _age(artifact_store, old, "selector", 3)
+    _age(artifact_store, old, "planner", 3)
+
+    artifact_store.evict()
+    # 只有 selector 過期的 run 整個保留，整個 run 都過期才刪
+    assert artifact_store.get(partial, "selector") == {"a": 1}
+    assert artifact_store.get(partial, "planner") == {"b": 2}
+    assert artifact_store.get(old, "selector") is None
+    assert artifact_store.get(old, "planner") is None
+
+
+def test_evict_keeps_pending_jobs(artifact_store):
+    artifact_store.retention_days = 1
+    pending, done = new_run_id(), new_run_id()
+    artifact_store.put_job(pending, "a", {"job_id": pending, "status": "running", "owner": "a"})
+    artifact_store.put_job(done, "a", {"job_id": done, "status": "succeeded", "owner": "a"})
+    for run_id in (pending, done):
+        _age(artifact_store, run_id, JOB_KIND, 3)
+    artifact_store.evict()
+    assert artifact_store.get(pending, JOB_KIND)["status"] == "running"
+    assert artifact_store.get(done, JOB_KIND) is None
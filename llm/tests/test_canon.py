@@ -0,0 +1,35 @@
+# llm/tests/test_canon.py
+from agents.planner.canon import AhoCorasick, canonical_ids, ingredient_ids, normalize, same_ingredient
+
+
+def test_normalize():
+    assert normalize("洋蔥（中型）") == "洋蔥"
+    assert normalize(" ＡＢＣ 醬 ") == "abc醬"
+    assert normalize(None) == ""
+
+
+def test_aho_corasick_leftmost_longest():
+    automaton = AhoCorasick([("雞蛋", "egg"), ("雞蛋豆腐", "egg-tofu"), ("豆腐", "tofu")])
+    assert automaton.find("雞蛋豆腐湯") == [(0, 4, "egg-tofu")]
+    assert automaton.find("雞蛋炒豆腐") == [(0, 2, "egg"), (3, 5, "tofu")]
+    assert automaton.find("白飯") == []
+
+
+def test_canonical_ids():
+    assert canonical_ids("去骨雞腿排") == frozenset({"雞腿"})
+    assert canonical_ids("蛋豆腐") == frozenset({"雞蛋豆腐"})
+    assert canonical_ids("不存在的食材") == frozenset()
+
+
+def test_ingredient_ids_fallback():
+    assert ingredient_ids("不存在的食材") == frozenset({"不存在的食材"})
+    assert ingredient_ids("") == frozenset()
+
+
+def test_same_ingredient():
+    assert same_ingredient("雞腿", "去骨雞腿排")
+    assert same_ingredient("雞蛋", "蛋液")
+    assert not same_ingredient("雞蛋", "雞蛋豆腐")
+    assert same_ingredient("石斑魚", "龍膽石斑魚塊")
+    # 字典沒有收錄時退回互相包含的字串比對
+    assert same_ingredient("芋頭絲", "芋頭")
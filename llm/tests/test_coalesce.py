@@ -0,0 +1,121 @@
+# llm/tests/test_coalesce.py
+import threading
+
+import pytest
+
+from coalesce import SharedResults, SingleFlight, request_key
+
+
+def _concurrent(n, target):
+    threads = [threading.Thread(target=target) for _ in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5)
+
+
+def test_single_flight_merges_concurrent_calls():
+    flight, release = SingleFlight(), threading.Event()
+    calls, results = [], []
+
+    def work():
+        calls.append(1)
+        release.wait(5)
+        return "done"
+
+    def caller():
+        results.append(flight.do("k", work))
+
+    threads = [threading.Thread(target=caller) for _ in range(4)]
+    for t in threads:
+        t.start()
+    while flight.in_flight() == 0:
+        pass
+    release.set()
+    for t in threads:
+        t.join(5)
+    assert len(calls) >= 1 and len(calls) + sum(joined for _, joined in results) == 4
+    assert all(result == "done" for result, _ in results)
+    assert flight.in_flight() == 0
+
+
+def test_single_flight_propagates_errors_and_forgets_key():
+    flight = SingleFlight()
+
+    def fail():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        flight.do("k", fail)
+    # 結束後不保留結果，下一次重新執行
+    assert flight.do("k", lambda: 1) == (1, False)
+    assert flight.do("k", lambda: 2) == (2, False)
+
+
+def test_shared_results_computes_once():
+    shared, calls = SharedResults(), []
+
+    def work():
+        calls.append(1)
+        return len(calls)
+
+    _concurrent(8, lambda: shared.get("k", work))
+    assert shared.get("k", work) == (1, True)
+    assert len(calls) == 1
+    assert shared.stats() == {"hits": 8, "misses": 1}
+
+
+def test_shared_results_does_not_keep_errors():
+    shared = SharedResults()
+    with pytest.raises(RuntimeError):
+        shared.get("k", lambda: (_ for _ in ()).throw(RuntimeError()))
+    assert shared.get("k", lambda: 1) == (1, False)
+
+
+def test_request_key():
+    assert request_key({"b": 1, "a": [1, 2]}, "x") == request_key({"a": [1, 2], "b": 1}, "x")
+    assert request_key({"a": 1}) != request_key({"a": 2})
+    assert len(request_key()) == 64
+
+
+def test_fridge_version_tracks_updates(monkeypatch):
+    from datetime import datetime, timedelta
+
+    from sqlalchemy import create_engine, update
+    from sqlalchemy.orm import sessionmaker
+    from sqlalchemy.pool import StaticPool
+
+    from agents.selector import tools
+    from models import Ingredient
+
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+    with engine.begin() as conn:
+        conn.exec_driver_sql(
+            "CREATE TABLE ingredients (ingredient_id TEXT PRIMARY KEY, user_id TEXT, ingredient_name TEXT NOT NULL, "
+            "expiry_date DATE, quantity NUMERIC NOT NULL, unit TEXT NOT NULL, created_at TIMESTAMP, updated_at TIMESTAMP)")
+    session_factory = sessionmaker(bind=engine)
+    monkeypatch.setattr(tools, "SessionLocal", session_factory)
+    user, now = "u1", datetime(2025, 11, 1, 12)
+    with session_factory() as s:
+        for i, name in enumerate(("雞腿", "豆腐")):
+            s.add(Ingredient(ingredient_id=f"i{i}", user_id=user, ingredient_name=name, quantity=2,
+                             unit="個", created_at=now, updated_at=now))
+        s.commit()
+    before = tools.fridge_version(user)
+    assert tools.fridge_version(user) == before
+
+    # 一筆 +1、一筆 -1：數量總和與筆數不變，仍要換版本（SQLite 沒有 trigger，手動改 updated_at）
+    with session_factory() as s:
+        s.execute(update(Ingredient).where(Ingredient.ingredient_id == "i0")
+                  .values(quantity=3, updated_at=now + timedelta(seconds=1)))
+        s.execute(update(Ingredient).where(Ingredient.ingredient_id == "i1")
+                  .values(quantity=1, updated_at=now + timedelta(seconds=1)))
+        s.commit()
+    after = tools.fridge_version(user)
+    assert after != before
+
+    with session_factory() as s:
+        s.execute(update(Ingredient).where(Ingredient.ingredient_id == "i1")
+                  .values(quantity=0, updated_at=now + timedelta(seconds=2)))
+        s.commit()
+    assert tools.fridge_version(user) != after
@@ -0,0 +1,62 @@
+# llm/tests/test_compaction.py
+import json
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from agents.compaction import ScratchpadCompactor, elide, summarize
+
+RECIPE = {"url": "https://example.com/r/1", "title": "蒜香雞腿", "cooking_time": 20, "score": 1.5,
+          "ingredients": [{"name": "雞腿", "amount": "2隻"}, {"name": "蒜頭", "amount": "3瓣"}],
+          "steps": ["醃雞腿" * 20, "煎雞腿" * 20, "加蒜" * 20]}
+FRIDGE = {"page": 1, "items": [{"name": "雞腿", "quantity_available": 2, "unit": "隻",
+                                "expiry_date": "2025-11-01", "ingredient_id": 7}]}
+
+
+def test_summarize_recipes():
+    digest = json.loads(summarize(json.dumps({"recipes": [RECIPE], "total": 1}, ensure_ascii=False)))
+    assert digest["total"] == 1 and "_compacted" in digest
+    assert digest["recipes"] == [{"url": RECIPE["url"], "title": "蒜香雞腿", "cooking_time": 20, "score": 1.5,
+                                  "step_count": 3, "ingredients": ["雞腿", "蒜頭"]}]
+
+
+def test_summarize_and_elide_fridge_items():
+    text = json.dumps(FRIDGE, ensure_ascii=False)
+    assert json.loads(summarize(text))["items"] == [
+        {"name": "雞腿", "quantity_available": 2, "unit": "隻", "expiry_date": "2025-11-01"}]
+    assert json.loads(elide(text))["items"] == ["雞腿"]
+
+
+def test_elide_recipe_list():
+    digest = json.loads(elide(json.dumps([RECIPE], ensure_ascii=False)))
+    assert digest["recipes"] == [{"url": RECIPE["url"], "title": "蒜香雞腿"}]
+
+
+def test_plain_text_truncated_only_when_long():
+    assert summarize("短訊息") == "短訊息"
+    long = "字" * 1000
+    assert summarize(long).startswith("字" * 400) and len(summarize(long)) < len(long)
+    assert len(elide(long)) < len(summarize(long))
+
+
+def _rounds(n):
+    payload = json.dumps({"recipes": [RECIPE] * 3}, ensure_ascii=False)
+    messages = [HumanMessage(content="規劃菜單")]
+    for i in range(n):
+        messages.append(AIMessage(content="", tool_calls=[{"name": "search", "args": {"q": "雞腿"}, "id": str(i)}]))
+        messages.append(ToolMessage(content=payload, tool_call_id=str(i)))
+    return messages
+
+
+def test_messages_under_budget_untouched():
+    messages = _rounds(3)
+    assert ScratchpadCompactor("planner", budget=10 ** 6).messages(messages) == messages
+
+
+def test_messages_compacts_old_rounds_keeps_recent():
+    messages = _rounds(3)
+    out = ScratchpadCompactor("planner", budget=200, keep_recent=1).messages(messages)
+    assert out[0] == messages[0]
+    assert all("_compacted" in out[i].content for i in (2, 4))
+    assert out[6] == messages[6]
+    # 原始訊息不被修改
+    assert "_compacted" not in messages[2].content
@@ -0,0 +1,51 @@
+# llm/tests/test_features.py
+import numpy as np
+
+from agents.planner.features import RecipeFeatures, filter_recipes, get_features
+
+RECIPES = [
+    {"url": "a", "cooking_time": 10, "steps": ["1", "2"], "servings": 2, "ingredients": [{}]},
+    {"url": "b", "cooking_time": 30, "steps": ["1", "2", "3", "4", "5", "6"], "servings": 4, "ingredients": []},
+    {"url": "c", "cooking_time": None, "steps": ["1"], "servings": "x", "ingredients": [{}, {}]},
+    {"url": "d", "cooking_time": "20", "steps": [], "ingredients": [{}, {}, {}]},
+]
+
+
+def test_range_mask_skips_missing():
+    features = RecipeFeatures(RECIPES)
+    assert features.range_mask("cooking_time", high=20).tolist() == [True, False, False, True]
+    assert features.range_mask("cooking_time", low=15).tolist() == [False, True, False, True]
+    assert features.range_mask("servings").tolist() == [True, True, False, False]
+
+
+def test_mask_intersects_constraints():
+    features = RecipeFeatures(RECIPES)
+    mask = features.mask({"max_time": 30, "max_steps": 5, "unknown": 1})
+    assert mask.tolist() == [True, False, False, True]
+    # 同一欄位的多個上限取最嚴格者
+    assert features.mask({"max_time": 30, "min_time": 15, "max_steps": 5}).tolist() == [False, False, False, True]
+
+
+def test_filter_recipes_uses_corpus():
+    corpus = RecipeFeatures(RECIPES)
+    assert [r["url"] for r in filter_recipes(RECIPES, {"max_steps": 2}, corpus)] == ["a", "c", "d"]
+    # 依 url 對回語料
+    subset = [dict(RECIPES[3]), dict(RECIPES[0])]
+    assert [r["url"] for r in filter_recipes(subset, {"max_time": 15}, corpus)] == ["a"]
+    # 對不回語料時就地計算
+    assert filter_recipes([{"cooking_time": 5}], {"max_time": 15}, corpus) == [{"cooking_time": 5}]
+    assert filter_recipes(RECIPES, {}) == RECIPES
+
+
+def test_lookup():
+    corpus = RecipeFeatures(RECIPES)
+    assert np.array_equal(corpus.lookup([{"url": "c"}, {"url": "a"}]), [2, 0])
+    assert corpus.lookup([{"url": "z"}]) is None
+
+
+def test_get_features_rebuilds_on_new_corpus():
+    data = {"recipes": RECIPES}
+    features = get_features(data)
+    assert get_features(data) is features
+    data["recipes"] = list(RECIPES)
+    assert get_features(data) is not features
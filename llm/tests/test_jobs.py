@@ -0,0 +1,95 @@
+# llm/tests/test_jobs.py
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from artifacts import JOB_KIND, new_run_id
+from jobs import JobManager
+
+REQUEST = {"user_id": "u1", "people": 2, "days": 1, "meals": ["午餐"]}
+
+
+@pytest.fixture
+def store(artifact_store):
+    return artifact_store
+
+
+class FakeOrchestrator:
+    def __init__(self):
+        self.runs = []
+
+    def run_full_pipeline(self, **kwargs):
+        self.runs.append(kwargs["run_id"])
+        return {"success": True, "run_id": kwargs["run_id"]}
+
+
+def _lease(seconds):
+    return (datetime.now(timezone.utc) + timedelta(seconds=seconds)).isoformat()
+
+
+def _job(owner, status="queued", lease_seconds=60.0):
+    job_id = new_run_id()
+    return job_id, {"job_id": job_id, "status": status, "request": REQUEST, "attempts": 0,
+                    "owner": owner, "lease_expires_at": _lease(lease_seconds)}
+
+
+def _wait(predicate, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def test_restart_within_lease_resumes_job(store):
+    # 重啟前的節點留下的工作：租約還要 1 秒才到期
+    job_id, record = _job("old", lease_seconds=1.0)
+    store.put_job(job_id, "old", record)
+
+    orchestrator = FakeOrchestrator()
+    manager = JobManager(store, workers=1, lease_seconds=0.3, owner="new", resume=True,
+                         orchestrator_factory=lambda: orchestrator)
+    manager.start()
+    try:
+        assert manager.resume() == 0
+        assert _wait(lambda: manager.status(job_id)["status"] == "succeeded")
+        assert orchestrator.runs == [job_id]
+        assert store.get(job_id, JOB_KIND)["owner"] == "new"
+    finally:
+        manager.stop()
+
+
+def test_live_lease_not_taken(store):
+    job_id, record = _job("other", lease_seconds=60)
+    store.put_job(job_id, "other", record)
+    manager = JobManager(store, workers=1, lease_seconds=0.3, owner="new", resume=True,
+                         orchestrator_factory=FakeOrchestrator)
+    manager.start()
+    try:
+        time.sleep(0.5)
+        assert store.get(job_id, JOB_KIND)["status"] == "queued"
+        assert store.get(job_id, JOB_KIND)["owner"] == "other"
+    finally:
+        manager.stop()
+
+
+def test_put_job_keeps_newer_claim(store):
+    job_id, record = _job("a", lease_seconds=-1)
+    assert store.put_job(job_id, "a", record)
+    assert store.claim_job(job_id, "b", 60)["owner"] == "b"
+    # 原持有者遲來的狀態更新不會蓋掉新的租約
+    assert not store.put_job(job_id, "a", {**record, "status": "running"})
+    current = store.get(job_id, JOB_KIND)
+    assert current["owner"] == "b" and current["status"] == "queued"
+    assert store.put_job(job_id, "b", {**current, "status": "running"})
+
+
+def test_pending_jobs(store):
+    pending, record = _job("a")
+    store.put_job(pending, "a", record)
+    done, record = _job("a", status="succeeded")
+    store.put_job(done, "a", record)
+    store.put(new_run_id(), "selector", {"daily_meals": []})
+    assert store.pending_jobs() == [pending]
@@ -0,0 +1,60 @@
+# llm/tests/test_json_utils.py
+import pytest
+
+from agents.json_utils import JSONScanner, extract_json, repair_json
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"a": 1}', {"a": 1}),
+    ('```json\n{"a": [1, 2]}\n```', {"a": [1, 2]}),
+    ('好的：{"a": {"b": "x}y"}} 以上', {"a": {"b": "x}y"}}),
+    ('{"a": 1,}', {"a": 1}),
+    ('{"a": NaN}', {"a": None}),
+    # 前言的落單引號與括號不能讓後面的物件擷取失敗
+    ('text "quote { not json" then {"ok": true}', {"ok": True}),
+    ('前言 {不是 JSON} 之後 {"ok": 1}', {"ok": 1}),
+    ('未閉合 { [ 之後 {"ok": [1, 2]}', {"ok": [1, 2]}),
+])
+def test_extract_json(text, expected):
+    assert extract_json(text) == expected
+
+
+def test_extract_json_prefers_longest_object():
+    text = '先看 {"a": 1} 再看 {"menu": {"days": 2}, "schedule": []}'
+    assert extract_json(text) == {"menu": {"days": 2}, "schedule": []}
+
+
+def test_extract_json_truncated():
+    assert extract_json('結果 {"a": 1, "b": [1, 2, {"c": "d') == {"a": 1, "b": [1, 2, {"c": "d"}]}
+
+
+def test_extract_json_dangling_key():
+    assert extract_json('{"a": 1, "b": ') == {"a": 1}
+
+
+@pytest.mark.parametrize("text", ["", "沒有 JSON", "[1, 2]", "{壞掉}"])
+def test_extract_json_none(text):
+    assert extract_json(text) is None
+
+
+@pytest.mark.parametrize("text", [
+    "[" * 5000 + "]" * 5000,
+    '{"a": ' + "[" * 5000 + "]" * 5000 + "}",
+    '前言 {"a": ' + "[" * 5000,
+])
+def test_extract_json_deep_nesting(text):
+    assert extract_json(text) is None
+
+
+def test_repair_json_keeps_strings():
+    assert repair_json('{"a": "x,}", "b": [1,],}') == '{"a": "x,}", "b": [1]}'
+
+
+def test_scanner_streaming_matches_single_feed():
+    text = '前言 {"a": "}{", "b": [1, {"c": 2}]} 後記 {"d": 3}'
+    whole = JSONScanner().feed(text)
+    chunked = JSONScanner()
+    for i in range(0, len(text), 3):
+        chunked.feed(text[i:i + 3])
+    assert chunked.spans == whole.spans
+    assert chunked.candidates() == ['{"a": "}{", "b": [1, {"c": 2}]}', '{"d": 3}']
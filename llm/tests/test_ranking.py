@@ -0,0 +1,73 @@
+# llm/tests/test_ranking.py
+from datetime import date
+
+import numpy as np
+
+from agents.planner.ranking import CoverageMatrix, days_left, expiry_weight, get_matrix, rank_recipes
+
+
+def _recipe(url, *names, **extra):
+    return {"url": url, "ingredients": [{"name": n} for n in names], **extra}
+
+
+RECIPES = [
+    _recipe("a", "雞腿", "高麗菜", "鹽", cooking_time=20, steps=["1", "2"]),
+    _recipe("b", "雞腿", "豆腐", "番茄", cooking_time=40, steps=["1"]),
+    _recipe("c", "鮭魚", "醬油"),
+    _recipe("d", "去骨雞腿排", cooking_time=10, steps=["1"]),
+]
+
+
+def test_pantry_not_counted():
+    matrix = CoverageMatrix(RECIPES)
+    assert matrix.needed.tolist() == [2, 3, 1, 1]
+
+
+def test_expiry_weight():
+    assert expiry_weight(None) == 1.0
+    assert expiry_weight(0) == 3.0
+    assert expiry_weight(-3) == 3.0
+    assert expiry_weight(1) == 2.0
+
+
+def test_rank_orders_by_score_then_missing():
+    matrix = CoverageMatrix(RECIPES)
+    ranked = matrix.rank([("雞腿", None), ("高麗菜", 0)])
+    assert [r["index"] for r in ranked] == [0, 3, 1]
+    assert ranked[0]["score"] == 2.0 and ranked[0]["coverage"] == 1.0
+    assert ranked[1]["matched_ingredients"] == ["雞腿"] and ranked[1]["missing_count"] == 0
+    assert ranked[2]["missing_count"] == 2
+    assert sorted(ranked[2]["missing_ingredients"]) == ["番茄", "豆腐"]
+
+
+def test_rank_filters():
+    matrix = CoverageMatrix(RECIPES)
+    fridge = [("雞腿", None)]
+    assert [r["index"] for r in matrix.rank(fridge, top_k=1)] == [3]
+    assert [r["index"] for r in matrix.rank(fridge, max_missing=0)] == [3]
+    allowed = np.array([True, True, True, False])
+    assert [r["index"] for r in matrix.rank(fridge, allowed=allowed)] == [0, 1]
+    assert CoverageMatrix([]).rank(fridge) == []
+
+
+def test_rank_recipes_with_constraints():
+    data = {"recipes": RECIPES}
+    ranked = rank_recipes(data, [("雞腿", 1)], constraints={"max_time": 30})
+    assert [r["url"] for r in ranked] == ["d", "a"]
+    assert "index" not in ranked[0] and ranked[0]["coverage"] == 1.0
+
+
+def test_get_matrix_rebuilds_on_new_corpus():
+    data = {"recipes": RECIPES}
+    matrix = get_matrix(data)
+    assert get_matrix(data) is matrix
+    data["recipes"] = list(RECIPES)
+    assert get_matrix(data) is not matrix
+
+
+def test_days_left():
+    today = date(2025, 11, 1)
+    assert days_left("2025-11-04", today) == 3
+    assert days_left("2025-11-04T10:00:00", today) == 3
+    assert days_left("壞掉", today) is None
+    assert days_left(None) is None
@@ -0,0 +1,76 @@
+# llm/tests/test_repair.py
+from typing import List
+
+from pydantic import BaseModel
+
+from agents.planner.agent import IngredientGroup, PlannerRequest
+from agents.planner.repair import check_slots, merge_slots, parse_slots, render_slot_prompt, slot_label
+
+
+class Recipe(BaseModel):
+    recipe_name: str
+    ingredients: List[str]
+
+
+def _recipe(name):
+    return {"recipe_name": name, "ingredients": ["雞腿"]}
+
+
+def _request(**kwargs):
+    groups = [IngredientGroup(main_ingredient="雞腿", supporting_ingredients=["蔥"], total_amount="300g",
+                              day=2, meal="晚餐"),
+              IngredientGroup(main_ingredient="豆腐", supporting_ingredients=[], total_amount="1盒",
+                              day=1, meal="午餐")]
+    return PlannerRequest(**{"ingredient_groups": groups, "people": 2, "days": 2, "meals": ["午餐", "晚餐"],
+                             "start_date": "2025-11-01", **kwargs})
+
+
+def test_check_slots_keeps_valid_and_reports_broken():
+    plan = {"schedule": [
+        # 日期不符的一天依位置對應
+        {"date": "2025-12-25", "lunch": [_recipe("A"), {"recipe_name": "壞掉"}], "dinner": [_recipe("B")]},
+        {"date": "2025-11-02", "lunch": [_recipe("C")], "dinner": "不是清單"},
+    ]}
+    fixed, broken, dropped = check_slots(_request(), plan, Recipe)
+    assert fixed["menu_plan"] == {"start_date": "2025-11-01", "days": 2, "people": 2, "daytimes": ["午餐", "晚餐"]}
+    assert [d["date"] for d in fixed["schedule"]] == ["2025-11-01", "2025-11-02"]
+    assert [r["recipe_name"] for r in fixed["schedule"][0]["lunch"]] == ["A"]
+    assert broken == [(1, "dinner")]
+    assert dropped == 1
+
+
+def test_check_slots_matches_by_date():
+    plan = {"schedule": [{"date": "2025-11-02", "lunch": [_recipe("C")], "dinner": [_recipe("D")]}]}
+    fixed, broken, _ = check_slots(_request(), plan, Recipe)
+    assert fixed["schedule"][1]["lunch"][0]["recipe_name"] == "C"
+    assert broken == [(0, "lunch"), (0, "dinner")]
+
+
+def test_parse_and_merge_slots():
+    broken = [(0, "lunch"), (1, "dinner")]
+    data = {"slots": [
+        {"day": 1, "meal": "午餐", "recipes": [_recipe("E"), {"recipe_name": "壞掉"}]},
+        {"day": "2", "meal": "晚餐", "recipes": [_recipe("F")]},
+        {"day": 2, "meal": "午餐", "recipes": [_recipe("不在列表")]},
+        {"day": "x", "meal": "晚餐"},
+        "不是 dict",
+    ]}
+    recipes = parse_slots(data, broken, Recipe)
+    assert {slot: [r["recipe_name"] for r in items] for slot, items in recipes.items()} == {
+        (0, "lunch"): ["E"], (1, "dinner"): ["F"]}
+    assert parse_slots(None, broken, Recipe) == {}
+
+    plan = {"schedule": [{"lunch": [], "dinner": []}, {"lunch": [], "dinner": []}]}
+    merged = merge_slots(plan, recipes)
+    assert merged["schedule"][1]["dinner"][0]["recipe_name"] == "F"
+
+
+def test_render_slot_prompt_lists_only_broken_slots():
+    request = _request()
+    plan, broken, _ = check_slots(request, {"schedule": [{"lunch": [_recipe("A")], "dinner": [_recipe("B")]}]},
+                                  Recipe)
+    prompt = render_slot_prompt(request, plan, broken)
+    assert slot_label((1, "dinner")) == "第2天 晚餐"
+    assert "第2天 晚餐" in prompt and "第1天 午餐" not in prompt
+    assert "主食材: 雞腿" in prompt and "主食材: 豆腐" not in prompt
+    assert "A, B" in prompt
@@ -0,0 +1,94 @@
+# llm/tests/test_scheduler.py
+import asyncio
+
+import httpx
+import pytest
+
+from scheduler import AsyncSchedulingTransport, LLMScheduler, SchedulingTransport
+
+
+def _scheduler(**kwargs):
+    return LLMScheduler(**{"initial": 2, "max_window": 4, "queue_timeout": 5, "priorities": {}, **kwargs})
+
+
+class _BrokenStream(httpx.SyncByteStream):
+    def __iter__(self):
+        raise RuntimeError("stream broke")
+        yield b""
+
+
+class _AsyncBrokenStream(httpx.AsyncByteStream):
+    async def __aiter__(self):
+        raise RuntimeError("stream broke")
+        yield b""
+
+
+def _fail(request):
+    raise ValueError("not a transport error")
+
+
+def test_sync_releases_on_non_transport_error():
+    scheduler = _scheduler()
+    client = httpx.Client(transport=SchedulingTransport(scheduler, httpx.MockTransport(_fail), max_retries=2))
+    with pytest.raises(ValueError):
+        client.get("http://llm.test/")
+    assert scheduler.in_flight == 0
+    assert scheduler.window == 2
+
+
+def test_sync_releases_when_retry_read_fails():
+    scheduler = _scheduler()
+    transport = httpx.MockTransport(lambda request: httpx.Response(503, stream=_BrokenStream()))
+    client = httpx.Client(transport=SchedulingTransport(scheduler, transport, max_retries=2))
+    with pytest.raises(RuntimeError):
+        client.get("http://llm.test/")
+    assert scheduler.in_flight == 0
+
+
+def test_sync_success_releases_on_close():
+    scheduler = _scheduler()
+    transport = httpx.MockTransport(lambda request: httpx.Response(200, json={"ok": True}))
+    client = httpx.Client(transport=SchedulingTransport(scheduler, transport))
+    assert client.get("http://llm.test/").json() == {"ok": True}
+    assert scheduler.in_flight == 0
+    assert scheduler.window > 2
+
+
+def test_async_releases_on_non_transport_error_and_read_failure():
+    scheduler = _scheduler()
+
+    async def main():
+        async with httpx.AsyncClient(transport=AsyncSchedulingTransport(
+                scheduler, httpx.MockTransport(_fail), max_retries=2)) as client:
+            with pytest.raises(ValueError):
+                await client.get("http://llm.test/")
+        transport = httpx.MockTransport(lambda request: httpx.Response(503, stream=_AsyncBrokenStream()))
+        async with httpx.AsyncClient(transport=AsyncSchedulingTransport(scheduler, transport, max_retries=2)) as client:
+            with pytest.raises(RuntimeError):
+                await client.get("http://llm.test/")
+
+    asyncio.run(main())
+    assert scheduler.in_flight == 0
+
+
+def test_async_cancelled_while_waiting_returns_slot():
+    scheduler = _scheduler(initial=1, max_window=1)
+
+    async def main():
+        held = scheduler.acquire(0)
+        transport = httpx.MockTransport(lambda request: httpx.Response(200))
+        async with httpx.AsyncClient(transport=AsyncSchedulingTransport(scheduler, transport)) as client:
+            task = asyncio.create_task(client.get("http://llm.test/"))
+            await asyncio.sleep(0.05)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            # 取消後才拿到的名額也要歸還
+            scheduler.release(held)
+            for _ in range(100):
+                if scheduler.stats()["queued"] == 0 and scheduler.in_flight == 0:
+                    break
+                await asyncio.sleep(0.01)
+
+    asyncio.run(main())
+    assert scheduler.in_flight == 0
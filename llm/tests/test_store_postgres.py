@@ -0,0 +1,89 @@
+# llm/tests/test_store_postgres.py
+"""
+Postgres 食譜語料的整合測試：匯入 → 食材查詢 → 全文檢索 → 排序，排序結果須與 ranking.CoverageMatrix.rank 一致
+需要可連線的 Postgres（例如 docker compose 的 db，本機埠 5433）：
+  TEST_DATABASE_URL=postgresql+psycopg://<user>:<password>@localhost:5433/<db> python -m pytest -q tests/test_store_postgres.py
+資料表見 conftest.pg_session_factory
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bench"))
+
+
+@pytest.fixture(scope="module")
+def corpus():
+    from synth_data import SyntheticData
+    return list(SyntheticData(seed=7).recipes(400))
+
+
+@pytest.fixture(scope="module")
+def store(pg_session_factory, corpus):
+    from sqlalchemy import text
+
+    from agents.planner.store import PostgresRecipeStore, ingest_recipes
+
+    with pg_session_factory() as s:
+        s.execute(text("TRUNCATE recipes CASCADE"))
+        s.commit()
+    counts = ingest_recipes(corpus, session_factory=pg_session_factory, chunk_size=150)
+    assert counts["recipes"] == len(corpus)
+    # 重複匯入同一批食譜覆寫原本的列
+    ingest_recipes(corpus[:10], session_factory=pg_session_factory)
+    return PostgresRecipeStore(pg_session_factory)
+
+
+def test_ingest_round_trip(store, corpus):
+    assert store.count() == len(corpus)
+    found = store.search_text(corpus[0]["title"], max_results=50)
+    assert corpus[0] in found
+
+
+def test_search_by_ingredients(store, corpus):
+    from agents.planner.canon import same_ingredient
+
+    for query in (["雞腿"], ["豆腐", "鮭魚"], ["不存在的食材"]):
+        expected = [r for r in corpus if any(same_ingredient(q, i["name"]) for q in query for i in r["ingredients"])]
+        assert store.search_by_ingredients(query, max_results=20) == expected[:20]
+
+
+def test_search_text_ranks_title_matches(store, corpus):
+    title = corpus[5]["title"]
+    results = store.search_text(title, max_results=10)
+    assert results[0]["title"] == title
+    assert store.search_text("   ") == []
+
+
+@pytest.mark.parametrize("fridge, kwargs", [
+    ([("雞腿", 0), ("高麗菜", 3), ("雞蛋", None), ("洋蔥", 10)], {}),
+    ([("豆腐", 1), ("番茄", 2), ("蔥", None)], {"top_k": 25, "max_missing": 2}),
+    ([("豬絞肉", 0), ("紅蘿蔔", 5), ("馬鈴薯", None)], {"constraints": {"max_time": 30, "max_steps": 6}}),
+])
+def test_rank_matches_coverage_matrix(store, corpus, fridge, kwargs):
+    from agents.planner.ranking import rank_recipes
+
+    keys = ("url", "score", "coverage", "missing_count")
+    expected = [{k: r[k] for k in keys} for r in rank_recipes({"recipes": corpus}, fridge, **kwargs)]
+    ranked = store.rank(fridge, **kwargs)
+    assert [{k: r[k] for k in keys} for r in ranked] == expected
+    for got, want in zip(ranked, rank_recipes({"recipes": corpus}, fridge, **kwargs)):
+        assert sorted(got["matched_ingredients"]) == sorted(want["matched_ingredients"])
+        assert sorted(got["missing_ingredients"]) == sorted(want["missing_ingredients"])
+
+
+def test_rank_ties_match_coverage_matrix(store, corpus):
+    """同分的食譜多半只差加總順序造成的浮點誤差，兩邊都應依缺少數與語料順序排"""
+    import random
+
+    from agents.planner.ranking import rank_recipes
+    from synth_data import INGREDIENTS
+
+    rng = random.Random(2)
+    for _ in range(200):
+        fridge = [(name, rng.choice([None, 0, 1, 2, 3, 5, 8, 20]))
+                  for name, _, _ in rng.sample(INGREDIENTS, rng.randint(1, 15))]
+        kwargs = {"top_k": rng.choice([5, 20, 100]), "max_missing": rng.choice([None, 1, 3])}
+        expected = [r["url"] for r in rank_recipes({"recipes": corpus}, fridge, **kwargs)]
+        assert [r["url"] for r in store.rank(fridge, **kwargs)] == expected, fridge
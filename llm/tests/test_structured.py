@@ -0,0 +1,51 @@
+# llm/tests/test_structured.py
+from agents.planner.agent import MenuPlan
+from agents.selector.agent_react import SelectorOutput
+from agents.structured import coerce_to_schema
+from metrics import STRUCTURED_ITEMS_DROPPED
+
+
+def _recipe(name, **kwargs):
+    return {"recipe_name": name, "main_ingredient": "雞腿", "ingredients": [{"name": "雞腿", "amount": "300g"}],
+            **kwargs}
+
+
+def _menu(schedule):
+    return {"menu_plan": {"start_date": "2025-10-29", "days": len(schedule), "people": 2, "daytimes": ["午餐"]},
+            "schedule": schedule}
+
+
+def _dropped(schema):
+    return STRUCTURED_ITEMS_DROPPED.labels(schema=schema)._value.get()
+
+
+def test_drops_only_invalid_recipe_items():
+    before = _dropped("MenuPlan")
+    lunch = [_recipe(f"菜{i}") for i in range(12)]
+    # 索引 2 與 10 無效：字串排序下 "10" < "2"，仍須由大到小刪
+    del lunch[2]["main_ingredient"]
+    lunch[10]["ingredients"] = [{"name": "雞腿"}]
+    plan = coerce_to_schema(MenuPlan, _menu([{"date": "2025-10-29", "lunch": lunch,
+                                              "dinner": [_recipe("晚餐", ingredients="x")]}]))
+    day = plan.schedule[0]
+    assert [r.recipe_name for r in day.lunch] == [f"菜{i}" for i in range(12) if i not in (2, 10)]
+    assert day.dinner == []
+    assert _dropped("MenuPlan") - before == 3
+
+
+def test_day_level_error_is_not_dropped():
+    before = _dropped("MenuPlan")
+    data = _menu([{"date": "2025-10-29", "lunch": [_recipe("菜")]}, {"lunch": [_recipe("菜")]}])
+    assert coerce_to_schema(MenuPlan, data) is None
+    # 缺少日期的那天沒有被默默刪掉
+    assert len(data["schedule"]) == 2
+    assert _dropped("MenuPlan") == before
+
+
+def test_selector_dish_items():
+    data = {"total_days": 1, "total_people": 2, "start_date": "2025-10-29",
+            "daily_meals": [{"date": "2025-10-29",
+                             "lunch": [{"dish_name": "炒雞", "ingredients": [{"name": "雞腿", "allocated_quantity": 1}]},
+                                       {"dish_name": "壞", "ingredients": [{"name": "蛋", "allocated_quantity": "很多"}]}]}]}
+    output = coerce_to_schema(SelectorOutput, data)
+    assert [d.dish_name for d in output.daily_meals[0].lunch] == ["炒雞"]
@@ -0,0 +1,61 @@
+# llm/tests/test_validator.py
+from agents.selector.allocator import allocated_totals
+from agents.selector.validator import repair, validate
+
+ITEMS = [
+    {"name": "雞胸肉", "unit": "克", "quantity_available": 300, "expiry_date": "2025-11-05"},
+    {"name": "雞蛋", "unit": "顆", "quantity_available": 3, "expiry_date": "2025-11-01"},
+    {"name": "草蝦", "unit": "克", "quantity_available": 200, "expiry_date": "2025-11-05"},
+]
+
+
+def _output(*dishes):
+    """dishes: (日期, 餐, [(名稱, 份量)])"""
+    days = {}
+    for day, field, ingredients in dishes:
+        entry = days.setdefault(day, {"date": day, "breakfast": [], "lunch": [], "dinner": []})
+        entry[field].append({"dish_name": "菜", "ingredients": [
+            {"name": n, "allocated_quantity": q} for n, q in ingredients]})
+    return {"total_days": len(days), "total_people": 2, "start_date": min(days), "daily_meals": list(days.values())}
+
+
+def test_validate_valid():
+    output = _output(("2025-11-01", "lunch", [("雞胸肉", 200), ("雞蛋", 2)]))
+    assert validate(output, ITEMS)["valid"]
+
+
+def test_validate_reports_each_problem():
+    output = _output(
+        ("2025-11-01", "lunch", [("雞胸肉", 200), ("牛肉", 100)]),
+        ("2025-11-02", "dinner", [("雞胸肉", 200), ("雞蛋", 1), ("草蝦", 100), ("雞胸肉", -1)]),
+    )
+    report = validate(output, ITEMS, allergies=["蝦"])
+    assert not report["valid"]
+    assert report["overdrawn"] == {"雞胸肉": {"allocated": 400.0, "available": 300.0}}
+    assert report["unknown"] == ["牛肉"]
+    assert report["expired"] == [{"date": "2025-11-02", "name": "雞蛋"}]
+    assert report["excluded"] == [{"date": "2025-11-02", "name": "草蝦"}]
+    assert report["invalid_quantity"] == [{"date": "2025-11-02", "name": "雞胸肉"}]
+
+
+def test_repair_renames_scales_and_drops():
+    output = _output(
+        ("2025-11-01", "lunch", [("雞胸", 200), ("雞蛋", 2)]),
+        ("2025-11-01", "dinner", [("雞胸肉", 200), ("雞蛋", 2)]),
+        ("2025-11-02", "dinner", [("牛肉", 100)]),
+    )
+    repaired, report = repair(output, ITEMS)
+    assert report["repairs"]["renamed"] == 1
+    assert report["repairs"]["dropped"] == 1
+    assert report["valid_after"]
+    totals = allocated_totals(repaired)
+    assert totals["雞胸肉"] <= 300 and totals["雞蛋"] == 3
+    # 只剩無法使用食材的菜色整道移除
+    assert repaired["daily_meals"][1]["dinner"] == []
+
+
+def test_repair_valid_output_unchanged():
+    output = _output(("2025-11-01", "lunch", [("雞胸肉", 100)]))
+    repaired, report = repair(output, ITEMS)
+    assert repaired is output
+    assert report["repairs"] == {"renamed": 0, "dropped": 0, "scaled": 0}